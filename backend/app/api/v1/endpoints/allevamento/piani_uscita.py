@@ -297,23 +297,52 @@ async def generate_piano_uscita_pdf_endpoint(
 ):
     """Genera PDF per piano uscita"""
     # Lazy import per risparmiare memoria all'avvio
-    from app.utils.pdf_generator import generate_piano_uscita_pdf
+    from app.services.pdf_rendering_service import render_pdf, iter_pdf_file
     
     if not request.animale_ids:
         raise HTTPException(status_code=400, detail="Lista animali vuota")
     
-    animali = db.query(Animale).filter(
-        Animale.id.in_(request.animale_ids),
-        Animale.deleted_at.is_(None)
-    ).all()
+    # Una sola query con le colonne necessarie al PDF (niente oggetti ORM per capo)
+    rows = (
+        db.query(
+            Animale.auricolare,
+            Animale.box_id,
+            Box.nome.label("box_nome"),
+            Stabilimento.nome.label("stabilimento_nome"),
+            Sede.nome.label("sede_nome"),
+            Azienda.nome.label("azienda_nome"),
+        )
+        .outerjoin(Box, Animale.box_id == Box.id)
+        .outerjoin(Stabilimento, Box.stabilimento_id == Stabilimento.id)
+        .outerjoin(Sede, Stabilimento.sede_id == Sede.id)
+        .outerjoin(Azienda, Animale.azienda_id == Azienda.id)
+        .filter(
+            Animale.id.in_(request.animale_ids),
+            Animale.deleted_at.is_(None)
+        )
+        .all()
+    )
     
-    if len(animali) != len(request.animale_ids):
+    if len(rows) != len(set(request.animale_ids)):
         raise HTTPException(status_code=404, detail="Alcuni animali non trovati")
     
-    pdf_bytes = generate_piano_uscita_pdf(animali)
+    animali_data = [
+        {
+            'auricolare': row.auricolare,
+            'box_id': row.box_id,
+            'box_nome': row.box_nome or 'N/A',
+            'stabilimento_nome': row.stabilimento_nome or 'N/A',
+            'sede_nome': row.sede_nome or 'N/A',
+            'azienda_nome': row.azienda_nome or 'N/A',
+        }
+        for row in rows
+    ]
+    del rows
+    
+    pdf_path = await render_pdf("generate_piano_uscita_pdf", animali_data, chunked=True)
     
     return StreamingResponse(
-        iter([pdf_bytes]),
+        iter_pdf_file(pdf_path),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename=piano_uscita_{datetime.utcnow().strftime('%Y%m%d')}.pdf"}
     )
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile
 from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, date
 from decimal import Decimal
 from pydantic import BaseModel
@@ -25,6 +25,7 @@ from app.models.allevamento.sede import Sede
 from app.models.allevamento.box import Box
 from app.models.allevamento.stabilimento import Stabilimento
 from app.schemas.amministrazione import (
+    AnagrafeConfirmBatch,
     PartitaAnimaleConfirm,
     PartitaAnimaleCreate,
     PartitaAnimaleResponse,
@@ -110,6 +111,169 @@ def _detach_pn_movimento(db: Session, pn_movimento_id: Optional[int]) -> None:
         movimento.partita_id = None
 
 
+class _BoxAllocator:
+    """Assegna i box liberi della sede (per codice stalla) tenendo conto dell'occupazione."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.cache: dict[str, Optional[dict]] = {}
+
+    def _load_context(self, codice_stalla_value: Optional[str]):
+        if not codice_stalla_value:
+            return None
+        if codice_stalla_value in self.cache:
+            return self.cache[codice_stalla_value]
+
+        sede = self.session.query(Sede).filter(
+            Sede.codice_stalla == codice_stalla_value,
+            Sede.deleted_at.is_(None)
+        ).first()
+        if not sede:
+            self.cache[codice_stalla_value] = None
+            return None
+
+        stabilimento = self.session.query(Stabilimento).filter(
+            Stabilimento.sede_id == sede.id,
+            Stabilimento.deleted_at.is_(None)
+        ).first()
+        if not stabilimento:
+            self.cache[codice_stalla_value] = None
+            return None
+
+        boxes = self.session.query(Box).filter(
+            Box.stabilimento_id == stabilimento.id,
+            Box.deleted_at.is_(None),
+            Box.stato.in_(['libero', 'occupato'])
+        ).all()
+        if not boxes:
+            self.cache[codice_stalla_value] = None
+            return None
+
+        box_ids = [box.id for box in boxes]
+        occupancy_rows = (
+            self.session.query(Animale.box_id, func.count(Animale.id))
+            .filter(
+                Animale.box_id.in_(box_ids),
+                Animale.stato == 'presente',
+                Animale.deleted_at.is_(None)
+            )
+            .group_by(Animale.box_id)
+            .all()
+        ) if box_ids else []
+        occupancy = {box_id: count for box_id, count in occupancy_rows}
+        context = {"boxes": boxes, "occupancy": occupancy}
+        self.cache[codice_stalla_value] = context
+        return context
+
+    def assign(self, codice_stalla_value: Optional[str]):
+        context = self._load_context(codice_stalla_value)
+        if not context:
+            return None
+
+        for box in context["boxes"]:
+            capacita = box.capacita or 0
+            if capacita <= 0:
+                continue
+            current = context["occupancy"].get(box.id, 0)
+            if current < capacita:
+                context["occupancy"][box.id] = current + 1
+                return box
+
+        fallback_box = context["boxes"][0] if context["boxes"] else None
+        if fallback_box:
+            context["occupancy"][fallback_box.id] = context["occupancy"].get(fallback_box.id, 0) + 1
+        return fallback_box
+
+
+
+# Righe per blocco nelle IN(...) del prefetch animali
+_PREFETCH_CHUNK = 1000
+# Elementi confermati tra un commit e il successivo nella conferma in blocco
+CONFIRM_BATCH_COMMIT_SIZE = 25
+
+
+class _AnagrafeConfirmContext:
+    """
+    Stato condiviso tra le conferme di uno stesso upload anagrafe: animali già
+    caricati per auricolare, allocatore box e occupazione dei box. Evita le query
+    per singolo capo quando si confermano molte partite in sequenza.
+    """
+
+    def __init__(self, session: Session, azienda_id: int):
+        self.session = session
+        self.azienda_id = azienda_id
+        self.animali_by_auricolare: Dict[str, Animale] = {}
+        self._box_allocator = _BoxAllocator(session)
+        self._box_presenti: Dict[int, set] = {}
+
+    def prefetch_animali(self, codici_capi) -> None:
+        """Carica in blocco gli animali non ancora in cache (una query ogni 1000 codici)."""
+        mancanti = [
+            codice for codice in dict.fromkeys(codici_capi or [])
+            if codice and codice not in self.animali_by_auricolare
+        ]
+        for start in range(0, len(mancanti), _PREFETCH_CHUNK):
+            chunk = mancanti[start:start + _PREFETCH_CHUNK]
+            for animale in self.session.query(Animale).filter(
+                Animale.azienda_id == self.azienda_id,
+                Animale.deleted_at.is_(None),
+                Animale.auricolare.in_(chunk)
+            ):
+                self.animali_by_auricolare[animale.auricolare] = animale
+
+    def _presenti_nel_box(self, box_id: int) -> set:
+        presenti = self._box_presenti.get(box_id)
+        if presenti is None:
+            presenti = set(
+                self.session.query(Animale).filter(
+                    Animale.box_id == box_id,
+                    Animale.stato == 'presente',
+                    Animale.deleted_at.is_(None)
+                ).all()
+            )
+            self._box_presenti[box_id] = presenti
+        return presenti
+
+    def assign_box(self, animale: Animale, codice_stalla_value: Optional[str]) -> Optional[Box]:
+        assigned_box = self._box_allocator.assign(codice_stalla_value)
+        if assigned_box:
+            animale.box_id = assigned_box.id
+            if assigned_box.stato == 'libero':
+                assigned_box.stato = 'occupato'
+            self.session.add(assigned_box)
+            if assigned_box.id in self._box_presenti:
+                self._box_presenti[assigned_box.id].add(animale)
+        return assigned_box
+
+    def release_box(self, animale: Animale) -> None:
+        """Toglie l'animale dal box e libera il box se non restano capi presenti."""
+        box_uscita = self.session.get(Box, animale.box_id)
+        if box_uscita:
+            altri_animali = any(
+                altro is not animale
+                and altro.box_id == box_uscita.id
+                and altro.stato == 'presente'
+                and altro.deleted_at is None
+                for altro in self._presenti_nel_box(box_uscita.id)
+            )
+            if not altri_animali:
+                box_uscita.stato = 'libero'
+                self.session.add(box_uscita)
+        animale.box_id = None
+
+    def reset_after_rollback(self) -> None:
+        """Dopo il rollback di un elemento scarta gli oggetti non più persistenti."""
+        from sqlalchemy import inspect as sa_inspect
+        
+        self.animali_by_auricolare = {
+            codice: animale
+            for codice, animale in self.animali_by_auricolare.items()
+            if sa_inspect(animale).persistent
+        }
+        self._box_allocator = _BoxAllocator(self.session)
+        self._box_presenti = {}
+
+
 @router.get("/partite", response_model=List[PartitaAnimaleResponse])
 async def get_partite(
     tipo: Optional[str] = None,
@@ -1101,7 +1265,7 @@ async def sincronizza_anagrafe(
     Upload e processamento file .gz anagrafe nazionale
     Restituisce le partite identificate senza crearle nel database.
     L'utente le confermerà una ad una tramite il modale.
-    Parsing con BeautifulSoup/openpyxl/csv (senza pandas) per ridurre uso memoria.
+    Parsing HTML in streaming con lxml, Excel con openpyxl, CSV con csv (senza pandas) per ridurre uso memoria.
     """
     from app.services.amministrazione.sincronizzazione_anagrafe import (
         process_anagrafe_file
@@ -1247,14 +1411,133 @@ async def sincronizza_anagrafe(
     }
 
 
-@router.post("/partite/confirm", response_model=PartitaAnimaleResponse, status_code=status.HTTP_201_CREATED)
-async def confirm_partita_anagrafe(
-    partita_data: PartitaAnimaleConfirm,
+
+@router.post("/sincronizza-anagrafe/multi", status_code=status.HTTP_200_OK)
+async def sincronizza_anagrafe_multi(
+    files: List[UploadFile] = File(...),
+    azienda_id: int = Query(..., description="ID azienda"),
     db: Session = Depends(get_db)
 ):
     """
-    Conferma una partita identificata dall'anagrafe e crea la partita nel database.
-    Aggiorna anche i pesi degli animali coinvolti.
+    Upload di più file .gz anagrafe (uno per codice stalla) in una sola sincronizzazione.
+    I file vengono decodificati e raggruppati in parallelo; i risultati sono uniti e
+    riconciliati con il database una sola volta, abbinando i trasferimenti interni
+    tra stalle gestite presenti in file diversi.
+    Restituisce le partite identificate senza crearle nel database.
+    """
+    from app.core.config import settings
+    from app.services.allevamento.codici_stalla_service import get_codici_stalla_gestiti
+    from app.services.amministrazione.sincronizzazione_anagrafe import (
+        decode_anagrafe_files,
+        merge_anagrafe_results,
+        verify_codice_stalla_exists,
+    )
+    import tempfile
+    import os
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+    if not files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nessun file caricato")
+    if len(files) > settings.ANAGRAFE_MAX_FILES_PER_SYNC:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Troppi file: massimo {settings.ANAGRAFE_MAX_FILES_PER_SYNC} per sincronizzazione"
+        )
+    for upload in files:
+        if not (upload.filename or "").endswith('.gz'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Il file {upload.filename} deve essere un file .gz"
+            )
+
+    azienda = db.query(Azienda).filter(Azienda.id == azienda_id).first()
+    if not azienda:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Azienda non trovata"
+        )
+    azienda_codice = azienda.partita_iva or azienda.codice_fiscale
+
+    temp_paths: List[str] = []
+    try:
+        # Ogni upload va su disco a blocchi: i worker leggono dal percorso
+        for upload in files:
+            fd, temp_path = tempfile.mkstemp(suffix=".gz")
+            temp_paths.append(temp_path)
+            with os.fdopen(fd, "wb") as buffer:
+                while True:
+                    chunk = await upload.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    buffer.write(chunk)
+
+        logger.info(f"Sincronizzazione anagrafe multi-file: {len(files)} file per azienda {azienda_id}")
+        try:
+            codici_stalla_gestiti = get_codici_stalla_gestiti(db, azienda_id)
+            results = await decode_anagrafe_files(temp_paths, azienda_codice, codici_stalla_gestiti)
+            partite_ingresso, partite_uscita, decessi = merge_anagrafe_results(results, azienda_id, db)
+        except Exception as e:
+            logger.error(f"Sincronizzazione anagrafe multi-file: Errore - {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Errore nel processamento dei file: {str(e)}"
+            )
+    finally:
+        for temp_path in temp_paths:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    # Tutti i codici stalla dei file devono esistere (stessa regola dell'upload singolo)
+    for result in results:
+        codice_stalla_file = result["codice_stalla_file"]
+        if codice_stalla_file and not verify_codice_stalla_exists(codice_stalla_file, db)[0]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Codice stalla '{codice_stalla_file}' non trovato nel database. È necessario creare una nuova sede con questo codice stalla.",
+                headers={"X-Codice-Stalla": codice_stalla_file, "X-Azione-Richiesta": "crea_sede"}
+            )
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    file_paths = [
+        f"anagrafe/{azienda_id}/{timestamp}_{upload.filename or f'anagrafe_{indice}.gz'}"
+        for indice, upload in enumerate(files)
+    ]
+    data_importazione = datetime.utcnow().isoformat()
+    for gruppo in partite_ingresso + partite_uscita + decessi:
+        gruppo['file_anagrafe_origine'] = file_paths[gruppo.pop('file_indice')]
+        gruppo['data_importazione'] = data_importazione
+
+    return {
+        'message': 'File processati correttamente. Seleziona le partite da confermare.',
+        'partite_trovate': {
+            'ingresso': len(partite_ingresso),
+            'uscita': len(partite_uscita)
+        },
+        'partite': {
+            'ingresso': partite_ingresso,
+            'uscita': partite_uscita
+        },
+        'gruppi_decessi_trovati': len(decessi),
+        'gruppi_decessi': decessi,
+        'trasferimenti_interni_abbinati': sum(1 for p in partite_uscita if p.get('id_trasferimento_interno')),
+        'file': [
+            {'file_origine': file_paths[indice], 'codice_stalla_file': result["codice_stalla_file"]}
+            for indice, result in enumerate(results)
+        ],
+    }
+
+def _apply_partita_confirm(
+    partita_data: PartitaAnimaleConfirm,
+    db: Session,
+    ctx: "_AnagrafeConfirmContext",
+) -> Tuple[PartitaAnimale, int, List[str]]:
+    """
+    Applica la conferma di una partita anagrafe nella sessione (senza commit).
+    Restituisce (partita, animali_aggiornati, animali_non_trovati).
     """
     from app.models.amministrazione.partita_animale import TipoPartita
     from decimal import Decimal, InvalidOperation
@@ -1466,91 +1749,9 @@ async def confirm_partita_anagrafe(
             ]
         )
 
-    animali_by_auricolare: dict[str, Animale] = {}
-    if codici_capi:
-        existing_animali = (
-            db.query(Animale)
-            .filter(
-                Animale.azienda_id == azienda_id,
-                Animale.deleted_at.is_(None),
-                Animale.auricolare.in_(codici_capi)
-            )
-            .all()
-        )
-        animali_by_auricolare = {animale.auricolare: animale for animale in existing_animali}
-
-    class _BoxAllocator:
-        def __init__(self, session: Session):
-            self.session = session
-            self.cache: dict[str, Optional[dict]] = {}
-
-        def _load_context(self, codice_stalla_value: Optional[str]):
-            if not codice_stalla_value:
-                return None
-            if codice_stalla_value in self.cache:
-                return self.cache[codice_stalla_value]
-
-            sede = self.session.query(Sede).filter(
-                Sede.codice_stalla == codice_stalla_value,
-                Sede.deleted_at.is_(None)
-            ).first()
-            if not sede:
-                self.cache[codice_stalla_value] = None
-                return None
-
-            stabilimento = self.session.query(Stabilimento).filter(
-                Stabilimento.sede_id == sede.id,
-                Stabilimento.deleted_at.is_(None)
-            ).first()
-            if not stabilimento:
-                self.cache[codice_stalla_value] = None
-                return None
-
-            boxes = self.session.query(Box).filter(
-                Box.stabilimento_id == stabilimento.id,
-                Box.deleted_at.is_(None),
-                Box.stato.in_(['libero', 'occupato'])
-            ).all()
-            if not boxes:
-                self.cache[codice_stalla_value] = None
-                return None
-
-            box_ids = [box.id for box in boxes]
-            occupancy_rows = (
-                self.session.query(Animale.box_id, func.count(Animale.id))
-                .filter(
-                    Animale.box_id.in_(box_ids),
-                    Animale.stato == 'presente',
-                    Animale.deleted_at.is_(None)
-                )
-                .group_by(Animale.box_id)
-                .all()
-            ) if box_ids else []
-            occupancy = {box_id: count for box_id, count in occupancy_rows}
-            context = {"boxes": boxes, "occupancy": occupancy}
-            self.cache[codice_stalla_value] = context
-            return context
-
-        def assign(self, codice_stalla_value: Optional[str]):
-            context = self._load_context(codice_stalla_value)
-            if not context:
-                return None
-
-            for box in context["boxes"]:
-                capacita = box.capacita or 0
-                if capacita <= 0:
-                    continue
-                current = context["occupancy"].get(box.id, 0)
-                if current < capacita:
-                    context["occupancy"][box.id] = current + 1
-                    return box
-
-            fallback_box = context["boxes"][0] if context["boxes"] else None
-            if fallback_box:
-                context["occupancy"][fallback_box.id] = context["occupancy"].get(fallback_box.id, 0) + 1
-            return fallback_box
-
-    box_allocator = _BoxAllocator(db)
+    # Animali e box arrivano dal contesto condiviso (prefetch unico per tutto l'upload)
+    ctx.prefetch_animali(codici_capi)
+    animali_by_auricolare = ctx.animali_by_auricolare
     
     # Verifica se esiste già una partita con gli stessi parametri
     # Questo evita duplicati se si conferma di nuovo la stessa partita
@@ -1597,21 +1798,15 @@ async def confirm_partita_anagrafe(
         
         db.flush()  # Salva le modifiche
     else:
-        # Genera numero partita con numero progressivo per (data, tipo, codice_stalla)
-        # Include codice_stalla nel conteggio per evitare collisioni tra partite verso stalle diverse
-        tipo_prefix = "ING" if tipo == 'ingresso' else "USC"
-        data_str_format = data.strftime('%Y%m%d')
-        tipo_partita = TipoPartita.INGRESSO if tipo == 'ingresso' else TipoPartita.USCITA
-
-        count = db.query(func.count(PartitaAnimale.id)).filter(
-            PartitaAnimale.data == data,
-            PartitaAnimale.tipo == tipo_partita,
-            PartitaAnimale.codice_stalla == codice_stalla,
-            PartitaAnimale.deleted_at.is_(None)
-        ).scalar() or 0
-
-        numero_progressivo = f"{(count + 1):03d}"
-        numero_partita = f"{tipo_prefix}-{data_str_format}-{codice_stalla}-{numero_progressivo}"
+        # Genera numero partita dal contatore per (azienda, anno, tipo): niente count()
+        # e nessun duplicato con richieste concorrenti
+        from app.services.amministrazione.sequenze_service import (
+            allocate_sequence,
+            format_numero_partita,
+            sequenza_partita,
+        )
+        progressivo = allocate_sequence(db, azienda_id, data.year, sequenza_partita(tipo))
+        numero_partita = format_numero_partita(tipo, data, codice_stalla, progressivo)
 
         db_partita = PartitaAnimale(
             azienda_id=azienda_id,
@@ -1743,12 +1938,7 @@ async def confirm_partita_anagrafe(
                         # - origine_dati
 
                     if not animale.box_id and codice_stalla_destinazione_finale:
-                        assigned_box = box_allocator.assign(codice_stalla_destinazione_finale)
-                        if assigned_box:
-                            animale.box_id = assigned_box.id
-                            if assigned_box.stato == 'libero':
-                                assigned_box.stato = 'occupato'
-                            db.add(assigned_box)
+                        ctx.assign_box(animale, codice_stalla_destinazione_finale)
                     
                     # Assegna valore all'animale se disponibile (solo per ingressi esterni)
                     if tipo == 'ingresso' and not is_trasferimento_interno and valore_per_animale is not None:
@@ -1822,19 +2012,7 @@ async def confirm_partita_anagrafe(
                                 animale.stato = 'venduto'  # Default per uscite esterne non specificate
 
                         if animale.box_id:
-                            box_uscita = db.query(Box).filter(Box.id == animale.box_id).first()
-                            if box_uscita:
-                                altri_animali = db.query(Animale).filter(
-                                    Animale.box_id == box_uscita.id,
-                                    Animale.id != animale.id,
-                                    Animale.stato == 'presente',
-                                    Animale.deleted_at.is_(None)
-                                ).count()
-
-                                if altri_animali == 0:
-                                    box_uscita.stato = 'libero'
-                                    db.add(box_uscita)
-                            animale.box_id = None
+                            ctx.release_box(animale)
                 animali_aggiornati += 1
                 continue
 
@@ -1882,19 +2060,16 @@ async def confirm_partita_anagrafe(
                 )
 
                 if nuovo_animale.codice_azienda_anagrafe:
-                    assigned_box = box_allocator.assign(nuovo_animale.codice_azienda_anagrafe)
-                    if assigned_box:
-                        nuovo_animale.box_id = assigned_box.id
-                        if assigned_box.stato == 'libero':
-                            assigned_box.stato = 'occupato'
-                        db.add(assigned_box)
+                    ctx.assign_box(nuovo_animale, nuovo_animale.codice_azienda_anagrafe)
 
                 db.add(nuovo_animale)
-                db.flush()
                 animali_by_auricolare[codice_capo] = nuovo_animale
                 animali_aggiornati += 1
             else:
                 animali_non_trovati.append(codice_capo)
+        
+        # Un solo flush per i nuovi animali della partita (INSERT multi-riga)
+        db.flush()
     
     # Crea i record di join tra partita e animali per tracciare i movimenti
     # Questo permette di tracciare lo storico completo dei movimenti di ogni animale
@@ -1907,6 +2082,7 @@ async def confirm_partita_anagrafe(
         )
     }
     
+    join_records = []
     for codice_capo in codici_capi:
         animale = animali_by_auricolare.get(codice_capo)
         if not animale or animale.id in existing_join_animali:
@@ -1926,13 +2102,44 @@ async def confirm_partita_anagrafe(
             except:
                 pass
         
-        join_record = PartitaAnimaleAnimale(
-            partita_animale_id=db_partita.id,
-            animale_id=animale.id,
-            peso=peso_animale
+        join_records.append(
+            PartitaAnimaleAnimale(
+                partita_animale_id=db_partita.id,
+                animale_id=animale.id,
+                peso=peso_animale
+            )
         )
-        db.add(join_record)
         existing_join_animali.add(animale.id)
+    db.add_all(join_records)
+    
+    # Registra gli eventi nell'indice anagrafe: le prossime sincronizzazioni li salteranno
+    from app.services.amministrazione.sincronizzazione_anagrafe import record_capo_events
+    tipo_evento = tipo.value if hasattr(tipo, "value") else str(tipo)
+    record_capo_events(
+        db,
+        azienda_id,
+        [
+            (codice_capo, tipo_evento, data, codice_stalla)
+            for codice_capo in codici_capi
+            if codice_capo in animali_by_auricolare
+        ],
+        partita_animale_id=db_partita.id,
+    )
+    
+    return db_partita, animali_aggiornati, animali_non_trovati
+
+
+@router.post("/partite/confirm", response_model=PartitaAnimaleResponse, status_code=status.HTTP_201_CREATED)
+async def confirm_partita_anagrafe(
+    partita_data: PartitaAnimaleConfirm,
+    db: Session = Depends(get_db)
+):
+    """
+    Conferma una partita identificata dall'anagrafe e crea la partita nel database.
+    Aggiorna anche i pesi degli animali coinvolti.
+    """
+    ctx = _AnagrafeConfirmContext(db, partita_data.azienda_id)
+    db_partita, animali_aggiornati, animali_non_trovati = _apply_partita_confirm(partita_data, db, ctx)
     
     db.commit()
     db.refresh(db_partita)
@@ -1956,30 +2163,28 @@ async def confirm_partita_anagrafe(
     }
 
 
-@router.post("/gruppi-decessi/confirm", status_code=status.HTTP_201_CREATED)
-async def confirm_gruppo_decessi_anagrafe(
-    gruppo_data: dict,
-    db: Session = Depends(get_db)
-):
-    """
-    Conferma un gruppo di decessi identificato dall'anagrafe e crea il gruppo nel database.
-    Crea anche i singoli decessi e aggiorna lo stato degli animali.
-    """
-    from app.models.allevamento.gruppo_decessi import GruppoDecessi
-    from app.models.allevamento.decesso import Decesso
-    from app.models.allevamento.animale import Animale
-    from app.schemas.allevamento.gruppo_decessi import GruppoDecessiConfirm, GruppoDecessiResponse
-    from decimal import Decimal
-    from datetime import datetime
+def _parse_gruppo_decessi_confirm(gruppo_data: dict):
+    """Valida il payload di conferma gruppo decessi (400 se non valido)."""
+    from app.schemas.allevamento.gruppo_decessi import GruppoDecessiConfirm
     
-    # Valida i dati usando lo schema
     try:
-        gruppo_confirm = GruppoDecessiConfirm(**gruppo_data)
+        return GruppoDecessiConfirm(**gruppo_data)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Dati non validi: {str(e)}"
         )
+
+
+def _apply_gruppo_decessi_confirm(gruppo_confirm, db: Session, ctx: "_AnagrafeConfirmContext"):
+    """
+    Applica la conferma di un gruppo decessi nella sessione (senza commit).
+    Restituisce (gruppo, animali_aggiornati, animali_non_trovati, decessi_creati).
+    """
+    from app.models.allevamento.gruppo_decessi import GruppoDecessi
+    from app.models.allevamento.decesso import Decesso
+    from decimal import Decimal
+    from datetime import datetime
     
     # Estrai dati dalla richiesta
     azienda_id = gruppo_confirm.azienda_id
@@ -2045,21 +2250,25 @@ async def confirm_gruppo_decessi_anagrafe(
     animali_non_trovati = []
     decessi_creati = []
     
+    # Animali e decessi già registrati caricati in blocco (niente query per capo)
+    ctx.prefetch_animali(codici_capi)
+    animali_ids = [
+        ctx.animali_by_auricolare[codice].id
+        for codice in codici_capi
+        if codice in ctx.animali_by_auricolare
+    ]
+    animali_con_decesso = {
+        row[0]
+        for row in db.query(Decesso.animale_id).filter(Decesso.animale_id.in_(animali_ids))
+    } if animali_ids else set()
+    
     for codice_capo in codici_capi:
-        # Cerca l'animale
-        animale = db.query(Animale).filter(
-            Animale.auricolare == codice_capo,
-            Animale.azienda_id == azienda_id,
-            Animale.deleted_at.is_(None)
-        ).first()
+        animale = ctx.animali_by_auricolare.get(codice_capo)
         
         if animale:
             # Verifica se esiste già un decesso per questo animale
-            existing_decesso = db.query(Decesso).filter(
-                Decesso.animale_id == animale.id
-            ).first()
-            
-            if not existing_decesso:
+            if animale.id not in animali_con_decesso:
+                animali_con_decesso.add(animale.id)
                 # Estrai dati completi per questo animale (se disponibili)
                 animale_dati = None
                 if gruppo_confirm.animali_dati and codice_capo in gruppo_confirm.animali_dati:
@@ -2142,6 +2351,39 @@ async def confirm_gruppo_decessi_anagrafe(
         else:
             animali_non_trovati.append(codice_capo)
     
+    # Registra i decessi nell'indice anagrafe: le prossime sincronizzazioni li salteranno
+    from app.services.amministrazione.sincronizzazione_anagrafe import EVENTO_DECESSO, record_capo_events
+    record_capo_events(
+        db,
+        azienda_id,
+        [
+            (codice_capo, EVENTO_DECESSO, data_uscita, codice_stalla_decesso)
+            for codice_capo in codici_capi
+            if codice_capo not in animali_non_trovati
+        ],
+        gruppo_decessi_id=db_gruppo.id,
+    )
+    
+    return db_gruppo, animali_aggiornati, animali_non_trovati, decessi_creati
+
+
+@router.post("/gruppi-decessi/confirm", status_code=status.HTTP_201_CREATED)
+async def confirm_gruppo_decessi_anagrafe(
+    gruppo_data: dict,
+    db: Session = Depends(get_db)
+):
+    """
+    Conferma un gruppo di decessi identificato dall'anagrafe e crea il gruppo nel database.
+    Crea anche i singoli decessi e aggiorna lo stato degli animali.
+    """
+    from app.schemas.allevamento.gruppo_decessi import GruppoDecessiResponse
+    
+    gruppo_confirm = _parse_gruppo_decessi_confirm(gruppo_data)
+    ctx = _AnagrafeConfirmContext(db, gruppo_confirm.azienda_id)
+    db_gruppo, animali_aggiornati, animali_non_trovati, decessi_creati = _apply_gruppo_decessi_confirm(
+        gruppo_confirm, db, ctx
+    )
+    
     db.commit()
     db.refresh(db_gruppo)
     
@@ -2156,3 +2398,112 @@ async def confirm_gruppo_decessi_anagrafe(
     }
 
 
+@router.post("/sincronizza-anagrafe/confirm", status_code=status.HTTP_200_OK)
+async def confirm_anagrafe_batch(
+    payload: AnagrafeConfirmBatch,
+    db: Session = Depends(get_db)
+):
+    """
+    Conferma in blocco partite e gruppi decessi di uno stesso upload anagrafe.
+    
+    Gli animali referenziati sono caricati con poche query iniziali; ogni elemento
+    è applicato in un savepoint (un errore annulla solo quell'elemento) e si esegue
+    commit ogni CONFIRM_BATCH_COMMIT_SIZE elementi. Restituisce l'esito per elemento.
+    """
+    from app.services.allevamento.censimento_service import defer_censimento, flush_censimento
+    
+    # I commit intermedi non devono scadere gli animali in cache (eviterebbe il prefetch)
+    db.expire_on_commit = False
+    # Censimento giornaliero ricalcolato una volta sola a fine lotto
+    defer_censimento(db)
+    contesti: Dict[int, _AnagrafeConfirmContext] = {}
+    
+    def _contesto(azienda_id: int) -> _AnagrafeConfirmContext:
+        if azienda_id not in contesti:
+            contesti[azienda_id] = _AnagrafeConfirmContext(db, azienda_id)
+        return contesti[azienda_id]
+    
+    # Prefetch unico di tutti i capi citati nell'upload, per azienda
+    codici_per_azienda: Dict[int, List[str]] = {}
+    for partita_data in payload.partite:
+        codici = codici_per_azienda.setdefault(partita_data.azienda_id, [])
+        codici.extend(partita_data.codici_capi or [])
+        codici.extend(p.auricolare for p in (partita_data.pesi_individuali or []) if p.auricolare)
+        codici.extend((partita_data.animali_dati or {}).keys())
+    for gruppo_data in payload.gruppi_decessi:
+        azienda_id = gruppo_data.get("azienda_id")
+        if isinstance(azienda_id, int):
+            codici_per_azienda.setdefault(azienda_id, []).extend(gruppo_data.get("codici_capi") or [])
+    for azienda_id, codici in codici_per_azienda.items():
+        _contesto(azienda_id).prefetch_animali(codici)
+    
+    risultati: List[dict] = []
+    da_committare = 0
+    
+    def _registra_errore(tipo: str, indice: int, azienda_id: Optional[int], exc: Exception) -> None:
+        if isinstance(exc, HTTPException):
+            errore = exc.detail
+        elif isinstance(exc, IntegrityError):
+            errore = "Elemento già confermato o in conflitto con dati esistenti"
+        else:
+            errore = str(exc)
+        risultati.append({"tipo": tipo, "indice": indice, "successo": False, "errore": errore})
+        if azienda_id in contesti:
+            contesti[azienda_id].reset_after_rollback()
+    
+    for indice, partita_data in enumerate(payload.partite):
+        ctx = _contesto(partita_data.azienda_id)
+        try:
+            with db.begin_nested():
+                db_partita, animali_aggiornati, animali_non_trovati = _apply_partita_confirm(partita_data, db, ctx)
+        except Exception as exc:
+            _registra_errore("partita", indice, partita_data.azienda_id, exc)
+            continue
+        risultati.append({
+            "tipo": "partita",
+            "indice": indice,
+            "successo": True,
+            "id": db_partita.id,
+            "numero_partita": db_partita.numero_partita,
+            "animali_aggiornati": animali_aggiornati,
+            "animali_non_trovati": animali_non_trovati or None,
+        })
+        da_committare += 1
+        if da_committare >= CONFIRM_BATCH_COMMIT_SIZE:
+            db.commit()
+            da_committare = 0
+    
+    for indice, gruppo_data in enumerate(payload.gruppi_decessi):
+        azienda_id = gruppo_data.get("azienda_id")
+        try:
+            gruppo_confirm = _parse_gruppo_decessi_confirm(gruppo_data)
+            ctx = _contesto(gruppo_confirm.azienda_id)
+            with db.begin_nested():
+                db_gruppo, animali_aggiornati, animali_non_trovati, decessi_creati = _apply_gruppo_decessi_confirm(
+                    gruppo_confirm, db, ctx
+                )
+        except Exception as exc:
+            _registra_errore("gruppo_decessi", indice, azienda_id, exc)
+            continue
+        risultati.append({
+            "tipo": "gruppo_decessi",
+            "indice": indice,
+            "successo": True,
+            "id": db_gruppo.id,
+            "animali_aggiornati": animali_aggiornati,
+            "animali_non_trovati": animali_non_trovati or None,
+            "decessi_creati": len(decessi_creati),
+        })
+        da_committare += 1
+        if da_committare >= CONFIRM_BATCH_COMMIT_SIZE:
+            db.commit()
+            da_committare = 0
+    
+    flush_censimento(db)
+    
+    confermati = sum(1 for r in risultati if r["successo"])
+    return {
+        "confermati": confermati,
+        "errori": len(risultati) - confermati,
+        "risultati": risultati,
+    }
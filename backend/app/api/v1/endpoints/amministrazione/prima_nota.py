@@ -7,7 +7,7 @@ from typing import List, Optional
 from datetime import date
 
 from app.core.database import get_db
-from app.models.amministrazione.pn import PNTipoOperazione, PNStatoMovimento, PNMovimento
+from app.models.amministrazione.pn import PNConto, PNTipoOperazione, PNStatoMovimento, PNMovimento
 from app.schemas.amministrazione import (
     PNContoIbanCreate,
     PNContoIbanResponse,
@@ -24,6 +24,8 @@ from app.schemas.amministrazione import (
     PNMovimentoUpdate,
     PNMovimentoResponse,
     PNDocumentoApertoResponse,
+    PNSaldoContoResponse,
+    PNEstrattoContoResponse,
     SoccidaAccontoCreate,
     SoccidaAccontoResponse,
     SyncFattureResponse,
@@ -48,6 +50,11 @@ from app.services.amministrazione.prima_nota_service import (
     delete_categoria as pn_delete_categoria,
     list_categorie as pn_list_categorie,
 )
+from app.services.amministrazione.pn_ricerca_service import PNModalitaRicerca
+from app.services.amministrazione.pn_saldi_service import (
+    estratto_conto as pn_estratto_conto,
+    saldo_al as pn_saldo_al,
+)
 from app.services.amministrazione.prima_nota_automation import (
     ensure_prima_nota_for_soccida_acconto,
     sync_prima_nota_fatture,
@@ -158,6 +165,36 @@ async def prima_nota_delete_conto_api(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
 
 
+@router.get("/prima-nota/conti/{conto_id}/saldo", response_model=PNSaldoContoResponse)
+async def prima_nota_saldo_conto_api(
+    conto_id: int,
+    data: Optional[date] = Query(None, description="Saldo a fine giornata (default: oggi)"),
+    db: Session = Depends(get_db),
+):
+    """Saldo del conto a una data, dai saldi mensili (solo movimenti definitivi)"""
+    conto = db.get(PNConto, conto_id)
+    if not conto:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conto non trovato.")
+    giorno = data or date.today()
+    return PNSaldoContoResponse(conto_id=conto_id, data=giorno, saldo=pn_saldo_al(db, conto, giorno))
+
+
+@router.get("/prima-nota/conti/{conto_id}/estratto", response_model=PNEstrattoContoResponse)
+async def prima_nota_estratto_conto_api(
+    conto_id: int,
+    data_da: date = Query(..., description="Data iniziale (inclusa)"),
+    data_a: date = Query(..., description="Data finale (inclusa)"),
+    db: Session = Depends(get_db),
+):
+    """Estratto conto del periodo con saldo progressivo riga per riga"""
+    if data_a < data_da:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="data_a deve essere successiva a data_da.")
+    conto = db.get(PNConto, conto_id)
+    if not conto:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conto non trovato.")
+    return PNEstrattoContoResponse(**pn_estratto_conto(db, conto, data_da, data_a))
+
+
 @router.get("/prima-nota/categorie", response_model=List[PNCategoriaResponse])
 async def list_categorie_api(
     azienda_id: int = Query(..., description="ID azienda"),
@@ -482,25 +519,37 @@ async def prima_nota_movimenti(
     partita_id: Optional[int] = Query(None, description="Filtra per partita animale"),
     contratto_soccida_id: Optional[int] = Query(None, description="Filtra per contratto soccida"),
     search: Optional[str] = Query(None),
+    search_mode: PNModalitaRicerca = Query(
+        PNModalitaRicerca.CONTIENE,
+        description="contiene: sottostringa; parole: ricerca full-text (parole, \"frasi\", -esclusioni)",
+    ),
     data_da: Optional[date] = Query(None),
     data_a: Optional[date] = Query(None),
+    cursore: Optional[str] = Query(None, description="Cursore restituito dalla pagina precedente"),
+    limit: int = Query(200, ge=1, le=1000),
     db: Session = Depends(get_db),
 ):
-    """Get all movimenti con filtri"""
-    return pn_list_movimenti(
-        db,
-        azienda_id,
-        conto_id=conto_id,
-        tipo_operazione=tipo_operazione,
-        stato=stato,
-        categoria_id=categoria_id,
-        attrezzatura_id=attrezzatura_id,
-        partita_id=partita_id,
-        contratto_soccida_id=contratto_soccida_id,
-        search=search,
-        data_da=data_da,
-        data_a=data_a,
-    )
+    """Get movimenti con filtri (paginazione a cursore, riepilogo su tutti i filtrati)"""
+    try:
+        return pn_list_movimenti(
+            db,
+            azienda_id,
+            conto_id=conto_id,
+            tipo_operazione=tipo_operazione,
+            stato=stato,
+            categoria_id=categoria_id,
+            attrezzatura_id=attrezzatura_id,
+            partita_id=partita_id,
+            contratto_soccida_id=contratto_soccida_id,
+            search=search,
+            search_mode=search_mode,
+            data_da=data_da,
+            data_a=data_a,
+            cursore=cursore,
+            limit=limit,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
 
 @router.post("/prima-nota/movimenti", response_model=PNMovimentoResponse, status_code=status.HTTP_201_CREATED)
@@ -608,10 +657,12 @@ async def prima_nota_delete_movimento_api(
 @router.get("/prima-nota/documenti-aperti", response_model=List[PNDocumentoApertoResponse])
 async def prima_nota_documenti_aperti(
     azienda_id: int = Query(..., description="ID azienda"),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Se omesso restituisce tutti i documenti aperti"),
     db: Session = Depends(get_db),
 ):
-    """Get all documenti aperti (fatture non pagate, etc.)"""
-    return pn_get_documenti_aperti(db, azienda_id)
+    """Get documenti aperti (fatture con residuo da pagare/incassare), dalla più recente"""
+    return pn_get_documenti_aperti(db, azienda_id, skip=skip, limit=limit)
 
 
 @router.post("/prima-nota/soccida-acconto", response_model=SoccidaAccontoResponse, status_code=status.HTTP_201_CREATED)
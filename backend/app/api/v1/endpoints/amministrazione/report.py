@@ -4,7 +4,7 @@ Report endpoints
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import func
 from app.services.amministrazione.report_allevamento_service import to_decimal
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
@@ -21,9 +21,7 @@ from app.models.amministrazione import (
 from app.models.amministrazione.fattura_amministrazione import TipoFattura
 from app.models.amministrazione.report_allevamento_fatture import ReportAllevamentoFattureUtilizzate
 from app.services.amministrazione.report_allevamento_service import to_decimal
-from app.models.amministrazione.pn import PNMovimento, PNTipoOperazione
 from app.models.allevamento.azienda import Azienda
-from app.models.amministrazione import Fornitore
 from app.schemas.amministrazione import FatturaAmministrazioneResponse
 from app.services.amministrazione.report_allevamento_service import calculate_report_allevamento_data
 # PDF imports lazy - caricati solo quando servono per risparmiare memoria
@@ -465,7 +463,7 @@ async def report_allevamento(
         )
     
     # Lazy import per risparmiare memoria all'avvio
-    from app.utils.pdf_generator import generate_report_allevamento_pdf
+    from app.services.pdf_rendering_service import render_pdf, iter_pdf_file
     from app.utils.pdf_layout import branding_from_azienda
     
     branding = None
@@ -480,7 +478,11 @@ async def report_allevamento(
             if azienda:
                 branding = branding_from_azienda(azienda)
     
-    pdf_buffer = generate_report_allevamento_pdf(report_data, branding=branding)
+    # Rendering nel process pool (fuori dall'event loop) in modalità chunked:
+    # tabelle divise per pagina e PDF su file temporaneo, inviato al client a blocchi
+    pdf_path = await render_pdf(
+        "generate_report_allevamento_pdf", report_data, branding=branding, chunked=True
+    )
     if data_uscita:
         filename = f"report_allevamento_uscita_del_{data_uscita.strftime('%Y-%m-%d')}.pdf"
     else:
@@ -488,15 +490,139 @@ async def report_allevamento(
             f"report_allevamento_uscita_dal_{data_uscita_da.strftime('%Y-%m-%d')}"
             f"_al_{data_uscita_a.strftime('%Y-%m-%d')}.pdf"
         )
-    pdf_buffer.seek(0)
     
     return StreamingResponse(
-        pdf_buffer,
+        iter_pdf_file(pdf_path),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
+@router.get("/report/allevamento/batch")
+async def report_allevamento_batch(
+    azienda_id: int = Query(..., description="ID azienda"),
+    data_uscita_da: date = Query(..., description="Data inizio intervallo uscite"),
+    data_uscita_a: date = Query(..., description="Data fine intervallo uscite"),
+    contratti: str = Query("all", description="'all' oppure lista ID contratti soccida separati da virgola"),
+    db: Session = Depends(get_db),
+):
+    """
+    Esporta in un unico ZIP un report allevamento per ogni contratto soccida con uscite nel periodo.
+    Le uscite dell'azienda vengono caricate una sola volta e i PDF generati in parallelo.
+    """
+    import os
+    import re
+    import tempfile
+    import zipfile
+
+    from app.services.amministrazione.report_allevamento_service import load_uscite_allevamento_dataset
+    from app.services.pdf_rendering_service import discard_pdf_file, iter_pdf_file, render_pdfs
+    from app.utils.pdf_layout import branding_from_azienda
+
+    if data_uscita_a < data_uscita_da:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="data_uscita_a non può essere precedente a data_uscita_da"
+        )
+
+    contratti_richiesti: Optional[List[int]] = None
+    if contratti.strip().lower() != "all":
+        try:
+            contratti_richiesti = [int(x.strip()) for x in contratti.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="contratti deve essere 'all' oppure una lista di numeri separati da virgola",
+            )
+        if not contratti_richiesti:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Seleziona almeno un contratto",
+            )
+
+    azienda = db.query(Azienda).filter(Azienda.id == azienda_id).first()
+    if not azienda:
+        raise HTTPException(status_code=404, detail="Azienda non trovata")
+    branding = branding_from_azienda(azienda)
+
+    # Dataset uscite condiviso da tutti i report del batch
+    dataset = load_uscite_allevamento_dataset(db, azienda_id, data_uscita_da, data_uscita_a)
+    contratti_map = {
+        cid: contratto
+        for cid, contratto in dataset["contratti_map"].items()
+        if contratto.azienda_id == azienda_id and contratto.deleted_at is None
+    }
+    if contratti_richiesti is None:
+        contratti_ids = sorted(contratti_map)
+    else:
+        contratti_ids = [cid for cid in dict.fromkeys(contratti_richiesti) if cid in contratti_map]
+
+    if not contratti_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Nessun contratto soccida con uscite nel periodo richiesto"
+        )
+
+    jobs = []
+    nomi_file = []
+    for contratto_id in contratti_ids:
+        report_data = calculate_report_allevamento_data(
+            db=db,
+            data_uscita=None,
+            data_inizio=data_uscita_da,
+            data_fine=data_uscita_a,
+            azienda_id=azienda_id,
+            contratto_soccida_id=contratto_id,
+            dataset=dataset,
+        )
+        if report_data.get('totale_capi', 0) == 0:
+            continue
+        numero = contratti_map[contratto_id].numero_contratto or str(contratto_id)
+        numero = re.sub(r"[^A-Za-z0-9_.-]+", "_", numero).strip("_") or str(contratto_id)
+        nomi_file.append(f"report_allevamento_contratto_{numero}.pdf")
+        jobs.append(("generate_report_allevamento_pdf", (report_data,), {"branding": branding, "chunked": True}))
+    del dataset
+
+    if not jobs:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Nessun animale trovato per il periodo richiesto"
+        )
+
+    risultati = await render_pdfs(jobs)
+
+    fd, zip_path = tempfile.mkstemp(prefix="regifarm_report_", suffix=".zip")
+    errori = []
+    try:
+        with os.fdopen(fd, "wb") as zip_file, zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as archive:
+            for nome_file, risultato in zip(nomi_file, risultati):
+                if isinstance(risultato, Exception):
+                    errori.append(f"{nome_file}: {risultato}")
+                    continue
+                try:
+                    archive.write(risultato, arcname=nome_file)
+                finally:
+                    discard_pdf_file(risultato)
+            if errori:
+                archive.writestr("errori.txt", "\n".join(errori))
+    except Exception:
+        for risultato in risultati:
+            if isinstance(risultato, str):
+                discard_pdf_file(risultato)
+        discard_pdf_file(zip_path)
+        raise
+
+    filename = (
+        f"report_allevamento_contratti_dal_{data_uscita_da.strftime('%Y-%m-%d')}"
+        f"_al_{data_uscita_a.strftime('%Y-%m-%d')}.zip"
+    )
+    return StreamingResponse(
+        iter_pdf_file(zip_path),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @router.get("/report/allevamento/per-partita")
 async def report_allevamento_per_partita(
     azienda_id: Optional[int] = Query(None, description="ID azienda"),
@@ -536,7 +662,7 @@ async def report_allevamento_per_partita(
             calculate_riepilogo_per_partita_by_ids,
             calculate_riepilogo_valore_per_partite_ids,
         )
-        from app.utils.pdf_generator import generate_report_allevamento_per_partita_pdf
+        from app.services.pdf_rendering_service import render_pdf, iter_pdf_file
         from app.utils.pdf_layout import branding_from_azienda
 
         riepilogo = calculate_riepilogo_per_partita_by_ids(
@@ -575,11 +701,12 @@ async def report_allevamento_per_partita(
                 azienda = db.query(Azienda).filter(Azienda.id == contratto.azienda_id).first()
                 if azienda:
                     branding = branding_from_azienda(azienda)
-        pdf_buffer = generate_report_allevamento_per_partita_pdf(report_data, branding=branding)
+        pdf_path = await render_pdf(
+            "generate_report_allevamento_per_partita_pdf", report_data, branding=branding
+        )
         filename = "report_allevamento_per_partite_selezionate.pdf"
-        pdf_buffer.seek(0)
         return StreamingResponse(
-            pdf_buffer,
+            iter_pdf_file(pdf_path),
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"},
         )
@@ -648,7 +775,7 @@ async def report_allevamento_per_partita(
             detail="Nessun animale trovato per il periodo richiesto"
         )
 
-    from app.utils.pdf_generator import generate_report_allevamento_per_partita_pdf
+    from app.services.pdf_rendering_service import render_pdf, iter_pdf_file
     from app.utils.pdf_layout import branding_from_azienda
 
     branding = None
@@ -663,7 +790,9 @@ async def report_allevamento_per_partita(
             if azienda:
                 branding = branding_from_azienda(azienda)
 
-    pdf_buffer = generate_report_allevamento_per_partita_pdf(report_data, branding=branding)
+    pdf_path = await render_pdf(
+        "generate_report_allevamento_per_partita_pdf", report_data, branding=branding
+    )
     if data_uscita:
         filename = f"report_allevamento_per_partita_uscita_del_{data_uscita.strftime('%Y-%m-%d')}.pdf"
     else:
@@ -671,10 +800,9 @@ async def report_allevamento_per_partita(
             f"report_allevamento_per_partita_dal_{data_uscita_da.strftime('%Y-%m-%d')}"
             f"_al_{data_uscita_a.strftime('%Y-%m-%d')}.pdf"
         )
-    pdf_buffer.seek(0)
 
     return StreamingResponse(
-        pdf_buffer,
+        iter_pdf_file(pdf_path),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -785,102 +913,100 @@ async def get_contropartite_prima_nota(
     db: Session = Depends(get_db),
 ):
     """Restituisce la lista delle contropartite disponibili per i movimenti prima nota."""
-    contropartite = db.query(
-        func.distinct(PNMovimento.contropartita_nome).label('nome')
-    ).filter(
-        PNMovimento.azienda_id == azienda_id,
-        PNMovimento.contropartita_nome.isnot(None),
-        PNMovimento.contropartita_nome != '',
-        PNMovimento.deleted_at.is_(None)
-    ).order_by(PNMovimento.contropartita_nome).all()
-    
+    from app.services.amministrazione.pn_contropartite_service import list_contropartite
+
+    contropartite = list_contropartite(db, azienda_id)
     return {
-        "contropartite": [c.nome for c in contropartite if c.nome]
+        "contropartite": [c.nome for c in contropartite],
+        "elenco": [
+            {"id": c.id, "nome": c.nome, "fornitore_id": c.fornitore_id}
+            for c in contropartite
+        ],
     }
 
 
+def _get_contropartita_or_404(
+    db: Session,
+    azienda_id: int,
+    contropartita_id: Optional[int],
+    contropartita_nome: Optional[str],
+):
+    from app.services.amministrazione.pn_contropartite_service import get_contropartita
+
+    if contropartita_id is None and not contropartita_nome:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specificare contropartita_id o contropartita_nome",
+        )
+    contropartita = get_contropartita(db, azienda_id, contropartita_id=contropartita_id, nome=contropartita_nome)
+    if not contropartita:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Nessun movimento trovato per il fornitore/cliente '{contropartita_nome or contropartita_id}'"
+        )
+    return contropartita
+
+
+@router.get("/report/prima-nota/dare-avere/movimenti")
+async def report_prima_nota_dare_avere_movimenti(
+    azienda_id: int = Query(..., description="ID azienda"),
+    contropartita_id: Optional[int] = Query(None, description="ID contropartita (da /report/prima-nota/contropartite)"),
+    contropartita_nome: Optional[str] = Query(None, description="Nome fornitore/cliente (contropartita)"),
+    data_da: Optional[date] = Query(None, description="Data inizio periodo"),
+    data_a: Optional[date] = Query(None, description="Data fine periodo"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """Dare/avere di un fornitore/cliente in JSON, paginato, con saldo progressivo e totali del periodo."""
+    from app.services.amministrazione.pn_contropartite_service import estratto_contropartita
+
+    contropartita = _get_contropartita_or_404(db, azienda_id, contropartita_id, contropartita_nome)
+    return estratto_contropartita(db, contropartita, data_da, data_a, skip=skip, limit=limit)
+
+
 @router.get("/report/prima-nota/dare-avere")
 async def report_prima_nota_dare_avere(
     azienda_id: int = Query(..., description="ID azienda"),
-    contropartita_nome: str = Query(..., description="Nome fornitore/cliente (contropartita)"),
+    contropartita_nome: Optional[str] = Query(None, description="Nome fornitore/cliente (contropartita)"),
+    contropartita_id: Optional[int] = Query(None, description="ID contropartita (alternativo al nome)"),
     data_da: Optional[date] = Query(None, description="Data inizio periodo"),
     data_a: Optional[date] = Query(None, description="Data fine periodo"),
     db: Session = Depends(get_db),
 ):
     """Genera report prima nota dare/avere per un fornitore/cliente specifico."""
-    query = db.query(PNMovimento).filter(
-        PNMovimento.azienda_id == azienda_id,
-        PNMovimento.contropartita_nome == contropartita_nome,
-        PNMovimento.deleted_at.is_(None)
+    from app.services.amministrazione.pn_contropartite_service import (
+        dati_fornitore_cliente,
+        estratto_contropartita,
     )
-    
-    if data_da:
-        query = query.filter(PNMovimento.data >= data_da)
-    if data_a:
-        query = query.filter(PNMovimento.data <= data_a)
-    
-    movimenti = query.order_by(PNMovimento.data.asc(), PNMovimento.created_at.asc()).all()
-    
-    if not movimenti:
+
+    contropartita = _get_contropartita_or_404(db, azienda_id, contropartita_id, contropartita_nome)
+    estratto = estratto_contropartita(db, contropartita, data_da, data_a)
+    if not estratto["movimenti"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Nessun movimento trovato per il fornitore/cliente '{contropartita_nome}'"
+            detail=f"Nessun movimento trovato per il fornitore/cliente '{contropartita.nome}'"
         )
-    
-    movimenti_data = []
-    totale_dare = Decimal('0.00')
-    totale_avere = Decimal('0.00')
-    
-    for movimento in movimenti:
-        if movimento.tipo_operazione == PNTipoOperazione.ENTRATA:
-            dare = movimento.importo
-            avere = Decimal('0.00')
-            totale_dare += dare
-        else:
-            dare = Decimal('0.00')
-            avere = movimento.importo
-            totale_avere += avere
-        
-        movimenti_data.append({
-            'data': movimento.data.strftime('%d/%m/%Y') if movimento.data else '',
-            'descrizione': movimento.descrizione or '',
-            'dare': float(dare),
-            'avere': float(avere),
-        })
-    
-    saldo = totale_dare - totale_avere
-    
-    fornitore_cliente_data = {'nome': contropartita_nome}
-    
-    fornitore = db.query(Fornitore).filter(
-        or_(
-            Fornitore.nome == contropartita_nome,
-            Fornitore.partita_iva == contropartita_nome,
-        )
-    ).first()
-    
-    if fornitore:
-        fornitore_cliente_data.update({
-            'nome': fornitore.nome or contropartita_nome,
-            'piva': fornitore.partita_iva or '',
-            'indirizzo': fornitore.indirizzo or '',
-            'cap': fornitore.indirizzo_cap or '',
-            'citta': fornitore.indirizzo_comune or '',
-            'provincia': fornitore.indirizzo_provincia or '',
-            'telefono': fornitore.telefono or '',
-            'email': fornitore.email or '',
-        })
-    
+    contropartita_nome = contropartita.nome
+
     report_data = {
-        'fornitore_cliente': fornitore_cliente_data,
-        'movimenti': movimenti_data,
-        'totale_dare': float(totale_dare),
-        'totale_avere': float(totale_avere),
-        'saldo': float(saldo),
+        'fornitore_cliente': dati_fornitore_cliente(db, contropartita),
+        'movimenti': [
+            {
+                'data': movimento['data'].strftime('%d/%m/%Y') if movimento['data'] else '',
+                'descrizione': movimento['descrizione'],
+                'dare': float(movimento['dare']),
+                'avere': float(movimento['avere']),
+            }
+            for movimento in estratto['movimenti']
+        ],
+        'totale_dare': float(estratto['totale_dare']),
+        'totale_avere': float(estratto['totale_avere']),
+        'saldo': float(estratto['saldo']),
     }
     
     # Lazy import per risparmiare memoria all'avvio
-    from app.utils.pdf_generator import generate_prima_nota_dare_avere_pdf
+    from app.services.pdf_rendering_service import render_pdf, iter_pdf_file
     from app.utils.pdf_layout import branding_from_azienda
     
     azienda = db.query(Azienda).filter(Azienda.id == azienda_id).first()
@@ -888,12 +1014,11 @@ async def report_prima_nota_dare_avere(
     if azienda:
         branding = branding_from_azienda(azienda)
     
-    pdf_buffer = generate_prima_nota_dare_avere_pdf(report_data, branding=branding)
+    pdf_path = await render_pdf("generate_prima_nota_dare_avere_pdf", report_data, branding=branding)
     filename = f"report_prima_nota_dare_avere_{contropartita_nome.replace(' ', '_')}_{datetime.utcnow().strftime('%Y%m%d_%H%M')}.pdf"
-    pdf_buffer.seek(0)
     
     return StreamingResponse(
-        pdf_buffer,
+        iter_pdf_file(pdf_path),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
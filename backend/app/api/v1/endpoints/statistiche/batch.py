@@ -2,8 +2,8 @@
 Statistiche endpoint - Dashboard statistics
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_, case, extract
+from sqlalchemy.orm import Session, joinedload, join as orm_join
+from sqlalchemy import func, and_, or_, case, extract, select, true, cast, String
 from typing import Optional, List, Dict, Any
 from datetime import date, datetime, timedelta
 from decimal import Decimal
@@ -27,138 +27,200 @@ from app.models.amministrazione.attrezzatura import Attrezzatura, ScadenzaAttrez
 from app.models.amministrazione.partita_animale import PartitaAnimale, TipoPartita
 from app.models.amministrazione.partita_animale_animale import PartitaAnimaleAnimale
 
+from app.models.alimentazione.componente_alimentare import ComponenteAlimentare
+from app.models.alimentazione.mangime_confezionato import MangimeConfezionato
+from app.models.alimentazione.piano_alimentazione import PianoAlimentazione
+from app.models.amministrazione.fornitore import Fornitore
+from app.services.statistiche.batch_cache import cached_batch, register_batch
+
 router = APIRouter()
 
+# Tabelle lette da ciascun endpoint batch: le scritture su questi modelli invalidano la cache
+register_batch("home", (
+    Animale, Somministrazione, TerrenoModel, AssicurazioneAziendale,
+    ScadenzaAttrezzatura, Attrezzatura, FatturaAmministrazione,
+))
+register_batch("allevamento", (Sede, Stabilimento, Box, Animale))
+register_batch("alimentazione", (ComponenteAlimentare, MangimeConfezionato, PianoAlimentazione, Fornitore))
+register_batch("amministrazione", (FatturaAmministrazione, AssicurazioneAziendale))
 
-@router.get("/home-batch")
-def get_home_stats_batch(
-    azienda_id: Optional[int] = None,
-    db: Session = Depends(get_db)
-):
+
+def _riga_unica(db: Session, *ctes) -> Dict[str, Any]:
     """
-    Endpoint ottimizzato per caricare tutte le statistiche della home in una singola chiamata.
-    Riduce drasticamente la latenza evitando multiple roundtrip al database.
+    Esegue le CTE (ognuna restituisce una sola riga) in un unico statement:
+    SELECT ... FROM cte1 JOIN cte2 ON true ... -> una riga con tutte le colonne.
     """
+    from_clause = ctes[0]
+    for cte in ctes[1:]:
+        from_clause = from_clause.join(cte, true())
+    stmt = select(*[col for cte in ctes for col in cte.c]).select_from(from_clause)
+    return dict(db.execute(stmt).mappings().one())
+
+
+def _conteggi_cte(nome: str, chiave, *criteri):
+    """CTE con un oggetto JSON {chiave: conteggio} (GROUP BY chiave)."""
+    gruppi = select(
+        chiave.label("chiave"),
+        func.count().label("n")
+    ).where(*criteri).group_by(chiave).subquery()
+    return select(
+        func.json_object_agg(gruppi.c.chiave, gruppi.c.n).label(nome)
+    ).cte(nome)
+
+
+def _animali_stato_cte(azienda_id: Optional[int]):
+    criteri = [Animale.deleted_at.is_(None)]
+    if azienda_id:
+        criteri.append(Animale.azienda_id == azienda_id)
+    return _conteggi_cte("animali_stato", Animale.stato, *criteri)
+
+
+def _animali_stato(valore: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    return {stato or 'sconosciuto': int(count) for stato, count in (valore or {}).items()}
+
+
+def _scadenze_cte(nome: str, data_scadenza, oggi: date, scadenza_30g: date, *criteri, select_from=None):
+    """CTE con i conteggi <nome>_scadute e <nome>_in_scadenza (entro 30 giorni)."""
+    stmt = select(
+        func.count().filter(data_scadenza < oggi).label(f"{nome}_scadute"),
+        func.count().filter(data_scadenza >= oggi, data_scadenza <= scadenza_30g).label(f"{nome}_in_scadenza")
+    )
+    if select_from is not None:
+        stmt = stmt.select_from(select_from)
+    return stmt.where(*criteri).cte(nome)
+
+
+def _conteggio_cte(nome: str, colonna, *criteri, select_from=None):
+    stmt = select(func.count(colonna).label(nome))
+    if select_from is not None:
+        stmt = stmt.select_from(select_from)
+    return stmt.where(*criteri).cte(nome)
+
+
+def _home_stats(db: Session, azienda_id: Optional[int]) -> Dict[str, Any]:
     oggi = date.today()
+    scadenza_30g = oggi + timedelta(days=30)
     
     # Animali per stato (presente, venduto, macellato, deceduto, ecc.)
-    query_stati = db.query(Animale.stato, func.count(Animale.id)).filter(
-        Animale.deleted_at.is_(None)
-    )
-    if azienda_id:
-        query_stati = query_stati.filter(Animale.azienda_id == azienda_id)
-    stati_results = query_stati.group_by(Animale.stato).all()
-    animali_stato = {stato or 'sconosciuto': int(count) for stato, count in stati_results}
-    
-    # Animali presenti totale
-    animali_presenti = animali_stato.get('presente', 0)
+    animali_stato = _animali_stato_cte(azienda_id)
     
-    # Somministrazioni totali (tutti i periodi in una query)
-    query_somm = db.query(func.count(Somministrazione.id)).filter(
-        Somministrazione.deleted_at.is_(None)
-    )
+    # Somministrazioni totali (tutti i periodi)
+    somm_criteri = [Somministrazione.deleted_at.is_(None)]
+    somm_from = None
     if azienda_id:
-        query_somm = query_somm.join(Animale).filter(Animale.azienda_id == azienda_id)
-    somministrazioni_totali = query_somm.scalar() or 0
+        somm_from = orm_join(Somministrazione, Animale, Somministrazione.animale_id == Animale.id)
+        somm_criteri.append(Animale.azienda_id == azienda_id)
+    somministrazioni = _conteggio_cte("somministrazioni_totali", Somministrazione.id, *somm_criteri, select_from=somm_from)
     
     # Terreni
-    query_terreni = db.query(
-        func.count(TerrenoModel.id),
-        func.coalesce(func.sum(case((TerrenoModel.unita_misura == 'ha', TerrenoModel.superficie), else_=0)), 0)
-    ).filter(TerrenoModel.deleted_at.is_(None))
+    terreni_criteri = [TerrenoModel.deleted_at.is_(None)]
     if azienda_id:
-        query_terreni = query_terreni.filter(TerrenoModel.azienda_id == azienda_id)
-    terreni_count, terreni_superficie = query_terreni.first()
+        terreni_criteri.append(TerrenoModel.azienda_id == azienda_id)
+    terreni = select(
+        func.count(TerrenoModel.id).label("terreni_numero"),
+        func.coalesce(
+            func.sum(case((TerrenoModel.unita_misura == 'ha', TerrenoModel.superficie), else_=0)), 0
+        ).label("terreni_superficie_ha")
+    ).where(*terreni_criteri).cte("terreni")
     
     # Assicurazioni scadute e in scadenza
-    scadenza_30g = oggi + timedelta(days=30)
-    assic_scadute = db.query(func.count(AssicurazioneAziendale.id)).filter(
-        AssicurazioneAziendale.data_scadenza < oggi,
-        AssicurazioneAziendale.deleted_at.is_(None)
-    ).scalar() or 0
-    assic_in_scadenza = db.query(func.count(AssicurazioneAziendale.id)).filter(
-        AssicurazioneAziendale.data_scadenza >= oggi,
-        AssicurazioneAziendale.data_scadenza <= scadenza_30g,
-        AssicurazioneAziendale.deleted_at.is_(None)
-    ).scalar() or 0
+    assic_criteri = [AssicurazioneAziendale.deleted_at.is_(None)]
+    if azienda_id:
+        assic_criteri.append(AssicurazioneAziendale.azienda_id == azienda_id)
+    assicurazioni = _scadenze_cte("assicurazioni", AssicurazioneAziendale.data_scadenza, oggi, scadenza_30g, *assic_criteri)
     
     # Revisioni scadute e in scadenza
-    rev_scadute = db.query(func.count(ScadenzaAttrezzatura.id)).filter(
-        ScadenzaAttrezzatura.tipo == "revisione",
-        ScadenzaAttrezzatura.data_scadenza < oggi,
-        ScadenzaAttrezzatura.deleted_at.is_(None)
-    ).scalar() or 0
-    rev_in_scadenza = db.query(func.count(ScadenzaAttrezzatura.id)).filter(
-        ScadenzaAttrezzatura.tipo == "revisione",
-        ScadenzaAttrezzatura.data_scadenza >= oggi,
-        ScadenzaAttrezzatura.data_scadenza <= scadenza_30g,
-        ScadenzaAttrezzatura.deleted_at.is_(None)
-    ).scalar() or 0
+    rev_criteri = [ScadenzaAttrezzatura.tipo == "revisione", ScadenzaAttrezzatura.deleted_at.is_(None)]
+    rev_from = None
+    if azienda_id:
+        rev_from = orm_join(ScadenzaAttrezzatura, Attrezzatura, ScadenzaAttrezzatura.attrezzatura_id == Attrezzatura.id)
+        rev_criteri.append(Attrezzatura.azienda_id == azienda_id)
+    revisioni = _scadenze_cte("revisioni", ScadenzaAttrezzatura.data_scadenza, oggi, scadenza_30g, *rev_criteri, select_from=rev_from)
     
     # Attrezzature totali
-    attrezzature_count = db.query(func.count(Attrezzatura.id)).filter(
-        Attrezzatura.deleted_at.is_(None)
-    ).scalar() or 0
+    attr_criteri = [Attrezzatura.deleted_at.is_(None)]
+    if azienda_id:
+        attr_criteri.append(Attrezzatura.azienda_id == azienda_id)
+    attrezzature = _conteggio_cte("attrezzature", Attrezzatura.id, *attr_criteri)
     
     # Fatture scadute
-    fatture_scadute_count = db.query(func.count(FatturaAmministrazione.id)).filter(
+    fatt_criteri = [
         FatturaAmministrazione.data_scadenza.isnot(None),
         FatturaAmministrazione.data_scadenza < oggi,
         FatturaAmministrazione.deleted_at.is_(None)
-    ).scalar() or 0
+    ]
+    if azienda_id:
+        fatt_criteri.append(FatturaAmministrazione.azienda_id == azienda_id)
+    fatture_scadute = _conteggio_cte("fatture_scadute", FatturaAmministrazione.id, *fatt_criteri)
+    
+    riga = _riga_unica(
+        db, animali_stato, somministrazioni, terreni, assicurazioni, revisioni, attrezzature, fatture_scadute
+    )
+    stati = _animali_stato(riga["animali_stato"])
     
     return {
-        "animali_stato": animali_stato,
-        "animali_presenti": animali_presenti,
-        "somministrazioni_totali": somministrazioni_totali,
+        "animali_stato": stati,
+        "animali_presenti": stati.get('presente', 0),
+        "somministrazioni_totali": riga["somministrazioni_totali"] or 0,
         "terreni": {
-            "numero": terreni_count or 0,
-            "superficie_ha": float(terreni_superficie or 0)
+            "numero": riga["terreni_numero"] or 0,
+            "superficie_ha": float(riga["terreni_superficie_ha"] or 0)
         },
         "assicurazioni": {
-            "scadute": assic_scadute,
-            "in_scadenza": assic_in_scadenza
+            "scadute": riga["assicurazioni_scadute"] or 0,
+            "in_scadenza": riga["assicurazioni_in_scadenza"] or 0
         },
         "revisioni": {
-            "scadute": rev_scadute,
-            "in_scadenza": rev_in_scadenza
+            "scadute": riga["revisioni_scadute"] or 0,
+            "in_scadenza": riga["revisioni_in_scadenza"] or 0
         },
-        "attrezzature": attrezzature_count,
-        "fatture_scadute": fatture_scadute_count
+        "attrezzature": riga["attrezzature"] or 0,
+        "fatture_scadute": riga["fatture_scadute"] or 0
     }
 
 
-def get_sede_from_animale(db: Session, animale: Animale) -> Optional[int]:
-    """Ottiene la sede_id di un animale tramite box -> stabilimento -> sede"""
-    if animale.box_id:
-        box = db.query(Box).filter(Box.id == animale.box_id).first()
-        if box and box.stabilimento_id:
-            stabilimento = db.query(Stabilimento).filter(Stabilimento.id == box.stabilimento_id).first()
-            if stabilimento:
-                return stabilimento.sede_id
-    return None
-
-
-def build_box_to_sede_map(db: Session, azienda_id: Optional[int] = None) -> Dict[int, int]:
+@router.get("/home-batch")
+def get_home_stats_batch(
+    azienda_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Pre-carica la mappatura box_id -> sede_id per evitare N+1 queries.
-    Restituisce un dizionario {box_id: sede_id}
+    Endpoint ottimizzato per caricare tutte le statistiche della home in una singola chiamata.
+    Un solo statement (una CTE per statistica) e cache breve per azienda.
     """
-    query = db.query(Box.id, Sede.id).join(
-        Stabilimento, Box.stabilimento_id == Stabilimento.id
-    ).join(
-        Sede, Stabilimento.sede_id == Sede.id
-    ).filter(
-        Box.deleted_at.is_(None),
-        Stabilimento.deleted_at.is_(None),
-        Sede.deleted_at.is_(None)
-    )
-    
+    return cached_batch("home", azienda_id, lambda: _home_stats(db, azienda_id))
+
+
+def _allevamento_stats(db: Session, azienda_id: Optional[int]) -> Dict[str, Any]:
+    sedi_criteri = [Sede.deleted_at.is_(None)]
+    stab_criteri = [Stabilimento.deleted_at.is_(None)]
+    box_criteri = [Box.deleted_at.is_(None)]
+    stab_from = box_from = None
     if azienda_id:
-        query = query.filter(Sede.azienda_id == azienda_id)
+        sedi_criteri.append(Sede.azienda_id == azienda_id)
+        stab_from = orm_join(Stabilimento, Sede, Stabilimento.sede_id == Sede.id)
+        stab_criteri.append(Sede.azienda_id == azienda_id)
+        box_from = orm_join(Box, Stabilimento, Box.stabilimento_id == Stabilimento.id).join(
+            Sede, Stabilimento.sede_id == Sede.id
+        )
+        box_criteri.append(Sede.azienda_id == azienda_id)
     
-    results = query.all()
-    return {box_id: sede_id for box_id, sede_id in results}
+    riga = _riga_unica(
+        db,
+        _conteggio_cte("sedi", Sede.id, *sedi_criteri),
+        _conteggio_cte("stabilimenti", Stabilimento.id, *stab_criteri, select_from=stab_from),
+        _conteggio_cte("box", Box.id, *box_criteri, select_from=box_from),
+        _animali_stato_cte(azienda_id),
+    )
+    stati = _animali_stato(riga["animali_stato"])
+    
+    return {
+        "sedi": riga["sedi"] or 0,
+        "stabilimenti": riga["stabilimenti"] or 0,
+        "box": riga["box"] or 0,
+        "animali_stato": stati,
+        "animali_presenti": stati.get('presente', 0)
+    }
 
 
 @router.get("/allevamento-batch")
@@ -169,44 +231,24 @@ def get_allevamento_stats_batch(
     """
     Endpoint batch per statistiche allevamento - sedi, stabilimenti, box in una sola chiamata.
     """
-    from app.models.allevamento.sede import Sede
-    from app.models.allevamento.stabilimento import Stabilimento
-    from app.models.allevamento.box import Box
-    
-    # Sedi count
-    sedi_query = db.query(func.count(Sede.id)).filter(Sede.deleted_at.is_(None))
-    if azienda_id:
-        sedi_query = sedi_query.filter(Sede.azienda_id == azienda_id)
-    sedi_count = sedi_query.scalar() or 0
-    
-    # Stabilimenti count
-    stab_query = db.query(func.count(Stabilimento.id)).filter(Stabilimento.deleted_at.is_(None))
-    if azienda_id:
-        stab_query = stab_query.join(Sede).filter(Sede.azienda_id == azienda_id)
-    stab_count = stab_query.scalar() or 0
-    
-    # Box count
-    box_query = db.query(func.count(Box.id)).filter(Box.deleted_at.is_(None))
-    if azienda_id:
-        box_query = box_query.join(Stabilimento).join(Sede).filter(Sede.azienda_id == azienda_id)
-    box_count = box_query.scalar() or 0
-    
-    # Animali per stato
-    animali_query = db.query(Animale.stato, func.count(Animale.id)).filter(
-        Animale.deleted_at.is_(None)
-    )
-    if azienda_id:
-        animali_query = animali_query.filter(Animale.azienda_id == azienda_id)
-    animali_results = animali_query.group_by(Animale.stato).all()
-    animali_stato = {stato or 'sconosciuto': int(count) for stato, count in animali_results}
+    return cached_batch("allevamento", azienda_id, lambda: _allevamento_stats(db, azienda_id))
+
+
+def _alimentazione_stats(db: Session, azienda_id: Optional[int]) -> Dict[str, Any]:
+    ctes = []
+    for nome, modello in (
+        ("componenti", ComponenteAlimentare),
+        ("mangimi", MangimeConfezionato),
+        ("piani", PianoAlimentazione),
+        ("fornitori", Fornitore),
+    ):
+        criteri = [modello.deleted_at.is_(None)]
+        if azienda_id:
+            criteri.append(modello.azienda_id == azienda_id)
+        ctes.append(_conteggio_cte(nome, modello.id, *criteri))
     
-    return {
-        "sedi": sedi_count,
-        "stabilimenti": stab_count,
-        "box": box_count,
-        "animali_stato": animali_stato,
-        "animali_presenti": animali_stato.get('presente', 0)
-    }
+    riga = _riga_unica(db, *ctes)
+    return {nome: valore or 0 for nome, valore in riga.items()}
 
 
 @router.get("/alimentazione-batch")
@@ -217,40 +259,49 @@ def get_alimentazione_stats_batch(
     """
     Endpoint batch per statistiche alimentazione - componenti, mangimi, piani, fornitori in una sola chiamata.
     """
-    from app.models.alimentazione.componente_alimentare import ComponenteAlimentare
-    from app.models.alimentazione.mangime_confezionato import MangimeConfezionato
-    from app.models.alimentazione.piano_alimentazione import PianoAlimentazione
-    from app.models.amministrazione.fornitore import Fornitore
+    return cached_batch("alimentazione", azienda_id, lambda: _alimentazione_stats(db, azienda_id))
+
+
+def _amministrazione_stats(db: Session, azienda_id: Optional[int]) -> Dict[str, Any]:
+    oggi = date.today()
+    scadenza_30g = oggi + timedelta(days=30)
     
-    # Componenti
-    comp_query = db.query(func.count(ComponenteAlimentare.id)).filter(ComponenteAlimentare.deleted_at.is_(None))
+    fatt_criteri = [FatturaAmministrazione.deleted_at.is_(None)]
+    assic_criteri = [AssicurazioneAziendale.deleted_at.is_(None)]
     if azienda_id:
-        comp_query = comp_query.filter(ComponenteAlimentare.azienda_id == azienda_id)
-    componenti_count = comp_query.scalar() or 0
+        fatt_criteri.append(FatturaAmministrazione.azienda_id == azienda_id)
+        assic_criteri.append(AssicurazioneAziendale.azienda_id == azienda_id)
     
-    # Mangimi
-    mang_query = db.query(func.count(MangimeConfezionato.id)).filter(MangimeConfezionato.deleted_at.is_(None))
-    if azienda_id:
-        mang_query = mang_query.filter(MangimeConfezionato.azienda_id == azienda_id)
-    mangimi_count = mang_query.scalar() or 0
+    # Fatture totali e scadute
+    fatture = select(
+        func.count(FatturaAmministrazione.id).label("fatture_totali"),
+        func.count(FatturaAmministrazione.id).filter(
+            FatturaAmministrazione.data_scadenza.isnot(None),
+            FatturaAmministrazione.data_scadenza < oggi
+        ).label("fatture_scadute")
+    ).where(*fatt_criteri).cte("fatture")
     
-    # Piani
-    piani_query = db.query(func.count(PianoAlimentazione.id)).filter(PianoAlimentazione.deleted_at.is_(None))
-    if azienda_id:
-        piani_query = piani_query.filter(PianoAlimentazione.azienda_id == azienda_id)
-    piani_count = piani_query.scalar() or 0
+    # Fatture per tipo (entrata/uscita): cast a stringa per il GROUP BY
+    fatture_per_tipo = _conteggi_cte(
+        "fatture_per_tipo", func.coalesce(cast(FatturaAmministrazione.tipo, String), 'altro'), *fatt_criteri
+    )
     
-    # Fornitori
-    forn_query = db.query(func.count(Fornitore.id)).filter(Fornitore.deleted_at.is_(None))
-    if azienda_id:
-        forn_query = forn_query.filter(Fornitore.azienda_id == azienda_id)
-    fornitori_count = forn_query.scalar() or 0
+    assicurazioni = _scadenze_cte("assicurazioni", AssicurazioneAziendale.data_scadenza, oggi, scadenza_30g, *assic_criteri)
+    
+    riga = _riga_unica(db, fatture, fatture_per_tipo, assicurazioni)
+    per_tipo = {
+        str(tipo): int(count)
+        for tipo, count in (riga["fatture_per_tipo"] or {}).items()
+    }
     
     return {
-        "componenti": componenti_count,
-        "mangimi": mangimi_count,
-        "piani": piani_count,
-        "fornitori": fornitori_count
+        "fatture_totali": riga["fatture_totali"] or 0,
+        "fatture_per_tipo": per_tipo,
+        "fatture_scadute": riga["fatture_scadute"] or 0,
+        "assicurazioni": {
+            "scadute": riga["assicurazioni_scadute"] or 0,
+            "in_scadenza": riga["assicurazioni_in_scadenza"] or 0
+        }
     }
 
 
@@ -262,70 +313,4 @@ def get_amministrazione_stats_batch(
     """
     Endpoint batch per statistiche amministrazione - fatture, scadenze in una sola chiamata.
     """
-    oggi = date.today()
-    
-    # Fatture totali
-    fatture_query = db.query(func.count(FatturaAmministrazione.id)).filter(
-        FatturaAmministrazione.deleted_at.is_(None)
-    )
-    if azienda_id:
-        fatture_query = fatture_query.filter(FatturaAmministrazione.azienda_id == azienda_id)
-    fatture_totali = fatture_query.scalar() or 0
-    
-    # Fatture per tipo (entrata/uscita)
-    # Usa cast per assicurarsi che il tipo sia trattato come stringa nel GROUP BY
-    from sqlalchemy import cast, String
-    tipo_query = db.query(
-        cast(FatturaAmministrazione.tipo, String).label('tipo'),
-        func.count(FatturaAmministrazione.id)
-    ).filter(FatturaAmministrazione.deleted_at.is_(None))
-    if azienda_id:
-        tipo_query = tipo_query.filter(FatturaAmministrazione.azienda_id == azienda_id)
-    tipo_results = tipo_query.group_by('tipo').all()
-    # Converti a dizionario con chiavi stringa
-    fatture_per_tipo = {}
-    for tipo, count in tipo_results:
-        # tipo è già una stringa grazie al cast
-        tipo_str = str(tipo) if tipo else 'altro'
-        fatture_per_tipo[tipo_str] = int(count)
-    
-    # Fatture scadute
-    scadute_query = db.query(func.count(FatturaAmministrazione.id)).filter(
-        FatturaAmministrazione.data_scadenza.isnot(None),
-        FatturaAmministrazione.data_scadenza < oggi,
-        FatturaAmministrazione.deleted_at.is_(None)
-    )
-    if azienda_id:
-        scadute_query = scadute_query.filter(FatturaAmministrazione.azienda_id == azienda_id)
-    fatture_scadute = scadute_query.scalar() or 0
-    
-    # Assicurazioni scadute e in scadenza
-    scadenza_30g = oggi + timedelta(days=30)
-    assic_scadute_query = db.query(func.count(AssicurazioneAziendale.id)).filter(
-        AssicurazioneAziendale.data_scadenza < oggi,
-        AssicurazioneAziendale.deleted_at.is_(None)
-    )
-    if azienda_id:
-        assic_scadute_query = assic_scadute_query.filter(AssicurazioneAziendale.azienda_id == azienda_id)
-    assic_scadute = assic_scadute_query.scalar() or 0
-    
-    assic_in_scadenza_query = db.query(func.count(AssicurazioneAziendale.id)).filter(
-        AssicurazioneAziendale.data_scadenza >= oggi,
-        AssicurazioneAziendale.data_scadenza <= scadenza_30g,
-        AssicurazioneAziendale.deleted_at.is_(None)
-    )
-    if azienda_id:
-        assic_in_scadenza_query = assic_in_scadenza_query.filter(AssicurazioneAziendale.azienda_id == azienda_id)
-    assic_in_scadenza = assic_in_scadenza_query.scalar() or 0
-    
-    return {
-        "fatture_totali": fatture_totali,
-        "fatture_per_tipo": fatture_per_tipo,
-        "fatture_scadute": fatture_scadute,
-        "assicurazioni": {
-            "scadute": assic_scadute,
-            "in_scadenza": assic_in_scadenza
-        }
-    }
-
-
+    return cached_batch("amministrazione", azienda_id, lambda: _amministrazione_stats(db, azienda_id))
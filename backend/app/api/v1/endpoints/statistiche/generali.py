@@ -11,7 +11,6 @@ from decimal import Decimal
 from app.core.database import get_db
 from app.models.allevamento.animale import Animale
 from app.models.allevamento.azienda import Azienda
-from app.models.allevamento.sede import Sede
 from app.models.allevamento.stabilimento import Stabilimento
 from app.models.allevamento.box import Box
 from app.models.allevamento.decesso import Decesso
@@ -72,18 +71,17 @@ def get_somministrazioni(
         results = base_query.group_by(Animale.azienda_id).all()
         result = {az_id: count for az_id, count in results}
         return {"aggregazione": "azienda", "periodo": periodo, "solo_presenti": solo_presenti, "dati": result}
-    else:  # sede - richiede logica più complessa
-        # Per sede, pre-carichiamo la mappatura box -> sede
-        box_to_sede = build_box_to_sede_map(db, azienda_id)
+    else:  # sede: la sede di ogni animale è risolta dalla vista animali_sede
+        from app.services.allevamento.sede_animale_service import outerjoin_sede, sede_animale
         
-        # Query con box_id per mappatura
         query = db.query(
-            Animale.box_id,
-            Animale.codice_azienda_anagrafe,
+            sede_animale,
             func.count(Somministrazione.id)
-        ).join(Animale).filter(
+        ).select_from(Somministrazione).join(Animale)
+        query = outerjoin_sede(query).filter(
             Somministrazione.deleted_at.is_(None),
-            Animale.deleted_at.is_(None)
+            Animale.deleted_at.is_(None),
+            sede_animale.isnot(None)
         )
         
         if solo_presenti:
@@ -99,31 +97,7 @@ def get_somministrazioni(
         if azienda_id:
             query = query.filter(Animale.azienda_id == azienda_id)
         
-        results = query.group_by(Animale.box_id, Animale.codice_azienda_anagrafe).all()
-        
-        # Pre-carica mappatura codice_stalla -> sede_id
-        if azienda_id:
-            sedi = db.query(Sede).filter(Sede.azienda_id == azienda_id, Sede.deleted_at.is_(None)).all()
-        else:
-            sedi = db.query(Sede).filter(Sede.deleted_at.is_(None)).all()
-        codice_to_sede = {s.codice_stalla: s.id for s in sedi}
-        
-        result = {}
-        for box_id, codice_anagrafe, count in results:
-            sede_id_animale = None
-            
-            # 1. Prova con codice_azienda_anagrafe
-            if codice_anagrafe and codice_anagrafe in codice_to_sede:
-                sede_id_animale = codice_to_sede[codice_anagrafe]
-            
-            # 2. Usa mappatura box -> sede
-            if not sede_id_animale and box_id:
-                sede_id_animale = box_to_sede.get(box_id)
-            
-            if sede_id_animale:
-                if sede_id_animale not in result:
-                    result[sede_id_animale] = 0
-                result[sede_id_animale] += count
+        result = {sede_id: count for sede_id, count in query.group_by(sede_animale).all()}
         
         return {"aggregazione": "sede", "periodo": periodo, "solo_presenti": solo_presenti, "dati": result}
 
@@ -26,6 +26,27 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # PDF rendering (process pool fuori dall'event loop)
+    PDF_RENDER_WORKERS: int = 2
+    PDF_RENDER_MAX_QUEUE: int = 4
+    PDF_RENDER_TIMEOUT_SECONDS: float = 120.0
+    
+    # Sincronizzazione anagrafe (limiti upload BDN)
+    ANAGRAFE_MAX_FILE_SIZE_MB: int = 50
+    ANAGRAFE_MAX_ROWS: int = 25000
+    ANAGRAFE_MAX_FILES_PER_SYNC: int = 10
+    ANAGRAFE_DECODE_WORKERS: int = 2
+    
+    # Cache delle statistiche batch della dashboard (secondi, 0 = disattivata)
+    STATISTICHE_CACHE_TTL_SECONDS: float = 30.0
+    
+    # Strumentazione SQL per richiesta (header X-SQL-*, GET /metrics/sql)
+    SQL_INSTRUMENTATION_ENABLED: bool = True
+    # Avviso di possibile N+1 oltre questo numero di ripetizioni della stessa istruzione
+    SQL_N_PLUS_ONE_THRESHOLD: int = 20
+    # Abilita DELETE /metrics/sql (azzera i contatori del processo); disattivato di default
+    SQL_METRICS_RESET_ENABLED: bool = False
+    
     # Supabase integration
     SUPABASE_URL: Optional[str] = None
     SUPABASE_SERVICE_ROLE_KEY: Optional[str] = None
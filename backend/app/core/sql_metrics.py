@@ -0,0 +1,210 @@
+"""
+Strumentazione SQL per richiesta
+
+Gli eventi before/after_cursor_execute dell'engine contano le istruzioni e il
+tempo di database della richiesta HTTP in corso (ContextVar impostata dal
+middleware; vale anche per gli endpoint sincroni eseguiti nel threadpool, che
+copiano il contesto). Ogni istruzione viene ridotta a una "forma" senza
+parametri né liste IN: se la stessa forma si ripete più di
+settings.SQL_N_PLUS_ONE_THRESHOLD volte in una richiesta viene registrato un
+avviso (tipico N+1: una query per riga di un ciclo).
+
+Per ogni richiesta:
+- header X-SQL-Query-Count, X-SQL-Time-Ms, X-SQL-Max-Repeat (nelle risposte in
+  streaming valgono fino all'invio degli header);
+- totali per endpoint (metodo e percorso della route) e ultime segnalazioni N+1
+  in GET /metrics/sql.
+
+Le istruzioni eseguite fuori da una richiesta (script, warmup) non vengono misurate.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+HEADER_QUERY = "X-SQL-Query-Count"
+HEADER_TEMPO = "X-SQL-Time-Ms"
+HEADER_RIPETIZIONI = "X-SQL-Max-Repeat"
+HEADERS = [HEADER_QUERY, HEADER_TEMPO, HEADER_RIPETIZIONI]
+
+_MAX_SEGNALAZIONI = 50
+_MAX_FORMA = 300
+
+_PARAMETRO = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_STRINGA = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPAZI = re.compile(r"\s+")
+
+
+def forma_istruzione(statement: str) -> str:
+    """Istruzione senza parametri, letterali e lunghezza delle liste IN."""
+    forma = _STRINGA.sub("?", statement)
+    forma = _PARAMETRO.sub("?", forma)
+    forma = _NUMERO.sub("?", forma)
+    forma = _LISTA.sub("(?)", forma)
+    return _SPAZI.sub(" ", forma).strip()
+
+
+class MetricheRichiesta:
+    """Istruzioni SQL di una richiesta."""
+
+    __slots__ = ("query", "tempo_ms", "forme")
+
+    def __init__(self) -> None:
+        self.query = 0
+        self.tempo_ms = 0.0
+        self.forme: Counter = Counter()
+
+    def ripetizioni_max(self) -> int:
+        return max(self.forme.values(), default=0)
+
+    def headers(self) -> List[tuple]:
+        return [
+            (HEADER_QUERY.lower().encode(), str(self.query).encode()),
+            (HEADER_TEMPO.lower().encode(), f"{self.tempo_ms:.1f}".encode()),
+            (HEADER_RIPETIZIONI.lower().encode(), str(self.ripetizioni_max()).encode()),
+        ]
+
+
+_richiesta_corrente: ContextVar[Optional[MetricheRichiesta]] = ContextVar("sql_metrics_richiesta", default=None)
+
+_lock = threading.Lock()
+_per_endpoint: Dict[str, Dict[str, Any]] = {}
+_segnalazioni: Deque[Dict[str, Any]] = deque(maxlen=_MAX_SEGNALAZIONI)
+
+
+# ============ EVENTI ENGINE ============
+@event.listens_for(engine, "before_cursor_execute")
+def _prima_istruzione(conn, cursor, statement, parameters, context, executemany):
+    if _richiesta_corrente.get() is not None:
+        conn.info.setdefault("sql_metrics_inizio", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _dopo_istruzione(conn, cursor, statement, parameters, context, executemany):
+    metriche = _richiesta_corrente.get()
+    inizi = conn.info.get("sql_metrics_inizio")
+    if metriche is None or not inizi:
+        return
+    metriche.query += 1
+    metriche.tempo_ms += (time.perf_counter() - inizi.pop()) * 1000
+    metriche.forme[forma_istruzione(statement)] += 1
+
+
+@event.listens_for(engine, "handle_error")
+def _errore_istruzione(exception_context):
+    # L'istruzione fallita non arriva ad after_cursor_execute
+    connessione = exception_context.connection
+    if connessione is not None:
+        inizi = connessione.info.get("sql_metrics_inizio")
+        if inizi:
+            inizi.pop()
+
+
+# ============ AGGREGATI ============
+def _registra(endpoint: str, metriche: MetricheRichiesta) -> None:
+    soglia = settings.SQL_N_PLUS_ONE_THRESHOLD
+    ripetute = [(forma, volte) for forma, volte in metriche.forme.items() if volte > soglia]
+    for forma, volte in ripetute:
+        logger.warning(
+            "Possibile N+1 in %s: istruzione ripetuta %d volte (%d query, %.1f ms): %s",
+            endpoint, volte, metriche.query, metriche.tempo_ms, forma[:_MAX_FORMA],
+        )
+
+    with _lock:
+        totali = _per_endpoint.setdefault(
+            endpoint,
+            {"richieste": 0, "query": 0, "tempo_db_ms": 0.0, "query_max": 0, "segnalazioni_n_piu_1": 0},
+        )
+        totali["richieste"] += 1
+        totali["query"] += metriche.query
+        totali["tempo_db_ms"] += metriche.tempo_ms
+        totali["query_max"] = max(totali["query_max"], metriche.query)
+        totali["segnalazioni_n_piu_1"] += len(ripetute)
+        for forma, volte in ripetute:
+            _segnalazioni.append({
+                "endpoint": endpoint,
+                "ripetizioni": volte,
+                "istruzione": forma[:_MAX_FORMA],
+                "registrata_il": time.time(),
+            })
+
+
+def metriche_sql() -> Dict[str, Any]:
+    """Totali per endpoint (con medie per richiesta) e ultime segnalazioni N+1."""
+    with _lock:
+        endpoint = {
+            nome: {
+                **totali,
+                "tempo_db_ms": round(totali["tempo_db_ms"], 1),
+                "query_media": round(totali["query"] / totali["richieste"], 1),
+                "tempo_db_medio_ms": round(totali["tempo_db_ms"] / totali["richieste"], 1),
+            }
+            for nome, totali in sorted(_per_endpoint.items())
+        }
+        segnalazioni = list(_segnalazioni)
+    return {
+        "soglia_n_piu_1": settings.SQL_N_PLUS_ONE_THRESHOLD,
+        "endpoint": endpoint,
+        "segnalazioni_n_piu_1": segnalazioni,
+    }
+
+
+def azzera_metriche_sql() -> None:
+    with _lock:
+        _per_endpoint.clear()
+        _segnalazioni.clear()
+
+
+# ============ MIDDLEWARE ============
+def _nome_endpoint(scope) -> str:
+    # Percorso della route: più route possono avere funzioni con lo stesso nome
+    # (es. /sanitario/somministrazioni e /statistiche/somministrazioni)
+    percorso = getattr(scope.get("route"), "path", None)
+    if not percorso:
+        percorso = getattr(scope.get("endpoint"), "__name__", None) or "nessuna_route"
+    return f"{scope.get('method', '')} {percorso}"
+
+
+class SQLMetricsMiddleware:
+    """Middleware ASGI: misura le istruzioni SQL di ogni richiesta HTTP."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.SQL_INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        metriche = MetricheRichiesta()
+        token = _richiesta_corrente.set(metriche)
+        registrata = False
+
+        async def send_con_metriche(message):
+            nonlocal registrata
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + metriche.headers()
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and not registrata:
+                registrata = True
+                _registra(_nome_endpoint(scope), metriche)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_metriche)
+        finally:
+            if not registrata:
+                _registra(_nome_endpoint(scope), metriche)
+            _richiesta_corrente.reset(token)
@@ -4,7 +4,7 @@ Main application entry point
 """
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
@@ -20,6 +20,17 @@ from app.api.v1.endpoints import onboarding
 from app.api.v1.endpoints import sync
 from app.api.v1.endpoints import compatibility
 from app.core.database import warmup_pool
+from app.core.sql_metrics import HEADERS as SQL_METRICS_HEADERS, SQLMetricsMiddleware
+import app.services.allevamento.censimento_service  # noqa: F401 - registra gli hook del censimento giornaliero
+import app.services.amministrazione.scadenze_service  # noqa: F401 - registra gli hook dell'indice scadenze
+import app.services.amministrazione.pn_contropartite_service  # noqa: F401 - registra gli hook delle contropartite di Prima Nota
+import app.services.amministrazione.sincronizzazione_anagrafe  # noqa: F401 - registra gli hook dell'indice eventi anagrafe
+from app.services.pdf_rendering_service import (
+    PdfRenderBusy,
+    PdfRenderError,
+    PdfRenderTimeout,
+    shutdown_pdf_rendering,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +47,8 @@ async def lifespan(app: FastAPI):
     # Se necessario in futuro, usare un worker separato o servizio esterno
     
     yield
+    # Shutdown: termina i rendering PDF ancora in corso
+    shutdown_pdf_rendering()
     # Shutdown: Close database connections gracefully
     try:
         from app.core.database import engine, wait_for_warmup_complete
@@ -62,12 +75,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=SQL_METRICS_HEADERS,
 )
 
 # GZip compression middleware - comprime risposte > 1000 bytes
 # Riduce bandwidth del 60-80% senza impatto significativo su CPU
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+# Conteggio e tempo delle query SQL per richiesta, con avviso sui pattern N+1
+app.add_middleware(SQLMetricsMiddleware)
+
 
 # Global exception handler for database connection errors
 @app.exception_handler(OperationalError)
@@ -106,6 +123,37 @@ async def database_error_handler(request: Request, exc: OperationalError):
     )
 
 
+# Rendering PDF: coda piena, timeout o errore del processo di rendering
+@app.exception_handler(PdfRenderBusy)
+async def pdf_render_busy_handler(request: Request, exc: PdfRenderBusy):
+    """Troppi PDF in generazione: il client può riprovare"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc), "error_type": "pdf_render_busy"},
+        headers={"Retry-After": "5"},
+    )
+
+
+@app.exception_handler(PdfRenderTimeout)
+async def pdf_render_timeout_handler(request: Request, exc: PdfRenderTimeout):
+    """Generazione PDF interrotta per timeout"""
+    logger.error(f"PDF render timeout on {request.url.path}")
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": str(exc), "error_type": "pdf_render_timeout"},
+    )
+
+
+@app.exception_handler(PdfRenderError)
+async def pdf_render_error_handler(request: Request, exc: PdfRenderError):
+    """Processo di rendering PDF fallito o terminato senza risultato"""
+    logger.error(f"PDF render error on {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Generazione del PDF non riuscita. Riprova tra qualche secondo.", "error_type": "pdf_render_error"},
+    )
+
+
 # Global exception handler per errori 500 - logga traceback completo per debug
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -186,6 +234,28 @@ async def health_check_detailed():
         )
 
 
+@app.get("/metrics/sql")
+async def sql_metrics():
+    """Query SQL per endpoint (conteggi, tempo database) e ultime segnalazioni N+1"""
+    from app.core.sql_metrics import metriche_sql
+
+    return metriche_sql()
+
+
+@app.delete("/metrics/sql", status_code=status.HTTP_204_NO_CONTENT)
+async def sql_metrics_reset():
+    """Azzera le metriche SQL raccolte dal processo (solo con SQL_METRICS_RESET_ENABLED)"""
+    from app.core.config import settings
+    from app.core.sql_metrics import azzera_metriche_sql
+
+    if not settings.SQL_METRICS_RESET_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Azzeramento delle metriche SQL disabilitato (SQL_METRICS_RESET_ENABLED)",
+        )
+    azzera_metriche_sql()
+
+
 if __name__ == "__main__":
     import uvicorn
     import signal
@@ -0,0 +1,57 @@
+"""Add anagrafe_eventi_capi index table
+
+Indice persistente degli eventi anagrafe già riconciliati
+(codice_capo, tipo evento, data, codice_stalla) per rendere incrementale
+la sincronizzazione dei file BDN.
+
+Revision ID: 20261018_anagrafe_eventi
+Revises: 20260204_gruppi_stalla
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_anagrafe_eventi"
+down_revision = "20260204_gruppi_stalla"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "anagrafe_eventi_capi",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("event_hash", sa.String(length=40), nullable=False),
+        sa.Column("codice_capo", sa.String(length=50), nullable=False),
+        sa.Column("tipo_evento", sa.String(length=20), nullable=False),
+        sa.Column("data_evento", sa.Date(), nullable=False),
+        sa.Column("codice_stalla", sa.String(length=50), nullable=True),
+        sa.Column("partita_animale_id", sa.Integer(), nullable=True),
+        sa.Column("gruppo_decessi_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["partita_animale_id"], ["partite_animali.id"], ondelete="SET NULL"),
+        sa.ForeignKeyConstraint(["gruppo_decessi_id"], ["gruppi_decessi.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("azienda_id", "event_hash", name="uq_anagrafe_eventi_capi_azienda_hash"),
+    )
+    op.create_index(op.f("ix_anagrafe_eventi_capi_id"), "anagrafe_eventi_capi", ["id"], unique=False)
+    op.create_index(op.f("ix_anagrafe_eventi_capi_azienda_id"), "anagrafe_eventi_capi", ["azienda_id"], unique=False)
+    op.create_index(op.f("ix_anagrafe_eventi_capi_codice_capo"), "anagrafe_eventi_capi", ["codice_capo"], unique=False)
+    op.create_index(
+        op.f("ix_anagrafe_eventi_capi_partita_animale_id"), "anagrafe_eventi_capi", ["partita_animale_id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_anagrafe_eventi_capi_gruppo_decessi_id"), "anagrafe_eventi_capi", ["gruppo_decessi_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_anagrafe_eventi_capi_gruppo_decessi_id"), table_name="anagrafe_eventi_capi")
+    op.drop_index(op.f("ix_anagrafe_eventi_capi_partita_animale_id"), table_name="anagrafe_eventi_capi")
+    op.drop_index(op.f("ix_anagrafe_eventi_capi_codice_capo"), table_name="anagrafe_eventi_capi")
+    op.drop_index(op.f("ix_anagrafe_eventi_capi_azienda_id"), table_name="anagrafe_eventi_capi")
+    op.drop_index(op.f("ix_anagrafe_eventi_capi_id"), table_name="anagrafe_eventi_capi")
+    op.drop_table("anagrafe_eventi_capi")
@@ -0,0 +1,54 @@
+"""Add animali_sede view
+
+Sede di ogni animale risolta in SQL (codice_azienda_anagrafe -> sede,
+altrimenti box -> stabilimento -> sede), così le statistiche per sede
+possono fare GROUP BY sede_id senza mappature in Python.
+
+Revision ID: 20261018_animali_sede_view
+Revises: 20261018_censimenti_giornalieri
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+revision = "20261018_animali_sede_view"
+down_revision = "20261018_censimenti_giornalieri"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE OR REPLACE VIEW animali_sede AS
+        SELECT
+            a.id AS animale_id,
+            a.azienda_id,
+            COALESCE(
+                (
+                    SELECT s.id
+                    FROM sedi s
+                    WHERE s.azienda_id = a.azienda_id
+                      AND s.codice_stalla = a.codice_azienda_anagrafe
+                      AND s.deleted_at IS NULL
+                    LIMIT 1
+                ),
+                (
+                    SELECT st.sede_id
+                    FROM box b
+                    JOIN stabilimenti st ON st.id = b.stabilimento_id
+                    JOIN sedi s ON s.id = st.sede_id
+                    WHERE b.id = a.box_id
+                      AND b.deleted_at IS NULL
+                      AND st.deleted_at IS NULL
+                      AND s.deleted_at IS NULL
+                    LIMIT 1
+                )
+            ) AS sede_id
+        FROM animali a
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS animali_sede")
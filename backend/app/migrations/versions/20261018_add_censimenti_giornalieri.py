@@ -0,0 +1,50 @@
+"""Add censimenti_giornalieri table
+
+Consistenza giornaliera pre-aggregata per (azienda, sede, data) usata dalle
+statistiche animali. Le righe si popolano con scripts/backfill_censimento.py
+o con la migrazione 20261019_censimenti_backfill.
+
+Revision ID: 20261018_censimenti_giornalieri
+Revises: 20261018_contatori_sequenze
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_censimenti_giornalieri"
+down_revision = "20261018_contatori_sequenze"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "censimenti_giornalieri",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("sede_id", sa.Integer(), nullable=True),
+        sa.Column("data", sa.Date(), nullable=False),
+        sa.Column("presenti", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("maschi", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("femmine", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("presenti_per_razza", sa.JSON(), nullable=True),
+        sa.Column("arrivati", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("usciti", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("morti", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("uscite_per_stato", sa.JSON(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["sede_id"], ["sedi.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_censimenti_giornalieri_id"), "censimenti_giornalieri", ["id"], unique=False)
+    op.create_index(
+        "ix_censimenti_giornalieri_azienda_data", "censimenti_giornalieri", ["azienda_id", "data"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_censimenti_giornalieri_azienda_data", table_name="censimenti_giornalieri")
+    op.drop_index(op.f("ix_censimenti_giornalieri_id"), table_name="censimenti_giornalieri")
+    op.drop_table("censimenti_giornalieri")
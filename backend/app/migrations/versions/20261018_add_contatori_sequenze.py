@@ -0,0 +1,35 @@
+"""Add contatori_sequenze table
+
+Contatori per azienda/anno/tipo usati per assegnare numero_partita e
+numeri DDT senza count()/max() per elemento e senza duplicati concorrenti.
+Le righe vengono create al primo utilizzo partendo dai numeri già presenti.
+
+Revision ID: 20261018_contatori_sequenze
+Revises: 20261018_anagrafe_eventi
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_contatori_sequenze"
+down_revision = "20261018_anagrafe_eventi"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "contatori_sequenze",
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("anno", sa.Integer(), nullable=False),
+        sa.Column("tipo", sa.String(length=30), nullable=False),
+        sa.Column("ultimo_valore", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("azienda_id", "anno", "tipo"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("contatori_sequenze")
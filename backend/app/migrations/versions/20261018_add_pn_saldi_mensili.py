@@ -0,0 +1,91 @@
+"""Add pn_saldi_mensili table
+
+Saldo di apertura, dare, avere e saldo di chiusura per conto e mese, così il saldo
+a una data e l'estratto conto non devono risommare tutti i movimenti del conto.
+La tabella viene popolata qui dai movimenti definitivi esistenti; in seguito la
+mantiene pn_saldi_service. Verifica/ricostruzione: scripts/verifica_saldi_prima_nota.py.
+
+Revision ID: 20261018_pn_saldi_mensili
+Revises: 20261018_scadenze_indice
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_pn_saldi_mensili"
+down_revision = "20261018_scadenze_indice"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "pn_saldi_mensili",
+        sa.Column("conto_id", sa.Integer(), nullable=False),
+        sa.Column("mese", sa.Date(), nullable=False),
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("saldo_apertura", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("dare", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("avere", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("saldo_chiusura", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["conto_id"], ["pn_conti.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("conto_id", "mese"),
+    )
+    op.create_index("ix_pn_saldi_mensili_azienda_mese", "pn_saldi_mensili", ["azienda_id", "mese"])
+
+    # Popolamento dai movimenti definitivi: entrate e giroconti in ingresso in dare,
+    # uscite e giroconti in uscita in avere (stessa regola di _apply_balance_effect)
+    op.execute(
+        """
+        INSERT INTO pn_saldi_mensili (conto_id, mese, azienda_id, saldo_apertura, dare, avere, saldo_chiusura)
+        SELECT
+            s.conto_id,
+            s.mese,
+            s.azienda_id,
+            s.saldo_iniziale + COALESCE(SUM(s.dare - s.avere) OVER (
+                PARTITION BY s.conto_id ORDER BY s.mese
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ), 0),
+            s.dare,
+            s.avere,
+            s.saldo_iniziale + SUM(s.dare - s.avere) OVER (
+                PARTITION BY s.conto_id ORDER BY s.mese
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            )
+        FROM (
+            SELECT
+                c.id AS conto_id,
+                c.azienda_id,
+                c.saldo_iniziale,
+                date_trunc('month', e.data)::date AS mese,
+                SUM(e.dare) AS dare,
+                SUM(e.avere) AS avere
+            FROM (
+                SELECT
+                    m.conto_id,
+                    m.data,
+                    CASE WHEN m.tipo_operazione = 'entrata' THEN m.importo ELSE 0 END AS dare,
+                    CASE WHEN m.tipo_operazione IN ('uscita', 'giroconto') THEN m.importo ELSE 0 END AS avere
+                FROM pn_movimenti m
+                WHERE m.stato = 'definitivo' AND m.deleted_at IS NULL
+                UNION ALL
+                SELECT m.conto_destinazione_id, m.data, m.importo, 0
+                FROM pn_movimenti m
+                WHERE m.tipo_operazione = 'giroconto'
+                  AND m.conto_destinazione_id IS NOT NULL
+                  AND m.stato = 'definitivo'
+                  AND m.deleted_at IS NULL
+            ) e
+            JOIN pn_conti c ON c.id = e.conto_id
+            GROUP BY c.id, c.azienda_id, c.saldo_iniziale, date_trunc('month', e.data)
+        ) s
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pn_saldi_mensili_azienda_mese", table_name="pn_saldi_mensili")
+    op.drop_table("pn_saldi_mensili")
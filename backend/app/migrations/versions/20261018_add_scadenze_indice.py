@@ -0,0 +1,45 @@
+"""Add scadenze index table
+
+Indice unificato delle scadenze (polizze attrezzature, scadenze attrezzature,
+assicurazioni aziendali, fatture) letto dal feed notifiche con una sola query
+su (azienda_id, data_scadenza). Le righe sono mantenute da scadenze_service;
+il popolamento sui dati esistenti è nella migrazione 20261019_scadenze_backfill.
+
+Revision ID: 20261018_scadenze_indice
+Revises: 20261018_animali_sede_view
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "20261018_scadenze_indice"
+down_revision = "20261018_animali_sede_view"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scadenze",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("tipo_entita", sa.String(length=40), nullable=False),
+        sa.Column("entita_id", sa.Integer(), nullable=False),
+        sa.Column("data_scadenza", sa.Date(), nullable=True),
+        sa.Column("stato", sa.String(length=30), nullable=True),
+        sa.Column("dati", postgresql.JSONB(), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("tipo_entita", "entita_id", name="uq_scadenze_entita"),
+    )
+    op.create_index("ix_scadenze_azienda_data", "scadenze", ["azienda_id", "data_scadenza"])
+    op.create_index("ix_scadenze_azienda_updated_at", "scadenze", ["azienda_id", "updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_scadenze_azienda_updated_at", table_name="scadenze")
+    op.drop_index("ix_scadenze_azienda_data", table_name="scadenze")
+    op.drop_table("scadenze")
@@ -0,0 +1,52 @@
+"""Add partial composite indexes for the hot list filters
+
+Indici parziali (WHERE deleted_at IS NULL) sui percorsi di accesso più usati:
+- animali per azienda e stato; per stalla e data arrivo/uscita (confronto con
+  le partite importate dall'anagrafe);
+- partite per azienda, tipo, data e codice stalla (lista partite, ricerca dei
+  duplicati in filter_existing_partite) e per azienda e data;
+- fatture per azienda e data scadenza / data fattura;
+- movimenti di Prima Nota per azienda, stato e data (riepiloghi, saldi);
+- somministrazioni per animale e data.
+
+Le righe eliminate restano fuori dagli indici, che così restano piccoli.
+Verifica dei piani: scripts/verifica_piani_query.py.
+
+Revision ID: 20261019_indici_parziali
+Revises: 20261019_pn_contropartite
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019_indici_parziali"
+down_revision = "20261019_pn_contropartite"
+branch_labels = None
+depends_on = None
+
+NON_ELIMINATI = sa.text("deleted_at IS NULL")
+
+INDICI = [
+    ("ix_animali_azienda_stato", "animali", ["azienda_id", "stato"]),
+    ("ix_animali_stalla_data_arrivo", "animali", ["codice_azienda_anagrafe", "data_arrivo"]),
+    ("ix_animali_stalla_data_uscita", "animali", ["codice_azienda_anagrafe", "data_uscita"]),
+    ("ix_partite_animali_azienda_tipo_data_stalla", "partite_animali", ["azienda_id", "tipo", "data", "codice_stalla"]),
+    ("ix_partite_animali_azienda_data", "partite_animali", ["azienda_id", "data"]),
+    ("ix_fatture_amministrazione_azienda_scadenza", "fatture_amministrazione", ["azienda_id", "data_scadenza"]),
+    ("ix_fatture_amministrazione_azienda_data_id", "fatture_amministrazione", ["azienda_id", "data_fattura", "id"]),
+    ("ix_pn_movimenti_azienda_stato_data", "pn_movimenti", ["azienda_id", "stato", "data"]),
+    ("ix_somministrazioni_animale_data", "somministrazioni", ["animale_id", "data_ora"]),
+]
+
+
+def upgrade() -> None:
+    for nome, tabella, colonne in INDICI:
+        op.create_index(nome, tabella, colonne, postgresql_where=NON_ELIMINATI)
+    for tabella in sorted({tabella for _, tabella, _ in INDICI}):
+        op.execute(f"ANALYZE {tabella}")
+
+
+def downgrade() -> None:
+    for nome, tabella, _ in reversed(INDICI):
+        op.drop_index(nome, table_name=tabella)
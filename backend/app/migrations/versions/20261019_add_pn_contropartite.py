@@ -0,0 +1,95 @@
+"""Add pn_contropartite table and pn_movimenti.contropartita_id
+
+Dimensione contropartita (nome normalizzato per azienda, collegamento al
+fornitore) per i report dare/avere: i movimenti di una contropartita si
+leggono dall'indice (contropartita_id, data). La tabella viene popolata qui dai
+movimenti esistenti; in seguito la mantiene pn_contropartite_service.
+
+Revision ID: 20261019_pn_contropartite
+Revises: 20261019_pn_setup_version
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019_pn_contropartite"
+down_revision = "20261019_pn_setup_version"
+branch_labels = None
+depends_on = None
+
+# Stessa regola di normalizza_contropartita(): spazi (anche tab e a capo) compattati, poi trim
+_COMPATTA = "btrim(regexp_replace({col}, '\\s+', ' ', 'g'))"
+_NORMALIZZA = "lower(" + _COMPATTA + ")"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "pn_contropartite",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("azienda_id", sa.Integer(), nullable=False),
+        sa.Column("nome", sa.String(length=200), nullable=False),
+        sa.Column("nome_normalizzato", sa.String(length=200), nullable=False),
+        sa.Column("fornitore_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["azienda_id"], ["aziende.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["fornitore_id"], ["fornitori.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("azienda_id", "nome_normalizzato", name="uq_pn_contropartite_azienda_nome"),
+    )
+    op.create_index("ix_pn_contropartite_id", "pn_contropartite", ["id"])
+    op.create_index("ix_pn_contropartite_fornitore_id", "pn_contropartite", ["fornitore_id"])
+
+    op.add_column("pn_movimenti", sa.Column("contropartita_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "fk_pn_movimenti_contropartita_id",
+        "pn_movimenti",
+        "pn_contropartite",
+        ["contropartita_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+
+    # Popolamento dai movimenti esistenti
+    normalizzato = _NORMALIZZA.format(col="m.contropartita_nome")
+    op.execute(
+        f"""
+        INSERT INTO pn_contropartite (azienda_id, nome, nome_normalizzato)
+        SELECT m.azienda_id, min({_COMPATTA.format(col="m.contropartita_nome")}), {normalizzato}
+        FROM pn_movimenti m
+        WHERE m.contropartita_nome IS NOT NULL AND {normalizzato} <> ''
+        GROUP BY m.azienda_id, {normalizzato}
+        """
+    )
+    op.execute(
+        f"""
+        UPDATE pn_contropartite c
+        SET fornitore_id = (
+            SELECT f.id
+            FROM fornitori f
+            WHERE {_NORMALIZZA.format(col="f.nome")} = c.nome_normalizzato
+               OR f.partita_iva = c.nome
+            ORDER BY (f.azienda_id = c.azienda_id) DESC, f.id
+            LIMIT 1
+        )
+        """
+    )
+    op.execute(
+        f"""
+        UPDATE pn_movimenti m
+        SET contropartita_id = c.id
+        FROM pn_contropartite c
+        WHERE c.azienda_id = m.azienda_id
+          AND c.nome_normalizzato = {normalizzato}
+        """
+    )
+    op.create_index("ix_pn_movimenti_contropartita_data", "pn_movimenti", ["contropartita_id", "data"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pn_movimenti_contropartita_data", table_name="pn_movimenti")
+    op.drop_constraint("fk_pn_movimenti_contropartita_id", "pn_movimenti", type_="foreignkey")
+    op.drop_column("pn_movimenti", "contropartita_id")
+    op.drop_index("ix_pn_contropartite_fornitore_id", table_name="pn_contropartite")
+    op.drop_index("ix_pn_contropartite_id", table_name="pn_contropartite")
+    op.drop_table("pn_contropartite")
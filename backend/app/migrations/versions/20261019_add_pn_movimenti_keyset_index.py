@@ -0,0 +1,28 @@
+"""Add keyset index on pn_movimenti
+
+Indice (azienda_id, data, id) per la lista movimenti paginata a cursore:
+ogni pagina è una scansione dell'indice a partire dall'ultimo (data, id) letto.
+
+Revision ID: 20261019_pn_movimenti_keyset
+Revises: 20261018_pn_saldi_mensili
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_pn_movimenti_keyset"
+down_revision = "20261018_pn_saldi_mensili"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_pn_movimenti_azienda_data_id",
+        "pn_movimenti",
+        ["azienda_id", "data", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pn_movimenti_azienda_data_id", table_name="pn_movimenti")
@@ -0,0 +1,55 @@
+"""Add search indexes on pn_movimenti
+
+Indici per la ricerca dei movimenti (pn_ricerca_service):
+- trigram GIN su lower(descrizione), lower(note), lower(contropartita_nome)
+  per la modalità "contiene" (LIKE '%testo%');
+- GIN su to_tsvector('italian', descrizione || note || contropartita_nome)
+  per la modalità "parole".
+Solo PostgreSQL; su altri database la ricerca resta una scansione.
+
+Revision ID: 20261019_pn_ricerca
+Revises: 20261019_pn_movimenti_keyset
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_pn_ricerca"
+down_revision = "20261019_pn_movimenti_keyset"
+branch_labels = None
+depends_on = None
+
+_TRIGRAM_INDEXES = {
+    "ix_pn_movimenti_descrizione_trgm": "descrizione",
+    "ix_pn_movimenti_note_trgm": "note",
+    "ix_pn_movimenti_contropartita_trgm": "contropartita_nome",
+}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for nome, colonna in _TRIGRAM_INDEXES.items():
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS {nome} ON pn_movimenti USING gin (lower({colonna}) gin_trgm_ops)"
+        )
+    # L'espressione deve coincidere con _testo_movimento() in pn_ricerca_service
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_pn_movimenti_fts ON pn_movimenti USING gin (
+            to_tsvector(
+                'italian'::regconfig,
+                COALESCE(descrizione, '') || ' ' || COALESCE(note, '') || ' ' || COALESCE(contropartita_nome, '')
+            )
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_pn_movimenti_fts")
+    for nome in _TRIGRAM_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {nome}")
@@ -0,0 +1,30 @@
+"""Add setup_version to pn_preferenze
+
+Marker della versione del setup predefinito di Prima Nota applicata a ogni
+azienda: ensure_default_setup esegue il setup completo solo quando differisce
+da PN_SETUP_VERSION. Le righe esistenti partono da 0 e vengono aggiornate al
+primo accesso.
+
+Revision ID: 20261019_pn_setup_version
+Revises: 20261019_pn_ricerca
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019_pn_setup_version"
+down_revision = "20261019_pn_ricerca"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "pn_preferenze",
+        sa.Column("setup_version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("pn_preferenze", "setup_version")
@@ -0,0 +1,62 @@
+"""Cascade anagrafe_eventi_capi on partita / gruppo decessi delete
+
+Le righe dell'indice eventi anagrafe seguono la partita o il gruppo decessi che
+le ha riconciliate: eliminandolo, gli eventi escono dall'indice e il prossimo
+upload li ripropone (prima restavano con il collegamento a NULL e venivano
+scartati per sempre). Le righe già senza collegamento (riconciliate prima di
+questa revisione) vengono rimosse: il prossimo upload riconosce quegli eventi
+dal confronto con le partite e i decessi esistenti.
+
+Revision ID: 20261019_eventi_capi_cascade
+Revises: 20261019_indici_parziali
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_eventi_capi_cascade"
+down_revision = "20261019_indici_parziali"
+branch_labels = None
+depends_on = None
+
+FK = [
+    ("anagrafe_eventi_capi_partita_animale_id_fkey", "partita_animale_id", "partite_animali"),
+    ("anagrafe_eventi_capi_gruppo_decessi_id_fkey", "gruppo_decessi_id", "gruppi_decessi"),
+]
+
+
+def _ricrea_fk(ondelete: str) -> None:
+    for nome, colonna, tabella in FK:
+        op.drop_constraint(nome, "anagrafe_eventi_capi", type_="foreignkey")
+        op.create_foreign_key(
+            nome, "anagrafe_eventi_capi", tabella, [colonna], ["id"], ondelete=ondelete
+        )
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM anagrafe_eventi_capi
+        WHERE partita_animale_id IS NULL AND gruppo_decessi_id IS NULL
+        """
+    )
+    # Eventi di partite / gruppi già eliminati con soft delete
+    op.execute(
+        """
+        DELETE FROM anagrafe_eventi_capi e
+        USING partite_animali p
+        WHERE e.partita_animale_id = p.id AND p.deleted_at IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM anagrafe_eventi_capi e
+        USING gruppi_decessi g
+        WHERE e.gruppo_decessi_id = g.id AND g.deleted_at IS NOT NULL
+        """
+    )
+    _ricrea_fk("CASCADE")
+
+
+def downgrade() -> None:
+    _ricrea_fk("SET NULL")
@@ -0,0 +1,156 @@
+"""Backfill censimenti_giornalieri
+
+Le statistiche animali leggono solo il censimento e le letture non lo scrivono:
+senza righe le statistiche restano vuote. Qui si calcola in SQL, con la stessa
+semantica di censimento_service, lo storico di ogni azienda che non ha ancora
+righe (dal primo arrivo ad oggi):
+- presente il giorno d se data_arrivo <= d < fine, con fine = NULL per i
+  presenti, altrimenti data_uscita, data del decesso o data_arrivo;
+- una riga senza sede per ogni giorno, le righe delle sedi (vista animali_sede)
+  solo nei giorni con capi presenti o movimenti.
+I giorni successivi si completano con i ricalcoli al commit o con
+scripts/backfill_censimento.py --mancanti.
+
+Revision ID: 20261019_censimenti_backfill
+Revises: 20261019_censimenti_unique
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_censimenti_backfill"
+down_revision = "20261019_censimenti_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        WITH capi AS (
+            SELECT
+                a.azienda_id,
+                s.sede_id,
+                upper(coalesce(a.sesso, '')) AS sesso,
+                coalesce(a.razza, 'Non specificata') AS razza,
+                a.stato,
+                a.data_arrivo,
+                CASE WHEN a.stato = 'presente' THEN NULL
+                     ELSE coalesce(a.data_uscita, d.data_ora::date, a.data_arrivo) END AS fine,
+                d.data_ora::date AS decesso
+            FROM animali a
+            JOIN aziende az ON az.id = a.azienda_id AND az.deleted_at IS NULL
+            LEFT JOIN decessi d ON d.animale_id = a.id
+            LEFT JOIN animali_sede s ON s.animale_id = a.id
+            WHERE a.deleted_at IS NULL
+              AND a.data_arrivo IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM censimenti_giornalieri c WHERE c.azienda_id = a.azienda_id
+              )
+        ),
+        giorni AS (
+            SELECT azienda_id, generate_series(min(data_arrivo), current_date, interval '1 day')::date AS data
+            FROM capi
+            GROUP BY azienda_id
+        ),
+        variazioni AS (
+            SELECT azienda_id, sede_id, sesso, razza, data, sum(n) AS n
+            FROM (
+                SELECT azienda_id, sede_id, sesso, razza, data_arrivo AS data, 1 AS n
+                FROM capi WHERE fine IS NULL OR fine > data_arrivo
+                UNION ALL
+                SELECT azienda_id, sede_id, sesso, razza, fine, -1
+                FROM capi WHERE fine > data_arrivo
+            ) v
+            GROUP BY azienda_id, sede_id, sesso, razza, data
+        ),
+        gruppi AS (
+            SELECT DISTINCT azienda_id, sede_id, sesso, razza FROM variazioni
+        ),
+        stock AS (
+            SELECT
+                g.azienda_id, gr.sede_id, gr.sesso, gr.razza, g.data,
+                sum(coalesce(v.n, 0)) OVER (
+                    PARTITION BY g.azienda_id, gr.sede_id, gr.sesso, gr.razza ORDER BY g.data
+                ) AS presenti
+            FROM giorni g
+            JOIN gruppi gr ON gr.azienda_id = g.azienda_id
+            LEFT JOIN variazioni v
+              ON v.azienda_id = g.azienda_id
+             AND v.sede_id IS NOT DISTINCT FROM gr.sede_id
+             AND v.sesso = gr.sesso
+             AND v.razza = gr.razza
+             AND v.data = g.data
+        ),
+        per_razza AS (
+            SELECT
+                azienda_id, sede_id, data, razza,
+                sum(presenti) AS presenti,
+                coalesce(sum(presenti) FILTER (WHERE sesso = 'M'), 0) AS maschi,
+                coalesce(sum(presenti) FILTER (WHERE sesso = 'F'), 0) AS femmine
+            FROM stock
+            GROUP BY azienda_id, sede_id, data, razza
+        ),
+        consistenza AS (
+            SELECT
+                azienda_id, sede_id, data,
+                sum(presenti) AS presenti,
+                sum(maschi) AS maschi,
+                sum(femmine) AS femmine,
+                json_object_agg(razza, presenti) FILTER (WHERE presenti > 0) AS presenti_per_razza
+            FROM per_razza
+            GROUP BY azienda_id, sede_id, data
+        ),
+        movimenti AS (
+            SELECT azienda_id, sede_id, data, sum(arrivati) AS arrivati, sum(usciti) AS usciti, sum(morti) AS morti
+            FROM (
+                SELECT azienda_id, sede_id, data_arrivo AS data, 1 AS arrivati, 0 AS usciti, 0 AS morti FROM capi
+                UNION ALL
+                SELECT azienda_id, sede_id, fine, 0, 1, 0 FROM capi WHERE stato IN ('venduto', 'macellato')
+                UNION ALL
+                SELECT azienda_id, sede_id, coalesce(decesso, fine), 0, 0, 1 FROM capi WHERE stato = 'deceduto'
+            ) m
+            GROUP BY azienda_id, sede_id, data
+        ),
+        uscite AS (
+            SELECT azienda_id, sede_id, data, json_object_agg(stato, numero) AS uscite_per_stato
+            FROM (
+                SELECT azienda_id, sede_id, fine AS data, coalesce(stato, 'sconosciuto') AS stato, count(*) AS numero
+                FROM capi
+                WHERE fine IS NOT NULL
+                GROUP BY azienda_id, sede_id, fine, coalesce(stato, 'sconosciuto')
+            ) u
+            GROUP BY azienda_id, sede_id, data
+        ),
+        chiavi AS (
+            SELECT azienda_id, NULL::integer AS sede_id, data FROM giorni
+            UNION
+            SELECT azienda_id, sede_id, data FROM consistenza WHERE presenti > 0
+            UNION
+            SELECT m.azienda_id, m.sede_id, m.data
+            FROM movimenti m
+            JOIN giorni g ON g.azienda_id = m.azienda_id AND g.data = m.data
+            WHERE m.arrivati + m.usciti + m.morti > 0
+        )
+        INSERT INTO censimenti_giornalieri (
+            azienda_id, sede_id, data, presenti, maschi, femmine, presenti_per_razza,
+            arrivati, usciti, morti, uscite_per_stato
+        )
+        SELECT
+            k.azienda_id, k.sede_id, k.data,
+            coalesce(c.presenti, 0), coalesce(c.maschi, 0), coalesce(c.femmine, 0), c.presenti_per_razza,
+            coalesce(m.arrivati, 0), coalesce(m.usciti, 0), coalesce(m.morti, 0), u.uscite_per_stato
+        FROM chiavi k
+        LEFT JOIN consistenza c
+          ON c.azienda_id = k.azienda_id AND c.sede_id IS NOT DISTINCT FROM k.sede_id AND c.data = k.data
+        LEFT JOIN movimenti m
+          ON m.azienda_id = k.azienda_id AND m.sede_id IS NOT DISTINCT FROM k.sede_id AND m.data = k.data
+        LEFT JOIN uscite u
+          ON u.azienda_id = k.azienda_id AND u.sede_id IS NOT DISTINCT FROM k.sede_id AND u.data = k.data
+        """
+    )
+
+
+def downgrade() -> None:
+    # Le righe sono derivate da animali: restano valide anche senza questa revisione
+    pass
@@ -0,0 +1,42 @@
+"""Unique (azienda, sede, data) on censimenti_giornalieri
+
+Due ricalcoli concorrenti della stessa azienda potevano inserire entrambi le
+righe dello stesso periodo, raddoppiando la consistenza. Ora i ricalcoli
+prendono un advisory lock per azienda e l'indice univoco impedisce i doppioni
+(sede_id NULL = animali senza sede, trattato come una sede tramite COALESCE).
+I doppioni già presenti vengono rimossi tenendo la riga più recente.
+
+Revision ID: 20261019_censimenti_unique
+Revises: 20261019_numero_partita_azienda
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_censimenti_unique"
+down_revision = "20261019_numero_partita_azienda"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM censimenti_giornalieri c
+        USING censimenti_giornalieri altra
+        WHERE c.azienda_id = altra.azienda_id
+          AND COALESCE(c.sede_id, 0) = COALESCE(altra.sede_id, 0)
+          AND c.data = altra.data
+          AND c.id < altra.id
+        """
+    )
+    op.execute(
+        """
+        CREATE UNIQUE INDEX uq_censimenti_giornalieri_azienda_sede_data
+        ON censimenti_giornalieri (azienda_id, COALESCE(sede_id, 0), data)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_censimenti_giornalieri_azienda_sede_data", table_name="censimenti_giornalieri")
@@ -0,0 +1,48 @@
+"""Scope the numero_partita unique index to the azienda
+
+I numeri partita vengono dal contatore per (azienda, anno, tipo) di
+contatori_sequenze: due aziende possono ottenere lo stesso progressivo per la
+stessa data e codice stalla. L'unicità (solo partite non eliminate) diventa
+quindi per azienda, come per i numeri DDT.
+
+Il downgrade fallisce se nel frattempo due aziende hanno lo stesso numero_partita.
+
+Revision ID: 20261019_numero_partita_azienda
+Revises: 20261019_eventi_capi_cascade
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_numero_partita_azienda"
+down_revision = "20261019_eventi_capi_cascade"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE UNIQUE INDEX partite_animali_azienda_numero_partita_unique_not_deleted
+        ON partite_animali (azienda_id, numero_partita)
+        WHERE deleted_at IS NULL
+        """
+    )
+    op.drop_index(
+        "partite_animali_numero_partita_unique_not_deleted",
+        table_name="partite_animali",
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE UNIQUE INDEX partite_animali_numero_partita_unique_not_deleted
+        ON partite_animali (numero_partita)
+        WHERE deleted_at IS NULL
+        """
+    )
+    op.drop_index(
+        "partite_animali_azienda_numero_partita_unique_not_deleted",
+        table_name="partite_animali",
+    )
@@ -0,0 +1,77 @@
+"""Backfill scadenze index
+
+L'indice scadenze nasce vuoto e il feed notifiche legge solo l'indice: senza
+popolamento le scadenze esistenti sparirebbero dalle notifiche. Le righe sono
+calcolate in SQL con le stesse regole di scadenze_service (_righe_*); le
+scritture successive le mantengono al commit.
+
+Revision ID: 20261019_scadenze_backfill
+Revises: 20261019_censimenti_backfill
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+revision = "20261019_scadenze_backfill"
+down_revision = "20261019_censimenti_backfill"
+branch_labels = None
+depends_on = None
+
+_DATI_FATTURA = "jsonb_build_object('numero', f.numero, 'fornitore', fo.nome, 'totale', f.importo_totale)"
+
+# tipo_entita -> SELECT (azienda_id, entita_id, data_scadenza, stato, dati)
+RIGHE = {
+    "scadenza_attrezzatura": """
+        SELECT a.azienda_id, s.id, s.data_scadenza, NULL::varchar,
+               jsonb_build_object('nome', a.nome, 'numero_polizza', s.numero_polizza, 'attrezzatura_id', s.attrezzatura_id)
+        FROM scadenze_attrezzature s
+        JOIN attrezzature a ON a.id = s.attrezzatura_id
+        WHERE s.tipo = 'assicurazione' AND s.deleted_at IS NULL
+    """,
+    "polizza_attrezzatura": """
+        SELECT p.azienda_id, p.id, p.data_scadenza, NULL::varchar,
+               jsonb_build_object('nome', a.nome, 'tipo_polizza', p.tipo_polizza::varchar,
+                                  'numero_polizza', p.numero_polizza, 'attrezzatura_id', p.attrezzatura_id)
+        FROM polizze_attrezzature p
+        LEFT JOIN attrezzature a ON a.id = p.attrezzatura_id
+        WHERE p.attiva IS TRUE AND p.deleted_at IS NULL
+    """,
+    "assicurazione_aziendale": """
+        SELECT s.azienda_id, s.id, s.data_scadenza, NULL::varchar,
+               jsonb_build_object('tipo', s.tipo::varchar, 'numero_polizza', s.numero_polizza, 'compagnia', s.compagnia)
+        FROM assicurazioni_aziendali s
+        WHERE s.deleted_at IS NULL
+    """,
+    "fattura": f"""
+        SELECT f.azienda_id, f.id, f.data_scadenza, f.stato_pagamento::varchar, {_DATI_FATTURA}
+        FROM fatture_amministrazione f
+        LEFT JOIN fornitori fo ON fo.id = f.fornitore_id
+        WHERE f.data_scadenza IS NOT NULL AND f.deleted_at IS NULL
+    """,
+    "fattura_senza_categoria": f"""
+        SELECT f.azienda_id, f.id, NULL::date, NULL::varchar, {_DATI_FATTURA}
+        FROM fatture_amministrazione f
+        LEFT JOIN fornitori fo ON fo.id = f.fornitore_id
+        WHERE f.deleted_at IS NULL
+          AND (f.categoria IS NULL OR f.categoria = '')
+          AND f.categoria_id IS NULL
+    """,
+}
+
+
+def upgrade() -> None:
+    for tipo, righe in RIGHE.items():
+        op.execute(
+            f"""
+            INSERT INTO scadenze (azienda_id, tipo_entita, entita_id, data_scadenza, stato, dati)
+            SELECT r.azienda_id, '{tipo}', r.entita_id, r.data_scadenza, r.stato, r.dati
+            FROM ({righe}) AS r (azienda_id, entita_id, data_scadenza, stato, dati)
+            WHERE r.azienda_id IS NOT NULL
+            ON CONFLICT ON CONSTRAINT uq_scadenze_entita DO NOTHING
+            """
+        )
+
+
+def downgrade() -> None:
+    # Le righe sono derivate dai record di origine: restano valide anche senza questa revisione
+    pass
@@ -12,6 +12,7 @@ from .decesso import Decesso
 from .gruppo_decessi import GruppoDecessi
 from .piano_uscita import PianoUscita, PianoUscitaAnimale
 from .storico_tipo_allevamento import StoricoTipoAllevamento
+from .censimento_giornaliero import CensimentoGiornaliero
 
 __all__ = [
     "Azienda",
@@ -26,5 +27,6 @@ __all__ = [
     "PianoUscita",
     "PianoUscitaAnimale",
     "StoricoTipoAllevamento",
+    "CensimentoGiornaliero",
 ]
 
@@ -1,7 +1,7 @@
 """
 Animale model - Anagrafica completa animali
 """
-from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, ForeignKey, CheckConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -103,5 +103,9 @@ class Animale(Base):
         CheckConstraint("tipo_allevamento IN ('svezzamento', 'ingrasso', 'universale') OR tipo_allevamento IS NULL"),
         CheckConstraint("stato IN ('presente', 'venduto', 'deceduto', 'trasferito', 'macellato')"),
         CheckConstraint("origine_dati IN ('manuale', 'anagrafe', 'misto')"),
+        # Indici parziali sui soli animali non eliminati
+        Index("ix_animali_azienda_stato", "azienda_id", "stato", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_animali_stalla_data_arrivo", "codice_azienda_anagrafe", "data_arrivo", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_animali_stalla_data_uscita", "codice_azienda_anagrafe", "data_uscita", postgresql_where=text("deleted_at IS NULL")),
     )
 
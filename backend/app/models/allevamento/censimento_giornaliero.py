@@ -0,0 +1,55 @@
+"""
+CensimentoGiornaliero model - Consistenza giornaliera pre-aggregata per sede
+"""
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class CensimentoGiornaliero(Base):
+    """
+    Consistenza del bestiame a fine giornata per (azienda, sede, data) più i movimenti
+    del giorno. Mantenuta da app.services.allevamento.censimento_service ad ogni
+    scrittura su animali, partite e decessi; le statistiche leggono poche righe
+    invece di scansionare animali.
+
+    sede_id NULL raccoglie gli animali non attribuibili a una sede; esiste sempre
+    almeno questa riga per ogni giorno calcolato dell'azienda.
+    """
+    __tablename__ = "censimenti_giornalieri"
+
+    id = Column(Integer, primary_key=True, index=True)
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), nullable=False)
+    # CASCADE: con SET NULL le righe della sede eliminata collidono con quella senza sede
+    # dello stesso giorno nell'indice univoco
+    sede_id = Column(Integer, ForeignKey("sedi.id", ondelete="CASCADE"), nullable=True)
+    data = Column(Date, nullable=False)
+
+    # Consistenza a fine giornata
+    presenti = Column(Integer, nullable=False, default=0)
+    maschi = Column(Integer, nullable=False, default=0)
+    femmine = Column(Integer, nullable=False, default=0)
+    presenti_per_razza = Column(JSON, nullable=True)  # {razza: numero capi presenti}
+
+    # Movimenti del giorno
+    arrivati = Column(Integer, nullable=False, default=0)
+    usciti = Column(Integer, nullable=False, default=0)  # venduti + macellati
+    morti = Column(Integer, nullable=False, default=0)
+    uscite_per_stato = Column(JSON, nullable=True)  # {stato: numero capi usciti nel giorno}
+
+    # Timestamps
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_censimenti_giornalieri_azienda_data", "azienda_id", "data"),
+    )
+
+
+# Una sola riga per (azienda, sede, data); sede_id NULL conta come una sede
+Index(
+    "uq_censimenti_giornalieri_azienda_sede_data",
+    CensimentoGiornaliero.azienda_id,
+    func.coalesce(CensimentoGiornaliero.sede_id, 0),
+    CensimentoGiornaliero.data,
+    unique=True,
+)
@@ -12,6 +12,7 @@ from .fattura_amministrazione_pagamento import FatturaAmministrazionePagamento
 from .fattura_amministrazione_ricezione import FatturaAmministrazioneRicezione
 from .partita_animale import PartitaAnimale, ModalitaGestionePartita
 from .partita_animale_animale import PartitaAnimaleAnimale
+from .anagrafe_evento_capo import AnagrafeEventoCapo
 from .partita_animale_movimento_finanziario import (
     PartitaMovimentoFinanziario,
     PartitaMovimentoDirezione,
@@ -26,6 +27,7 @@ from .pn import (
     PNCategoria,
     PNMovimento,
     PNMovimentoDocumento,
+    PNContropartita,
     PNContoIban,
     PNContoTipo,
     PNTipoOperazione,
@@ -41,6 +43,9 @@ from .polizza_rinnovo import PolizzaRinnovo
 from .contratto_soccida import ContrattoSoccida
 from .report_allevamento_fatture import ReportAllevamentoFattureUtilizzate
 from .ddt_emesso import DdtEmesso
+from .contatore_sequenza import ContatoreSequenza
+from .scadenza_indice import ScadenzaIndice
+from .pn_saldo_mensile import PNSaldoMensile
 
 __all__ = [
     "Fornitore",
@@ -55,6 +60,7 @@ __all__ = [
     "PartitaAnimale",
     "ModalitaGestionePartita",
     "PartitaAnimaleAnimale",
+    "AnagrafeEventoCapo",
     "PartitaMovimentoFinanziario",
     "PartitaMovimentoDirezione",
     "PartitaMovimentoTipo",
@@ -65,6 +71,7 @@ __all__ = [
     "PNPreferenze",
     "PNCategoria",
     "PNMovimento",
+    "PNContropartita",
     "PNMovimentoDocumento",
     "PNContoIban",
     "PNContoTipo",
@@ -83,5 +90,8 @@ __all__ = [
     "ContrattoSoccida",
     "ReportAllevamentoFattureUtilizzate",
     "DdtEmesso",
+    "ContatoreSequenza",
+    "ScadenzaIndice",
+    "PNSaldoMensile",
 ]
 
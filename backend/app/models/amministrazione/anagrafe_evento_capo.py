@@ -0,0 +1,38 @@
+"""
+AnagrafeEventoCapo model - Indice degli eventi anagrafe già riconciliati
+"""
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AnagrafeEventoCapo(Base):
+    """
+    Un record per ogni evento (codice_capo, tipo evento, data, codice_stalla) già
+    importato da un file anagrafe. event_hash è l'impronta della tupla normalizzata:
+    la sincronizzazione confronta gli hash del file con quelli salvati e processa
+    solo gli eventi nuovi.
+    """
+    __tablename__ = "anagrafe_eventi_capi"
+
+    id = Column(Integer, primary_key=True, index=True)
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_hash = Column(String(40), nullable=False)
+
+    # Tupla originale (per diagnostica e ricostruzione dell'indice)
+    codice_capo = Column(String(50), nullable=False, index=True)
+    tipo_evento = Column(String(20), nullable=False)  # ingresso, uscita, decesso
+    data_evento = Column(Date, nullable=False)
+    codice_stalla = Column(String(50), nullable=True)
+
+    # Origine della riconciliazione: eliminando la partita o il gruppo decessi
+    # l'evento esce dall'indice e viene riproposto al prossimo upload
+    partita_animale_id = Column(Integer, ForeignKey("partite_animali.id", ondelete="CASCADE"), nullable=True, index=True)
+    gruppo_decessi_id = Column(Integer, ForeignKey("gruppi_decessi.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("azienda_id", "event_hash", name="uq_anagrafe_eventi_capi_azienda_hash"),
+    )
@@ -0,0 +1,23 @@
+"""
+ContatoreSequenza model - Contatori per numerazioni progressive (partite, DDT)
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class ContatoreSequenza(Base):
+    """
+    Ultimo numero assegnato per (azienda, anno, tipo documento).
+    Le allocazioni avvengono con UPDATE ... RETURNING sulla riga del contatore:
+    il lock di riga serializza le richieste concorrenti (anche da macchine diverse).
+    """
+    __tablename__ = "contatori_sequenze"
+
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), primary_key=True)
+    anno = Column(Integer, primary_key=True)
+    tipo = Column(String(30), primary_key=True)  # es. ddt_emesso, partita_ingresso, partita_uscita
+    ultimo_valore = Column(Integer, nullable=False, default=0)
+
+    # Timestamps
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
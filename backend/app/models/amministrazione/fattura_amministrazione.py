@@ -1,7 +1,7 @@
 """
 FatturaAmministrazione model - Estensione fattura con periodo attribuzione e scadenze
 """
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, ForeignKey, Text, TypeDecorator, JSON
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, ForeignKey, Text, TypeDecorator, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -197,6 +197,11 @@ class FatturaAmministrazione(Base):
     fornitore = relationship("Fornitore", foreign_keys=[fornitore_id], backref="fatture_amministrazione_fornitore")
     pagamenti = relationship("Pagamento", back_populates="fattura_amministrazione", cascade="all, delete-orphan")
     categoria_pn = relationship("PNCategoria", foreign_keys=[categoria_id], backref="fatture_amministrazione")
+
+    __table_args__ = (
+        Index("ix_fatture_amministrazione_azienda_scadenza", "azienda_id", "data_scadenza", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_fatture_amministrazione_azienda_data_id", "azienda_id", "data_fattura", "id", postgresql_where=text("deleted_at IS NULL")),
+    )
     
     def __repr__(self):
         return f"<FatturaAmministrazione(id={self.id}, numero='{self.numero}', tipo='{self.tipo}')>"
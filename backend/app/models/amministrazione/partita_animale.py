@@ -13,6 +13,8 @@ from sqlalchemy import (
     Enum as SQLEnum,
     TypeDecorator,
     Boolean,
+    Index,
+    text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -76,7 +78,7 @@ class PartitaAnimale(Base):
     
     # Dati partita
     data = Column(Date, nullable=False, index=True)
-    numero_partita = Column(String(50), nullable=True, index=True)  # univoco solo se deleted_at IS NULL (indice parziale)
+    numero_partita = Column(String(50), nullable=True, index=True)  # univoco per azienda solo se deleted_at IS NULL (indice parziale)
     
     # Provenienza/Destinazione (esterna)
     codice_stalla = Column(String(20), nullable=False, index=True)  # codice stalla provenienza/destinazione esterna
@@ -160,6 +162,23 @@ class PartitaAnimale(Base):
     fattura_amministrazione = relationship("FatturaAmministrazione", foreign_keys=[fattura_amministrazione_id])
     fattura_emessa = relationship("FatturaEmessa", foreign_keys=[fattura_emessa_id])
     contratto_soccida = relationship("ContrattoSoccida", back_populates="partite")
+
+    __table_args__ = (
+        # Lista partite per tipo/data e ricerca duplicati (tipo, data, codice_stalla)
+        Index(
+            "ix_partite_animali_azienda_tipo_data_stalla",
+            "azienda_id", "tipo", "data", "codice_stalla",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index("ix_partite_animali_azienda_data", "azienda_id", "data", postgresql_where=text("deleted_at IS NULL")),
+        # Numerazione per (azienda, anno, tipo): il numero è univoco all'interno dell'azienda
+        Index(
+            "partite_animali_azienda_numero_partita_unique_not_deleted",
+            "azienda_id", "numero_partita",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
     
     def __repr__(self):
         return (
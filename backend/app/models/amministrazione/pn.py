@@ -11,11 +11,13 @@ from sqlalchemy import (
     DateTime,
     Enum as SQLEnum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -120,6 +122,8 @@ class PNPreferenze(Base):
     conto_pagamenti_id = Column(Integer, ForeignKey("pn_conti.id", ondelete="SET NULL"), nullable=True)
     conto_debiti_fornitori_id = Column(Integer, ForeignKey("pn_conti.id", ondelete="SET NULL"), nullable=True)
     conto_crediti_clienti_id = Column(Integer, ForeignKey("pn_conti.id", ondelete="SET NULL"), nullable=True)
+    # Versione del setup predefinito applicata (vedi PN_SETUP_VERSION in prima_nota_service)
+    setup_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -164,6 +168,27 @@ class PNCategoria(Base):
     )
 
 
+class PNContropartita(Base):
+    """
+    Contropartita (cliente/fornitore) dei movimenti, una per nome normalizzato
+    (minuscolo, spazi compattati) e azienda, con il Fornitore corrispondente se noto.
+    """
+    __tablename__ = "pn_contropartite"
+
+    id = Column(Integer, primary_key=True, index=True)
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), nullable=False)
+    nome = Column(String(200), nullable=False)
+    nome_normalizzato = Column(String(200), nullable=False)
+    fornitore_id = Column(Integer, ForeignKey("fornitori.id", ondelete="SET NULL"), nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    fornitore = relationship("Fornitore")
+
+    __table_args__ = (
+        UniqueConstraint("azienda_id", "nome_normalizzato", name="uq_pn_contropartite_azienda_nome"),
+    )
+
+
 class PNMovimento(Base):
     __tablename__ = "pn_movimenti"
 
@@ -207,6 +232,8 @@ class PNMovimento(Base):
     importo = Column(Numeric(12, 2), nullable=False)
     quota_extra = Column(Numeric(12, 2), nullable=True)
     contropartita_nome = Column(String(200), nullable=True)
+    # Valorizzato da pn_contropartite_service a ogni scrittura di contropartita_nome
+    contropartita_id = Column(Integer, ForeignKey("pn_contropartite.id", ondelete="SET NULL"), nullable=True)
     metodo_pagamento = Column(String(80), nullable=True)
     documento_riferimento = Column(String(120), nullable=True)
     riferimento_esterno = Column(String(120), nullable=True)
@@ -240,8 +267,12 @@ class PNMovimento(Base):
         cascade="all, delete-orphan",
     )
 
+    contropartita = relationship("PNContropartita")
+
     __table_args__ = (
         CheckConstraint("importo >= 0", name="ck_pn_movimento_importo_non_negativo"),
+        Index("ix_pn_movimenti_contropartita_data", "contropartita_id", "data"),
+        Index("ix_pn_movimenti_azienda_stato_data", "azienda_id", "stato", "data", postgresql_where=text("deleted_at IS NULL")),
     )
 
 
@@ -0,0 +1,34 @@
+"""
+PNSaldoMensile model - Saldi mensili per conto di Prima Nota
+"""
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, Numeric
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class PNSaldoMensile(Base):
+    """
+    Riepilogo di un mese per un conto: saldo di apertura, dare (entrate e
+    giroconti in ingresso), avere (uscite e giroconti in uscita) e saldo di chiusura.
+    Conta solo i movimenti definitivi, come saldo_attuale.
+
+    Le righe esistono solo per i mesi con movimenti: il saldo a una data è la
+    chiusura dell'ultimo mese precedente, oppure apertura + movimenti del mese.
+    Aggiornate nella stessa transazione dei movimenti (pn_saldi_service).
+    """
+    __tablename__ = "pn_saldi_mensili"
+
+    conto_id = Column(Integer, ForeignKey("pn_conti.id", ondelete="CASCADE"), primary_key=True)
+    mese = Column(Date, primary_key=True)  # primo giorno del mese
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), nullable=False)
+    saldo_apertura = Column(Numeric(12, 2), nullable=False, default=0)
+    dare = Column(Numeric(12, 2), nullable=False, default=0)
+    avere = Column(Numeric(12, 2), nullable=False, default=0)
+    saldo_chiusura = Column(Numeric(12, 2), nullable=False, default=0)
+
+    # Timestamps
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_pn_saldi_mensili_azienda_mese", "azienda_id", "mese"),
+    )
@@ -0,0 +1,37 @@
+"""
+ScadenzaIndice model - Indice unificato delle scadenze per le notifiche
+"""
+from sqlalchemy import BigInteger, Column, Date, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class ScadenzaIndice(Base):
+    """
+    Una riga per ogni record che può generare una notifica (polizze, scadenze
+    attrezzature, assicurazioni aziendali, fatture). È derivata: la mantiene
+    scadenze_service al commit delle scritture sui record di origine.
+
+    data_scadenza NULL indica una notifica senza data (es. fattura senza categoria).
+    updated_at cambia solo quando la riga cambia davvero ed è il cursore
+    "novità dall'ultima lettura" del feed notifiche.
+    """
+    __tablename__ = "scadenze"
+
+    id = Column(BigInteger, primary_key=True)
+    azienda_id = Column(Integer, ForeignKey("aziende.id", ondelete="CASCADE"), nullable=False)
+    tipo_entita = Column(String(40), nullable=False)  # scadenza_attrezzatura, polizza_attrezzatura, assicurazione_aziendale, fattura, fattura_senza_categoria
+    entita_id = Column(Integer, nullable=False)
+    data_scadenza = Column(Date, nullable=True)
+    stato = Column(String(30), nullable=True)  # es. stato_pagamento per le fatture
+    dati = Column(JSONB, nullable=False, server_default="{}")  # campi per titolo/descrizione della notifica
+
+    # Timestamps
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("tipo_entita", "entita_id", name="uq_scadenze_entita"),
+        Index("ix_scadenze_azienda_data", "azienda_id", "data_scadenza"),
+        Index("ix_scadenze_azienda_updated_at", "azienda_id", "updated_at"),
+    )
@@ -1,5 +1,5 @@
 """Modello Somministrazione - Registrazione somministrazioni a animali"""
-from sqlalchemy import Column, Integer, Numeric, DateTime, Date, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, Numeric, DateTime, Date, String, Text, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -42,6 +42,10 @@ class Somministrazione(Base):
     animale = relationship("Animale", backref="somministrazioni")
     farmaco = relationship("Farmaco", back_populates="somministrazioni")
     lotto_farmaco = relationship("LottoFarmaco", back_populates="somministrazioni")
+
+    __table_args__ = (
+        Index("ix_somministrazioni_animale_data", "animale_id", "data_ora", postgresql_where=text("deleted_at IS NULL")),
+    )
     
     def __repr__(self):
         return f"<Somministrazione(id={self.id}, animale_id={self.animale_id}, farmaco_id={self.farmaco_id}, data={self.data_ora})>"
@@ -37,6 +37,9 @@ from .pn import (
     PNMovimentoUpdate,
     PNPreferenzeResponse,
     PNRiepilogoResponse,
+    PNSaldoContoResponse,
+    PNEstrattoContoRiga,
+    PNEstrattoContoResponse,
     PNSetupResponse,
     SoccidaAccontoCreate,
     SoccidaAccontoResponse,
@@ -58,7 +61,7 @@ from .attrezzatura import (
     AttrezzaturaCostiRiepilogo,
 )
 from .assicurazione_aziendale import AssicurazioneAziendaleCreate, AssicurazioneAziendaleUpdate, AssicurazioneAziendaleResponse, AssicurazioneAziendaleSummary
-from .partita_animale import PartitaAnimaleCreate, PartitaAnimaleUpdate, PartitaAnimaleResponse, PartitaAnimaleConfirm
+from .partita_animale import PartitaAnimaleCreate, PartitaAnimaleUpdate, PartitaAnimaleResponse, PartitaAnimaleConfirm, AnagrafeConfirmBatch
 from .contratto_soccida import (
     ContrattoSoccidaCreate,
     ContrattoSoccidaUpdate,
@@ -126,6 +129,9 @@ __all__ = [
     "PNCategoriaResponse",
     "PNPreferenzeResponse",
     "PNDocumentoApertoResponse",
+    "PNSaldoContoResponse",
+    "PNEstrattoContoRiga",
+    "PNEstrattoContoResponse",
     "AttrezzaturaCreate",
     "AttrezzaturaUpdate",
     "AttrezzaturaResponse",
@@ -146,6 +152,7 @@ __all__ = [
     "PartitaAnimaleUpdate",
     "PartitaAnimaleResponse",
     "PartitaAnimaleConfirm",
+    "AnagrafeConfirmBatch",
     "PartitaMovimentoFinanziarioCreate",
     "PartitaMovimentoFinanziarioUpdate",
     "PartitaMovimentoFinanziarioResponse",
@@ -1,6 +1,6 @@
 """Schemi Pydantic per PartitaAnimale"""
 from pydantic import BaseModel, ConfigDict, Field, field_validator
-from typing import Optional, List, Dict, Union
+from typing import Any, Optional, List, Dict, Union
 from datetime import datetime, date
 from decimal import Decimal
 import json
@@ -195,3 +195,11 @@ class PartitaAnimaleConfirm(BaseModel):
         None, description="Pesi individuali per capo (opzionali)"
     )
 
+
+class AnagrafeConfirmBatch(BaseModel):
+    """Schema per conferma in blocco delle partite e dei gruppi decessi di un upload anagrafe"""
+    partite: List[PartitaAnimaleConfirm] = Field(default_factory=list, description="Partite da confermare")
+    # Validati elemento per elemento: un gruppo non valido diventa un esito di errore, non un 422
+    gruppi_decessi: List[Dict[str, Any]] = Field(
+        default_factory=list, description="Gruppi decessi da confermare (payload GruppoDecessiConfirm)"
+    )
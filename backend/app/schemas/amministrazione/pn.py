@@ -247,9 +247,36 @@ class PNRiepilogoResponse(BaseModel):
     saldo: Decimal
 
 
+class PNSaldoContoResponse(BaseModel):
+    conto_id: int
+    data: date
+    saldo: Decimal
+
+
+class PNEstrattoContoRiga(BaseModel):
+    movimento_id: int
+    data: date
+    descrizione: str
+    dare: Decimal
+    avere: Decimal
+    saldo: Decimal
+
+
+class PNEstrattoContoResponse(BaseModel):
+    conto_id: int
+    data_da: date
+    data_a: date
+    saldo_iniziale: Decimal
+    totale_dare: Decimal
+    totale_avere: Decimal
+    saldo_finale: Decimal
+    righe: List[PNEstrattoContoRiga]
+
+
 class PNMovimentiListResponse(BaseModel):
     movimenti: List[PNMovimentoResponse]
     riepilogo: PNRiepilogoResponse
+    cursore: Optional[str] = None  # da passare per la pagina successiva; None all'ultima
 
 
 class PNSetupResponse(BaseModel):
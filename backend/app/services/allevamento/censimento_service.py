@@ -0,0 +1,588 @@
+"""
+Service per il censimento giornaliero pre-aggregato (tabella censimenti_giornalieri)
+
+Per ogni (azienda, sede, giorno) mantiene la consistenza a fine giornata (presenti,
+per sesso e per razza) e i movimenti del giorno (arrivati, usciti, morti, uscite per
+stato). Le statistiche animali leggono queste righe invece di scansionare animali.
+
+Manutenzione:
+- hook di sessione: le scritture su Animale, PartitaAnimale e Decesso marcano
+  i giorni toccati (dal primo all'ultimo giorno in cui cambiano consistenza o
+  movimenti) e, quando la sede del capo non cambia, la sola sede; il ricalcolo
+  avviene al commit, nella stessa transazione (in un savepoint);
+- ogni ricalcolo prende un advisory lock transazionale per azienda e l'indice
+  univoco (azienda, sede, data) impedisce righe doppie;
+- lo storico iniziale lo scrive la migrazione 20261019_censimenti_backfill;
+- le letture non scrivono: la consistenza di un giorno è quella dell'ultimo
+  giorno calcolato (nei giorni senza scritture non cambia); i giorni mancanti si
+  completano al primo ricalcolo dell'azienda o con
+  scripts/backfill_censimento.py --mancanti.
+
+Semantica: un animale è presente il giorno d se data_arrivo <= d < data di uscita
+(data_uscita, o data del decesso). La sede è quella attribuita al momento del
+calcolo dalla vista animali_sede (vedi sede_animale_service).
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, inspect as sa_inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.allevamento.animale import Animale
+from app.models.allevamento.censimento_giornaliero import CensimentoGiornaliero
+from app.models.allevamento.decesso import Decesso
+from app.models.amministrazione.partita_animale import PartitaAnimale
+from app.services.allevamento.sede_animale_service import animali_sede, outerjoin_sede, sede_animale
+
+logger = logging.getLogger(__name__)
+
+STATI_USCITA_VENDITA = ("venduto", "macellato")
+STATO_DECEDUTO = "deceduto"
+STATO_PRESENTE = "presente"
+
+# Chiavi in session.info
+_DIRTY_KEY = "censimento_da_ricalcolare"
+_DEFER_KEY = "censimento_differito"
+
+# Chiave dell'advisory lock (pg_advisory_xact_lock(chiave, azienda_id)) dei ricalcoli
+_LOCK_CENSIMENTO = 0x43454E53
+
+# Attributi di Animale che cambiano consistenza o movimenti
+_ANIMALE_DATE_ATTRS = ("data_arrivo", "data_uscita")
+_ANIMALE_STORICO_ATTRS = ("stato", "deleted_at", "azienda_id")
+_ANIMALE_ATTUALE_ATTRS = ("sesso", "razza", "box_id", "codice_azienda_anagrafe")
+# Attributi che cambiano i conteggi su tutto il periodo di presenza del capo
+_ANIMALE_PERIODO_ATTRS = ("deleted_at", "azienda_id") + _ANIMALE_ATTUALE_ATTRS
+# Attributi che possono spostare il capo in un'altra sede (vista animali_sede)
+_ANIMALE_SEDE_ATTRS = ("deleted_at", "azienda_id", "box_id", "codice_azienda_anagrafe")
+
+# Colonne di consistenza (valori a fine giornata, non somme di periodo)
+_CAMPI_CONSISTENZA = ("presenti", "maschi", "femmine")
+
+# Sedi da ricalcolare: insieme di sede_id (None = animali senza sede) o TUTTE_LE_SEDI
+TUTTE_LE_SEDI = None
+
+
+def _filtro_sedi(colonna, sedi: Set[Optional[int]]):
+    ids = [sede_id for sede_id in sedi if sede_id is not None]
+    condizioni = [colonna.in_(ids)] if ids else []
+    if None in sedi:
+        condizioni.append(colonna.is_(None))
+    return or_(*condizioni)
+
+
+def _load_animali(
+    db: Session,
+    azienda_id: int,
+    data_da: date,
+    data_a: date,
+    sedi: Optional[Set[Optional[int]]] = TUTTE_LE_SEDI,
+) -> List[tuple]:
+    """
+    Colonne (non oggetti ORM) degli animali rilevanti per il periodo:
+    (sede_id, sesso, razza, stato, data_arrivo, fine, data_decesso).
+    """
+    data_decesso = func.date(Decesso.data_ora)
+    query = db.query(
+        sede_animale,
+        Animale.sesso,
+        Animale.razza,
+        Animale.stato,
+        Animale.data_arrivo,
+        Animale.data_uscita,
+        data_decesso,
+    ).select_from(Animale).outerjoin(
+        Decesso, Decesso.animale_id == Animale.id
+    )
+    query = outerjoin_sede(query).filter(
+        Animale.azienda_id == azienda_id,
+        Animale.deleted_at.is_(None),
+        Animale.data_arrivo <= data_a,
+        or_(Animale.data_uscita.is_(None), Animale.data_uscita >= data_da),
+    )
+    if sedi is not TUTTE_LE_SEDI:
+        query = query.filter(_filtro_sedi(sede_animale, sedi))
+    rows = query.all()
+
+    animali = []
+    for sede_id, sesso, razza, stato, data_arrivo, data_uscita, decesso in rows:
+        if isinstance(decesso, str):
+            decesso = date.fromisoformat(decesso[:10])
+        if stato == STATO_PRESENTE:
+            fine = None
+        else:
+            # Uscito senza data: non è mai conteggiato tra i presenti
+            fine = data_uscita or decesso or data_arrivo
+        if stato == STATO_DECEDUTO and decesso is None:
+            decesso = fine
+        animali.append((sede_id, (sesso or "").upper(), razza or "Non specificata", stato, data_arrivo, fine, decesso))
+    return animali
+
+
+def _compute_rows(
+    azienda_id: int,
+    animali: List[tuple],
+    data_da: date,
+    data_a: date,
+) -> List[Dict]:
+    """Calcola le righe giornaliere con un unico passaggio cronologico (sweep) sugli eventi."""
+    arrivi: Dict[date, List[tuple]] = defaultdict(list)
+    partenze: Dict[date, List[tuple]] = defaultdict(list)
+    presenti: Dict[Optional[int], Counter] = defaultdict(Counter)
+    razze: Dict[Optional[int], Counter] = defaultdict(Counter)
+    flussi: Dict[date, Dict[Optional[int], Counter]] = defaultdict(lambda: defaultdict(Counter))
+    uscite_stato: Dict[date, Dict[Optional[int], Counter]] = defaultdict(lambda: defaultdict(Counter))
+    sedi = {None}
+
+    def _entra(animale):
+        sede_id, sesso = animale[0], animale[1]
+        presenti[sede_id]["presenti"] += 1
+        if sesso in ("M", "F"):
+            presenti[sede_id][sesso] += 1
+        razze[sede_id][animale[2]] += 1
+
+    def _esce(animale):
+        sede_id, sesso = animale[0], animale[1]
+        presenti[sede_id]["presenti"] -= 1
+        if sesso in ("M", "F"):
+            presenti[sede_id][sesso] -= 1
+        razze[sede_id][animale[2]] -= 1
+
+    for animale in animali:
+        sede_id, _, _, stato, data_arrivo, fine, decesso = animale
+        sedi.add(sede_id)
+        mai_presente = fine is not None and fine <= data_arrivo
+        if not mai_presente:
+            if data_arrivo < data_da:
+                if fine is None or fine >= data_da:
+                    _entra(animale)
+                    if fine is not None and fine <= data_a:
+                        partenze[fine].append(animale)
+            elif data_arrivo <= data_a:
+                arrivi[data_arrivo].append(animale)
+                if fine is not None and fine <= data_a:
+                    partenze[fine].append(animale)
+        if data_da <= data_arrivo <= data_a:
+            flussi[data_arrivo][sede_id]["arrivati"] += 1
+        if fine is not None and data_da <= fine <= data_a:
+            if stato in STATI_USCITA_VENDITA:
+                flussi[fine][sede_id]["usciti"] += 1
+            uscite_stato[fine][sede_id][stato or "sconosciuto"] += 1
+        if stato == STATO_DECEDUTO and decesso and data_da <= decesso <= data_a:
+            flussi[decesso][sede_id]["morti"] += 1
+
+    righe = []
+    giorno = data_da
+    while giorno <= data_a:
+        for animale in arrivi.pop(giorno, ()):
+            _entra(animale)
+        for animale in partenze.pop(giorno, ()):
+            _esce(animale)
+        flussi_giorno = flussi.pop(giorno, {})
+        uscite_giorno = uscite_stato.pop(giorno, {})
+        for sede_id in sedi:
+            stock = presenti[sede_id]
+            flusso = flussi_giorno.get(sede_id) or Counter()
+            if sede_id is not None and not stock["presenti"] and not flusso:
+                continue
+            righe.append({
+                "azienda_id": azienda_id,
+                "sede_id": sede_id,
+                "data": giorno,
+                "presenti": stock["presenti"],
+                "maschi": stock["M"],
+                "femmine": stock["F"],
+                "presenti_per_razza": {r: n for r, n in razze[sede_id].items() if n} or None,
+                "arrivati": flusso["arrivati"],
+                "usciti": flusso["usciti"],
+                "morti": flusso["morti"],
+                "uscite_per_stato": dict(uscite_giorno.get(sede_id) or {}) or None,
+            })
+        giorno += timedelta(days=1)
+    return righe
+
+
+def refresh_censimento(
+    db: Session,
+    azienda_id: int,
+    data_da: date,
+    data_a: Optional[date] = None,
+    sedi: Optional[Set[Optional[int]]] = TUTTE_LE_SEDI,
+) -> int:
+    """
+    Ricalcola le righe dell'azienda nel periodo [data_da, data_a] (default: oggi),
+    per tutte le sedi o solo per quelle indicate (None nell'insieme = animali senza sede).
+    Non esegue commit. Restituisce il numero di righe scritte.
+    """
+    data_a = min(data_a or date.today(), date.today())
+    if data_da > data_a:
+        return 0
+    # Serializza i ricalcoli della stessa azienda fino al commit: due transazioni
+    # concorrenti non possono cancellare e reinserire lo stesso periodo insieme
+    db.execute(select(func.pg_advisory_xact_lock(_LOCK_CENSIMENTO, azienda_id)))
+    righe = _compute_rows(azienda_id, _load_animali(db, azienda_id, data_da, data_a, sedi), data_da, data_a)
+    filtro = [
+        CensimentoGiornaliero.azienda_id == azienda_id,
+        CensimentoGiornaliero.data >= data_da,
+        CensimentoGiornaliero.data <= data_a,
+    ]
+    if sedi is not TUTTE_LE_SEDI:
+        righe = [riga for riga in righe if riga["sede_id"] in sedi]
+        filtro.append(_filtro_sedi(CensimentoGiornaliero.sede_id, sedi))
+    db.execute(delete(CensimentoGiornaliero).where(*filtro).execution_options(synchronize_session=False))
+    if righe:
+        db.execute(insert(CensimentoGiornaliero), righe)
+    return len(righe)
+
+
+def _prima_data_azienda(db: Session, azienda_id: int) -> Optional[date]:
+    return db.query(func.min(Animale.data_arrivo)).filter(
+        Animale.azienda_id == azienda_id,
+        Animale.deleted_at.is_(None),
+    ).scalar()
+
+
+def backfill_censimento(db: Session, azienda_id: int, data_da: Optional[date] = None) -> int:
+    """Ricostruisce il censimento dell'azienda dal primo arrivo (o da data_da) ad oggi. Non esegue commit."""
+    data_da = data_da or _prima_data_azienda(db, azienda_id) or date.today()
+    return refresh_censimento(db, azienda_id, data_da)
+
+
+def completa_censimento(db: Session, azienda_id: int) -> int:
+    """
+    Calcola i giorni mancanti fino ad oggi (giorni senza scritture); se l'azienda non
+    ha ancora righe esegue il backfill completo. Non esegue commit.
+    Usata da scripts/backfill_censimento.py --mancanti, mai dalle letture.
+    """
+    ultima = db.query(func.max(CensimentoGiornaliero.data)).filter(
+        CensimentoGiornaliero.azienda_id == azienda_id
+    ).scalar()
+    if ultima is None:
+        return backfill_censimento(db, azienda_id)
+    if ultima >= date.today():
+        return 0
+    return refresh_censimento(db, azienda_id, ultima + timedelta(days=1))
+
+
+def aziende_censimento(db: Session, azienda_id: Optional[int]) -> List[int]:
+    """Aziende da elaborare (una o tutte), per gli script di backfill."""
+    if azienda_id:
+        return [azienda_id]
+    from app.models.allevamento.azienda import Azienda
+    return [a for (a,) in db.query(Azienda.id).filter(Azienda.deleted_at.is_(None))]
+
+
+def _chiave_aggregazione(aggregazione: str):
+    return CensimentoGiornaliero.sede_id if aggregazione == "sede" else CensimentoGiornaliero.azienda_id
+
+
+def _consistenza_al(query, giorno: date, azienda_id: Optional[int]):
+    """
+    Limita la query alle righe di consistenza valide al giorno: per ogni azienda
+    l'ultimo giorno calcolato non successivo. Nei giorni senza scritture la
+    consistenza non cambia, quindi la riga più recente vale finché non viene
+    ricalcolata (commit o scripts/backfill_censimento.py --mancanti).
+    """
+    ultimo = select(
+        CensimentoGiornaliero.azienda_id.label("azienda_id"),
+        func.max(CensimentoGiornaliero.data).label("data"),
+    ).where(CensimentoGiornaliero.data <= giorno)
+    if azienda_id:
+        ultimo = ultimo.where(CensimentoGiornaliero.azienda_id == azienda_id)
+    ultimo = ultimo.group_by(CensimentoGiornaliero.azienda_id).subquery()
+    return query.join(
+        ultimo,
+        and_(
+            CensimentoGiornaliero.azienda_id == ultimo.c.azienda_id,
+            CensimentoGiornaliero.data == ultimo.c.data,
+        ),
+    )
+
+
+def totali_censimento(
+    db: Session,
+    campo: str,
+    aggregazione: str,
+    azienda_id: Optional[int] = None,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+) -> Dict[int, int]:
+    """
+    Somma di una colonna del censimento per sede o azienda.
+    Per la consistenza (presenti, maschi, femmine) conta il giorno data_a (default oggi);
+    per i movimenti (arrivati, usciti, morti) il periodo, o nessuna data per "sempre".
+    """
+    chiave = _chiave_aggregazione(aggregazione)
+    query = db.query(chiave, func.sum(getattr(CensimentoGiornaliero, campo))).filter(chiave.isnot(None))
+    if azienda_id:
+        query = query.filter(CensimentoGiornaliero.azienda_id == azienda_id)
+    if campo in _CAMPI_CONSISTENZA:
+        query = _consistenza_al(query, data_a or date.today(), azienda_id)
+    else:
+        if data_da:
+            query = query.filter(CensimentoGiornaliero.data >= data_da)
+        if data_a:
+            query = query.filter(CensimentoGiornaliero.data <= data_a)
+    return {k: int(totale) for k, totale in query.group_by(chiave).all() if totale}
+
+
+def presenti_per_razza(
+    db: Session,
+    aggregazione: str,
+    azienda_id: Optional[int] = None,
+    razza: Optional[str] = None,
+    giorno: Optional[date] = None,
+) -> Dict[int, Dict[str, int]]:
+    """Capi presenti per razza (consistenza del giorno, default oggi) per sede o azienda."""
+    chiave = _chiave_aggregazione(aggregazione)
+    query = db.query(chiave, CensimentoGiornaliero.presenti_per_razza).filter(chiave.isnot(None))
+    if azienda_id:
+        query = query.filter(CensimentoGiornaliero.azienda_id == azienda_id)
+    query = _consistenza_al(query, giorno or date.today(), azienda_id)
+    result: Dict[int, Dict[str, int]] = {}
+    for k, per_razza in query.all():
+        for nome, numero in (per_razza or {}).items():
+            if razza and nome != razza:
+                continue
+            bucket = result.setdefault(k, {})
+            bucket[nome] = bucket.get(nome, 0) + int(numero)
+    return result
+
+
+# ============ HOOK DI SESSIONE ============
+# session.info[_DIRTY_KEY]: {azienda_id: [(data_da, data_a, animale_id)]}
+# data_da None = dal primo arrivo dell'azienda; animale_id None = tutte le sedi,
+# altrimenti solo la sede attuale del capo.
+Intervallo = Tuple[Optional[date], date, Optional[int]]
+
+
+def _mark(
+    session: Session,
+    azienda_id: Optional[int],
+    data_da: Optional[date],
+    data_a: Optional[date] = None,
+    animale_id: Optional[int] = None,
+) -> None:
+    if not azienda_id:
+        return
+    oggi = date.today()
+    data_a = min(data_a or oggi, oggi)
+    if data_da is not None and data_da > data_a:
+        # Evento futuro: nessun giorno calcolato cambia
+        return
+    session.info.setdefault(_DIRTY_KEY, {}).setdefault(azienda_id, []).append((data_da, data_a, animale_id))
+
+
+def _history_values(state, attr: str) -> List:
+    history = state.attrs[attr].history
+    return list(history.added or ()) + list(history.deleted or ()) + list(history.unchanged or ())
+
+
+_IGNOTO = object()
+
+
+def _vecchio_nuovo(state, attr: str):
+    """(valore precedente, valore attuale); il precedente è _IGNOTO se non era caricato."""
+    history = state.attrs[attr].history
+    nuovo = state.dict.get(attr)
+    if not history.has_changes():
+        return nuovo, nuovo
+    return (history.deleted[0] if history.deleted else _IGNOTO), nuovo
+
+
+def _fine_presenza(stato: Optional[str], data_uscita: Optional[date]) -> date:
+    """Ultimo giorno in cui il capo può contare (uscita o, se presente o senza data, oggi)."""
+    if stato != STATO_PRESENTE and data_uscita:
+        return data_uscita
+    return date.today()
+
+
+def _date(*valori) -> List[date]:
+    return [v for v in valori if isinstance(v, date)]
+
+
+def _track_animale(session: Session, animale: Animale, eliminato: bool = False, nuovo: bool = False) -> None:
+    state = sa_inspect(animale)
+    if nuovo or eliminato:
+        fine = _fine_presenza(state.dict.get("stato"), state.dict.get("data_uscita"))
+        # Capo eliminato: non è più nella vista animali_sede, si ricalcolano tutte le sedi
+        _mark(session, animale.azienda_id, state.dict.get("data_arrivo") or date.today(), fine,
+              None if eliminato else animale.id)
+        return
+    changed = {
+        attr for attr in _ANIMALE_DATE_ATTRS + _ANIMALE_STORICO_ATTRS + _ANIMALE_ATTUALE_ATTRS
+        if state.attrs[attr].history.has_changes()
+    }
+    if not changed:
+        return
+
+    arrivo_prima, arrivo = _vecchio_nuovo(state, "data_arrivo")
+    uscita_prima, uscita = _vecchio_nuovo(state, "data_uscita")
+    stato_prima, stato = _vecchio_nuovo(state, "stato")
+    if any(valore is _IGNOTO for valore in (arrivo_prima, uscita_prima, stato_prima)):
+        # Valore precedente non caricato: periodo non delimitabile
+        data_da, data_a = None, date.today()
+    else:
+        fine_prima, fine = _fine_presenza(stato_prima, uscita_prima), _fine_presenza(stato, uscita)
+        if changed & set(_ANIMALE_PERIODO_ATTRS):
+            # Cambiano i conteggi per tutto il periodo di presenza (vecchio e nuovo)
+            confini = _date(arrivo_prima, arrivo, fine_prima, fine)
+        else:
+            # Cambiano solo i giorni tra il vecchio e il nuovo estremo del periodo
+            confini = []
+            if arrivo_prima != arrivo:
+                confini += _date(arrivo_prima, arrivo)
+            if fine_prima != fine or "stato" in changed:
+                confini += _date(fine_prima, fine)
+            if "stato" in changed and any(
+                s != STATO_PRESENTE and u is None for s, u in ((stato_prima, uscita_prima), (stato, uscita))
+            ):
+                # Uscito senza data: la fine dipende dal decesso o coincide con l'arrivo
+                confini += _date(arrivo_prima, arrivo)
+        if not confini:
+            return
+        data_da, data_a = min(confini), max(confini)
+
+    animale_id = None if changed & set(_ANIMALE_SEDE_ATTRS) else animale.id
+    aziende = set(v for v in _history_values(state, "azienda_id") if v) or {animale.azienda_id}
+    for azienda_id in aziende:
+        _mark(session, azienda_id, data_da, data_a, animale_id)
+
+
+def _track_partita(session: Session, partita: PartitaAnimale, tutto: bool) -> None:
+    state = sa_inspect(partita)
+    if not tutto and not any(state.attrs[attr].history.has_changes() for attr in ("data", "deleted_at", "tipo")):
+        return
+    # Le conferme delle partite aggiornano anche gli animali con SQL diretto: dalla data ad oggi
+    giorni = _date(*_history_values(state, "data"))
+    _mark(session, state.dict.get("azienda_id") or partita.azienda_id, min(giorni) if giorni else date.today())
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _censimento_after_flush(session: Session, flush_context) -> None:
+    for obj in session.new:
+        if isinstance(obj, Animale):
+            _track_animale(session, obj, nuovo=True)
+        elif isinstance(obj, PartitaAnimale):
+            _track_partita(session, obj, True)
+    for obj in session.deleted:
+        if isinstance(obj, Animale):
+            _track_animale(session, obj, eliminato=True)
+        elif isinstance(obj, PartitaAnimale):
+            _track_partita(session, obj, True)
+    for obj in session.dirty:
+        if isinstance(obj, Animale):
+            _track_animale(session, obj)
+        elif isinstance(obj, PartitaAnimale):
+            _track_partita(session, obj, False)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Decesso):
+            # I decessi cambiano anche lo stato dell'animale; qui basta la data se l'animale è caricato
+            animale = sa_inspect(obj).dict.get("animale")
+            data_ora = sa_inspect(obj).dict.get("data_ora")
+            if animale is not None:
+                _mark(session, animale.azienda_id, data_ora.date() if data_ora else date.today(), None, animale.id)
+
+
+def _merge_dirty(target: Dict[int, List[Intervallo]], source: Optional[Dict[int, List[Intervallo]]]):
+    for azienda_id, intervalli in (source or {}).items():
+        target.setdefault(azienda_id, []).extend(intervalli)
+    return target
+
+
+def _accorpa(session: Session, azienda_id: int, intervalli: List[Intervallo]) -> List[tuple]:
+    """
+    Intervalli marcati -> ricalcoli (data_da, data_a, sedi): gli intervalli che si
+    toccano vengono uniti, con l'unione delle sedi dei capi coinvolti. Se la tabella
+    è indietro rispetto ad oggi si calcolano anche i giorni mancanti, così le righe
+    di ogni azienda restano contigue dal primo arrivo all'ultimo giorno calcolato.
+    """
+    ultima = session.query(func.max(CensimentoGiornaliero.data)).filter(
+        CensimentoGiornaliero.azienda_id == azienda_id
+    ).scalar()
+    oggi = date.today()
+    if ultima is None:
+        intervalli = intervalli + [(None, oggi, None)]
+    elif ultima < oggi:
+        intervalli = intervalli + [(ultima + timedelta(days=1), oggi, None)]
+
+    animale_ids = {animale_id for _, _, animale_id in intervalli if animale_id is not None}
+    sede_per_animale = {}
+    if animale_ids:
+        sede_per_animale = dict(session.execute(
+            select(animali_sede.c.animale_id, animali_sede.c.sede_id)
+            .where(animali_sede.c.animale_id.in_(animale_ids))
+        ).all())
+    prima_data = None
+    if any(data_da is None for data_da, _, _ in intervalli):
+        prima_data = _prima_data_azienda(session, azienda_id) or date.today()
+
+    normalizzati = []
+    for data_da, data_a, animale_id in intervalli:
+        if animale_id is None or animale_id not in sede_per_animale:
+            sedi = TUTTE_LE_SEDI
+        else:
+            sedi = {sede_per_animale[animale_id]}
+        normalizzati.append((data_da or prima_data, data_a, sedi))
+    normalizzati.sort(key=lambda intervallo: intervallo[0])
+
+    ricalcoli: List[list] = []
+    for data_da, data_a, sedi in normalizzati:
+        if ricalcoli and data_da <= ricalcoli[-1][1] + timedelta(days=1):
+            corrente = ricalcoli[-1]
+            corrente[1] = max(corrente[1], data_a)
+            corrente[2] = TUTTE_LE_SEDI if corrente[2] is TUTTE_LE_SEDI or sedi is TUTTE_LE_SEDI else corrente[2] | sedi
+        else:
+            ricalcoli.append([data_da, data_a, sedi])
+    return [tuple(ricalcolo) for ricalcolo in ricalcoli]
+
+
+def _apply_pending(session: Session, dirty: Optional[Dict[int, List[Intervallo]]]) -> None:
+    if not dirty:
+        return
+    try:
+        with session.begin_nested():
+            for azienda_id, intervalli in dirty.items():
+                for data_da, data_a, sedi in _accorpa(session, azienda_id, intervalli):
+                    refresh_censimento(session, azienda_id, data_da, data_a, sedi)
+    except Exception:
+        # Il censimento è derivato: un errore non deve bloccare la scrittura principale
+        logger.exception("Aggiornamento censimento giornaliero non riuscito (aziende %s)", list(dirty))
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _censimento_before_commit(session: Session) -> None:
+    if not session.info.get(_DIRTY_KEY) and not (session.new or session.dirty or session.deleted):
+        return
+    # Flush esplicito: le modifiche pendenti vengono tracciate prima del ricalcolo
+    session.flush()
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if _DEFER_KEY in session.info:
+        # Le date delle transazioni confermate restano in attesa di flush_censimento
+        _merge_dirty(session.info[_DEFER_KEY], dirty)
+        return
+    _apply_pending(session, dirty)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _censimento_after_rollback(session: Session) -> None:
+    # Solo le modifiche non confermate vengono scartate
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def defer_censimento(session: Session) -> None:
+    """
+    Rimanda il ricalcolo del censimento a flush_censimento (es. import a lotti con
+    molti commit): le date toccate si accumulano e il ricalcolo avviene una volta sola.
+    """
+    session.info.setdefault(_DEFER_KEY, {})
+
+
+def flush_censimento(session: Session) -> None:
+    """Esegue il ricalcolo rimandato da defer_censimento e fa commit."""
+    dirty = _merge_dirty(session.info.pop(_DEFER_KEY, None) or {}, session.info.pop(_DIRTY_KEY, None))
+    _apply_pending(session, dirty)
+    session.commit()
@@ -0,0 +1,34 @@
+"""
+Attribuzione della sede agli animali, risolta nel database
+
+La vista animali_sede (migrazione 20261018_animali_sede_view) restituisce per ogni
+animale la sede di appartenenza:
+- la sede dell'azienda con codice_stalla = codice_azienda_anagrafe, se esiste;
+- altrimenti la sede del box assegnato (box -> stabilimento -> sede).
+sede_id è NULL quando nessuna delle due regole si applica.
+
+Le statistiche per sede fanno un outer join sulla vista e raggruppano per
+animali_sede.c.sede_id, senza caricare animali, box o sedi in Python.
+"""
+from sqlalchemy import Column, Integer, MetaData, Table
+
+from app.models.allevamento.animale import Animale
+
+# MetaData separato: è una vista, non deve finire in Base.metadata (autogenerate)
+_metadata_viste = MetaData()
+
+animali_sede = Table(
+    "animali_sede",
+    _metadata_viste,
+    Column("animale_id", Integer, primary_key=True),
+    Column("azienda_id", Integer),
+    Column("sede_id", Integer),
+)
+
+# Colonna da selezionare / raggruppare dopo outerjoin_sede()
+sede_animale = animali_sede.c.sede_id
+
+
+def outerjoin_sede(query):
+    """Aggiunge alla query (che deve già includere Animale) la sede di ogni animale."""
+    return query.outerjoin(animali_sede, animali_sede.c.animale_id == Animale.id)
@@ -3,7 +3,7 @@ Servizio per la gestione dei DDT emessi
 """
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -14,6 +14,12 @@ from app.schemas.amministrazione.ddt_emesso import (
     DdtEmessoCreate,
     DdtEmessoUpdate,
 )
+from app.services.amministrazione.sequenze_service import (
+    SEQUENZA_DDT_EMESSO,
+    allocate_sequence,
+    bump_sequence,
+    peek_next_sequence,
+)
 
 
 def get_ddt_emessi(
@@ -62,7 +68,8 @@ def get_next_ddt_number(
     db: Session,
     azienda_id: int,
     anno: Optional[int] = None,
-    numero_progressivo: Optional[int] = None
+    numero_progressivo: Optional[int] = None,
+    riserva: bool = False
 ) -> tuple[int, int, str]:
     """
     Calcola il prossimo numero DDT per l'azienda e l'anno specificati.
@@ -72,6 +79,8 @@ def get_next_ddt_number(
         azienda_id: ID azienda
         anno: Anno di riferimento (default: anno corrente)
         numero_progressivo: Numero progressivo da usare (se None, calcola automaticamente)
+        riserva: Se True il numero viene riservato sul contatore (creazione DDT);
+            se False è solo un'anteprima e non consuma numeri
     
     Returns:
         Tuple (numero_progressivo, anno, numero_formattato)
@@ -82,16 +91,12 @@ def get_next_ddt_number(
     # Recupera formato numerazione dalle impostazioni
     formato_numero = get_ddt_number_format(db, azienda_id)
     
-    # Se numero_progressivo non è specificato, calcola il prossimo disponibile
+    # Se numero_progressivo non è specificato, usa il contatore della sequenza DDT
     if numero_progressivo is None:
-        # Trova il numero progressivo massimo per l'anno
-        max_progressivo = db.query(func.max(DdtEmesso.numero_progressivo)).filter(
-            DdtEmesso.azienda_id == azienda_id,
-            DdtEmesso.anno == anno,
-            DdtEmesso.deleted_at.is_(None)
-        ).scalar()
-        
-        numero_progressivo = (max_progressivo or 0) + 1
+        if riserva:
+            numero_progressivo = allocate_sequence(db, azienda_id, anno, SEQUENZA_DDT_EMESSO)
+        else:
+            numero_progressivo = peek_next_sequence(db, azienda_id, anno, SEQUENZA_DDT_EMESSO)
     
     # Formatta il numero secondo il formato configurato
     numero_formattato = format_ddt_number(numero_progressivo, anno, formato_numero)
@@ -156,10 +161,11 @@ def create_ddt_emesso(
     # Converti in dict per modifiche
     ddt_data = ddt.model_dump() if hasattr(ddt, 'model_dump') else ddt.dict()
     
-    # Calcola numero se non specificato
+    # Calcola numero se non specificato (riservandolo sul contatore)
+    numero_da_contatore = ddt_data.get('numero_progressivo') is None and numero_progressivo is None
     if ddt_data.get('numero_progressivo') is None:
         numero_prog, anno, numero = get_next_ddt_number(
-            db, ddt_data['azienda_id'], ddt_data.get('anno'), numero_progressivo
+            db, ddt_data['azienda_id'], ddt_data.get('anno'), numero_progressivo, riserva=True
         )
         ddt_data['numero_progressivo'] = numero_prog
         ddt_data['anno'] = anno
@@ -175,6 +181,12 @@ def create_ddt_emesso(
             formato
         )
     
+    # Numero scelto a mano: porta avanti il contatore perché non venga riassegnato
+    if not numero_da_contatore and ddt_data.get('anno') is not None:
+        bump_sequence(
+            db, ddt_data['azienda_id'], ddt_data['anno'], SEQUENZA_DDT_EMESSO, ddt_data['numero_progressivo']
+        )
+    
     # Popola snapshot destinatario se cliente_id è specificato
     if ddt_data.get('cliente_id') and not ddt_data.get('destinatario_nome'):
         cliente = db.query(Fornitore).filter(
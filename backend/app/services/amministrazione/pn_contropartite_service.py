@@ -0,0 +1,212 @@
+"""
+Contropartite di Prima Nota (tabella pn_contropartite)
+
+Ogni movimento con contropartita_nome è collegato (contropartita_id) alla
+contropartita della sua azienda con lo stesso nome normalizzato: minuscolo, senza
+spazi iniziali/finali e con gli spazi interni compattati. La contropartita porta
+il Fornitore con lo stesso nome o partita IVA, preferendo quelli dell'azienda.
+
+Manutenzione: hook before_flush sui PNMovimento nuovi o con contropartita_nome
+modificato (INSERT ... ON CONFLICT sulla coppia azienda/nome normalizzato). Le
+modifiche via SQL diretto non passano dall'hook: la migrazione
+20261019_pn_contropartite contiene il popolamento iniziale.
+
+I report dare/avere per contropartita filtrano su (contropartita_id, data), indicizzato.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, event, exists, func, inspect as sa_inspect, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.amministrazione.fornitore import Fornitore
+from app.models.amministrazione.pn import PNContropartita, PNMovimento, PNTipoOperazione
+
+# Chiave in session.info: {(azienda_id, nome_normalizzato): contropartita_id}
+_CACHE_KEY = "pn_contropartite_ids"
+
+_contropartite = PNContropartita.__table__
+
+
+def normalizza_contropartita(nome: Optional[str]) -> str:
+    """Nome confrontabile: minuscolo, spazi compattati (stessa regola della migrazione)."""
+    return " ".join((nome or "").split()).lower()
+
+
+def _normalizza_sql(colonna):
+    # Prima si compattano gli spazi (anche tab e a capo), poi btrim toglie lo spazio ai bordi
+    return func.lower(func.btrim(func.regexp_replace(colonna, r"\s+", " ", "g")))
+
+
+def _upsert_contropartita(session: Session, azienda_id: int, nome: str, nome_normalizzato: str) -> int:
+    fornitore_id = (
+        select(Fornitore.id)
+        .where(or_(_normalizza_sql(Fornitore.nome) == nome_normalizzato, Fornitore.partita_iva == nome))
+        .order_by((Fornitore.azienda_id == azienda_id).desc(), Fornitore.id.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = pg_insert(_contropartite).values(
+        azienda_id=azienda_id,
+        nome=nome,
+        nome_normalizzato=nome_normalizzato,
+        fornitore_id=fornitore_id,
+    )
+    # Collega il fornitore anche se è stato creato dopo la contropartita
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_contropartite.c.azienda_id, _contropartite.c.nome_normalizzato],
+        set_={"fornitore_id": func.coalesce(_contropartite.c.fornitore_id, stmt.excluded.fornitore_id)},
+    ).returning(_contropartite.c.id)
+    return session.connection().execute(stmt).scalar_one()
+
+
+def contropartita_id_per_nome(session: Session, azienda_id: Optional[int], nome: Optional[str]) -> Optional[int]:
+    """Id della contropartita per il nome (creata se manca), None se il nome è vuoto."""
+    nome_normalizzato = normalizza_contropartita(nome)
+    if not nome_normalizzato or not azienda_id:
+        return None
+    cache = session.info.setdefault(_CACHE_KEY, {})
+    chiave = (azienda_id, nome_normalizzato)
+    if chiave not in cache:
+        cache[chiave] = _upsert_contropartita(session, azienda_id, " ".join(nome.split()), nome_normalizzato)
+    return cache[chiave]
+
+
+# ============ HOOK DI SESSIONE ============
+@event.listens_for(SessionLocal, "before_flush")
+def _contropartite_before_flush(session: Session, flush_context, instances) -> None:
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, PNMovimento):
+            continue
+        if obj not in session.new and not sa_inspect(obj).attrs.contropartita_nome.history.has_changes():
+            continue
+        obj.contropartita_id = contropartita_id_per_nome(session, obj.azienda_id, obj.contropartita_nome)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _contropartite_fine_transazione(session: Session) -> None:
+    session.info.pop(_CACHE_KEY, None)
+
+
+# ============ LETTURE ============
+def get_contropartita(
+    db: Session,
+    azienda_id: int,
+    contropartita_id: Optional[int] = None,
+    nome: Optional[str] = None,
+) -> Optional[PNContropartita]:
+    """Contropartita dell'azienda per id o per nome (normalizzato)."""
+    query = db.query(PNContropartita).filter(PNContropartita.azienda_id == azienda_id)
+    if contropartita_id is not None:
+        return query.filter(PNContropartita.id == contropartita_id).one_or_none()
+    nome_normalizzato = normalizza_contropartita(nome)
+    if not nome_normalizzato:
+        return None
+    return query.filter(PNContropartita.nome_normalizzato == nome_normalizzato).one_or_none()
+
+
+def list_contropartite(db: Session, azienda_id: int) -> List[PNContropartita]:
+    """Contropartite con almeno un movimento non eliminato, per nome."""
+    ha_movimenti = exists().where(
+        PNMovimento.contropartita_id == PNContropartita.id,
+        PNMovimento.deleted_at.is_(None),
+    )
+    return (
+        db.query(PNContropartita)
+        .filter(PNContropartita.azienda_id == azienda_id, ha_movimenti)
+        .order_by(PNContropartita.nome.asc())
+        .all()
+    )
+
+
+def dati_fornitore_cliente(db: Session, contropartita: PNContropartita) -> Dict:
+    """Anagrafica per l'intestazione del report (dal Fornitore collegato, se presente)."""
+    dati = {"nome": contropartita.nome}
+    fornitore = db.get(Fornitore, contropartita.fornitore_id) if contropartita.fornitore_id else None
+    if fornitore:
+        dati.update({
+            "nome": fornitore.nome or contropartita.nome,
+            "piva": fornitore.partita_iva or "",
+            "indirizzo": fornitore.indirizzo or "",
+            "cap": fornitore.indirizzo_cap or "",
+            "citta": fornitore.indirizzo_comune or "",
+            "provincia": fornitore.indirizzo_provincia or "",
+            "telefono": fornitore.telefono or "",
+            "email": fornitore.email or "",
+        })
+    return dati
+
+
+def estratto_contropartita(
+    db: Session,
+    contropartita: PNContropartita,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> Dict:
+    """
+    Movimenti della contropartita (entrate in dare, il resto in avere) ordinati per
+    data, con saldo progressivo; totali e conteggio riguardano tutto il periodo,
+    anche quando si chiede una sola pagina.
+    """
+    dare = case((PNMovimento.tipo_operazione == PNTipoOperazione.ENTRATA, PNMovimento.importo), else_=0)
+    avere = case((PNMovimento.tipo_operazione != PNTipoOperazione.ENTRATA, PNMovimento.importo), else_=0)
+    filtri = [
+        PNMovimento.contropartita_id == contropartita.id,
+        PNMovimento.azienda_id == contropartita.azienda_id,
+        PNMovimento.deleted_at.is_(None),
+    ]
+    if data_da:
+        filtri.append(PNMovimento.data >= data_da)
+    if data_a:
+        filtri.append(PNMovimento.data <= data_a)
+
+    totale, totale_dare, totale_avere = db.execute(
+        select(func.count(), func.coalesce(func.sum(dare), 0), func.coalesce(func.sum(avere), 0)).where(*filtri)
+    ).one()
+
+    righe = (
+        select(
+            PNMovimento.id,
+            PNMovimento.data,
+            PNMovimento.descrizione,
+            dare.label("dare"),
+            avere.label("avere"),
+            func.sum(dare - avere).over(order_by=(PNMovimento.data, PNMovimento.id)).label("saldo"),
+        )
+        .where(*filtri)
+        .subquery()
+    )
+    pagina = select(righe).order_by(righe.c.data, righe.c.id).offset(skip)
+    if limit is not None:
+        pagina = pagina.limit(limit)
+
+    totale_dare = Decimal(totale_dare)
+    totale_avere = Decimal(totale_avere)
+    return {
+        "contropartita": {
+            "id": contropartita.id,
+            "nome": contropartita.nome,
+            "fornitore_id": contropartita.fornitore_id,
+        },
+        "movimenti": [
+            {
+                "id": riga.id,
+                "data": riga.data,
+                "descrizione": riga.descrizione or "",
+                "dare": Decimal(riga.dare),
+                "avere": Decimal(riga.avere),
+                "saldo": Decimal(riga.saldo),
+            }
+            for riga in db.execute(pagina)
+        ],
+        "totale": totale,
+        "totale_dare": totale_dare,
+        "totale_avere": totale_avere,
+        "saldo": totale_dare - totale_avere,
+    }
@@ -0,0 +1,65 @@
+"""
+Ricerca testuale sui movimenti di Prima Nota (descrizione, note, contropartita)
+
+Due modalità:
+- contiene: sottostringa case-insensitive (lower(colonna) LIKE '%testo%'),
+  servita in PostgreSQL dagli indici trigram GIN su lower(colonna);
+- parole: ricerca full-text in italiano (websearch_to_tsquery: parole, "frasi",
+  -esclusioni) sull'indice GIN to_tsvector della migrazione 20261019_pn_ricerca.
+
+Le espressioni devono restare identiche a quelle degli indici, altrimenti il
+planner non li usa. Su database diversi da PostgreSQL (SQLite in locale) la
+modalità parole ricade su LIKE: ogni parola deve comparire in una delle colonne.
+"""
+from enum import Enum
+
+from sqlalchemy import and_, func, literal_column, or_
+from sqlalchemy.orm import Session
+
+from app.models.amministrazione.pn import PNMovimento
+
+
+class PNModalitaRicerca(str, Enum):
+    CONTIENE = "contiene"
+    PAROLE = "parole"
+
+
+_COLONNE_RICERCA = (PNMovimento.descrizione, PNMovimento.note, PNMovimento.contropartita_nome)
+
+_CONFIGURAZIONE_FTS = literal_column("'italian'::regconfig")
+
+
+def _testo_movimento():
+    """Testo indicizzato per la ricerca full-text (stessa espressione dell'indice)."""
+    return (
+        func.coalesce(PNMovimento.descrizione, "")
+        + " "
+        + func.coalesce(PNMovimento.note, "")
+        + " "
+        + func.coalesce(PNMovimento.contropartita_nome, "")
+    )
+
+
+def _pattern_contiene(testo: str) -> str:
+    escaped = testo.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _filtro_contiene(testo: str):
+    pattern = _pattern_contiene(testo)
+    return or_(*(func.lower(colonna).like(pattern, escape="\\") for colonna in _COLONNE_RICERCA))
+
+
+def filtro_ricerca_movimenti(db: Session, testo: str, modalita: PNModalitaRicerca = PNModalitaRicerca.CONTIENE):
+    """Condizione WHERE per la ricerca `testo` nei movimenti, None se il testo è vuoto."""
+    testo = (testo or "").strip()
+    if not testo:
+        return None
+    if modalita != PNModalitaRicerca.PAROLE:
+        return _filtro_contiene(testo)
+
+    if db.get_bind().dialect.name != "postgresql":
+        return and_(*(_filtro_contiene(parola) for parola in testo.split()))
+    return func.to_tsvector(_CONFIGURAZIONE_FTS, _testo_movimento()).op("@@")(
+        func.websearch_to_tsquery(_CONFIGURAZIONE_FTS, testo)
+    )
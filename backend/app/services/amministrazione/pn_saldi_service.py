@@ -0,0 +1,309 @@
+"""
+Saldi progressivi dei conti di Prima Nota (tabella pn_saldi_mensili)
+
+Per ogni conto e mese con movimenti definitivi la tabella conserva saldo di
+apertura, dare, avere e saldo di chiusura. Regole di imputazione (le stesse di
+_apply_balance_effect in prima_nota_service):
+- entrata: dare sul conto;
+- uscita: avere sul conto;
+- giroconto: avere sul conto, dare sul conto di destinazione.
+
+Manutenzione:
+- registra_effetto_saldo() è chiamata da _apply_balance_effect nella stessa
+  transazione del movimento: aggiorna il mese del movimento e sposta apertura e
+  chiusura dei mesi successivi;
+- sposta_saldi() applica ai mesi la variazione del saldo iniziale del conto;
+- verifica_saldi() ricalcola i saldi dai movimenti e segnala (o corregge) le
+  differenze, compreso saldo_attuale: scripts/verifica_saldi_prima_nota.py.
+
+Letture: saldo_al() legge un solo snapshot più i movimenti del mese parziale;
+estratto_conto() parte dal saldo al giorno precedente e somma i movimenti del periodo.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.amministrazione.pn import PNConto, PNMovimento, PNStatoMovimento, PNTipoOperazione
+from app.models.amministrazione.pn_saldo_mensile import PNSaldoMensile
+
+ZERO = Decimal("0")
+
+_saldi = PNSaldoMensile.__table__
+
+
+def _inizio_mese(giorno: date) -> date:
+    return giorno.replace(day=1)
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+# ============ AGGIORNAMENTO INCREMENTALE ============
+def registra_effetto_saldo(
+    db: Session,
+    conto: PNConto,
+    giorno: date,
+    dare: Decimal = ZERO,
+    avere: Decimal = ZERO,
+) -> None:
+    """
+    Registra nel mese di `giorno` una variazione di dare/avere del conto (valori
+    negativi per stornare un movimento) e sposta i saldi dei mesi successivi.
+    """
+    delta = dare - avere
+    if dare == ZERO and avere == ZERO:
+        return
+    mese = _inizio_mese(giorno)
+
+    # Serializza gli aggiornamenti dello stesso conto: la riga del mese viene
+    # creata con la chiusura del mese precedente, che non deve cambiare nel frattempo
+    db.execute(select(PNConto.id).where(PNConto.id == conto.id).with_for_update())
+
+    apertura = db.execute(
+        select(_saldi.c.saldo_chiusura)
+        .where(_saldi.c.conto_id == conto.id, _saldi.c.mese < mese)
+        .order_by(_saldi.c.mese.desc())
+        .limit(1)
+    ).scalar()
+    if apertura is None:
+        apertura = _to_decimal(conto.saldo_iniziale)
+
+    db.execute(
+        pg_insert(_saldi)
+        .values(
+            conto_id=conto.id,
+            mese=mese,
+            azienda_id=conto.azienda_id,
+            saldo_apertura=apertura,
+            dare=ZERO,
+            avere=ZERO,
+            saldo_chiusura=apertura,
+        )
+        .on_conflict_do_nothing(index_elements=[_saldi.c.conto_id, _saldi.c.mese])
+    )
+    db.execute(
+        update(_saldi)
+        .where(_saldi.c.conto_id == conto.id, _saldi.c.mese == mese)
+        .values(
+            dare=_saldi.c.dare + dare,
+            avere=_saldi.c.avere + avere,
+            saldo_chiusura=_saldi.c.saldo_chiusura + delta,
+            updated_at=func.now(),
+        )
+    )
+    if delta != ZERO:
+        db.execute(
+            update(_saldi)
+            .where(_saldi.c.conto_id == conto.id, _saldi.c.mese > mese)
+            .values(
+                saldo_apertura=_saldi.c.saldo_apertura + delta,
+                saldo_chiusura=_saldi.c.saldo_chiusura + delta,
+                updated_at=func.now(),
+            )
+        )
+
+
+def sposta_saldi(db: Session, conto_id: int, delta: Decimal) -> None:
+    """Applica a tutti i mesi del conto una variazione del saldo iniziale."""
+    if delta == ZERO:
+        return
+    db.execute(
+        update(_saldi)
+        .where(_saldi.c.conto_id == conto_id)
+        .values(
+            saldo_apertura=_saldi.c.saldo_apertura + delta,
+            saldo_chiusura=_saldi.c.saldo_chiusura + delta,
+            updated_at=func.now(),
+        )
+    )
+
+
+# ============ LETTURE ============
+def _dare_avere(conto_id: int):
+    """Espressioni dare/avere di un movimento rispetto al conto e filtro dei movimenti che lo toccano."""
+    giroconto_in_ingresso = and_(
+        PNMovimento.conto_destinazione_id == conto_id,
+        PNMovimento.tipo_operazione == PNTipoOperazione.GIROCONTO,
+    )
+    dare = case(
+        (and_(PNMovimento.conto_id == conto_id, PNMovimento.tipo_operazione == PNTipoOperazione.ENTRATA), PNMovimento.importo),
+        (giroconto_in_ingresso, PNMovimento.importo),
+        else_=0,
+    )
+    avere = case(
+        (
+            and_(
+                PNMovimento.conto_id == conto_id,
+                PNMovimento.tipo_operazione.in_([PNTipoOperazione.USCITA, PNTipoOperazione.GIROCONTO]),
+            ),
+            PNMovimento.importo,
+        ),
+        else_=0,
+    )
+    filtro = and_(
+        or_(PNMovimento.conto_id == conto_id, giroconto_in_ingresso),
+        PNMovimento.stato == PNStatoMovimento.DEFINITIVO,
+        PNMovimento.deleted_at.is_(None),
+    )
+    return dare, avere, filtro
+
+
+def _somma_movimenti(db: Session, conto_id: int, data_da: date, data_a: date) -> Tuple[Decimal, Decimal]:
+    dare, avere, filtro = _dare_avere(conto_id)
+    totale_dare, totale_avere = db.execute(
+        select(func.coalesce(func.sum(dare), 0), func.coalesce(func.sum(avere), 0))
+        .where(filtro, PNMovimento.data >= data_da, PNMovimento.data <= data_a)
+    ).one()
+    return _to_decimal(totale_dare), _to_decimal(totale_avere)
+
+
+def saldo_al(db: Session, conto: PNConto, giorno: date) -> Decimal:
+    """Saldo del conto alla fine del giorno indicato (solo movimenti definitivi)."""
+    mese = _inizio_mese(giorno)
+    riga = db.execute(
+        select(_saldi.c.mese, _saldi.c.saldo_apertura, _saldi.c.saldo_chiusura)
+        .where(_saldi.c.conto_id == conto.id, _saldi.c.mese <= mese)
+        .order_by(_saldi.c.mese.desc())
+        .limit(1)
+    ).first()
+    if riga is None:
+        # Nessun movimento fino a fine mese
+        return _to_decimal(conto.saldo_iniziale)
+    if riga.mese < mese:
+        return _to_decimal(riga.saldo_chiusura)
+
+    dare, avere = _somma_movimenti(db, conto.id, mese, giorno)
+    return _to_decimal(riga.saldo_apertura) + dare - avere
+
+
+def estratto_conto(db: Session, conto: PNConto, data_da: date, data_a: date) -> Dict:
+    """Movimenti del periodo con saldo progressivo, a partire dal saldo al giorno precedente."""
+    saldo_iniziale = saldo_al(db, conto, data_da - timedelta(days=1))
+    dare, avere, filtro = _dare_avere(conto.id)
+    movimenti = db.execute(
+        select(PNMovimento.id, PNMovimento.data, PNMovimento.descrizione, dare.label("dare"), avere.label("avere"))
+        .where(filtro, PNMovimento.data >= data_da, PNMovimento.data <= data_a)
+        .order_by(PNMovimento.data, PNMovimento.id)
+    ).all()
+
+    saldo = saldo_iniziale
+    totale_dare = totale_avere = ZERO
+    righe = []
+    for movimento in movimenti:
+        riga_dare = _to_decimal(movimento.dare)
+        riga_avere = _to_decimal(movimento.avere)
+        saldo += riga_dare - riga_avere
+        totale_dare += riga_dare
+        totale_avere += riga_avere
+        righe.append(
+            {
+                "movimento_id": movimento.id,
+                "data": movimento.data,
+                "descrizione": movimento.descrizione,
+                "dare": riga_dare,
+                "avere": riga_avere,
+                "saldo": saldo,
+            }
+        )
+
+    return {
+        "conto_id": conto.id,
+        "data_da": data_da,
+        "data_a": data_a,
+        "saldo_iniziale": saldo_iniziale,
+        "totale_dare": totale_dare,
+        "totale_avere": totale_avere,
+        "saldo_finale": saldo,
+        "righe": righe,
+    }
+
+
+# ============ VERIFICA / RICOSTRUZIONE ============
+def _saldi_attesi(db: Session, conto: PNConto) -> List[Dict]:
+    """Righe mensili ricalcolate dai movimenti definitivi del conto."""
+    dare, avere, filtro = _dare_avere(conto.id)
+    mese_expr = func.date_trunc("month", PNMovimento.data)
+    mesi = db.execute(
+        select(mese_expr.label("mese"), func.sum(dare).label("dare"), func.sum(avere).label("avere"))
+        .where(filtro)
+        .group_by(mese_expr)
+        .order_by(mese_expr)
+    ).all()
+
+    saldo = _to_decimal(conto.saldo_iniziale)
+    attesi = []
+    for riga in mesi:
+        apertura = saldo
+        saldo = apertura + _to_decimal(riga.dare) - _to_decimal(riga.avere)
+        attesi.append(
+            {
+                "mese": riga.mese.date() if hasattr(riga.mese, "date") else riga.mese,
+                "saldo_apertura": apertura,
+                "dare": _to_decimal(riga.dare),
+                "avere": _to_decimal(riga.avere),
+                "saldo_chiusura": saldo,
+            }
+        )
+    return attesi
+
+
+def verifica_saldi(db: Session, azienda_id: Optional[int] = None, correggi: bool = False) -> List[Dict]:
+    """
+    Confronta saldi mensili e saldo_attuale di ogni conto con i valori ricalcolati
+    dai movimenti. Restituisce le differenze; con correggi=True riscrive i mesi del
+    conto e allinea saldo_attuale (non fa commit).
+    """
+    query = db.query(PNConto)
+    if azienda_id is not None:
+        query = query.filter(PNConto.azienda_id == azienda_id)
+
+    campi = ("saldo_apertura", "dare", "avere", "saldo_chiusura")
+    differenze: List[Dict] = []
+    for conto in query.order_by(PNConto.id).all():
+        attesi = _saldi_attesi(db, conto)
+        registrati = {
+            riga.mese: riga
+            for riga in db.execute(select(_saldi).where(_saldi.c.conto_id == conto.id)).all()
+        }
+        differenze_conto: List[Dict] = []
+        for atteso in attesi:
+            riga = registrati.pop(atteso["mese"], None)
+            for campo in campi:
+                valore = _to_decimal(getattr(riga, campo)) if riga is not None else None
+                if valore != atteso[campo]:
+                    differenze_conto.append(
+                        {"conto_id": conto.id, "mese": atteso["mese"], "campo": campo, "atteso": atteso[campo], "registrato": valore}
+                    )
+        for mese in registrati:
+            differenze_conto.append(
+                {"conto_id": conto.id, "mese": mese, "campo": "riga", "atteso": None, "registrato": "presente"}
+            )
+
+        saldo_finale = attesi[-1]["saldo_chiusura"] if attesi else _to_decimal(conto.saldo_iniziale)
+        if _to_decimal(conto.saldo_attuale) != saldo_finale:
+            differenze_conto.append(
+                {
+                    "conto_id": conto.id,
+                    "mese": None,
+                    "campo": "saldo_attuale",
+                    "atteso": saldo_finale,
+                    "registrato": _to_decimal(conto.saldo_attuale),
+                }
+            )
+
+        if correggi and differenze_conto:
+            db.execute(delete(_saldi).where(_saldi.c.conto_id == conto.id))
+            if attesi:
+                db.execute(
+                    _saldi.insert(),
+                    [{"conto_id": conto.id, "azienda_id": conto.azienda_id, **atteso} for atteso in attesi],
+                )
+            conto.saldo_attuale = saldo_finale
+            db.flush()
+        differenze.extend(differenze_conto)
+    return differenze
@@ -2,11 +2,12 @@
 
 from datetime import date
 from decimal import Decimal
-from typing import Optional, List
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, selectinload
 
+from app.core.database import SessionLocal
 from app.models.amministrazione import (
     FatturaAmministrazione,
     Pagamento,
@@ -19,6 +20,7 @@ from app.models.amministrazione.partita_animale_movimento_finanziario import (
     PartitaMovimentoTipo,
 )
 from app.models.amministrazione.contratto_soccida import ContrattoSoccida
+from app.models.amministrazione.fornitore import Fornitore
 from app.models.amministrazione.pn import (
     PNMovimento,
     PNPreferenze,
@@ -59,131 +61,211 @@ def _to_decimal(value: Optional[Decimal]) -> Decimal:
         return ZERO
 
 
-def _get_preferenze(db: Session, azienda_id: int) -> Optional[PNPreferenze]:
-    ensure_default_setup(db, azienda_id)
-    return (
-        db.query(PNPreferenze)
-        .filter(PNPreferenze.azienda_id == azienda_id)
-        .one_or_none()
-    )
+# ============ CONTESTO PER AZIENDA ============
+# Chiave in session.info: {azienda_id: ContestoPrimaNota}, valida fino a commit/rollback
+_CONTESTO_KEY = "pn_contesto_automazione"
 
+# Nomi dei conti (minuscoli, in ordine di preferenza; inclusi i nomi legacy)
+_NOMI_CONTO_IVA = {
+    TipoFattura.ENTRATA: ("iva vendite", "iva a debito"),
+    TipoFattura.USCITA: ("iva acquisti", "iva a credito"),
+}
+_NOMI_CONTO_IMPONIBILE = {
+    TipoFattura.ENTRATA: ("vendite", "ricavi vendite"),
+    TipoFattura.USCITA: ("acquisti",),
+}
 
-def _get_conto_iva(
-    db: Session,
-    azienda_id: int,
-    tipo_fattura: TipoFattura,
-) -> Optional[int]:
-    """
-    Trova il conto IVA appropriato per il tipo di fattura.
-    - Fatture emesse (entrata): IVA vendite (da versare allo Stato)
-    - Fatture ricevute (uscita): IVA acquisti (da recuperare dallo Stato)
-    Supporta anche nomi legacy (IVA a debito / IVA a credito).
-    """
-    from app.models.amministrazione.pn import PNConto
+# Attributi di PNConto che cambiano il contesto (saldo_attuale cambia a ogni movimento)
+_CAMPI_CONTO_CONTESTO = ("nome", "attivo", "azienda_id")
 
-    if tipo_fattura == TipoFattura.ENTRATA:
-        nomi_prova = ["IVA vendite", "IVA a debito"]
-    else:
-        nomi_prova = ["IVA acquisti", "IVA a credito"]
 
-    for nome_conto in nomi_prova:
-        conto = (
-            db.query(PNConto)
-            .filter(
-                PNConto.azienda_id == azienda_id,
-                func.lower(PNConto.nome) == nome_conto.lower(),
-                PNConto.attivo.is_(True),
-            )
-            .first()
-        )
-        if conto:
-            return conto.id
-    return None
+def _nomi_per_tipo(nomi: Dict[TipoFattura, tuple], tipo_fattura: TipoFattura) -> tuple:
+    return nomi[TipoFattura.ENTRATA] if tipo_fattura == TipoFattura.ENTRATA else nomi[TipoFattura.USCITA]
 
 
-def _get_categoria_id(
-    db: Session, 
-    azienda_id: int, 
-    tipo: PNTipoOperazione,
-    categoria_fattura: Optional[str] = None,
-    categoria_id: Optional[int] = None
-) -> Optional[int]:
+class _Categoria(NamedTuple):
+    id: int
+    tipo_operazione: PNTipoOperazione
+    nome: str
+    codice: str
+
+
+class ContestoPrimaNota:
     """
-    Trova la categoria Prima Nota da usare per un movimento.
-    
-    Strategia:
-    1. Se categoria_id è fornito direttamente, usalo (priorità massima)
-    2. Se categoria_fattura è fornita, cerca una categoria Prima Nota che corrisponda
-       (per nome o codice, case-insensitive)
-    3. Se non trovata, usa la categoria di default (prima categoria attiva per tipo)
+    Dati Prima Nota di un'azienda usati dall'automazione: preferenze, conti attivi
+    per nome e categorie attive, caricati una volta (ensure_default_setup + tre
+    query). Le categorie risolte sono memorizzate per (tipo, categoria, id).
     """
-    # Priorità 1: Se abbiamo categoria_id direttamente, usalo
-    if categoria_id:
-        categoria = db.query(PNCategoria).filter(
-            PNCategoria.id == categoria_id,
-            PNCategoria.tipo_operazione == tipo,
-            PNCategoria.attiva.is_(True),
-        ).first()
-        if categoria:
-            return categoria.id
-    
-    # Priorità 2: Se abbiamo una categoria dalla fattura (stringa), cerca una corrispondenza
-    if categoria_fattura:
-        # Cerca per nome (case-insensitive, partial match)
-        categoria = (
-            db.query(PNCategoria)
-            .filter(
-                PNCategoria.tipo_operazione == tipo,
-                (PNCategoria.azienda_id == azienda_id) | (PNCategoria.azienda_id.is_(None)),
-                PNCategoria.attiva.is_(True),
-                func.lower(PNCategoria.nome).contains(categoria_fattura.lower())
-            )
-            .order_by(
-                # Priorità: prima quelle specifiche dell'azienda, poi quelle globali
-                PNCategoria.azienda_id.desc().nullslast(),
-                PNCategoria.ordine.asc(),
-                PNCategoria.id.asc()
-            )
-            .first()
+
+    def __init__(self, db: Session, azienda_id: int):
+        ensure_default_setup(db, azienda_id)
+        self._db = db
+        self.azienda_id = azienda_id
+        self.preferenze = (
+            db.query(PNPreferenze)
+            .filter(PNPreferenze.azienda_id == azienda_id)
+            .one_or_none()
         )
-        
-        # Se non trovata per nome, prova per codice
-        if not categoria and categoria_fattura:
-            categoria = (
-                db.query(PNCategoria)
+
+        self._conti: Dict[str, int] = {}
+        conti = (
+            db.query(PNConto.id, PNConto.nome)
+            .filter(PNConto.azienda_id == azienda_id, PNConto.attivo.is_(True))
+            .order_by(PNConto.id.asc())
+        )
+        for conto_id, nome in conti:
+            self._conti.setdefault((nome or "").lower(), conto_id)
+
+        # Stesso ordine delle vecchie query: prima le categorie dell'azienda, poi ordine e id
+        self._categorie = [
+            _Categoria(cat_id, tipo, (nome or "").lower(), (codice or "").lower())
+            for cat_id, tipo, nome, codice in (
+                db.query(PNCategoria.id, PNCategoria.tipo_operazione, PNCategoria.nome, PNCategoria.codice)
                 .filter(
-                    PNCategoria.tipo_operazione == tipo,
                     (PNCategoria.azienda_id == azienda_id) | (PNCategoria.azienda_id.is_(None)),
                     PNCategoria.attiva.is_(True),
-                    func.lower(PNCategoria.codice).contains(categoria_fattura.lower())
                 )
                 .order_by(
                     PNCategoria.azienda_id.desc().nullslast(),
                     PNCategoria.ordine.asc(),
-                    PNCategoria.id.asc()
+                    PNCategoria.id.asc(),
+                )
+            )
+        ]
+        self._categorie_risolte: Dict[tuple, Optional[int]] = {}
+
+    def conto_per_nomi(self, nomi: Iterable[str]) -> Optional[int]:
+        for nome in nomi:
+            conto_id = self._conti.get(nome)
+            if conto_id:
+                return conto_id
+        return None
+
+    def conto_iva_id(self, tipo_fattura: TipoFattura) -> Optional[int]:
+        """
+        Conto IVA per il tipo di fattura.
+        - Fatture emesse (entrata): IVA vendite (da versare allo Stato)
+        - Fatture ricevute (uscita): IVA acquisti (da recuperare dallo Stato)
+        """
+        return self.conto_per_nomi(_nomi_per_tipo(_NOMI_CONTO_IVA, tipo_fattura))
+
+    def conti_iva_ids(self) -> List[int]:
+        nomi = set(_NOMI_CONTO_IVA[TipoFattura.ENTRATA]) | set(_NOMI_CONTO_IVA[TipoFattura.USCITA])
+        return [conto_id for nome, conto_id in self._conti.items() if nome in nomi]
+
+    def conto_imponibile_id(self, tipo_fattura: TipoFattura) -> Optional[int]:
+        """
+        Conto economico per l'imponibile.
+        - Fatture emesse (entrata): Vendite (o legacy Ricavi vendite)
+        - Fatture ricevute (uscita): Acquisti
+        """
+        return self.conto_per_nomi(_nomi_per_tipo(_NOMI_CONTO_IMPONIBILE, tipo_fattura))
+
+    def categoria_id(
+        self,
+        tipo: PNTipoOperazione,
+        categoria_fattura: Optional[str] = None,
+        categoria_id: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Trova la categoria Prima Nota da usare per un movimento.
+
+        Strategia:
+        1. Se categoria_id è fornito direttamente, usalo (priorità massima)
+        2. Se categoria_fattura è fornita, cerca una categoria Prima Nota che corrisponda
+           (per nome o codice, case-insensitive, corrispondenza parziale)
+        3. Se non trovata, usa la categoria di default (prima categoria attiva per tipo)
+        """
+        chiave = (tipo, categoria_fattura, categoria_id)
+        if chiave not in self._categorie_risolte:
+            self._categorie_risolte[chiave] = self._risolvi_categoria(tipo, categoria_fattura, categoria_id)
+        return self._categorie_risolte[chiave]
+
+    def _risolvi_categoria(
+        self,
+        tipo: PNTipoOperazione,
+        categoria_fattura: Optional[str],
+        categoria_id: Optional[int],
+    ) -> Optional[int]:
+        candidate = [cat for cat in self._categorie if cat.tipo_operazione == tipo]
+
+        if categoria_id:
+            if any(cat.id == categoria_id for cat in candidate):
+                return categoria_id
+            # Categoria non precaricata (es. di un'altra azienda): verifica puntuale
+            categoria = (
+                self._db.query(PNCategoria.id)
+                .filter(
+                    PNCategoria.id == categoria_id,
+                    PNCategoria.tipo_operazione == tipo,
+                    PNCategoria.attiva.is_(True),
                 )
                 .first()
             )
-        
-        if categoria:
-            return categoria.id
-    
-    # Fallback: categoria di default (prima categoria attiva per tipo)
-    categoria = (
-        db.query(PNCategoria)
-        .filter(
-            PNCategoria.tipo_operazione == tipo,
-            (PNCategoria.azienda_id == azienda_id) | (PNCategoria.azienda_id.is_(None)),
-            PNCategoria.attiva.is_(True),
-        )
-        .order_by(
-            PNCategoria.azienda_id.desc().nullslast(),  # Prima quelle specifiche dell'azienda
-            PNCategoria.ordine.asc(),
-            PNCategoria.id.asc()
-        )
-        .first()
+            if categoria:
+                return categoria.id
+
+        if categoria_fattura:
+            testo = categoria_fattura.lower()
+            for campo in ("nome", "codice"):
+                for cat in candidate:
+                    if testo in getattr(cat, campo):
+                        return cat.id
+
+        return candidate[0].id if candidate else None
+
+
+def get_contesto_prima_nota(db: Session, azienda_id: int) -> ContestoPrimaNota:
+    """Contesto dell'azienda, condiviso nella transazione corrente della sessione."""
+    contesti = db.info.setdefault(_CONTESTO_KEY, {})
+    contesto = contesti.get(azienda_id)
+    if contesto is None:
+        contesto = ContestoPrimaNota(db, azienda_id)
+        contesti[azienda_id] = contesto
+    return contesto
+
+
+def _modifica_contesto(obj, nuovo_o_eliminato: bool) -> bool:
+    if isinstance(obj, (PNCategoria, PNPreferenze)):
+        return True
+    if not isinstance(obj, PNConto):
+        return False
+    if nuovo_o_eliminato:
+        return True
+    state = sa_inspect(obj)
+    return any(state.attrs[campo].history.has_changes() for campo in _CAMPI_CONTO_CONTESTO)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _contesto_after_flush(session: Session, flush_context) -> None:
+    if _CONTESTO_KEY not in session.info:
+        return
+    modificato = any(_modifica_contesto(obj, True) for obj in list(session.new) + list(session.deleted)) or any(
+        _modifica_contesto(obj, False) for obj in session.dirty
     )
-    return categoria.id if categoria else None
+    if modificato:
+        session.info.pop(_CONTESTO_KEY, None)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _contesto_fine_transazione(session: Session) -> None:
+    session.info.pop(_CONTESTO_KEY, None)
+
+
+def _get_preferenze(db: Session, azienda_id: int) -> Optional[PNPreferenze]:
+    return get_contesto_prima_nota(db, azienda_id).preferenze
+
+
+def _get_categoria_id(
+    db: Session, 
+    azienda_id: int, 
+    tipo: PNTipoOperazione,
+    categoria_fattura: Optional[str] = None,
+    categoria_id: Optional[int] = None
+) -> Optional[int]:
+    """Categoria Prima Nota per un movimento (vedi ContestoPrimaNota.categoria_id)."""
+    return get_contesto_prima_nota(db, azienda_id).categoria_id(tipo, categoria_fattura, categoria_id)
 
 
 def _build_documento_link(documento_tipo: PNDocumentoTipo, documento_id: int, importo: Decimal) -> PNMovimentoDocumentoInput:
@@ -256,403 +338,368 @@ def ensure_prima_nota_for_fattura_amministrazione_entrata(db: Session, fattura:
         pn_create_movimento(db, create_payload)
 
 
-def _split_imponibile_iva(
+# ============ FATTURE -> PRIMA NOTA ============
+def _azienda_fattura(fattura: FatturaAmministrazione, azienda_id: Optional[int]) -> Optional[int]:
+    # Per tipo=entrata azienda_id è obbligatorio (ripiego su quello della fattura),
+    # per tipo=uscita deve essere passato dal chiamante
+    if fattura.tipo == TipoFattura.ENTRATA:
+        return azienda_id or fattura.azienda_id
+    return azienda_id
+
+
+def _carica_movimenti_fatture(db: Session, fattura_ids: List[int]) -> Dict[int, List[PNMovimento]]:
+    """Movimenti attivi delle fatture (con documenti collegati), in una query."""
+    movimenti: Dict[int, List[PNMovimento]] = {fattura_id: [] for fattura_id in fattura_ids}
+    if not fattura_ids:
+        return movimenti
+    query = (
+        db.query(PNMovimento)
+        .options(selectinload(PNMovimento.documenti))
+        .filter(
+            PNMovimento.fattura_amministrazione_id.in_(fattura_ids),
+            PNMovimento.deleted_at.is_(None),
+        )
+        .order_by(PNMovimento.id.asc())
+    )
+    for movimento in query:
+        movimenti[movimento.fattura_amministrazione_id].append(movimento)
+    return movimenti
+
+
+def _carica_nomi_fornitori(db: Session, fatture: Iterable[FatturaAmministrazione]) -> Dict[int, str]:
+    fornitore_ids = {f.fornitore_id for f in fatture if f.tipo != TipoFattura.ENTRATA and f.fornitore_id}
+    if not fornitore_ids:
+        return {}
+    return dict(db.query(Fornitore.id, Fornitore.nome).filter(Fornitore.id.in_(fornitore_ids)).all())
+
+
+def _trova_movimento(
+    movimenti: List[PNMovimento],
+    tipo_operazione: PNTipoOperazione,
+    conto_ids: Optional[Set[int]] = None,
+    escludi_conto_ids: Set[int] = frozenset(),
+) -> Optional[PNMovimento]:
+    for movimento in movimenti:
+        if movimento.tipo_operazione != tipo_operazione:
+            continue
+        if conto_ids is not None and movimento.conto_id not in conto_ids:
+            continue
+        if movimento.conto_id in escludi_conto_ids:
+            continue
+        return movimento
+    return None
+
+
+def _movimento_invariato(movimento: PNMovimento, campi: Dict, collegamenti: List[PNMovimentoDocumentoInput]) -> bool:
+    """True se update_movimento con questi valori non cambierebbe nulla."""
+    if movimento.stato != PNStatoMovimento.DEFINITIVO:
+        return False
+    for campo, valore in campi.items():
+        if valore is None:
+            # update_movimento ignora i campi None
+            continue
+        attuale = getattr(movimento, campo)
+        if campo == "importo":
+            if _to_decimal(attuale) != _to_decimal(valore):
+                return False
+        elif attuale != valore:
+            return False
+    attesi = sorted((link.documento_tipo, link.documento_id, _to_decimal(link.importo)) for link in collegamenti)
+    presenti = sorted((doc.documento_tipo, doc.documento_id, _to_decimal(doc.importo)) for doc in movimento.documenti)
+    return attesi == presenti
+
+
+def _scrivi_movimento(
     db: Session,
-    fattura: FatturaAmministrazione,
+    esistente: Optional[PNMovimento],
     azienda_id: int,
-    tipo_operazione: PNTipoOperazione,
-    conto_imponibile_id: int,
-    categoria_id: Optional[int],
-    movement_date: date,
-    description: str,
-    contropartita_nome: Optional[str],
+    fattura_id: int,
+    campi: Dict,
     collegamenti: List[PNMovimentoDocumentoInput],
-    attrezzatura_id: Optional[int] = None,
-    contratto_soccida_id: Optional[int] = None,
-) -> List[PNMovimento]:
-    """
-    Crea movimenti separati per imponibile e IVA.
-    Restituisce la lista dei movimenti creati.
-    """
-    importo_netto = _to_decimal(fattura.importo_netto or fattura.importo_totale)
-    importo_iva = _to_decimal(fattura.importo_iva or 0)
-    
-    movimenti_creati = []
-    
-    # Ottieni conti IVA per identificare movimenti IVA
-    conto_iva_id = _get_conto_iva(db, azienda_id, fattura.tipo) if importo_iva > 0 else None
-    conti_iva_ids = []
-    if conto_iva_id:
-        conti_iva_ids = [conto_iva_id]
-    else:
-        # Cerca anche manualmente i conti IVA
-        conti_iva = (
-            db.query(PNConto)
-            .filter(
-                PNConto.azienda_id == azienda_id,
-                func.lower(PNConto.nome).in_(
-                    ["iva vendite", "iva acquisti", "iva a debito", "iva a credito"]
-                ),
-                PNConto.attivo.is_(True),
-            )
-            .all()
-        )
-        conti_iva_ids = [c.id for c in conti_iva]
-    
-    # 1. Movimento imponibile (sempre creato se importo_netto > 0)
-    if importo_netto > 0:
-        # Cerca movimento imponibile esistente (non è un conto IVA)
-        movimento_imponibile = (
-            db.query(PNMovimento)
-            .filter(
-                PNMovimento.fattura_amministrazione_id == fattura.id,
-                PNMovimento.tipo_operazione == tipo_operazione,
-                PNMovimento.deleted_at.is_(None),
-            )
-        )
-        # Se ci sono conti IVA, escludili dalla ricerca
-        if conti_iva_ids:
-            movimento_imponibile = movimento_imponibile.filter(~PNMovimento.conto_id.in_(conti_iva_ids))
-        movimento_imponibile = movimento_imponibile.first()
-        
-        if movimento_imponibile:
-            update_payload = PNMovimentoUpdate(
-                conto_id=conto_imponibile_id,
-                categoria_id=categoria_id,
-                tipo_operazione=tipo_operazione,
-                stato=PNStatoMovimento.DEFINITIVO,
-                data=movement_date,
-                descrizione=f"{description} - Imponibile",
-                importo=importo_netto,
-                contropartita_nome=contropartita_nome,
-                collegamenti=collegamenti,
-                attrezzatura_id=attrezzatura_id,
-                contratto_soccida_id=contratto_soccida_id,
+) -> int:
+    """Aggiorna il movimento esistente (solo se cambia) o lo crea; restituisce l'id."""
+    if esistente is not None:
+        if not _movimento_invariato(esistente, campi, collegamenti):
+            pn_update_movimento(
+                db,
+                esistente.id,
+                PNMovimentoUpdate(stato=PNStatoMovimento.DEFINITIVO, collegamenti=collegamenti, **campi),
             )
-            movimento_updated = pn_update_movimento(db, movimento_imponibile.id, update_payload)
-            movimenti_creati.append(db.query(PNMovimento).filter(PNMovimento.id == movimento_updated.id).first())
-        else:
-            create_payload = PNMovimentoCreate(
-                azienda_id=azienda_id,
-                conto_id=conto_imponibile_id,
-                categoria_id=categoria_id,
-                tipo_operazione=tipo_operazione,
-                stato=PNStatoMovimento.DEFINITIVO,
-                origine=PNMovimentoOrigine.AUTOMATICO,
-                data=movement_date,
-                descrizione=f"{description} - Imponibile",
-                importo=importo_netto,
-                contropartita_nome=contropartita_nome,
-                fattura_amministrazione_id=fattura.id,
-                collegamenti=collegamenti,
-                attrezzatura_id=attrezzatura_id,
-                contratto_soccida_id=contratto_soccida_id,
-            )
-            movimento_response = pn_create_movimento(db, create_payload)
-            movimenti_creati.append(db.query(PNMovimento).filter(PNMovimento.id == movimento_response.id).first())
-    
-    # 2. Movimento IVA (solo se presente)
-    if importo_iva > 0 and conto_iva_id:
-        # Cerca movimento IVA esistente
-        movimento_iva = (
-            db.query(PNMovimento)
-            .filter(
-                PNMovimento.fattura_amministrazione_id == fattura.id,
-                PNMovimento.tipo_operazione == tipo_operazione,
-                PNMovimento.conto_id == conto_iva_id,
-                PNMovimento.deleted_at.is_(None),
-            )
-            .first()
-        )
-        
-        # Crea collegamento per IVA (stesso documento, importo IVA)
-        collegamenti_iva = [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_iva)]
-        
-        if movimento_iva:
-            update_payload = PNMovimentoUpdate(
-                conto_id=conto_iva_id,
-                categoria_id=_get_categoria_id(db, azienda_id, tipo_operazione, categoria_fattura="IVA"),
-                tipo_operazione=tipo_operazione,
-                stato=PNStatoMovimento.DEFINITIVO,
-                data=movement_date,
-                descrizione=f"{description} - IVA",
-                importo=importo_iva,
-                contropartita_nome=contropartita_nome,
-                collegamenti=collegamenti_iva,
-            )
-            movimento_updated = pn_update_movimento(db, movimento_iva.id, update_payload)
-            movimenti_creati.append(db.query(PNMovimento).filter(PNMovimento.id == movimento_updated.id).first())
-        else:
-            create_payload = PNMovimentoCreate(
-                azienda_id=azienda_id,
-                conto_id=conto_iva_id,
-                categoria_id=_get_categoria_id(db, azienda_id, tipo_operazione, categoria_fattura="IVA"),
-                tipo_operazione=tipo_operazione,
-                stato=PNStatoMovimento.DEFINITIVO,
-                origine=PNMovimentoOrigine.AUTOMATICO,
-                data=movement_date,
-                descrizione=f"{description} - IVA",
-                importo=importo_iva,
-                contropartita_nome=contropartita_nome,
-                fattura_amministrazione_id=fattura.id,
-                collegamenti=collegamenti_iva,
-            )
-            movimento_response = pn_create_movimento(db, create_payload)
-            movimenti_creati.append(db.query(PNMovimento).filter(PNMovimento.id == movimento_response.id).first())
-    
-    return movimenti_creati
+        return esistente.id
+    risposta = pn_create_movimento(
+        db,
+        PNMovimentoCreate(
+            azienda_id=azienda_id,
+            stato=PNStatoMovimento.DEFINITIVO,
+            origine=PNMovimentoOrigine.AUTOMATICO,
+            fattura_amministrazione_id=fattura_id,
+            collegamenti=collegamenti,
+            **campi,
+        ),
+    )
+    return risposta.id
 
 
-def _get_conto_revenue_or_cost(
+def _collega_partite_soccida(
     db: Session,
-    azienda_id: int,
-    tipo_fattura: TipoFattura,
-    categoria_id: Optional[int] = None,
-) -> Optional[int]:
+    fattura: FatturaAmministrazione,
+    contratto_soccida_id: int,
+    movimento_id: int,
+    movement_date: date,
+    importo_totale: Decimal,
+) -> None:
     """
-    Trova il conto economico appropriato per la fattura.
-    - Fatture emesse (entrata): Vendite (o legacy Ricavi vendite)
-    - Fatture ricevute (uscita): Acquisti
+    Crea PartitaMovimentoFinanziario per le partite del contratto soccida della
+    fattura emessa, con l'importo distribuito in proporzione ai capi.
     """
-    from app.models.amministrazione.pn import PNConto
+    partite = (
+        db.query(PartitaAnimale)
+        .filter(
+            PartitaAnimale.contratto_soccida_id == contratto_soccida_id,
+            PartitaAnimale.deleted_at.is_(None),
+        )
+        .all()
+    )
+    if not partite:
+        return
 
-    if tipo_fattura == TipoFattura.ENTRATA:
-        nomi_prova = ["Vendite", "Ricavi vendite"]
-    else:
-        nomi_prova = ["Acquisti"]
+    # Determina tipo movimento (acconto o saldo)
+    # Per ora assumiamo che se ci sono già fatture per questo contratto, questa è un saldo
+    # Altrimenti è un acconto. In futuro si può aggiungere un campo esplicito sulla fattura.
+    fatture_esistenti = (
+        db.query(FatturaAmministrazione)
+        .filter(
+            FatturaAmministrazione.contratto_soccida_id == contratto_soccida_id,
+            FatturaAmministrazione.tipo == TipoFattura.ENTRATA,
+            FatturaAmministrazione.id != fattura.id,
+            FatturaAmministrazione.deleted_at.is_(None),
+        )
+        .count()
+    )
+    tipo_movimento = PartitaMovimentoTipo.SALDO if fatture_esistenti > 0 else PartitaMovimentoTipo.ACCONTO
 
-    for nome_conto in nomi_prova:
-        conto = (
-            db.query(PNConto)
-            .filter(
-                PNConto.azienda_id == azienda_id,
-                func.lower(PNConto.nome) == nome_conto.lower(),
-                PNConto.attivo.is_(True),
+    partite_collegate = {
+        partita_id
+        for (partita_id,) in db.query(PartitaMovimentoFinanziario.partita_id).filter(
+            PartitaMovimentoFinanziario.fattura_amministrazione_id == fattura.id,
+        )
+    }
+
+    totale_capi = sum(p.numero_capi or 0 for p in partite)
+    for partita in partite:
+        if partita.id in partite_collegate:
+            continue
+        # Distribuzione proporzionale al numero di capi
+        numero_capi_partita = partita.numero_capi or 0
+        if totale_capi > 0 and numero_capi_partita > 0:
+            importo_per_partita = (importo_totale * numero_capi_partita) / totale_capi
+        else:
+            # Fallback: divisione equa se non ci sono dati sui capi
+            importo_per_partita = importo_totale / len(partite)
+        db.add(
+            PartitaMovimentoFinanziario(
+                partita_id=partita.id,
+                direzione=PartitaMovimentoDirezione.ENTRATA,
+                tipo=tipo_movimento,
+                modalita=partita.modalita_gestione or ModalitaGestionePartita.SOCCIDA_FATTURATA,
+                data=movement_date,
+                importo=importo_per_partita,
+                note=f"Fattura {fattura.numero} - {tipo_movimento.value}",
+                fattura_amministrazione_id=fattura.id,
+                pn_movimento_id=movimento_id,  # Usa il movimento sul conto ricavi
+                attivo=True,
             )
-            .first()
         )
-        if conto:
-            return conto.id
-    return None
+    db.flush()
 
 
-def ensure_prima_nota_for_fattura_amministrazione(
+def _sincronizza_fattura(
     db: Session,
     fattura: FatturaAmministrazione,
     azienda_id: Optional[int],
+    movimenti: List[PNMovimento],
+    nomi_fornitori: Dict[int, str],
 ) -> None:
-    """Crea/aggiorna movimento Prima Nota per fattura (gestisce sia tipo=entrata che tipo=uscita)
-    
-    Implementa la contabilizzazione completa secondo le best practice nazionali:
-    - Fattura emessa (ENTRATA):
-        * Debit: "Crediti verso clienti" (importo totale)
-        * Credit: "Ricavi vendite" (imponibile) 
-        * Credit: "IVA a debito" (IVA)
-    - Fattura ricevuta (USCITA):
-        * Credit: "Debiti verso fornitori" (importo totale)
-        * Debit: "Acquisti" (imponibile)
-        * Debit: "IVA a credito" (IVA)
-    """
-    if not fattura or not fattura.id:
+    """Movimenti di una fattura: imponibile, IVA e crediti/debiti (vedi ensure_prima_nota_for_fattura_amministrazione)."""
+    azienda_id = _azienda_fattura(fattura, azienda_id)
+    if not azienda_id:
         return
-    
-    # Determina azienda_id: per tipo=entrata è obbligatorio, per tipo=uscita può essere opzionale
+    contesto = get_contesto_prima_nota(db, azienda_id)
+    preferenze = contesto.preferenze
+    if not preferenze:
+        return
+
+    conto_imponibile_id = contesto.conto_imponibile_id(fattura.tipo)
     if fattura.tipo == TipoFattura.ENTRATA:
-        azienda_id = azienda_id or fattura.azienda_id
-        if not azienda_id:
-            return
-        preferenze = _get_preferenze(db, azienda_id)
-        if not preferenze:
-            return
         # Per fattura emessa: conto ricavi per imponibile, conto crediti per totale
-        conto_imponibile_id = _get_conto_revenue_or_cost(db, azienda_id, fattura.tipo)
-        conto_crediti_id = preferenze.conto_crediti_clienti_id
-        if not conto_imponibile_id or not conto_crediti_id:
-            return
+        conto_contropartita_id = preferenze.conto_crediti_clienti_id
+        conto_contropartita_nome = "Crediti verso clienti"
         tipo_operazione = PNTipoOperazione.ENTRATA
         description = f"Fattura emessa {fattura.numero}"
         contropartita_nome = fattura.cliente_nome or fattura.cliente_piva or fattura.cliente_cf
     else:
-        # Per tipo=uscita
-        if not azienda_id:
-            return
-        preferenze = _get_preferenze(db, azienda_id)
-        if not preferenze:
-            return
         # Per fattura ricevuta: conto acquisti per imponibile, conto debiti per totale
-        conto_imponibile_id = _get_conto_revenue_or_cost(db, azienda_id, fattura.tipo)
-        conto_debiti_id = preferenze.conto_debiti_fornitori_id
-        if not conto_imponibile_id or not conto_debiti_id:
-            return
+        conto_contropartita_id = preferenze.conto_debiti_fornitori_id
+        conto_contropartita_nome = "Debiti verso fornitori"
         tipo_operazione = PNTipoOperazione.USCITA
         description = f"Fattura ricevuta {fattura.numero}"
         # Per tipo=uscita, contropartita è il fornitore
-        from app.models.amministrazione.fornitore import Fornitore
-        if fattura.fornitore_id:
-            fornitore = db.query(Fornitore).filter(Fornitore.id == fattura.fornitore_id).first()
-            contropartita_nome = fornitore.nome if fornitore else None
-        else:
-            contropartita_nome = None
+        contropartita_nome = nomi_fornitori.get(fattura.fornitore_id) if fattura.fornitore_id else None
+    if not conto_imponibile_id or not conto_contropartita_id:
+        return
 
     movement_date = fattura.data_fattura or fattura.data_registrazione or date.today()
     # Usa categoria_id se disponibile, altrimenti cerca per categoria (stringa)
-    categoria_id = _get_categoria_id(
-        db, 
-        azienda_id, 
-        tipo_operazione, 
+    categoria_id = contesto.categoria_id(
+        tipo_operazione,
         categoria_fattura=fattura.categoria,
-        categoria_id=getattr(fattura, 'categoria_id', None)
+        categoria_id=getattr(fattura, "categoria_id", None),
     )
-
-    # Determina se la fattura è collegata a un contratto soccida
     contratto_soccida_id = getattr(fattura, "contratto_soccida_id", None)
-    
-    # Crea collegamenti per imponibile (importo netto)
+
     importo_netto = _to_decimal(fattura.importo_netto or fattura.importo_totale)
+    importo_iva = _to_decimal(fattura.importo_iva or 0)
     importo_totale = _to_decimal(fattura.importo_totale)
-    collegamenti = [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_netto)]
-    
-    # Crea movimenti separati per imponibile e IVA sui conti economici
-    movimenti = _split_imponibile_iva(
-        db=db,
-        fattura=fattura,
-        azienda_id=azienda_id,
-        tipo_operazione=tipo_operazione,
-        conto_imponibile_id=conto_imponibile_id,
-        categoria_id=categoria_id,
-        movement_date=movement_date,
-        description=description,
-        contropartita_nome=contropartita_nome,
-        collegamenti=collegamenti,
-        attrezzatura_id=getattr(fattura, "attrezzatura_id", None),
-        contratto_soccida_id=contratto_soccida_id,
-    )
-    
-    # Crea movimento sul conto debiti/crediti con importo totale
-    if fattura.tipo == TipoFattura.ENTRATA:
-        conto_contropartita_id = conto_crediti_id
-        conto_contropartita_nome = "Crediti verso clienti"
-    else:
-        conto_contropartita_id = conto_debiti_id
-        conto_contropartita_nome = "Debiti verso fornitori"
-    
-    # Cerca movimento esistente sul conto debiti/crediti
-    movimento_contropartita = (
-        db.query(PNMovimento)
-        .filter(
-            PNMovimento.fattura_amministrazione_id == fattura.id,
-            PNMovimento.tipo_operazione == tipo_operazione,
-            PNMovimento.conto_id == conto_contropartita_id,
-            PNMovimento.deleted_at.is_(None),
+
+    conto_iva_id = contesto.conto_iva_id(fattura.tipo) if importo_iva > 0 else None
+    conti_iva_ids = {conto_iva_id} if conto_iva_id else set(contesto.conti_iva_ids())
+
+    # 1. Movimento imponibile (sempre creato se importo_netto > 0)
+    movimento_imponibile_id = None
+    if importo_netto > 0:
+        esistente = _trova_movimento(movimenti, tipo_operazione, conto_ids={conto_imponibile_id}) or _trova_movimento(
+            movimenti, tipo_operazione, escludi_conto_ids=conti_iva_ids | {conto_contropartita_id}
         )
-        .first()
-    )
-    
-    collegamenti_contropartita = [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_totale)]
-    
-    if movimento_contropartita:
-        update_payload = PNMovimentoUpdate(
-            conto_id=conto_contropartita_id,
-            categoria_id=_get_categoria_id(db, azienda_id, tipo_operazione, categoria_fattura=conto_contropartita_nome),
-            tipo_operazione=tipo_operazione,
-            stato=PNStatoMovimento.DEFINITIVO,
-            data=movement_date,
-            descrizione=f"{description} - {conto_contropartita_nome}",
-            importo=importo_totale,
-            contropartita_nome=contropartita_nome,
-            collegamenti=collegamenti_contropartita,
+        movimento_imponibile_id = _scrivi_movimento(
+            db,
+            esistente,
+            azienda_id,
+            fattura.id,
+            {
+                "conto_id": conto_imponibile_id,
+                "categoria_id": categoria_id,
+                "tipo_operazione": tipo_operazione,
+                "data": movement_date,
+                "descrizione": f"{description} - Imponibile",
+                "importo": importo_netto,
+                "contropartita_nome": contropartita_nome,
+                "attrezzatura_id": getattr(fattura, "attrezzatura_id", None),
+                "contratto_soccida_id": contratto_soccida_id,
+            },
+            [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_netto)],
         )
-        pn_update_movimento(db, movimento_contropartita.id, update_payload)
-    else:
-        create_payload = PNMovimentoCreate(
-            azienda_id=azienda_id,
-            conto_id=conto_contropartita_id,
-            categoria_id=_get_categoria_id(db, azienda_id, tipo_operazione, categoria_fattura=conto_contropartita_nome),
-            tipo_operazione=tipo_operazione,
-            stato=PNStatoMovimento.DEFINITIVO,
-            origine=PNMovimentoOrigine.AUTOMATICO,
-            data=movement_date,
-            descrizione=f"{description} - {conto_contropartita_nome}",
-            importo=importo_totale,
-            contropartita_nome=contropartita_nome,
-            fattura_amministrazione_id=fattura.id,
-            collegamenti=collegamenti_contropartita,
+
+    # 2. Movimento IVA (solo se presente)
+    movimento_iva_id = None
+    if importo_iva > 0 and conto_iva_id:
+        movimento_iva_id = _scrivi_movimento(
+            db,
+            _trova_movimento(movimenti, tipo_operazione, conto_ids={conto_iva_id}),
+            azienda_id,
+            fattura.id,
+            {
+                "conto_id": conto_iva_id,
+                "categoria_id": contesto.categoria_id(tipo_operazione, categoria_fattura="IVA"),
+                "tipo_operazione": tipo_operazione,
+                "data": movement_date,
+                "descrizione": f"{description} - IVA",
+                "importo": importo_iva,
+                "contropartita_nome": contropartita_nome,
+            },
+            [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_iva)],
         )
-        pn_create_movimento(db, create_payload)
-    
-    # Usa il primo movimento (imponibile) per la logica successiva (partite soccida)
-    movimento = movimenti[0] if movimenti else None
-    
+
+    # 3. Movimento sul conto debiti/crediti con importo totale
+    _scrivi_movimento(
+        db,
+        _trova_movimento(movimenti, tipo_operazione, conto_ids={conto_contropartita_id}),
+        azienda_id,
+        fattura.id,
+        {
+            "conto_id": conto_contropartita_id,
+            "categoria_id": contesto.categoria_id(tipo_operazione, categoria_fattura=conto_contropartita_nome),
+            "tipo_operazione": tipo_operazione,
+            "data": movement_date,
+            "descrizione": f"{description} - {conto_contropartita_nome}",
+            "importo": importo_totale,
+            "contropartita_nome": contropartita_nome,
+        },
+        [_build_documento_link(PNDocumentoTipo.FATTURA_AMMINISTRAZIONE, fattura.id, importo_totale)],
+    )
+
     # Se la fattura è collegata a un contratto soccida e è di tipo ENTRATA (fattura emessa),
     # crea PartitaMovimentoFinanziario per le partite del contratto
-    if contratto_soccida_id and tipo_operazione == PNTipoOperazione.ENTRATA and movimento:
-        # Recupera le partite collegate al contratto
-        partite = (
-            db.query(PartitaAnimale)
-            .filter(
-                PartitaAnimale.contratto_soccida_id == contratto_soccida_id,
-                PartitaAnimale.deleted_at.is_(None),
-            )
-            .all()
-        )
-        
-        # Determina tipo movimento (acconto o saldo)
-        # Per ora assumiamo che se ci sono già fatture per questo contratto, questa è un saldo
-        # Altrimenti è un acconto. In futuro si può aggiungere un campo esplicito sulla fattura.
-        fatture_esistenti = (
-            db.query(FatturaAmministrazione)
-            .filter(
-                FatturaAmministrazione.contratto_soccida_id == contratto_soccida_id,
-                FatturaAmministrazione.tipo == TipoFattura.ENTRATA,
-                FatturaAmministrazione.id != fattura.id,
-                FatturaAmministrazione.deleted_at.is_(None),
-            )
-            .count()
-        )
-        tipo_movimento = PartitaMovimentoTipo.SALDO if fatture_esistenti > 0 else PartitaMovimentoTipo.ACCONTO
-        
-        # Crea PartitaMovimentoFinanziario per ogni partita (distribuisci importo proporzionalmente ai capi)
-        if partite:
-            # Calcola il totale dei capi per distribuzione proporzionale
-            totale_capi = sum(p.numero_capi or 0 for p in partite)
-            
-            # Crea PartitaMovimentoFinanziario per ogni partita (proporzionale ai capi)
-            # Usa il movimento sul conto ricavi (primo movimento) per il collegamento
-            movimento_riferimento = movimenti[0] if movimenti else movimento_contropartita
-            for partita in partite:
-                # Distribuzione proporzionale al numero di capi
-                numero_capi_partita = partita.numero_capi or 0
-                if totale_capi > 0 and numero_capi_partita > 0:
-                    importo_per_partita = (importo_totale * numero_capi_partita) / totale_capi
-                else:
-                    # Fallback: divisione equa se non ci sono dati sui capi
-                    importo_per_partita = importo_totale / len(partite)
-                # Verifica se esiste già un movimento finanziario per questa fattura e partita
-                movimento_finanziario_esistente = (
-                    db.query(PartitaMovimentoFinanziario)
-                    .filter(
-                        PartitaMovimentoFinanziario.partita_id == partita.id,
-                        PartitaMovimentoFinanziario.fattura_amministrazione_id == fattura.id,
-                    )
-                    .first()
+    movimento_riferimento_id = movimento_imponibile_id or movimento_iva_id
+    if contratto_soccida_id and tipo_operazione == PNTipoOperazione.ENTRATA and movimento_riferimento_id:
+        _collega_partite_soccida(db, fattura, contratto_soccida_id, movimento_riferimento_id, movement_date, importo_totale)
+
+
+def ensure_prima_nota_for_fattura_amministrazione(
+    db: Session,
+    fattura: FatturaAmministrazione,
+    azienda_id: Optional[int],
+) -> None:
+    """Crea/aggiorna movimento Prima Nota per fattura (gestisce sia tipo=entrata che tipo=uscita)
+    
+    Implementa la contabilizzazione completa secondo le best practice nazionali:
+    - Fattura emessa (ENTRATA):
+        * Debit: "Crediti verso clienti" (importo totale)
+        * Credit: "Ricavi vendite" (imponibile) 
+        * Credit: "IVA a debito" (IVA)
+    - Fattura ricevuta (USCITA):
+        * Credit: "Debiti verso fornitori" (importo totale)
+        * Debit: "Acquisti" (imponibile)
+        * Debit: "IVA a credito" (IVA)
+
+    Usa lo stesso motore di ensure_prima_nota_for_fatture; il contesto dell'azienda
+    resta in cache nella transazione (es. import di più fatture).
+    """
+    if not fattura or not fattura.id:
+        return
+    _sincronizza_fattura(
+        db,
+        fattura,
+        azienda_id,
+        _carica_movimenti_fatture(db, [fattura.id])[fattura.id],
+        _carica_nomi_fornitori(db, [fattura]),
+    )
+
+
+def ensure_prima_nota_for_fatture(
+    db: Session,
+    fatture: Iterable[FatturaAmministrazione],
+    azienda_id: Optional[int] = None,
+) -> List[SyncFattureErrorItem]:
+    """
+    Crea/aggiorna i movimenti Prima Nota di un gruppo di fatture.
+
+    Movimenti esistenti e nomi dei fornitori sono caricati con una query per
+    tutto il gruppo, preferenze/conti/categorie una volta per azienda
+    (ContestoPrimaNota); i movimenti già allineati non vengono riscritti.
+    L'azienda di ogni fattura ha la precedenza su azienda_id. Ogni fattura è
+    elaborata in un savepoint: gli errori sono restituiti senza interrompere il gruppo.
+    """
+    fatture = [f for f in fatture if f is not None and f.id]
+    movimenti = _carica_movimenti_fatture(db, [f.id for f in fatture])
+    nomi_fornitori = _carica_nomi_fornitori(db, fatture)
+
+    errors: List[SyncFattureErrorItem] = []
+    for fattura in fatture:
+        try:
+            with db.begin_nested():
+                _sincronizza_fattura(
+                    db, fattura, fattura.azienda_id or azienda_id, movimenti[fattura.id], nomi_fornitori
                 )
-                
-                if not movimento_finanziario_esistente and movimento_riferimento:
-                    movimento_finanziario = PartitaMovimentoFinanziario(
-                        partita_id=partita.id,
-                        direzione=PartitaMovimentoDirezione.ENTRATA,
-                        tipo=tipo_movimento,
-                        modalita=partita.modalita_gestione or ModalitaGestionePartita.SOCCIDA_FATTURATA,
-                        data=movement_date,
-                        importo=importo_per_partita,
-                        note=f"Fattura {fattura.numero} - {tipo_movimento.value}",
-                        fattura_amministrazione_id=fattura.id,
-                        pn_movimento_id=movimento_riferimento.id,  # Usa il movimento sul conto ricavi
-                        attivo=True,
-                    )
-                    db.add(movimento_finanziario)
-        
-        db.flush()
+        except Exception as exc:
+            errors.append(
+                SyncFattureErrorItem(
+                    fattura_id=fattura.id,
+                    numero=getattr(fattura, "numero", None),
+                    azienda_id=getattr(fattura, "azienda_id", None),
+                    error=str(exc),
+                )
+            )
+    return errors
 
 
 def sync_prima_nota_fatture(
@@ -676,36 +723,28 @@ def sync_prima_nota_fatture(
         SyncFattureResponse con processed, total ed eventuali errori per fattura.
     """
     query = (
-        db.query(FatturaAmministrazione)
+        db.query(FatturaAmministrazione.id)
         .filter(FatturaAmministrazione.deleted_at.is_(None))
     )
     if azienda_id is not None:
         query = query.filter(FatturaAmministrazione.azienda_id == azienda_id)
-    fatture = query.order_by(FatturaAmministrazione.id.asc()).all()
-    total = len(fatture)
+    fattura_ids = [fattura_id for (fattura_id,) in query.order_by(FatturaAmministrazione.id.asc())]
+    total = len(fattura_ids)
     errors: List[SyncFattureErrorItem] = []
-    processed = 0
     chunk_size = 50  # commit ogni N fatture per evitare transazioni troppo lunghe
 
-    for i, fattura in enumerate(fatture):
-        try:
-            ensure_prima_nota_for_fattura_amministrazione(
-                db, fattura, fattura.azienda_id or azienda_id
-            )
-            processed += 1
-        except Exception as exc:
-            errors.append(
-                SyncFattureErrorItem(
-                    fattura_id=fattura.id,
-                    numero=getattr(fattura, "numero", None),
-                    azienda_id=getattr(fattura, "azienda_id", None),
-                    error=str(exc),
-                )
-            )
-        if (i + 1) % chunk_size == 0:
-            db.commit()
+    for inizio in range(0, total, chunk_size):
+        blocco_ids = fattura_ids[inizio:inizio + chunk_size]
+        fatture = (
+            db.query(FatturaAmministrazione)
+            .filter(FatturaAmministrazione.id.in_(blocco_ids))
+            .order_by(FatturaAmministrazione.id.asc())
+            .all()
+        )
+        errors.extend(ensure_prima_nota_for_fatture(db, fatture, azienda_id))
+        db.commit()
 
-    return SyncFattureResponse(processed=processed, total=total, errors=errors)
+    return SyncFattureResponse(processed=total - len(errors), total=total, errors=errors)
 
 
 def ensure_prima_nota_for_pagamento(db: Session, pagamento: Pagamento) -> None:
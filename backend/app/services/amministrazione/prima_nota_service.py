@@ -2,10 +2,10 @@ from __future__ import annotations
 
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional, Set
 
-from sqlalchemy import func, or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, case, func, or_, select, tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app.models.amministrazione import (
     FatturaAmministrazione,
@@ -52,6 +52,8 @@ from app.schemas.amministrazione import (
     PNRiepilogoResponse,
     PNSetupResponse,
 )
+from app.services.amministrazione.pn_ricerca_service import PNModalitaRicerca, filtro_ricerca_movimenti
+from app.services.amministrazione.pn_saldi_service import registra_effetto_saldo, sposta_saldi
 
 ZERO = Decimal("0")
 
@@ -91,6 +93,13 @@ DEFAULT_CATEGORIE = [
     (PNTipoOperazione.GIROCONTO, "Trasferimenti interni", "Giroconto tra conti"),
 ]
 
+# Da incrementare quando cambiano DEFAULT_CONTI, DEFAULT_CATEGORIE o le regole
+# di _run_default_setup: al primo accesso ogni azienda riesegue il setup completo.
+PN_SETUP_VERSION = 1
+
+# Aziende con setup_version == PN_SETUP_VERSION già letto in questo processo
+_aziende_setup_verificate: Set[int] = set()
+
 
 def is_conto_sistema(nome: Optional[str]) -> bool:
     """True se il conto è di sistema (non modificabile/eliminabile dall'utente)."""
@@ -275,7 +284,9 @@ def update_conto(db: Session, conto_id: int, payload: PNContoUpdate) -> PNConto:
     if payload.giroconto_strategia is not None:
         conto.giroconto_strategia = PNGirocontoStrategia(payload.giroconto_strategia).value
     if payload.saldo_iniziale is not None:
-        conto.saldo_iniziale = _to_decimal(payload.saldo_iniziale)
+        nuovo_saldo_iniziale = _to_decimal(payload.saldo_iniziale)
+        sposta_saldi(db, conto.id, nuovo_saldo_iniziale - _to_decimal(conto.saldo_iniziale))
+        conto.saldo_iniziale = nuovo_saldo_iniziale
     if payload.saldo_attuale is not None:
         conto.saldo_attuale = _to_decimal(payload.saldo_attuale)
 
@@ -403,6 +414,34 @@ def delete_conto_iban(db: Session, iban_id: int) -> None:
 
 
 def ensure_default_setup(db: Session, azienda_id: int) -> None:
+    """
+    Garantisce conti di sistema, categorie e preferenze dell'azienda.
+
+    Il setup completo gira solo se pn_preferenze.setup_version è diverso da
+    PN_SETUP_VERSION; le aziende già verificate in questo processo non leggono
+    nemmeno il marker. La cache si popola solo leggendo il marker già salvato,
+    così un setup annullato da rollback viene rieseguito.
+    """
+    if azienda_id in _aziende_setup_verificate:
+        return
+    versione = db.execute(
+        select(PNPreferenze.setup_version).where(PNPreferenze.azienda_id == azienda_id)
+    ).scalar()
+    if versione == PN_SETUP_VERSION:
+        _aziende_setup_verificate.add(azienda_id)
+        return
+
+    _run_default_setup(db, azienda_id)
+    preferenze = (
+        db.query(PNPreferenze)
+        .filter(PNPreferenze.azienda_id == azienda_id)
+        .one()
+    )
+    preferenze.setup_version = PN_SETUP_VERSION
+    db.flush()
+
+
+def _run_default_setup(db: Session, azienda_id: int) -> None:
     # Ricrea sempre i 6 conti di sistema se mancanti (anche se esistono già Soccida, Cassa, Banca)
     conti_azienda = (
         db.query(PNConto)
@@ -644,22 +683,38 @@ def get_setup(
     )
 
 
-def _riepilogo_movimenti(movimenti: Iterable[PNMovimento]) -> PNRiepilogoResponse:
-    entrate = ZERO
-    uscite = ZERO
-    for movimento in movimenti:
-        if movimento.deleted_at is not None:
-            continue
-        if movimento.stato != PNStatoMovimento.DEFINITIVO:
-            continue
-        amount = _to_decimal(movimento.importo)
-        if movimento.tipo_operazione == PNTipoOperazione.ENTRATA:
-            entrate += amount
-        elif movimento.tipo_operazione == PNTipoOperazione.USCITA:
-            uscite += amount
+def _riepilogo_movimenti(db: Session, filtri: List) -> PNRiepilogoResponse:
+    """Totali dei movimenti definitivi non eliminati che rispettano i filtri (tutte le pagine)."""
+    conta = and_(PNMovimento.deleted_at.is_(None), PNMovimento.stato == PNStatoMovimento.DEFINITIVO)
+    entrate, uscite = db.execute(
+        select(
+            func.coalesce(
+                func.sum(case((and_(conta, PNMovimento.tipo_operazione == PNTipoOperazione.ENTRATA), PNMovimento.importo))),
+                0,
+            ),
+            func.coalesce(
+                func.sum(case((and_(conta, PNMovimento.tipo_operazione == PNTipoOperazione.USCITA), PNMovimento.importo))),
+                0,
+            ),
+        ).where(*filtri)
+    ).one()
+    entrate = _to_decimal(entrate)
+    uscite = _to_decimal(uscite)
     return PNRiepilogoResponse(entrate=entrate, uscite=uscite, saldo=entrate - uscite)
 
 
+def _encode_cursore(movimento: PNMovimento) -> str:
+    return f"{movimento.data.isoformat()}_{movimento.id}"
+
+
+def _decode_cursore(cursore: str) -> tuple:
+    try:
+        giorno, movimento_id = cursore.split("_", 1)
+        return date.fromisoformat(giorno), int(movimento_id)
+    except ValueError:
+        raise ValueError("Cursore non valido.")
+
+
 def movimento_to_response(movimento: PNMovimento) -> PNMovimentoResponse:
     from app.schemas.amministrazione.pn import PartitaCollegataResponse
     
@@ -741,66 +796,69 @@ def list_movimenti(
     partita_id: Optional[int] = None,
     contratto_soccida_id: Optional[int] = None,
     search: Optional[str] = None,
+    search_mode: PNModalitaRicerca = PNModalitaRicerca.CONTIENE,
     data_da: Optional[date] = None,
     data_a: Optional[date] = None,
-    skip: int = 0,
+    cursore: Optional[str] = None,
     limit: int = 200,
 ) -> PNMovimentiListResponse:
-    query = (
-        db.query(PNMovimento)
-        .options(
-            joinedload(PNMovimento.categoria),
-            joinedload(PNMovimento.conto),
-            joinedload(PNMovimento.conto_destinazione),
-            joinedload(PNMovimento.documenti),
-            joinedload(PNMovimento.attrezzatura),
-            joinedload(PNMovimento.movimenti_partita).joinedload(PartitaMovimentoFinanziario.partita),
-        )
-        .filter(
-            PNMovimento.azienda_id == azienda_id,
-        )
-    )
-
+    """
+    Pagina di movimenti ordinata per (data, id) decrescenti. La pagina successiva
+    parte da `cursore` (restituito nella risposta, None all'ultima pagina), così
+    il costo per pagina non dipende da quante ne precedono. Il riepilogo copre
+    tutti i movimenti filtrati, non solo la pagina.
+    """
+    filtri = [PNMovimento.azienda_id == azienda_id]
     if conto_id:
-        query = query.filter(
-            or_(PNMovimento.conto_id == conto_id, PNMovimento.conto_destinazione_id == conto_id)
-        )
+        filtri.append(or_(PNMovimento.conto_id == conto_id, PNMovimento.conto_destinazione_id == conto_id))
     if tipo_operazione:
-        query = query.filter(PNMovimento.tipo_operazione == tipo_operazione)
+        filtri.append(PNMovimento.tipo_operazione == tipo_operazione)
     if stato:
-        query = query.filter(PNMovimento.stato == stato)
+        filtri.append(PNMovimento.stato == stato)
     if categoria_id:
-        query = query.filter(PNMovimento.categoria_id == categoria_id)
+        filtri.append(PNMovimento.categoria_id == categoria_id)
     if attrezzatura_id:
-        query = query.filter(PNMovimento.attrezzatura_id == attrezzatura_id)
+        filtri.append(PNMovimento.attrezzatura_id == attrezzatura_id)
     if partita_id:
-        query = query.filter(PNMovimento.partita_id == partita_id)
+        filtri.append(PNMovimento.partita_id == partita_id)
     if contratto_soccida_id:
-        query = query.filter(PNMovimento.contratto_soccida_id == contratto_soccida_id)
+        filtri.append(PNMovimento.contratto_soccida_id == contratto_soccida_id)
     if data_da:
-        query = query.filter(PNMovimento.data >= data_da)
+        filtri.append(PNMovimento.data >= data_da)
     if data_a:
-        query = query.filter(PNMovimento.data <= data_a)
+        filtri.append(PNMovimento.data <= data_a)
     if search:
-        pattern = f"%{search.lower()}%"
-        query = query.filter(
-            or_(
-                func.lower(PNMovimento.descrizione).like(pattern),
-                func.lower(PNMovimento.note).like(pattern),
-                func.lower(PNMovimento.contropartita_nome).like(pattern),
-            )
-        )
+        filtro_ricerca = filtro_ricerca_movimenti(db, search, search_mode)
+        if filtro_ricerca is not None:
+            filtri.append(filtro_ricerca)
 
-    movimenti = (
-        query.order_by(PNMovimento.data.desc(), PNMovimento.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    query = (
+        db.query(PNMovimento)
+        .options(
+            joinedload(PNMovimento.categoria),
+            joinedload(PNMovimento.conto),
+            joinedload(PNMovimento.conto_destinazione),
+            selectinload(PNMovimento.documenti),
+            joinedload(PNMovimento.attrezzatura),
+            selectinload(PNMovimento.movimenti_partita).joinedload(PartitaMovimentoFinanziario.partita),
+        )
+        .filter(*filtri)
     )
+    if cursore:
+        cursore_data, cursore_id = _decode_cursore(cursore)
+        query = query.filter(tuple_(PNMovimento.data, PNMovimento.id) < tuple_(cursore_data, cursore_id))
+
+    # Una riga in più per sapere se esiste una pagina successiva
+    movimenti = query.order_by(PNMovimento.data.desc(), PNMovimento.id.desc()).limit(limit + 1).all()
+    prossimo = None
+    if len(movimenti) > limit:
+        movimenti = movimenti[:limit]
+        prossimo = _encode_cursore(movimenti[-1])
 
     return PNMovimentiListResponse(
         movimenti=[movimento_to_response(m) for m in movimenti],
-        riepilogo=_riepilogo_movimenti(movimenti),
+        riepilogo=_riepilogo_movimenti(db, filtri),
+        cursore=prossimo,
     )
 
 
@@ -816,16 +874,21 @@ def _apply_balance_effect(db: Session, movimento: PNMovimento, direction: int) -
     if not conto:
         return
 
+    # Saldi mensili (pn_saldi_mensili) aggiornati nella stessa transazione
     if movimento.tipo_operazione == PNTipoOperazione.ENTRATA:
         _update_conto_saldo(conto, amount)
+        registra_effetto_saldo(db, conto, movimento.data, dare=amount)
     elif movimento.tipo_operazione == PNTipoOperazione.USCITA:
         _update_conto_saldo(conto, -amount)
+        registra_effetto_saldo(db, conto, movimento.data, avere=amount)
     elif movimento.tipo_operazione == PNTipoOperazione.GIROCONTO:
         _update_conto_saldo(conto, -amount)
+        registra_effetto_saldo(db, conto, movimento.data, avere=amount)
         if movimento.conto_destinazione_id:
             conto_dest = movimento.conto_destinazione or db.get(PNConto, movimento.conto_destinazione_id)
             if conto_dest:
                 _update_conto_saldo(conto_dest, amount)
+                registra_effetto_saldo(db, conto_dest, movimento.data, dare=amount)
 
 
 def _adjust_fattura_emessa(movimento: PNMovimento, delta: Decimal) -> None:
@@ -1085,140 +1148,114 @@ def conferma_movimento(db: Session, movimento_id: int) -> PNMovimentoResponse:
     return movimento_to_response(movimento)
 
 
-def get_documenti_aperti(db: Session, azienda_id: int) -> List[PNDocumentoApertoResponse]:
+def get_documenti_aperti(
+    db: Session,
+    azienda_id: int,
+    *,
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> List[PNDocumentoApertoResponse]:
+    """
+    Fatture emesse e ricevute con residuo > 0, dalla più recente.
+
+    Residuo, contropartita e i campi di dati_xml (tipo documento, condizioni di
+    pagamento, cedente) sono calcolati in SQL, così le fatture saldate non vengono
+    caricate; i contratti soccida dei clienti della pagina sono letti con una query.
+    """
+    from app.models.amministrazione.contratto_soccida import ContrattoSoccida
     from app.models.amministrazione.fattura_amministrazione import TipoFattura
-    
-    documenti: List[PNDocumentoApertoResponse] = []
 
-    # Per le fatture emesse (tipo=entrata), recupera anche il cliente se collegato tramite cliente_id
-    fatture_emesse = (
-        db.query(FatturaAmministrazione, Fornitore)
-        .outerjoin(Fornitore, FatturaAmministrazione.cliente_id == Fornitore.id)
+    fattura = FatturaAmministrazione
+    emessa = fattura.tipo == TipoFattura.ENTRATA
+    residuo = fattura.importo_totale - func.coalesce(
+        case((emessa, fattura.importo_incassato), else_=fattura.importo_pagato), 0
+    )
+    xml_tipo_documento = fattura.dati_xml[("documento", "tipo_documento")].as_string()
+    xml_condizioni = fattura.dati_xml[("pagamenti", 0, "condizioni_pagamento")].as_string()
+
+    # Fatture emesse: cliente_nome, poi il cliente collegato.
+    # Fatture ricevute: fornitore collegato, poi cedente e dati di trasmissione dell'XML.
+    contropartita = case(
+        (emessa, func.coalesce(func.nullif(fattura.cliente_nome, ""), Fornitore.nome)),
+        else_=func.coalesce(
+            func.nullif(Fornitore.nome, ""),
+            fattura.dati_xml[("cedente", "denominazione")].as_string(),
+            fattura.dati_xml[("cedente", "ragione_sociale")].as_string(),
+            fattura.dati_xml[("dati_trasmissione", "id_codice")].as_string(),
+            fattura.dati_xml[("dati_trasmissione", "codice_destinatario")].as_string(),
+        ),
+    )
+    # Emesse: sempre dall'XML. Ricevute: dal modello, altrimenti dall'XML
+    # (le condizioni dell'XML valgono solo se manca anche il tipo documento)
+    tipo_documento = case(
+        (emessa, xml_tipo_documento),
+        else_=func.coalesce(fattura.tipo_documento, xml_tipo_documento),
+    )
+    condizioni_pagamento = case(
+        (emessa, xml_condizioni),
+        (fattura.tipo_documento.is_(None), func.coalesce(xml_condizioni, fattura.condizioni_pagamento)),
+        else_=fattura.condizioni_pagamento,
+    )
+
+    query = (
+        db.query(
+            fattura.id,
+            fattura.tipo,
+            fattura.numero,
+            fattura.data_fattura,
+            Fornitore.id.label("controparte_id"),
+            contropartita.label("contropartita"),
+            residuo.label("residuo"),
+            tipo_documento.label("tipo_documento"),
+            condizioni_pagamento.label("condizioni_pagamento"),
+        )
+        .outerjoin(Fornitore, Fornitore.id == case((emessa, fattura.cliente_id), else_=fattura.fornitore_id))
         .filter(
-            FatturaAmministrazione.azienda_id == azienda_id,
-            FatturaAmministrazione.tipo == TipoFattura.ENTRATA,
-            FatturaAmministrazione.deleted_at.is_(None),
+            fattura.azienda_id == azienda_id,
+            fattura.deleted_at.is_(None),
+            fattura.tipo.in_([TipoFattura.ENTRATA, TipoFattura.USCITA]),
+            residuo > 0,
         )
-        .all()
+        .order_by(fattura.data_fattura.desc(), fattura.id.desc())
+        .offset(skip)
     )
-    for fattura, cliente in fatture_emesse:
-        residuo = _to_decimal(fattura.importo_totale) - _to_decimal(fattura.importo_incassato)
-        if residuo <= ZERO:
-            continue
-        # Usa cliente_nome se disponibile, altrimenti il nome del fornitore/cliente collegato
-        contropartita = fattura.cliente_nome
-        if not contropartita and cliente:
-            contropartita = cliente.nome
-        # Recupera tipo_documento e condizioni_pagamento dai dati XML se disponibili
-        tipo_documento = None
-        condizioni_pagamento = None
-        # FatturaAmministrazione (tipo=entrata) potrebbe avere dati_xml se importata da XML
-        if hasattr(fattura, 'dati_xml') and fattura.dati_xml:
-            documento = fattura.dati_xml.get('documento', {})
-            if isinstance(documento, dict):
-                tipo_documento = documento.get('tipo_documento')
-            pagamenti = fattura.dati_xml.get('pagamenti', [])
-            if pagamenti and isinstance(pagamenti, list) and len(pagamenti) > 0:
-                primo_pagamento = pagamenti[0] if isinstance(pagamenti[0], dict) else {}
-                condizioni_pagamento = primo_pagamento.get('condizioni_pagamento')
-        
-        # Verifica se il cliente è una società di soccida
-        is_soccida = False
-        contratto_soccida_id = None
-        if cliente:
-            from app.models.amministrazione.contratto_soccida import ContrattoSoccida
-            contratto = (
-                db.query(ContrattoSoccida)
-                .filter(
-                    ContrattoSoccida.soccidante_id == cliente.id,
-                    ContrattoSoccida.deleted_at.is_(None),
-                )
-                .first()
-            )
-            if contratto:
-                is_soccida = True
-                contratto_soccida_id = contratto.id
-        
-        documenti.append(
-            PNDocumentoApertoResponse(
-                id=fattura.id,
-                tipo=PNDocumentoTipo.FATTURA_AMMINISTRAZIONE.value,
-                riferimento=fattura.numero,
-                data=fattura.data_fattura,
-                contropartita=contropartita,
-                residuo=residuo,
-                tipo_documento=tipo_documento,
-                condizioni_pagamento=condizioni_pagamento,
-                tipo_fattura=TipoFattura.ENTRATA.value,  # Fattura emessa = entrata
-                contratto_soccida_id=contratto_soccida_id,
-                is_soccida=is_soccida,
+    if limit is not None:
+        query = query.limit(limit)
+    righe = query.all()
+
+    # Clienti che sono società di soccida: primo contratto attivo per soccidante
+    clienti_ids = {r.controparte_id for r in righe if r.tipo == TipoFattura.ENTRATA and r.controparte_id}
+    contratti_soccida: Dict[int, int] = {}
+    if clienti_ids:
+        contratti_soccida = dict(
+            db.query(ContrattoSoccida.soccidante_id, func.min(ContrattoSoccida.id))
+            .filter(
+                ContrattoSoccida.soccidante_id.in_(clienti_ids),
+                ContrattoSoccida.deleted_at.is_(None),
             )
+            .group_by(ContrattoSoccida.soccidante_id)
+            .all()
         )
 
-    # Fatture ricevute (tipo=uscita) - sono fatture da fornitori
-    # Le includiamo tutte perché sono fatture ricevute dall'azienda
-    # Usa joinedload per caricare il fornitore in modo efficiente
-    fatture_ricevute = (
-        db.query(FatturaAmministrazione, Fornitore)
-        .outerjoin(Fornitore, FatturaAmministrazione.fornitore_id == Fornitore.id)
-        .filter(
-            FatturaAmministrazione.azienda_id == azienda_id,
-            FatturaAmministrazione.tipo == TipoFattura.USCITA,
-            FatturaAmministrazione.deleted_at.is_(None),
-        )
-        .all()
-    )
-    for fattura, fornitore in fatture_ricevute:
-        residuo = _to_decimal(fattura.importo_totale) - _to_decimal(fattura.importo_pagato)
-        if residuo <= ZERO:
-            continue
-        # Ottieni il nome del fornitore dalla relazione o da dati_xml
-        contropartita = None
-        if fornitore:
-            contropartita = fornitore.nome
-        # Se non c'è fornitore collegato, prova a recuperarlo dai dati XML
-        if not contropartita and fattura.dati_xml:
-            cedente = fattura.dati_xml.get('cedente', {})
-            if isinstance(cedente, dict):
-                contropartita = cedente.get('denominazione') or cedente.get('ragione_sociale')
-        # Se ancora non c'è contropartita, prova a recuperarla da altri campi XML
-        if not contropartita and fattura.dati_xml:
-            # Prova anche in altri punti dell'XML
-            dati_trasmissione = fattura.dati_xml.get('dati_trasmissione', {})
-            if isinstance(dati_trasmissione, dict):
-                contropartita = dati_trasmissione.get('id_codice') or dati_trasmissione.get('codice_destinatario')
-        # Recupera tipo_documento e condizioni_pagamento dai dati XML o dal modello
-        tipo_documento = fattura.tipo_documento
-        condizioni_pagamento = fattura.condizioni_pagamento
-        
-        # Se non disponibili nel modello, prova a recuperarli dai dati XML
-        if not tipo_documento and fattura.dati_xml:
-            documento = fattura.dati_xml.get('documento', {})
-            if isinstance(documento, dict):
-                tipo_documento = documento.get('tipo_documento')
-            pagamenti = fattura.dati_xml.get('pagamenti', [])
-            if pagamenti and isinstance(pagamenti, list) and len(pagamenti) > 0:
-                primo_pagamento = pagamenti[0] if isinstance(pagamenti[0], dict) else {}
-                condizioni_pagamento = primo_pagamento.get('condizioni_pagamento') or condizioni_pagamento
-        
-        # Per le fatture ricevute, verifica se il fornitore è anche cliente (potrebbe essere misto)
-        # ma non è una società di soccida (soccida è solo per clienti)
+    documenti: List[PNDocumentoApertoResponse] = []
+    for riga in righe:
+        is_entrata = riga.tipo == TipoFattura.ENTRATA
+        contratto_soccida_id = contratti_soccida.get(riga.controparte_id) if is_entrata else None
         documenti.append(
             PNDocumentoApertoResponse(
-                id=fattura.id,
+                id=riga.id,
                 tipo=PNDocumentoTipo.FATTURA_AMMINISTRAZIONE.value,
-                riferimento=fattura.numero,
-                data=fattura.data_fattura,
-                contropartita=contropartita,
-                residuo=residuo,
-                tipo_documento=tipo_documento,
-                condizioni_pagamento=condizioni_pagamento,
-                tipo_fattura=TipoFattura.USCITA.value,  # Fattura ricevuta = uscita
-                contratto_soccida_id=None,
-                is_soccida=False,
+                riferimento=riga.numero,
+                data=riga.data_fattura,
+                contropartita=riga.contropartita,
+                residuo=_to_decimal(riga.residuo),
+                tipo_documento=riga.tipo_documento,
+                condizioni_pagamento=riga.condizioni_pagamento,
+                tipo_fattura=TipoFattura.ENTRATA.value if is_entrata else TipoFattura.USCITA.value,
+                contratto_soccida_id=contratto_soccida_id,
+                is_soccida=contratto_soccida_id is not None,
             )
         )
-
     return documenti
 
 
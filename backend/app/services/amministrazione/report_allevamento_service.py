@@ -107,6 +107,103 @@ def get_movimenti_pn_per_contratto(
     return movimenti
 
 
+def _query_uscita_entries(db: Session, date_start: date, date_end: date):
+    """Query base delle uscite (non trasferimenti interni) nel periodo, con animale e partita."""
+    return (
+        db.query(PartitaAnimaleAnimale)
+        .join(PartitaAnimaleAnimale.partita)
+        .join(PartitaAnimaleAnimale.animale)
+        .options(
+            joinedload(PartitaAnimaleAnimale.animale),
+            joinedload(PartitaAnimaleAnimale.partita)
+            .joinedload(PartitaAnimale.fattura_amministrazione),
+        )
+        .filter(
+            Animale.deleted_at.is_(None),
+            PartitaAnimale.tipo == TipoPartita.USCITA,
+            PartitaAnimale.data >= date_start,
+            PartitaAnimale.data <= date_end,
+            PartitaAnimale.is_trasferimento_interno == False,
+            PartitaAnimale.deleted_at.is_(None),
+        )
+    )
+
+
+def _load_ingressi_per_animale(db: Session, animale_ids) -> Dict[int, List[PartitaAnimaleAnimale]]:
+    """Partite di ingresso per animale, ordinate per data (la prima è l'ingresso originale)."""
+    ingressi_per_animale: Dict[int, List[PartitaAnimaleAnimale]] = defaultdict(list)
+    if not animale_ids:
+        return ingressi_per_animale
+
+    ingressi_entries = (
+        db.query(PartitaAnimaleAnimale)
+        .join(PartitaAnimaleAnimale.partita)
+        .filter(
+            PartitaAnimaleAnimale.animale_id.in_(animale_ids),
+            PartitaAnimale.tipo == TipoPartita.INGRESSO,
+            PartitaAnimale.deleted_at.is_(None),
+        )
+        .options(
+            joinedload(PartitaAnimaleAnimale.partita)
+            .joinedload(PartitaAnimale.fattura_amministrazione),
+        )
+        .all()
+    )
+
+    for record in ingressi_entries:
+        ingressi_per_animale[record.animale_id].append(record)
+
+    for records in ingressi_per_animale.values():
+        records.sort(key=lambda rec: rec.partita.data or date.min)
+
+    return ingressi_per_animale
+
+
+def _load_contratti_map(db: Session, contratti_ids) -> Dict[int, ContrattoSoccida]:
+    if not contratti_ids:
+        return {}
+    contratti = (
+        db.query(ContrattoSoccida)
+        .filter(ContrattoSoccida.id.in_(contratti_ids))
+        .options(joinedload(ContrattoSoccida.soccidante))
+        .all()
+    )
+    return {contratto.id: contratto for contratto in contratti}
+
+
+def load_uscite_allevamento_dataset(
+    db: Session,
+    azienda_id: int,
+    data_inizio: date,
+    data_fine: date,
+) -> Dict:
+    """
+    Carica una sola volta i dati di uscita condivisi da più report allevamento
+    dello stesso periodo (es. un report per ogni contratto soccida).
+
+    Il risultato va passato a calculate_report_allevamento_data(dataset=...),
+    che filtra le uscite per contratto senza rieseguire le query.
+    """
+    uscita_entries = (
+        _query_uscita_entries(db, data_inizio, data_fine)
+        .filter(Animale.azienda_id == azienda_id)
+        .all()
+    )
+    animale_ids = {entry.animale_id for entry in uscita_entries}
+    contratti_ids = {
+        entry.animale.contratto_soccida_id
+        for entry in uscita_entries
+        if entry.animale.contratto_soccida_id
+    }
+    return {
+        "azienda_id": azienda_id,
+        "date_range": (data_inizio, data_fine),
+        "uscita_entries": uscita_entries,
+        "ingressi_per_animale": _load_ingressi_per_animale(db, animale_ids),
+        "contratti_map": _load_contratti_map(db, contratti_ids),
+    }
+
+
 def calculate_report_allevamento_data(
     db: Session,
     data_uscita: Optional[date],
@@ -119,9 +216,13 @@ def calculate_report_allevamento_data(
     movimenti_pn_ids: Optional[List[int]] = None,
     fatture_acconto_selezionate: Optional[List[Dict]] = None,
     include_riepilogo_per_partita: bool = False,
+    dataset: Optional[Dict] = None,
 ) -> Dict:
     """
     Calcola i dati per il report allevamento su una data o intervallo di date.
+
+    Se viene passato un dataset di load_uscite_allevamento_dataset (stessa azienda e
+    stesso periodo), uscite, ingressi e contratti vengono presi da lì.
     """
     if not data_uscita and not (data_inizio and data_fine):
         raise ValueError("Deve essere specificata una data di uscita o un intervallo (data_inizio + data_fine)")
@@ -144,32 +245,28 @@ def calculate_report_allevamento_data(
         else f"{date_start.strftime('%d/%m/%Y')} - {date_end.strftime('%d/%m/%Y')}"
     )
 
-    # Query ottimizzata: carica tutte le uscite con joinedload
-    uscita_entries = (
-        db.query(PartitaAnimaleAnimale)
-        .join(PartitaAnimaleAnimale.partita)
-        .join(PartitaAnimaleAnimale.animale)
-        .options(
-            joinedload(PartitaAnimaleAnimale.animale),
-            joinedload(PartitaAnimaleAnimale.partita)
-            .joinedload(PartitaAnimale.fattura_amministrazione),
-        )
-        .filter(
-            Animale.deleted_at.is_(None),
-            PartitaAnimale.tipo == TipoPartita.USCITA,
-            PartitaAnimale.data >= date_start,
-            PartitaAnimale.data <= date_end,
-            PartitaAnimale.is_trasferimento_interno == False,
-            PartitaAnimale.deleted_at.is_(None),
-        )
-    )
+    if dataset is not None and dataset.get("date_range") != (date_start, date_end):
+        raise ValueError("Il dataset condiviso non corrisponde al periodo richiesto")
 
-    if contratto_soccida_id:
-        uscita_entries = uscita_entries.filter(Animale.contratto_soccida_id == contratto_soccida_id)
-    elif azienda_id:
-        uscita_entries = uscita_entries.filter(Animale.azienda_id == azienda_id)
+    if dataset is not None:
+        # Uscite già caricate per l'intera azienda: filtra in memoria
+        if contratto_soccida_id:
+            uscita_entries = [
+                entry for entry in dataset["uscita_entries"]
+                if entry.animale.contratto_soccida_id == contratto_soccida_id
+            ]
+        else:
+            uscita_entries = list(dataset["uscita_entries"])
+    else:
+        # Query ottimizzata: carica tutte le uscite con joinedload
+        uscita_entries = _query_uscita_entries(db, date_start, date_end)
+
+        if contratto_soccida_id:
+            uscita_entries = uscita_entries.filter(Animale.contratto_soccida_id == contratto_soccida_id)
+        elif azienda_id:
+            uscita_entries = uscita_entries.filter(Animale.azienda_id == azienda_id)
 
-    uscita_entries = uscita_entries.all()
+        uscita_entries = uscita_entries.all()
 
     if not uscita_entries:
         return {
@@ -194,45 +291,19 @@ def calculate_report_allevamento_data(
             "riepilogo_per_partita": [],
         }
 
-    # Precarica tutte le partite di ingresso per gli animali coinvolti (VENDUTI)
-    animale_ids = {entry.animale_id for entry in uscita_entries}
-    ingressi_entries = (
-        db.query(PartitaAnimaleAnimale)
-        .join(PartitaAnimaleAnimale.partita)
-        .filter(
-            PartitaAnimaleAnimale.animale_id.in_(animale_ids),
-            PartitaAnimale.tipo == TipoPartita.INGRESSO,
-            PartitaAnimale.deleted_at.is_(None),
-        )
-        .options(
-            joinedload(PartitaAnimaleAnimale.partita)
-            .joinedload(PartitaAnimale.fattura_amministrazione),
-        )
-        .all()
-    )
-
-    ingressi_per_animale: Dict[int, List[PartitaAnimaleAnimale]] = defaultdict(list)
-    for record in ingressi_entries:
-        ingressi_per_animale[record.animale_id].append(record)
-
-    for records in ingressi_per_animale.values():
-        records.sort(key=lambda rec: rec.partita.data or date.min)
-
-    # Precarica contratti
-    contratti_ids = {
-        entry.animale.contratto_soccida_id
-        for entry in uscita_entries
-        if entry.animale.contratto_soccida_id
-    }
-    contratti_map = {}
-    if contratti_ids:
-        contratti = (
-            db.query(ContrattoSoccida)
-            .filter(ContrattoSoccida.id.in_(contratti_ids))
-            .options(joinedload(ContrattoSoccida.soccidante))
-            .all()
-        )
-        contratti_map = {contratto.id: contratto for contratto in contratti}
+    # Precarica tutte le partite di ingresso per gli animali coinvolti (VENDUTI) e i contratti
+    if dataset is not None:
+        ingressi_per_animale = dataset["ingressi_per_animale"]
+        contratti_map = dataset["contratti_map"]
+    else:
+        animale_ids = {entry.animale_id for entry in uscita_entries}
+        ingressi_per_animale = _load_ingressi_per_animale(db, animale_ids)
+        contratti_ids = {
+            entry.animale.contratto_soccida_id
+            for entry in uscita_entries
+            if entry.animale.contratto_soccida_id
+        }
+        contratti_map = _load_contratti_map(db, contratti_ids)
 
     peso_cache: Dict[int, Dict[str, Decimal]] = {}
 
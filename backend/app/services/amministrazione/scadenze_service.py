@@ -0,0 +1,378 @@
+"""
+Servizio per l'indice unificato delle scadenze (tabella scadenze)
+
+Ogni record che può generare una notifica (scadenze assicurative delle
+attrezzature, polizze attrezzature attive, assicurazioni aziendali, fatture con
+scadenza o senza categoria) ha una riga nell'indice con azienda, data di
+scadenza, stato e i campi necessari a comporre la notifica. Il feed notifiche
+legge solo questa tabella con una query su (azienda_id, data_scadenza).
+
+Manutenzione:
+- hook di sessione: le scritture sui modelli di origine (e i cambi di nome di
+  attrezzature e fornitori) vengono raccolte al flush e l'indice viene
+  aggiornato al commit, nella stessa transazione (in un savepoint);
+- popolamento iniziale: migrazione 20261019_scadenze_backfill; ricostruzione
+  completa: scripts/backfill_scadenze.py. Le letture non scrivono.
+
+Gli aggiornamenti sono INSERT ... SELECT ... ON CONFLICT calcolati in SQL dai
+record di origine; updated_at cambia solo se la riga cambia davvero.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import Date, String, and_, cast, delete, event, func, inspect as sa_inspect, literal, null, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.amministrazione.assicurazione_aziendale import AssicurazioneAziendale
+from app.models.amministrazione.attrezzatura import Attrezzatura, ScadenzaAttrezzatura
+from app.models.amministrazione.fattura_amministrazione import FatturaAmministrazione
+from app.models.amministrazione.fornitore import Fornitore
+from app.models.amministrazione.polizza_attrezzatura import PolizzaAttrezzatura
+from app.models.amministrazione.scadenza_indice import ScadenzaIndice
+
+logger = logging.getLogger(__name__)
+
+TIPO_SCADENZA_ATTREZZATURA = "scadenza_attrezzatura"
+TIPO_POLIZZA_ATTREZZATURA = "polizza_attrezzatura"
+TIPO_ASSICURAZIONE_AZIENDALE = "assicurazione_aziendale"
+TIPO_FATTURA = "fattura"
+TIPO_FATTURA_SENZA_CATEGORIA = "fattura_senza_categoria"
+
+# Chiave in session.info
+_DIRTY_KEY = "scadenze_da_aggiornare"
+
+# Dimensione dei blocchi di id per gli IN (...)
+_BLOCCO_ID = 1000
+
+# Sovrapposizione del cursore del feed: updated_at è l'inizio della transazione che
+# scrive la riga, quindi una transazione in corso alla lettura precedente può
+# rendere visibili righe con updated_at anteriore al cursore. Le righe aggiornate
+# entro questa finestra prima del cursore vengono riproposte.
+FINESTRA_CURSORE = timedelta(minutes=10)
+
+
+# ============ SORGENTI ============
+class _Sorgente(NamedTuple):
+    modello: type
+    azienda: object  # colonna azienda_id del record di origine
+    padri: Dict[str, object]  # attrezzatura_id / fornitore_id: aggiornamento per record padre
+    righe: Callable  # select (azienda_id, entita_id, data_scadenza, stato, dati)
+
+
+def _righe_scadenze_attrezzature():
+    return select(
+        Attrezzatura.azienda_id.label("azienda_id"),
+        ScadenzaAttrezzatura.id.label("entita_id"),
+        ScadenzaAttrezzatura.data_scadenza.label("data_scadenza"),
+        cast(null(), String).label("stato"),
+        func.jsonb_build_object(
+            "nome", Attrezzatura.nome,
+            "numero_polizza", ScadenzaAttrezzatura.numero_polizza,
+            "attrezzatura_id", ScadenzaAttrezzatura.attrezzatura_id,
+        ).label("dati"),
+    ).select_from(ScadenzaAttrezzatura).join(
+        Attrezzatura, ScadenzaAttrezzatura.attrezzatura_id == Attrezzatura.id
+    ).where(
+        ScadenzaAttrezzatura.tipo == "assicurazione",
+        ScadenzaAttrezzatura.deleted_at.is_(None),
+    )
+
+
+def _righe_polizze_attrezzature():
+    return select(
+        PolizzaAttrezzatura.azienda_id.label("azienda_id"),
+        PolizzaAttrezzatura.id.label("entita_id"),
+        PolizzaAttrezzatura.data_scadenza.label("data_scadenza"),
+        cast(null(), String).label("stato"),
+        func.jsonb_build_object(
+            "nome", Attrezzatura.nome,
+            "tipo_polizza", cast(PolizzaAttrezzatura.tipo_polizza, String),
+            "numero_polizza", PolizzaAttrezzatura.numero_polizza,
+            "attrezzatura_id", PolizzaAttrezzatura.attrezzatura_id,
+        ).label("dati"),
+    ).select_from(PolizzaAttrezzatura).outerjoin(
+        Attrezzatura, PolizzaAttrezzatura.attrezzatura_id == Attrezzatura.id
+    ).where(
+        PolizzaAttrezzatura.attiva.is_(True),
+        PolizzaAttrezzatura.deleted_at.is_(None),
+    )
+
+
+def _righe_assicurazioni_aziendali():
+    return select(
+        AssicurazioneAziendale.azienda_id.label("azienda_id"),
+        AssicurazioneAziendale.id.label("entita_id"),
+        AssicurazioneAziendale.data_scadenza.label("data_scadenza"),
+        cast(null(), String).label("stato"),
+        func.jsonb_build_object(
+            "tipo", cast(AssicurazioneAziendale.tipo, String),
+            "numero_polizza", AssicurazioneAziendale.numero_polizza,
+            "compagnia", AssicurazioneAziendale.compagnia,
+        ).label("dati"),
+    ).where(AssicurazioneAziendale.deleted_at.is_(None))
+
+
+def _dati_fattura():
+    return func.jsonb_build_object(
+        "numero", FatturaAmministrazione.numero,
+        "fornitore", Fornitore.nome,
+        "totale", FatturaAmministrazione.importo_totale,
+    )
+
+
+def _righe_fatture():
+    return select(
+        FatturaAmministrazione.azienda_id.label("azienda_id"),
+        FatturaAmministrazione.id.label("entita_id"),
+        FatturaAmministrazione.data_scadenza.label("data_scadenza"),
+        cast(FatturaAmministrazione.stato_pagamento, String).label("stato"),
+        _dati_fattura().label("dati"),
+    ).select_from(FatturaAmministrazione).outerjoin(
+        Fornitore, FatturaAmministrazione.fornitore_id == Fornitore.id
+    ).where(
+        FatturaAmministrazione.data_scadenza.isnot(None),
+        FatturaAmministrazione.deleted_at.is_(None),
+    )
+
+
+def _righe_fatture_senza_categoria():
+    return select(
+        FatturaAmministrazione.azienda_id.label("azienda_id"),
+        FatturaAmministrazione.id.label("entita_id"),
+        cast(null(), Date).label("data_scadenza"),
+        cast(null(), String).label("stato"),
+        _dati_fattura().label("dati"),
+    ).select_from(FatturaAmministrazione).outerjoin(
+        Fornitore, FatturaAmministrazione.fornitore_id == Fornitore.id
+    ).where(
+        FatturaAmministrazione.deleted_at.is_(None),
+        or_(FatturaAmministrazione.categoria.is_(None), FatturaAmministrazione.categoria == ''),
+        FatturaAmministrazione.categoria_id.is_(None),
+    )
+
+
+_SORGENTI: Dict[str, _Sorgente] = {
+    TIPO_SCADENZA_ATTREZZATURA: _Sorgente(
+        ScadenzaAttrezzatura, Attrezzatura.azienda_id,
+        {"attrezzatura": ScadenzaAttrezzatura.attrezzatura_id}, _righe_scadenze_attrezzature,
+    ),
+    TIPO_POLIZZA_ATTREZZATURA: _Sorgente(
+        PolizzaAttrezzatura, PolizzaAttrezzatura.azienda_id,
+        {"attrezzatura": PolizzaAttrezzatura.attrezzatura_id}, _righe_polizze_attrezzature,
+    ),
+    TIPO_ASSICURAZIONE_AZIENDALE: _Sorgente(
+        AssicurazioneAziendale, AssicurazioneAziendale.azienda_id, {}, _righe_assicurazioni_aziendali,
+    ),
+    TIPO_FATTURA: _Sorgente(
+        FatturaAmministrazione, FatturaAmministrazione.azienda_id,
+        {"fornitore": FatturaAmministrazione.fornitore_id}, _righe_fatture,
+    ),
+    TIPO_FATTURA_SENZA_CATEGORIA: _Sorgente(
+        FatturaAmministrazione, FatturaAmministrazione.azienda_id,
+        {"fornitore": FatturaAmministrazione.fornitore_id}, _righe_fatture_senza_categoria,
+    ),
+}
+
+# Modello di origine -> tipi di riga dell'indice che genera
+_TIPI_PER_MODELLO: Dict[type, List[str]] = {}
+for _tipo, _sorgente in _SORGENTI.items():
+    _TIPI_PER_MODELLO.setdefault(_sorgente.modello, []).append(_tipo)
+
+# Modelli padre i cui campi compaiono nei dati delle notifiche
+_PADRI = {Attrezzatura: ("attrezzatura", ("nome", "azienda_id")), Fornitore: ("fornitore", ("nome",))}
+
+
+# ============ AGGIORNAMENTO ============
+def _refresh(db: Session, tipo: str, criteri_sorgente: Iterable, criteri_indice: Iterable) -> None:
+    """Allinea le righe dell'indice di `tipo` nell'ambito indicato ai record di origine."""
+    tabella = ScadenzaIndice.__table__
+    righe = _SORGENTI[tipo].righe().where(*criteri_sorgente).subquery()
+
+    stmt = pg_insert(tabella).from_select(
+        ["azienda_id", "tipo_entita", "entita_id", "data_scadenza", "stato", "dati"],
+        select(
+            righe.c.azienda_id,
+            literal(tipo, String),
+            righe.c.entita_id,
+            righe.c.data_scadenza,
+            righe.c.stato,
+            righe.c.dati,
+        ),
+    )
+    campi = ("azienda_id", "data_scadenza", "stato", "dati")
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_scadenze_entita",
+        set_={
+            **{campo: stmt.excluded[campo] for campo in campi},
+            "updated_at": func.now(),
+        },
+        where=tuple_(*[tabella.c[campo] for campo in campi]).is_distinct_from(
+            tuple_(*[stmt.excluded[campo] for campo in campi])
+        ),
+    )
+    db.execute(stmt)
+
+    db.execute(
+        delete(tabella).where(
+            tabella.c.tipo_entita == tipo,
+            *criteri_indice,
+            tabella.c.entita_id.notin_(select(righe.c.entita_id)),
+        )
+    )
+
+
+def _blocchi(ids: Iterable[int]) -> Iterable[List[int]]:
+    ids = sorted(ids)
+    for i in range(0, len(ids), _BLOCCO_ID):
+        yield ids[i:i + _BLOCCO_ID]
+
+
+def refresh_scadenze_entita(db: Session, tipo: str, ids: Iterable[int]) -> None:
+    """Aggiorna le righe dei record `ids` di origine (inserimenti, modifiche, cancellazioni)."""
+    modello = _SORGENTI[tipo].modello
+    colonna_indice = ScadenzaIndice.__table__.c.entita_id
+    for blocco in _blocchi(ids):
+        _refresh(db, tipo, [modello.id.in_(blocco)], [colonna_indice.in_(blocco)])
+
+
+def refresh_scadenze_padre(db: Session, padre: str, ids: Iterable[int]) -> None:
+    """Aggiorna le righe dei record collegati alle attrezzature / ai fornitori `ids`."""
+    colonna_indice = ScadenzaIndice.__table__.c.entita_id
+    for tipo, sorgente in _SORGENTI.items():
+        colonna_padre = sorgente.padri.get(padre)
+        if colonna_padre is None:
+            continue
+        for blocco in _blocchi(ids):
+            figli = select(sorgente.modello.id).where(colonna_padre.in_(blocco))
+            _refresh(db, tipo, [colonna_padre.in_(blocco)], [colonna_indice.in_(figli)])
+
+
+def rebuild_scadenze(db: Session, azienda_id: Optional[int] = None, tipi: Optional[Iterable[str]] = None) -> None:
+    """Ricostruisce l'indice (di un'azienda o di tutte). Non esegue commit."""
+    tabella = ScadenzaIndice.__table__
+    for tipo in tipi or _SORGENTI:
+        sorgente = _SORGENTI[tipo]
+        if azienda_id is None:
+            _refresh(db, tipo, [], [])
+        else:
+            _refresh(db, tipo, [sorgente.azienda == azienda_id], [tabella.c.azienda_id == azienda_id])
+
+
+# ============ LETTURA ============
+def cursore_scadenze(db: Session) -> datetime:
+    """Istante della lettura (ora del database), da passare come `dopo` alla lettura successiva."""
+    return db.execute(select(func.now())).scalar()
+
+
+def feed_scadenze(
+    db: Session,
+    azienda_id: Optional[int],
+    fino_a: date,
+    dopo: Optional[datetime] = None,
+    dopo_data: Optional[date] = None,
+) -> List[tuple]:
+    """
+    Righe dell'indice con scadenza entro `fino_a` (incluse quelle già scadute) o senza
+    data, ordinate per data. Con `dopo` (cursore_scadenze della lettura precedente)
+    restituisce solo le righe inserite o cambiate da allora, più quelle aggiornate
+    nei FINESTRA_CURSORE precedenti (transazioni ancora in corso a quella lettura):
+    una notifica può quindi ripresentarsi e va deduplicata per tipo e id. Con `dopo_data`
+    (giorno della lettura precedente) anche le righe che nel frattempo sono diventate
+    scadute o sono entrate nella finestra fino a `fino_a`, che non cambiano col
+    passare dei giorni.
+    """
+    query = db.query(
+        ScadenzaIndice.tipo_entita,
+        ScadenzaIndice.entita_id,
+        ScadenzaIndice.data_scadenza,
+        ScadenzaIndice.stato,
+        ScadenzaIndice.dati,
+    ).filter(
+        or_(ScadenzaIndice.data_scadenza <= fino_a, ScadenzaIndice.data_scadenza.is_(None))
+    )
+    if azienda_id:
+        query = query.filter(ScadenzaIndice.azienda_id == azienda_id)
+    if dopo is not None:
+        novita = ScadenzaIndice.updated_at > dopo - FINESTRA_CURSORE
+        if dopo_data is not None:
+            oggi = date.today()
+            preavviso = fino_a - oggi
+            novita = or_(
+                novita,
+                and_(ScadenzaIndice.data_scadenza >= dopo_data, ScadenzaIndice.data_scadenza < oggi),
+                ScadenzaIndice.data_scadenza > dopo_data + preavviso,
+            )
+        query = query.filter(novita)
+    return query.order_by(ScadenzaIndice.data_scadenza, ScadenzaIndice.id).all()
+
+
+# ============ HOOK DI SESSIONE ============
+def _pending(session: Session) -> Dict[str, Set]:
+    return session.info.setdefault(_DIRTY_KEY, {})
+
+
+def _padre_modificato(obj, campi) -> bool:
+    state = sa_inspect(obj)
+    return any(state.attrs[campo].history.has_changes() for campo in campi)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _scadenze_after_flush(session: Session, flush_context) -> None:
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tipi = _TIPI_PER_MODELLO.get(type(obj))
+        if tipi:
+            state = sa_inspect(obj)
+            obj_id = state.identity[0] if state.identity else state.dict.get("id")
+            if obj_id is not None:
+                for tipo in tipi:
+                    _pending(session).setdefault(tipo, set()).add(obj_id)
+            continue
+        padre = _PADRI.get(type(obj))
+        if padre and obj in session.dirty and _padre_modificato(obj, padre[1]):
+            _pending(session).setdefault(padre[0], set()).add(obj.id)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _scadenze_bulk(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    for mapper in orm_execute_state.all_mappers:
+        for tipo in _TIPI_PER_MODELLO.get(mapper.class_, ()):
+            # Scritture in blocco: record coinvolti non noti, si ricostruisce il tipo
+            _pending(orm_execute_state.session).setdefault("completi", set()).add(tipo)
+
+
+def _apply_pending(session: Session, dirty: Dict[str, Set]) -> None:
+    try:
+        with session.begin_nested():
+            completi = dirty.pop("completi", set())
+            if completi:
+                rebuild_scadenze(session, tipi=completi)
+            for padre in ("attrezzatura", "fornitore"):
+                ids = dirty.pop(padre, None)
+                if ids:
+                    refresh_scadenze_padre(session, padre, ids)
+            for tipo, ids in dirty.items():
+                if tipo not in completi:
+                    refresh_scadenze_entita(session, tipo, ids)
+    except Exception:
+        # L'indice è derivato: un errore non deve bloccare la scrittura principale
+        logger.exception("Aggiornamento indice scadenze non riuscito")
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _scadenze_before_commit(session: Session) -> None:
+    if not session.info.get(_DIRTY_KEY) and not (session.new or session.dirty or session.deleted):
+        return
+    session.flush()
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        _apply_pending(session, dirty)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _scadenze_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,154 @@
+"""
+Servizio per l'allocazione dei numeri progressivi (numero_partita, numeri DDT)
+
+Ogni sequenza è una riga di contatori_sequenze per (azienda, anno, tipo).
+I numeri si riservano con un UPDATE ... RETURNING sulla riga: il lock di riga
+serializza le richieste concorrenti fino al commit del chiamante, quindi due
+richieste (anche su macchine diverse) non ricevono mai lo stesso numero.
+Un import può riservare un intero blocco di numeri con un solo round trip.
+
+I numeri sono univoci all'interno dell'azienda: per numero_partita l'indice
+univoco parziale è su (azienda_id, numero_partita).
+"""
+from datetime import date
+from typing import Union
+
+from sqlalchemy import extract, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.amministrazione.contatore_sequenza import ContatoreSequenza
+from app.models.amministrazione.partita_animale import TipoPartita
+
+SEQUENZA_DDT_EMESSO = "ddt_emesso"
+SEQUENZA_PARTITA_INGRESSO = "partita_ingresso"
+SEQUENZA_PARTITA_USCITA = "partita_uscita"
+
+
+def _ultimo_ddt_emesso(db: Session, azienda_id: int, anno: int) -> int:
+    from app.models.amministrazione.ddt_emesso import DdtEmesso
+
+    return db.query(func.max(DdtEmesso.numero_progressivo)).filter(
+        DdtEmesso.azienda_id == azienda_id,
+        DdtEmesso.anno == anno,
+        DdtEmesso.deleted_at.is_(None)
+    ).scalar() or 0
+
+
+def _ultimo_numero_partita(tipo: TipoPartita):
+    def _seed(db: Session, azienda_id: int, anno: int) -> int:
+        from app.models.amministrazione.partita_animale import PartitaAnimale
+
+        numeri = db.query(PartitaAnimale.numero_partita).filter(
+            PartitaAnimale.azienda_id == azienda_id,
+            PartitaAnimale.tipo == tipo,
+            extract('year', PartitaAnimale.data) == anno,
+            PartitaAnimale.numero_partita.isnot(None),
+            PartitaAnimale.deleted_at.is_(None)
+        )
+        ultimo = 0
+        for (numero,) in numeri:
+            # Formato ING|USC-YYYYMMDD-<codice_stalla>-NNN: il progressivo è l'ultimo segmento
+            suffisso = numero.rsplit('-', 1)[-1]
+            if suffisso.isdigit():
+                ultimo = max(ultimo, int(suffisso))
+        return ultimo
+    return _seed
+
+
+# Valore iniziale di un contatore: ultimo numero già usato nei dati esistenti
+_SEED_SEQUENZE = {
+    SEQUENZA_DDT_EMESSO: _ultimo_ddt_emesso,
+    SEQUENZA_PARTITA_INGRESSO: _ultimo_numero_partita(TipoPartita.INGRESSO),
+    SEQUENZA_PARTITA_USCITA: _ultimo_numero_partita(TipoPartita.USCITA),
+}
+
+
+def _filtro_contatore(azienda_id: int, anno: int, tipo: str):
+    return (
+        ContatoreSequenza.azienda_id == azienda_id,
+        ContatoreSequenza.anno == anno,
+        ContatoreSequenza.tipo == tipo,
+    )
+
+
+def _ensure_contatore(db: Session, azienda_id: int, anno: int, tipo: str) -> None:
+    """Crea la riga del contatore partendo dai numeri già assegnati."""
+    seed = _SEED_SEQUENZE[tipo](db, azienda_id, anno)
+    try:
+        with db.begin_nested():
+            db.add(ContatoreSequenza(azienda_id=azienda_id, anno=anno, tipo=tipo, ultimo_valore=seed))
+            db.flush()
+    except IntegrityError:
+        # Creata nel frattempo da un'altra richiesta: va bene così
+        pass
+
+
+def allocate_sequence(db: Session, azienda_id: int, anno: int, tipo: str, quantita: int = 1) -> int:
+    """
+    Riserva `quantita` numeri consecutivi e restituisce il primo.
+    Non esegue commit: il lock sulla riga del contatore resta fino al commit del chiamante.
+    """
+    if tipo not in _SEED_SEQUENZE:
+        raise ValueError(f"Sequenza non supportata: {tipo}")
+    if quantita < 1:
+        raise ValueError("La quantità da riservare deve essere almeno 1")
+    stmt = (
+        update(ContatoreSequenza)
+        .where(*_filtro_contatore(azienda_id, anno, tipo))
+        .values(ultimo_valore=ContatoreSequenza.ultimo_valore + quantita)
+        .returning(ContatoreSequenza.ultimo_valore)
+        .execution_options(synchronize_session=False)
+    )
+    ultimo = db.execute(stmt).scalar()
+    if ultimo is None:
+        _ensure_contatore(db, azienda_id, anno, tipo)
+        ultimo = db.execute(stmt).scalar()
+    return ultimo - quantita + 1
+
+
+def peek_next_sequence(db: Session, azienda_id: int, anno: int, tipo: str) -> int:
+    """Prossimo numero che verrebbe assegnato, senza riservarlo (anteprima)."""
+    if tipo not in _SEED_SEQUENZE:
+        raise ValueError(f"Sequenza non supportata: {tipo}")
+    ultimo = db.query(ContatoreSequenza.ultimo_valore).filter(
+        *_filtro_contatore(azienda_id, anno, tipo)
+    ).scalar()
+    if ultimo is None:
+        ultimo = _SEED_SEQUENZE[tipo](db, azienda_id, anno)
+    return ultimo + 1
+
+
+def bump_sequence(db: Session, azienda_id: int, anno: int, tipo: str, valore: int) -> None:
+    """
+    Porta il contatore almeno a `valore` quando un numero viene scelto a mano,
+    così le allocazioni successive non lo riassegnano.
+    """
+    if tipo not in _SEED_SEQUENZE:
+        raise ValueError(f"Sequenza non supportata: {tipo}")
+    stmt = (
+        update(ContatoreSequenza)
+        .where(*_filtro_contatore(azienda_id, anno, tipo), ContatoreSequenza.ultimo_valore < valore)
+        .values(ultimo_valore=valore)
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(stmt).rowcount:
+        return
+    esiste = db.query(ContatoreSequenza.ultimo_valore).filter(
+        *_filtro_contatore(azienda_id, anno, tipo)
+    ).scalar()
+    if esiste is None:
+        _ensure_contatore(db, azienda_id, anno, tipo)
+        db.execute(stmt)
+
+
+def sequenza_partita(tipo: Union[TipoPartita, str]) -> str:
+    """Nome della sequenza per il tipo di partita."""
+    valore = tipo.value if isinstance(tipo, TipoPartita) else str(tipo)
+    return SEQUENZA_PARTITA_INGRESSO if valore == TipoPartita.INGRESSO.value else SEQUENZA_PARTITA_USCITA
+
+
+def format_numero_partita(tipo: Union[TipoPartita, str], data: date, codice_stalla: str, progressivo: int) -> str:
+    """Formato ING|USC-YYYYMMDD-<codice_stalla>-NNN."""
+    tipo_prefix = "ING" if sequenza_partita(tipo) == SEQUENZA_PARTITA_INGRESSO else "USC"
+    return f"{tipo_prefix}-{data.strftime('%Y%m%d')}-{codice_stalla}-{progressivo:03d}"
@@ -2,23 +2,29 @@
 Servizio per sincronizzazione anagrafe nazionale
 Processa file .gz contenente dati anagrafe e crea partite animali.
 
-Senza pandas: usa BeautifulSoup+lxml per HTML, openpyxl per Excel, csv per CSV
+Senza pandas: usa un parser lxml in streaming per HTML, openpyxl per Excel, csv per CSV
 per ridurre uso memoria (~300MB risparmiati).
 """
 import csv
 import gzip
+import hashlib
 import io
+import itertools
 import os
 import re
 import tempfile
-from typing import List, Dict, Optional, Tuple, Union, Any
+from typing import List, Dict, Callable, Iterable, Iterator, Optional, Tuple, Union, Any
 from datetime import datetime, date
 from decimal import Decimal
-from collections import defaultdict
+from collections import Counter, defaultdict
+from operator import itemgetter
 
-from bs4 import BeautifulSoup
+from lxml import etree
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import event, func, inspect as sa_inspect
+
+from app.core.config import settings
+from app.core.database import SessionLocal
 
 from app.models.amministrazione.partita_animale import (
     PartitaAnimale,
@@ -29,14 +35,6 @@ from app.models.allevamento.sede import Sede
 from app.models.allevamento.azienda import Azienda
 
 
-def _cell_text(cell) -> str:
-    """Estrae testo da cella HTML (th/td), gestisce colspan/rowspan semplificato."""
-    if cell is None:
-        return ""
-    text = cell.get_text(separator=" ", strip=True) if hasattr(cell, "get_text") else (cell.text or "")
-    return (text or "").strip()
-
-
 def parse_date(date_str: Optional[str]) -> Optional[date]:
     """Converte stringa data in formato dd/mm/yyyy a date object"""
     if not date_str or date_str.strip() == '':
@@ -58,96 +56,251 @@ def extract_table_from_html(html_content: str) -> Tuple[List[str], List[Dict[str
     return extract_table_from_stream(io.StringIO(html_content))
 
 
-def extract_table_from_stream(stream) -> Tuple[List[str], List[Dict[str, Any]]]:
+HTML_READ_CHUNK_SIZE = 64 * 1024
+
+
+class _HtmlTableCollector:
     """
-    Estrae tabella da stream HTML con BeautifulSoup+lxml (senza pandas).
-    Restituisce (columns, rows) dove rows è lista di dict colonna -> valore.
+    Target per lxml.etree.HTMLParser: ricostruisce le righe delle <table> mentre il
+    parser avanza, senza costruire il DOM.
+
+    La prima <tr> di ogni tabella è l'intestazione. Le righe della tabella anagrafe
+    (intestazione con CODICE_CAPO) vengono emesse subito; quelle delle altre tabelle
+    restano in buffer e servono solo come fallback (tabella con più righe), come
+    faceva il vecchio parser BeautifulSoup.
     """
-    try:
-        content = stream.read() if hasattr(stream, "read") else stream
-        if isinstance(content, bytes):
-            content = content.decode("utf-8", errors="ignore")
-    except Exception as e:
-        raise ValueError(f"Errore lettura stream: {e}")
-    try:
-        soup = BeautifulSoup(content, "lxml")
-    except Exception:
-        soup = BeautifulSoup(content, "html.parser")
-    tables = soup.find_all("table")
-    if not tables:
-        raise ValueError("Nessuna tabella trovata nell'HTML")
-    best_columns, best_rows = [], []
-    for table in tables:
-        thead = table.find("thead")
-        tbody = table.find("tbody") or table
-        header_cells = []
-        if thead:
-            header_row = thead.find("tr")
-            if header_row:
-                header_cells = header_row.find_all(["th", "td"])
-        if not header_cells:
-            first_tr = table.find("tr")
-            if first_tr:
-                header_cells = first_tr.find_all(["th", "td"])
-        if not header_cells:
-            continue
-        columns = [normalize_column_name(_cell_text(c)) or f"col_{i}" for i, c in enumerate(header_cells)]
-        rows = []
-        trs = tbody.find_all("tr") if tbody != table else table.find_all("tr")[1:]
-        for tr in trs:
-            cells = tr.find_all(["td", "th"])
-            if len(cells) < len(columns):
-                row = {columns[i]: _cell_text(cells[i]) if i < len(cells) else "" for i in range(len(columns))}
+
+    def __init__(self, max_rows: Optional[int] = None):
+        self.max_rows = max_rows
+        self.tables: List[Dict[str, Any]] = []
+        self.ready: List[Dict[str, str]] = []
+        self.columns: Optional[List[str]] = None
+        self.streaming = False
+        self.rows_emitted = 0
+        self.best_columns: List[str] = []
+        self.best_rows: List[Dict[str, str]] = []
+        self.found_table = False
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+
+    def start(self, tag, attrib):
+        if tag == "table":
+            self.found_table = True
+            self.tables.append({"columns": None, "rows": [], "streaming": False})
+        elif not self.tables:
+            return
+        elif tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def data(self, text):
+        if self._cell is not None:
+            self._cell.append(text)
+
+    def end(self, tag):
+        if not self.tables:
+            return
+        table = self.tables[-1]
+        if tag in ("td", "th"):
+            if self._cell is not None and self._row is not None:
+                self._row.append(" ".join(part.strip() for part in self._cell if part.strip()))
+            self._cell = None
+        elif tag == "tr":
+            cells, self._row = self._row, None
+            if not cells:
+                return
+            if table["columns"] is None:
+                table["columns"] = [normalize_column_name(c) or f"col_{i}" for i, c in enumerate(cells)]
+                # Una sola tabella in streaming: la prima con intestazione anagrafe
+                if not self.streaming and "CODICE_CAPO" in table["columns"]:
+                    table["streaming"] = True
+                    self.streaming = True
+                    self.columns = table["columns"]
+                return
+            columns = table["columns"]
+            row = {col: (cells[i] if i < len(cells) else "") for i, col in enumerate(columns)}
+            if table["streaming"]:
+                self.rows_emitted += 1
+                if self.max_rows is not None and self.rows_emitted > self.max_rows:
+                    raise ValueError(
+                        f"File contiene troppe righe (oltre {self.max_rows}). Dimensione massima consentita: "
+                        f"{self.max_rows} righe. Suddividere il file o contattare il supporto."
+                    )
+                self.ready.append(row)
             else:
-                row = {columns[i]: _cell_text(cells[i]) for i in range(len(columns))}
-            rows.append(row)
-        if len(rows) > len(best_rows):
-            best_columns, best_rows = columns, rows
-    if not best_rows:
+                table["rows"].append(row)
+        elif tag == "table":
+            table = self.tables.pop()
+            if not table["streaming"] and len(table["rows"]) > len(self.best_rows):
+                self.best_columns, self.best_rows = table["columns"] or [], table["rows"]
+
+    def close(self):
+        return None
+
+    def drain(self) -> List[Dict[str, str]]:
+        ready, self.ready = self.ready, []
+        return ready
+
+
+def iter_table_rows_from_stream(
+    stream,
+    max_rows: Optional[int] = None,
+    columns_out: Optional[List[str]] = None,
+) -> Iterator[Dict[str, str]]:
+    """
+    Legge HTML a blocchi con lxml (parser target, senza DOM) ed emette le righe
+    della tabella anagrafe come dict colonna -> valore mentre il parsing procede.
+    La memoria resta costante indipendentemente dalla dimensione del file.
+
+    Se columns_out è una lista, viene riempita con i nomi colonna appena noti.
+    """
+    collector = _HtmlTableCollector(max_rows=max_rows)
+    parser = etree.HTMLParser(target=collector, encoding="utf-8", recover=True)
+
+    def _publish_columns(columns):
+        if columns_out is not None and not columns_out and columns:
+            columns_out.extend(columns)
+
+    while True:
+        try:
+            chunk = stream.read(HTML_READ_CHUNK_SIZE)
+        except Exception as e:
+            raise ValueError(f"Errore lettura stream: {e}")
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        parser.feed(chunk)
+        _publish_columns(collector.columns)
+        yield from collector.drain()
+    parser.close()
+    _publish_columns(collector.columns)
+    yield from collector.drain()
+
+    if collector.streaming:
+        return
+    if not collector.found_table:
+        raise ValueError("Nessuna tabella trovata nell'HTML")
+    if not collector.best_rows:
+        raise ValueError("Nessuna riga dati trovata nelle tabelle HTML")
+    # Nessuna intestazione anagrafe riconosciuta: tabella con più righe
+    if max_rows is not None and len(collector.best_rows) > max_rows:
+        raise ValueError(
+            f"File contiene troppe righe ({len(collector.best_rows)}). Dimensione massima consentita: "
+            f"{max_rows} righe. Suddividere il file o contattare il supporto."
+        )
+    _publish_columns(collector.best_columns)
+    yield from collector.best_rows
+
+
+def extract_table_from_stream(stream, max_rows: Optional[int] = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Estrae tabella da stream HTML con il parser lxml in streaming (senza pandas).
+    Restituisce (columns, rows) dove rows è lista di dict colonna -> valore.
+    """
+    columns: List[str] = []
+    rows = list(iter_table_rows_from_stream(stream, max_rows=max_rows, columns_out=columns))
+    if not rows:
         raise ValueError("Nessuna riga dati trovata nelle tabelle HTML")
-    return (best_columns, best_rows)
+    return (columns or list(rows[0].keys()), rows)
+
 
+# Soglia oltre la quale il contenuto decompresso passa da RAM a file temporaneo
+ANAGRAFE_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
 
-def _excel_to_rows(gz_file) -> Tuple[List[str], List[Dict[str, Any]]]:
-    """Legge Excel da file-like e restituisce (columns, rows)."""
+_XLSX_MAGIC = b"PK\x03\x04"
+_XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+_HTML_MARKERS = (b"<html", b"<!doctype html", b"<table")
+
+
+def _iter_excel_rows(buffer, columns_out: List[str]) -> Iterator[Dict[str, str]]:
+    """Legge Excel da file-like seekable riga per riga (openpyxl read_only)."""
     from openpyxl import load_workbook
-    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=True) as tmp:
-        tmp.write(gz_file.read())
-        tmp.flush()
-        wb = load_workbook(tmp.name, read_only=True, data_only=True)
-        ws = wb.active
-        rows_iter = list(ws.iter_rows(values_only=True))
-    if not rows_iter:
-        raise ValueError("File Excel vuoto")
-    header = [str(c).strip().upper().replace(" ", "_") if c else f"col_{i}" for i, c in enumerate(rows_iter[0])]
-    columns = [normalize_column_name(h) for h in header]
-    rows = [dict(zip(columns, (str(v).strip() if v is not None else "" for v in row))) for row in rows_iter[1:]]
-    return (columns, rows)
-
-
-def _csv_to_rows(gz_file) -> Tuple[List[str], List[Dict[str, Any]]]:
-    """Legge CSV (tab-separated) da file-like e restituisce (columns, rows)."""
-    text = gz_file.read().decode("utf-8", errors="ignore")
-    reader = csv.reader(io.StringIO(text), delimiter="\t")
-    lines = list(reader)
-    if not lines:
+    wb = load_workbook(buffer, read_only=True, data_only=True)
+    try:
+        rows_iter = wb.active.iter_rows(values_only=True)
+        first = next(rows_iter, None)
+        if first is None:
+            raise ValueError("File Excel vuoto")
+        header = [str(c).strip().upper().replace(" ", "_") if c else f"col_{i}" for i, c in enumerate(first)]
+        columns_out.extend(normalize_column_name(h) for h in header)
+        for row in rows_iter:
+            yield dict(zip(columns_out, (str(v).strip() if v is not None else "" for v in row)))
+    finally:
+        wb.close()
+
+
+def _iter_tsv_rows(buffer, columns_out: List[str]) -> Iterator[Dict[str, str]]:
+    """Legge CSV (tab-separated) da file-like riga per riga."""
+    text_stream = io.TextIOWrapper(buffer, encoding="utf-8", errors="ignore", newline="")
+    reader = csv.reader(text_stream, delimiter="\t")
+    header = next(reader, None)
+    if not header:
         raise ValueError("File CSV vuoto")
-    header = lines[0]
-    columns = [normalize_column_name(h) for h in header]
-    rows = []
-    for line in lines[1:]:
-        row = {}
-        for i, col in enumerate(columns):
-            row[col] = (line[i].strip() if i < len(line) else "")
-        rows.append(row)
-    return (columns, rows)
+    columns_out.extend(normalize_column_name(h) for h in header)
+    for line in reader:
+        yield {col: (line[i].strip() if i < len(line) else "") for i, col in enumerate(columns_out)}
+
+
+def _decompress_to_spool(gz_buffer) -> tempfile.SpooledTemporaryFile:
+    """Decomprime il .gz una sola volta in un buffer che resta in RAM finché è piccolo."""
+    spool = tempfile.SpooledTemporaryFile(max_size=ANAGRAFE_SPOOL_MAX_SIZE)
+    try:
+        with gzip.GzipFile(fileobj=gz_buffer, mode="rb") as gz_file:
+            while True:
+                chunk = gz_file.read(DECOMPRESS_CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def sniff_anagrafe_format(head: bytes) -> str:
+    """Riconosce il formato dai primi byte: 'xlsx', 'html' oppure 'tsv'."""
+    if head.startswith(_XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(_XLS_MAGIC):
+        raise ValueError("Formato Excel 97-2003 (.xls) non supportato. Esportare in HTML, XLSX o CSV.")
+    sample = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if any(marker in sample for marker in _HTML_MARKERS):
+        return "html"
+    return "tsv"
+
+
+def _iter_decoded_rows(spool, fmt: str, columns_out: List[str], max_rows: Optional[int]) -> Iterator[Dict[str, str]]:
+    """Generatore proprietario del buffer: lo chiude a fine iterazione o su errore."""
+    try:
+        if fmt == "html":
+            rows = iter_table_rows_from_stream(spool, columns_out=columns_out)
+        elif fmt == "xlsx":
+            rows = _iter_excel_rows(spool, columns_out)
+        else:
+            rows = _iter_tsv_rows(spool, columns_out)
+        for count, row in enumerate(rows, start=1):
+            if max_rows is not None and count > max_rows:
+                raise ValueError(
+                    f"File contiene troppe righe (oltre {max_rows}). Dimensione massima consentita: "
+                    f"{max_rows} righe. Suddividere il file o contattare il supporto."
+                )
+            yield row
+    finally:
+        spool.close()
 
 
-def process_gz_file(gz_content: Union[bytes, str, io.BytesIO]) -> Tuple[List[str], List[Dict[str, Any]]]:
+def open_anagrafe_rows(
+    gz_content: Union[bytes, str, io.BytesIO],
+    max_rows: Optional[int] = None,
+) -> Tuple[List[str], Iterator[Dict[str, str]]]:
     """
-    Decomprime file .gz e estrae dati anagrafe.
-    Restituisce (nomi_colonne, lista di righe come dict).
-    Senza pandas: HTML con BeautifulSoup, Excel con openpyxl, CSV con modulo csv.
+    Decomprime il file .gz una sola volta, riconosce il formato dai magic bytes e
+    restituisce (columns, iteratore righe). Le righe vengono decodificate solo
+    mentre l'iteratore viene consumato: non si costruisce mai la lista completa.
     """
     if isinstance(gz_content, str):
         gz_buffer = open(gz_content, "rb")
@@ -164,209 +317,280 @@ def process_gz_file(gz_content: Union[bytes, str, io.BytesIO]) -> Tuple[List[str
         gz_buffer.seek(0, io.SEEK_END)
         file_size = gz_buffer.tell()
         gz_buffer.seek(cur)
-    MAX_FILE_SIZE = 10 * 1024 * 1024
-    if file_size > MAX_FILE_SIZE:
-        if should_close and hasattr(gz_buffer, "close"):
-            gz_buffer.close()
-        raise ValueError(f"File troppo grande. Dimensione massima: {MAX_FILE_SIZE / (1024*1024):.1f}MB")
+    MAX_FILE_SIZE = settings.ANAGRAFE_MAX_FILE_SIZE_MB * 1024 * 1024
     try:
-        is_html = False
+        if file_size > MAX_FILE_SIZE:
+            raise ValueError(f"File troppo grande. Dimensione massima: {MAX_FILE_SIZE / (1024*1024):.1f}MB")
         try:
-            with gzip.GzipFile(fileobj=gz_buffer, mode="rb") as gz_peek:
-                sample = gz_peek.read(2048).decode("utf-8", errors="ignore").lower()
-                if "<html" in sample or "<!doctype html" in sample or "<table" in sample:
-                    is_html = True
-        except Exception:
-            pass
-        gz_buffer.seek(0)
-        with gzip.GzipFile(fileobj=gz_buffer, mode="rb") as gz_file:
-            if is_html:
-                try:
-                    text_stream = io.TextIOWrapper(gz_file, encoding="utf-8", errors="ignore")
-                    return extract_table_from_stream(text_stream)
-                except Exception:
-                    pass
-        gz_buffer.seek(0)
-        with gzip.GzipFile(fileobj=gz_buffer, mode="rb") as gz_file:
-            if not is_html:
-                try:
-                    return _excel_to_rows(gz_file)
-                except Exception:
-                    pass
-        gz_buffer.seek(0)
-        with gzip.GzipFile(fileobj=gz_buffer, mode="rb") as gz_file:
-            try:
-                return _csv_to_rows(gz_file)
-            except Exception as e:
-                raise ValueError(f"Impossibile leggere il file. Formati: HTML, XLSX, CSV. Errore: {str(e)}")
-    except Exception as e:
-        if "troppo grande" in str(e).lower():
-            raise e
-        import gc
-        gc.collect()
-        raise ValueError(f"Errore elaborazione file: {str(e)}")
+            spool = _decompress_to_spool(gz_buffer)
+        except (OSError, EOFError) as e:
+            raise ValueError(f"Impossibile decomprimere il file .gz: {str(e)}")
     finally:
-        if should_close and hasattr(gz_buffer, "close"):
+        if should_close:
             gz_buffer.close()
 
+    try:
+        fmt = sniff_anagrafe_format(spool.read(2048))
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+
+    columns: List[str] = []
+    rows = _iter_decoded_rows(spool, fmt, columns, max_rows)
+    try:
+        # Legge la prima riga per conoscere le colonne prima di restituire l'iteratore
+        first = next(rows, None)
+    except ValueError as e:
+        if "troppe righe" in str(e) or "non supportato" in str(e):
+            raise
+        raise ValueError(f"Impossibile leggere il file ({fmt.upper()}): {str(e)}")
+    except Exception as e:
+        raise ValueError(f"Impossibile leggere il file ({fmt.upper()}): {str(e)}")
+    if first is None:
+        return (columns, iter(()))
+    return (columns, itertools.chain((first,), rows))
+
 
 def normalize_column_name(col: str) -> str:
     """Normalizza nome colonna rimuovendo spazi e caratteri speciali"""
     return re.sub(r'[^\w]', '_', col.strip().upper())
 
 
-def _row_val(row: Dict[str, Any], key: str) -> Optional[str]:
-    """Restituisce valore riga come stringa strippata o None se vuoto."""
-    v = row.get(key)
-    if v is None:
-        return None
-    s = str(v).strip()
-    return s if s else None
+# ============ TABELLA ANAGRAFE COMPATTA ============
+def _missing_column(row: tuple) -> None:
+    return None
+
 
+class AnagrafeTable:
+    """
+    Tabella anagrafe in forma compatta: mappa colonna -> posizione e righe come tuple.
 
-def group_ingressi(columns: List[str], rows: List[Dict[str, Any]], azienda_codice: str, azienda_id: int, db: Session, codici_stalla_gestiti: Optional[set] = None) -> List[Dict]:
+    I valori sono già strippati (None se vuoti) e le stringhe ripetute (codici stalla,
+    razza, motivi, date) sono condivise tramite un pool di interning locale alla
+    tabella: una riga da ~40 colonne occupa una tupla di riferimenti invece di un
+    dict con le proprie copie di chiavi e valori.
+    """
+
+    __slots__ = ("columns", "index", "rows", "_pool")
+
+    def __init__(self, columns: Iterable[str]):
+        self.columns: List[str] = list(columns)
+        # Colonne duplicate: vince l'ultima, come nel dict riga costruito dai reader
+        self.index: Dict[str, int] = {col: i for i, col in enumerate(self.columns)}
+        self.rows: List[tuple] = []
+        self._pool: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def intern(self, value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        s = str(value).strip()
+        if not s:
+            return None
+        return self._pool.setdefault(s, s)
+
+    def make_row(self, values: Iterable[Any]) -> tuple:
+        """Converte i valori (nell'ordine delle colonne) in una riga compatta."""
+        row = tuple(self.intern(v) for v in values)
+        if len(row) < len(self.columns):
+            row += (None,) * (len(self.columns) - len(row))
+        return row
+
+    def append(self, values: Iterable[Any]) -> tuple:
+        row = self.make_row(values)
+        self.rows.append(row)
+        return row
+
+    def subset(self, rows: Iterable[tuple]) -> "AnagrafeTable":
+        """Nuova tabella con le stesse colonne (e lo stesso pool) e solo le righe indicate."""
+        table = AnagrafeTable.__new__(AnagrafeTable)
+        table.columns = self.columns
+        table.index = self.index
+        table.rows = list(rows)
+        table._pool = self._pool
+        return table
+
+    def getter(self, column: str) -> Callable[[tuple], Optional[str]]:
+        """Accessor per posizione, da usare nei cicli sulle righe."""
+        i = self.index.get(column)
+        return _missing_column if i is None else itemgetter(i)
+
+    def get(self, row: tuple, column: str) -> Optional[str]:
+        i = self.index.get(column)
+        return None if i is None else row[i]
+
+    def first_col_value(self, row: tuple) -> Optional[str]:
+        return row[0] if self.columns else None
+
+    def as_dicts(self) -> List[Dict[str, Optional[str]]]:
+        """Righe come dict colonna -> valore (solo per debug/export, non per i file grandi)."""
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+
+def load_anagrafe_table(
+    gz_content: Union[bytes, str, io.BytesIO],
+    max_rows: Optional[int] = None,
+) -> AnagrafeTable:
+    """Decodifica il file .gz direttamente in una AnagrafeTable compatta."""
+    raw_columns, rows = open_anagrafe_rows(gz_content, max_rows=max_rows)
+    table = AnagrafeTable(normalize_column_name(c) for c in raw_columns)
+    for r in rows:
+        table.append(r.get(c) for c in raw_columns)
+    return table
+
+
+def process_gz_file(
+    gz_content: Union[bytes, str, io.BytesIO],
+    max_rows: Optional[int] = None,
+) -> AnagrafeTable:
+    """
+    Decomprime file .gz e estrae dati anagrafe.
+    Restituisce una AnagrafeTable (colonne normalizzate, righe come tuple).
+    """
+    return load_anagrafe_table(gz_content, max_rows=max_rows)
+
+
+def _moda(values: Iterable[Optional[str]]) -> Optional[str]:
+    """Valore più frequente (ignorando i vuoti), None se non ce ne sono."""
+    counts = Counter(v for v in values if v)
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def _codice_stalla_azienda_from_row(table: AnagrafeTable, row: tuple) -> Optional[str]:
+    """Codice stalla dell'allevamento per cui è stato estratto il file (AZIENDA_CODICE o prima colonna)."""
+    return table.get(row, "AZIENDA_CODICE") or table.first_col_value(row)
+
+
+def group_ingressi(table: AnagrafeTable, azienda_codice: str, azienda_id: int, db: Session, codici_stalla_gestiti: Optional[set] = None) -> List[Dict]:
     """
     Raggruppa ingressi per DATA_INGRESSO e CODICE_PROVENIENZA.
-    Funziona con lista di dict (senza pandas).
+    Lavora sulle posizioni di colonna della AnagrafeTable.
     """
-    ingressi = [r for r in rows if _row_val(r, "DATA_INGRESSO") and _row_val(r, "CODICE_PROVENIENZA")]
-    if not ingressi:
+    data_ingresso_of = table.getter("DATA_INGRESSO")
+    provenienza_of = table.getter("CODICE_PROVENIENZA")
+    grouped: Dict[Tuple[str, str], List[tuple]] = defaultdict(list)
+    for r in table.rows:
+        data_ingresso_str = data_ingresso_of(r)
+        codice_provenienza = provenienza_of(r)
+        if data_ingresso_str and codice_provenienza:
+            grouped[(data_ingresso_str, codice_provenienza)].append(r)
+    if not grouped:
         return []
     if codici_stalla_gestiti is None:
         from app.services.allevamento.codici_stalla_service import get_codici_stalla_gestiti
         codici_stalla_gestiti = get_codici_stalla_gestiti(db, azienda_id)
-    grouped: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
-    for r in ingressi:
-        key = (_row_val(r, "DATA_INGRESSO") or "", _row_val(r, "CODICE_PROVENIENZA") or "")
-        grouped[key].append(r)
+    codice_capo_of = table.getter("CODICE_CAPO")
+    motivo_of = table.getter("MOTIVO_INGRESSO")
+    modello_of = table.getter("NUMERO_MODELLO_INGRESSO")
+    get = table.get
     partite = []
-    first_col = columns[0] if columns else None
     for (data_ingresso_str, codice_provenienza), group in grouped.items():
         data_ingresso = parse_date(data_ingresso_str)
         if not data_ingresso:
             continue
-        capi_unici = list({_row_val(r, "CODICE_CAPO") for r in group if _row_val(r, "CODICE_CAPO")})
+        capi_unici = list({c for c in map(codice_capo_of, group) if c})
         numero_capi = len(capi_unici)
         animali_dati = {}
         for row in group:
-            codice_capo = _row_val(row, "CODICE_CAPO")
+            codice_capo = codice_capo_of(row)
             if not codice_capo:
                 continue
-            sesso = _row_val(row, "SESSO")
+            sesso = get(row, "SESSO")
             if sesso and sesso.upper() in ("M", "F"):
                 sesso = sesso.upper()
             else:
                 sesso = None
-            data_nascita_val = _row_val(row, "DATA_NASCITA")
-            data_nascita = parse_date(data_nascita_val) if data_nascita_val else None
-            data_modello_ingresso_val = _row_val(row, "DATA_MODELLO_INGRESSO")
-            data_modello_ingresso = parse_date(data_modello_ingresso_val) if data_modello_ingresso_val else None
-            data_estrazione_val = _row_val(row, "DATA_ESTRAZIONE_DATI")
-            data_estrazione_dati = parse_date(data_estrazione_val) if data_estrazione_val else None
             animali_dati[codice_capo] = {
                 "sesso": sesso,
-                "razza": _row_val(row, "RAZZA"),
-                "data_nascita": data_nascita,
-                "codice_elettronico": _row_val(row, "CODICE_ELETTRONICO"),
-                "codice_madre": _row_val(row, "CODICE_MADRE"),
-                "identificativo_fiscale_provenienza": _row_val(row, "IDENTIFICATIVO_FISCALE_PROV_"),
-                "specie_allevata_provenienza": _row_val(row, "SPECIE_ALLEVATA_PROV"),
-                "data_modello_ingresso": data_modello_ingresso,
-                "codice_assegnato_precedenza": _row_val(row, "CODICE_ASSEGNATO_IN_PRECEDENZA"),
-                "data_estrazione_dati": data_estrazione_dati,
+                "razza": get(row, "RAZZA"),
+                "data_nascita": parse_date(get(row, "DATA_NASCITA")),
+                "codice_elettronico": get(row, "CODICE_ELETTRONICO"),
+                "codice_madre": get(row, "CODICE_MADRE"),
+                "identificativo_fiscale_provenienza": get(row, "IDENTIFICATIVO_FISCALE_PROV_"),
+                "specie_allevata_provenienza": get(row, "SPECIE_ALLEVATA_PROV"),
+                "data_modello_ingresso": parse_date(get(row, "DATA_MODELLO_INGRESSO")),
+                "codice_assegnato_precedenza": get(row, "CODICE_ASSEGNATO_IN_PRECEDENZA"),
+                "data_estrazione_dati": parse_date(get(row, "DATA_ESTRAZIONE_DATI")),
             }
-        codice_provenienza_str = (codice_provenienza or "").strip().upper()
-        is_interno = codice_provenienza_str in codici_stalla_gestiti
-        motivi = [_row_val(r, "MOTIVO_INGRESSO") for r in group if _row_val(r, "MOTIVO_INGRESSO")]
-        motivo = max(set(motivi), key=motivi.count) if motivi else None
-        modelli = [_row_val(r, "NUMERO_MODELLO_INGRESSO") for r in group if _row_val(r, "NUMERO_MODELLO_INGRESSO")]
-        numero_modello = max(set(modelli), key=modelli.count) if modelli else None
-        codice_stalla_azienda_val = None
-        if group and first_col:
-            codice_stalla_azienda_val = _row_val(group[0], "AZIENDA_CODICE") or _row_val(group[0], first_col)
+        is_interno = codice_provenienza.upper() in codici_stalla_gestiti
         partite.append({
             "tipo": TipoPartita.INGRESSO,
             "data": data_ingresso,
-            "codice_stalla": (codice_provenienza or "").strip(),
+            "codice_stalla": codice_provenienza,
             "numero_capi": numero_capi,
-            "motivo": motivo.strip() if motivo else None,
-            "numero_modello": numero_modello.strip() if numero_modello else None,
+            "motivo": _moda(map(motivo_of, group)),
+            "numero_modello": _moda(map(modello_of, group)),
             "is_trasferimento_interno": is_interno,
             "codici_capi": capi_unici,
             "animali_dati": animali_dati,
             "azienda_codice": azienda_codice,
-            "codice_stalla_azienda_from_file": codice_stalla_azienda_val,
+            "codice_stalla_azienda_from_file": _codice_stalla_azienda_from_row(table, group[0]),
         })
     return partite
 
 
-def group_uscite(columns: List[str], rows: List[Dict[str, Any]], azienda_codice: str, azienda_id: int, db: Session, codici_stalla_gestiti: Optional[set] = None) -> List[Dict]:
+def group_uscite(table: AnagrafeTable, azienda_codice: str, azienda_id: int, db: Session, codici_stalla_gestiti: Optional[set] = None) -> List[Dict]:
     """
     Raggruppa uscite per DATA_USCITA_STALLA e CODICE_AZIENDA_DESTINAZIONE.
-    Funziona con lista di dict (senza pandas).
+    Lavora sulle posizioni di colonna della AnagrafeTable.
     """
-    uscite = [r for r in rows if _row_val(r, "DATA_USCITA_STALLA") and _row_val(r, "CODICE_AZIENDA_DESTINAZIONE")]
-    if not uscite:
+    data_uscita_of = table.getter("DATA_USCITA_STALLA")
+    destinazione_of = table.getter("CODICE_AZIENDA_DESTINAZIONE")
+    grouped: Dict[Tuple[str, str], List[tuple]] = defaultdict(list)
+    for r in table.rows:
+        data_uscita_str = data_uscita_of(r)
+        codice_destinazione = destinazione_of(r)
+        if data_uscita_str and codice_destinazione:
+            grouped[(data_uscita_str, codice_destinazione)].append(r)
+    if not grouped:
         return []
     if codici_stalla_gestiti is None:
         from app.services.allevamento.codici_stalla_service import get_codici_stalla_gestiti
         codici_stalla_gestiti = get_codici_stalla_gestiti(db, azienda_id)
-    grouped: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
-    for r in uscite:
-        key = (_row_val(r, "DATA_USCITA_STALLA") or "", _row_val(r, "CODICE_AZIENDA_DESTINAZIONE") or "")
-        grouped[key].append(r)
+    codice_capo_of = table.getter("CODICE_CAPO")
+    motivo_of = table.getter("MOTIVO_USCITA")
+    modello_of = table.getter("NUMERO_MODELLO_USCITA")
+    get = table.get
     partite = []
-    first_col = columns[0] if columns else None
     for (data_uscita_str, codice_destinazione), group in grouped.items():
         data_uscita = parse_date(data_uscita_str)
         if not data_uscita:
             continue
-        capi_unici = list({_row_val(r, "CODICE_CAPO") for r in group if _row_val(r, "CODICE_CAPO")})
+        capi_unici = list({c for c in map(codice_capo_of, group) if c})
         numero_capi = len(capi_unici)
-        codice_destinazione_str = (codice_destinazione or "").strip().upper()
-        is_interno = codice_destinazione_str in codici_stalla_gestiti
-        motivi = [_row_val(r, "MOTIVO_USCITA") for r in group if _row_val(r, "MOTIVO_USCITA")]
-        motivo = max(set(motivi), key=motivi.count) if motivi else None
-        modelli = [_row_val(r, "NUMERO_MODELLO_USCITA") for r in group if _row_val(r, "NUMERO_MODELLO_USCITA")]
-        numero_modello = max(set(modelli), key=modelli.count) if modelli else None
+        is_interno = codice_destinazione.upper() in codici_stalla_gestiti
         animali_dati_uscita = {}
         for row in group:
-            codice_capo = _row_val(row, "CODICE_CAPO")
+            codice_capo = codice_capo_of(row)
             if not codice_capo:
                 continue
-            data_modello_uscita_val = _row_val(row, "DATA_MODELLO_USCITA")
-            data_modello_uscita = parse_date(data_modello_uscita_val) if data_modello_uscita_val else None
-            data_macellazione_val = _row_val(row, "DATA_MACELLAZIONE")
-            data_macellazione = parse_date(data_macellazione_val) if data_macellazione_val else None
-            data_provv_val = _row_val(row, "DATA_PROVVEDIMENTO")
-            data_provvvedimento = parse_date(data_provv_val) if data_provv_val else None
             animali_dati_uscita[codice_capo] = {
-                "data_modello_uscita": data_modello_uscita,
-                "codice_fiera_destinazione": _row_val(row, "CODICE_FIERA_DESTINAZIONE"),
-                "codice_stato_destinazione": _row_val(row, "CODICE_STATO_DESTINAZIONE"),
-                "regione_macello_destinazione": _row_val(row, "REGIONE_MACELLO_DESTINAZIONE"),
-                "codice_macello_destinazione": _row_val(row, "CODICE_MACELLO_DESTINAZIONE"),
-                "codice_pascolo_destinazione": _row_val(row, "CODICE_PASCOLO_DESTINAZIONE"),
-                "codice_circo_destinazione": _row_val(row, "CODICE_CIRCO_DESTINAZIONE"),
-                "data_macellazione": data_macellazione,
-                "abbattimento": _row_val(row, "ABBATTIMENTO__S_N_"),
-                "data_provvvedimento": data_provvvedimento,
+                "data_modello_uscita": parse_date(get(row, "DATA_MODELLO_USCITA")),
+                "codice_fiera_destinazione": get(row, "CODICE_FIERA_DESTINAZIONE"),
+                "codice_stato_destinazione": get(row, "CODICE_STATO_DESTINAZIONE"),
+                "regione_macello_destinazione": get(row, "REGIONE_MACELLO_DESTINAZIONE"),
+                "codice_macello_destinazione": get(row, "CODICE_MACELLO_DESTINAZIONE"),
+                "codice_pascolo_destinazione": get(row, "CODICE_PASCOLO_DESTINAZIONE"),
+                "codice_circo_destinazione": get(row, "CODICE_CIRCO_DESTINAZIONE"),
+                "data_macellazione": parse_date(get(row, "DATA_MACELLAZIONE")),
+                "abbattimento": get(row, "ABBATTIMENTO__S_N_"),
+                "data_provvvedimento": parse_date(get(row, "DATA_PROVVEDIMENTO")),
             }
-        codice_stalla_azienda_val = None
-        if group and first_col:
-            codice_stalla_azienda_val = _row_val(group[0], "AZIENDA_CODICE") or _row_val(group[0], first_col)
         partite.append({
             "tipo": TipoPartita.USCITA,
             "data": data_uscita,
-            "codice_stalla": (codice_destinazione or "").strip(),
+            "codice_stalla": codice_destinazione,
             "numero_capi": numero_capi,
-            "motivo": motivo.strip() if motivo else None,
-            "numero_modello": numero_modello.strip() if numero_modello else None,
+            "motivo": _moda(map(motivo_of, group)),
+            "numero_modello": _moda(map(modello_of, group)),
             "is_trasferimento_interno": is_interno,
             "codici_capi": capi_unici,
             "animali_dati": animali_dati_uscita,
             "azienda_codice": azienda_codice,
-            "codice_stalla_azienda_from_file": codice_stalla_azienda_val,
+            "codice_stalla_azienda_from_file": _codice_stalla_azienda_from_row(table, group[0]),
         })
     return partite
 
@@ -375,57 +599,44 @@ def group_uscite(columns: List[str], rows: List[Dict[str, Any]], azienda_codice:
 _CODICI_MOTIVO_DECESSO = ("D", "02", "2")
 
 
-def group_decessi(columns: List[str], rows: List[Dict[str, Any]], azienda_codice: str, azienda_id: int, db: Session, animali_esistenti_map: Optional[dict] = None) -> List[Dict]:
+def group_decessi(table: AnagrafeTable, azienda_codice: str, azienda_id: int, db: Session, animali_esistenti_map: Optional[dict] = None) -> List[Dict]:
     """
     Raggruppa decessi (MOTIVO_USCITA = 'D', '02' o '2') per data di uscita E codice stalla.
     Più gruppi nella stessa giornata (es. 2 stalle diverse) vengono trattati separatamente.
     L'anagrafe è passata da D a 2: supportiamo entrambi i codici.
-    Funziona con lista di dict (senza pandas).
-    """
-    def is_decesso(row: Dict) -> bool:
-        m = _row_val(row, "MOTIVO_USCITA")
-        if not m:
-            return False
-        m = m.strip().upper()
-        return m in _CODICI_MOTIVO_DECESSO
+    Lavora sulle posizioni di colonna della AnagrafeTable.
+    """
+    motivo_of = table.getter("MOTIVO_USCITA")
+    data_uscita_of = table.getter("DATA_USCITA_STALLA")
+    codice_capo_of = table.getter("CODICE_CAPO")
     decessi = [
-        r for r in rows
-        if is_decesso(r) and _row_val(r, "DATA_USCITA_STALLA") and _row_val(r, "CODICE_CAPO")
+        r for r in table.rows
+        if (motivo_of(r) or "").upper() in _CODICI_MOTIVO_DECESSO and data_uscita_of(r) and codice_capo_of(r)
     ]
     if not decessi:
         return []
     if animali_esistenti_map is None:
         from app.models.allevamento.animale import Animale
-        codici_capi = list({_row_val(r, "CODICE_CAPO") for r in decessi if _row_val(r, "CODICE_CAPO")})
-        if codici_capi:
-            animali_tuples = db.query(Animale.id, Animale.auricolare).filter(
-                Animale.auricolare.in_(codici_capi),
-                Animale.azienda_id == azienda_id,
-                Animale.deleted_at.is_(None),
-            ).all()
-            animali_esistenti_map = {aur: id_ for id_, aur in animali_tuples}
-        else:
-            animali_esistenti_map = {}
-    first_col = columns[0] if columns else None
+        codici_capi = list({codice_capo_of(r) for r in decessi})
+        animali_tuples = db.query(Animale.id, Animale.auricolare).filter(
+            Animale.auricolare.in_(codici_capi),
+            Animale.azienda_id == azienda_id,
+            Animale.deleted_at.is_(None),
+        ).all()
+        animali_esistenti_map = {aur: id_ for id_, aur in animali_tuples}
+    get = table.get
     gruppi_decessi: Dict[str, Dict] = {}
     for row in decessi:
-        data_uscita_stalla_val = _row_val(row, "DATA_USCITA_STALLA")
-        data_decesso = parse_date(data_uscita_stalla_val) if data_uscita_stalla_val else None
+        data_decesso = parse_date(data_uscita_of(row))
         if not data_decesso:
             continue
-        codice_capo = _row_val(row, "CODICE_CAPO")
-        animale_id = animali_esistenti_map.get(codice_capo) if codice_capo else None
-        numero_modello = _row_val(row, "NUMERO_MODELLO_USCITA")
-        codice_stalla_decesso = _row_val(row, "AZIENDA_CODICE") or (first_col and _row_val(row, first_col))
-        data_modello_uscita_val = _row_val(row, "DATA_MODELLO_USCITA")
-        data_modello_uscita = parse_date(data_modello_uscita_val) if data_modello_uscita_val else None
-        data_macellazione_val = _row_val(row, "DATA_MACELLAZIONE")
-        data_macellazione = parse_date(data_macellazione_val) if data_macellazione_val else None
-        data_provv_val = _row_val(row, "DATA_PROVVEDIMENTO")
-        data_provvvedimento = parse_date(data_provv_val) if data_provv_val else None
+        codice_capo = codice_capo_of(row)
+        animale_id = animali_esistenti_map.get(codice_capo)
+        numero_modello = get(row, "NUMERO_MODELLO_USCITA")
+        codice_stalla_decesso = _codice_stalla_azienda_from_row(table, row)
         # Chiave composita: data + codice_stalla per gestire più gruppi nello stesso giorno (stalle diverse)
-        codice_stalla_key = (codice_stalla_decesso or "").strip() or "_default"
-        data_key = f"{data_decesso.isoformat() if isinstance(data_decesso, date) else str(data_decesso)}__{codice_stalla_key}"
+        codice_stalla_key = codice_stalla_decesso or "_default"
+        data_key = f"{data_decesso.isoformat()}__{codice_stalla_key}"
         if data_key not in gruppi_decessi:
             gruppi_decessi[data_key] = {
                 "data_uscita": data_decesso,
@@ -447,16 +658,16 @@ def group_decessi(columns: List[str], rows: List[Dict[str, Any]], azienda_codice
         g["animali_dati"][codice_capo] = {
             "codice_stalla_decesso": codice_stalla_decesso,
             "numero_modello_uscita": numero_modello,
-            "data_modello_uscita": data_modello_uscita,
-            "codice_fiera_destinazione": _row_val(row, "CODICE_FIERA_DESTINAZIONE"),
-            "codice_stato_destinazione": _row_val(row, "CODICE_STATO_DESTINAZIONE"),
-            "regione_macello_destinazione": _row_val(row, "REGIONE_MACELLO_DESTINAZIONE"),
-            "codice_macello_destinazione": _row_val(row, "CODICE_MACELLO_DESTINAZIONE"),
-            "codice_pascolo_destinazione": _row_val(row, "CODICE_PASCOLO_DESTINAZIONE"),
-            "codice_circo_destinazione": _row_val(row, "CODICE_CIRCO_DESTINAZIONE"),
-            "data_macellazione": data_macellazione,
-            "abbattimento": _row_val(row, "ABBATTIMENTO__S_N_"),
-            "data_provvvedimento": data_provvvedimento,
+            "data_modello_uscita": parse_date(get(row, "DATA_MODELLO_USCITA")),
+            "codice_fiera_destinazione": get(row, "CODICE_FIERA_DESTINAZIONE"),
+            "codice_stato_destinazione": get(row, "CODICE_STATO_DESTINAZIONE"),
+            "regione_macello_destinazione": get(row, "REGIONE_MACELLO_DESTINAZIONE"),
+            "codice_macello_destinazione": get(row, "CODICE_MACELLO_DESTINAZIONE"),
+            "codice_pascolo_destinazione": get(row, "CODICE_PASCOLO_DESTINAZIONE"),
+            "codice_circo_destinazione": get(row, "CODICE_CIRCO_DESTINAZIONE"),
+            "data_macellazione": parse_date(get(row, "DATA_MACELLAZIONE")),
+            "abbattimento": get(row, "ABBATTIMENTO__S_N_"),
+            "data_provvvedimento": parse_date(get(row, "DATA_PROVVEDIMENTO")),
             "a_carico": True,
         }
     return list(gruppi_decessi.values())
@@ -474,8 +685,18 @@ def filter_existing_decessi(
     stesso codice_stalla_decesso e azienda_id (più gruppi nello stesso giorno in stalle diverse
     sono trattati separatamente).
     """
+    esistenti = _match_existing_decessi(gruppi_decessi, azienda_id, db)
+    return [gruppo for idx, gruppo in enumerate(gruppi_decessi) if idx not in esistenti]
+
+
+def _match_existing_decessi(
+    gruppi_decessi: List[Dict],
+    azienda_id: int,
+    db: Session
+) -> Dict[int, int]:
+    """Indice del gruppo candidato -> id del gruppo decessi già registrato che lo copre."""
     if not gruppi_decessi:
-        return []
+        return {}
     
     from app.models.allevamento.gruppo_decessi import GruppoDecessi
     
@@ -483,7 +704,7 @@ def filter_existing_decessi(
     date_uscita = list({gruppo.get('data_uscita') for gruppo in gruppi_decessi if gruppo.get('data_uscita')})
     
     if not date_uscita:
-        return gruppi_decessi
+        return {}
     
     # Query batch per trovare tutti i gruppi esistenti con quelle date
     existing_gruppi = db.query(GruppoDecessi).filter(
@@ -492,25 +713,28 @@ def filter_existing_decessi(
         GruppoDecessi.deleted_at.is_(None)
     ).all()
     
-    # Set di (data_uscita, codice_stalla) esistenti per lookup veloce
+    # (data_uscita, codice_stalla) esistenti -> id del gruppo, per lookup veloce
     # Per record vecchi senza codice_stalla si usa "_default"
     existing_keys = {
-        (g.data_uscita, (g.codice_stalla_decesso or "").strip() or "_default")
+        (g.data_uscita, (g.codice_stalla_decesso or "").strip() or "_default"): g.id
         for g in existing_gruppi
     }
     
-    # Filtra i gruppi: escludi se (data, codice_stalla) già esistente
-    gruppi_filtered = []
-    for gruppo in gruppi_decessi:
+    # Gruppi già registrati: stessa (data, codice_stalla)
+    esistenti = {}
+    for idx, gruppo in enumerate(gruppi_decessi):
         data = gruppo.get('data_uscita')
         if not data:
-            gruppi_filtered.append(gruppo)
             continue
         codice_stalla = (gruppo.get('codice_stalla_decesso') or "").strip() or "_default"
-        if (data, codice_stalla) not in existing_keys:
-            gruppi_filtered.append(gruppo)
+        gruppo_id = existing_keys.get((data, codice_stalla))
+        if gruppo_id is not None:
+            esistenti[idx] = gruppo_id
     
-    return gruppi_filtered
+    return esistenti
+
+
+_PARTITE_VALUES_CHUNK = 1000
 
 
 def filter_existing_partite(
@@ -519,188 +743,295 @@ def filter_existing_partite(
     db: Session
 ) -> List[Dict]:
     """
-    Filtra le partite già esistenti nel database usando query batch per ottimizzazione.
+    Filtra le partite già esistenti nel database con una query set-based.
     
     Una partita è considerata duplicata se esiste già una partita con:
     - stessa azienda_id
     - stesso tipo (ingresso/uscita)
     - stessa data
     - stesso codice_stalla
-    - stesso numero_capi
     - E se è stata completamente processata (ha tutti gli animali collegati)
     
     Se una partita esiste ma non è stata completamente processata, viene inclusa
     per permettere di completarla.
     
-    OTTIMIZZAZIONE: Usa query batch per evitare N+1 query problem.
+    OTTIMIZZAZIONE: le chiavi candidate viaggiano come lista VALUES in JOIN con
+    partite_animali; animali collegati e animali creati sono contati nella stessa
+    istruzione (subquery correlate), quindi una sola query indicizzata per blocco
+    invece di un OR con un termine per partita.
     """
+    complete = _match_existing_partite(partite, azienda_id, db)
+    # Le partite nuove o non completamente processate restano da confermare
+    return [partita for idx, partita in enumerate(partite) if idx not in complete]
+
+
+def _match_existing_partite(
+    partite: List[Dict],
+    azienda_id: int,
+    db: Session
+) -> Dict[int, int]:
+    """Indice della partita candidata -> id della partita già completamente processata."""
     if not partite:
-        return []
+        return {}
     
     from app.models.amministrazione.partita_animale_animale import PartitaAnimaleAnimale
     from app.models.allevamento.animale import Animale
-    from sqlalchemy import and_, or_, func, case, literal_column
+    from sqlalchemy import Date, Integer, String, and_, column, or_, select, values
     
-    # Crea una lista di tuple (tipo, data, codice_stalla) per query batch
-    partite_keys = [
-        (partita['tipo'], partita['data'], partita['codice_stalla'])
-        for partita in partite
-    ]
+    animali_collegati = (
+        select(func.count(PartitaAnimaleAnimale.id))
+        .where(PartitaAnimaleAnimale.partita_animale_id == PartitaAnimale.id)
+        .correlate(PartitaAnimale)
+        .scalar_subquery()
+    )
+    # Animali creati dall'import: stessa stalla azienda e data arrivo/uscita della partita
+    animali_creati = (
+        select(func.count(Animale.id))
+        .where(
+            Animale.codice_azienda_anagrafe == PartitaAnimale.codice_stalla_azienda,
+            Animale.deleted_at.is_(None),
+            or_(
+                and_(PartitaAnimale.tipo == TipoPartita.INGRESSO.value, Animale.data_arrivo == PartitaAnimale.data),
+                and_(PartitaAnimale.tipo != TipoPartita.INGRESSO.value, Animale.data_uscita == PartitaAnimale.data),
+            ),
+        )
+        .correlate(PartitaAnimale)
+        .scalar_subquery()
+    )
     
-    # Query batch per trovare tutte le partite esistenti
-    conditions = []
-    for tipo, data, codice_stalla in partite_keys:
-        conditions.append(
-            and_(
-                PartitaAnimale.azienda_id == azienda_id,
-                PartitaAnimale.tipo == tipo,
-                PartitaAnimale.data == data,
-                PartitaAnimale.codice_stalla == codice_stalla,
-                PartitaAnimale.deleted_at.is_(None)
+    # Indici delle partite candidate già completamente processate
+    complete = {}
+    for start in range(0, len(partite), _PARTITE_VALUES_CHUNK):
+        chunk = partite[start:start + _PARTITE_VALUES_CHUNK]
+        candidati = values(
+            column("idx", Integer),
+            column("tipo", String),
+            column("data", Date),
+            column("codice_stalla", String),
+            name="candidati",
+        ).data([
+            (
+                start + offset,
+                partita['tipo'].value if hasattr(partita['tipo'], "value") else partita['tipo'],
+                partita['data'],
+                partita['codice_stalla'],
+            )
+            for offset, partita in enumerate(chunk)
+        ])
+        stmt = (
+            select(
+                candidati.c.idx,
+                PartitaAnimale.id,
+                PartitaAnimale.numero_capi,
+                animali_collegati.label("animali_collegati"),
+                animali_creati.label("animali_creati"),
+            )
+            .select_from(candidati)
+            .join(
+                PartitaAnimale,
+                and_(
+                    PartitaAnimale.azienda_id == azienda_id,
+                    PartitaAnimale.tipo == candidati.c.tipo,
+                    PartitaAnimale.data == candidati.c.data,
+                    PartitaAnimale.codice_stalla == candidati.c.codice_stalla,
+                    PartitaAnimale.deleted_at.is_(None),
+                ),
             )
         )
+        for row in db.execute(stmt):
+            animali_processati_reali = max(row.animali_collegati or 0, row.animali_creati or 0)
+            if animali_processati_reali >= (row.numero_capi or 0):
+                complete.setdefault(row.idx, row.id)
     
-    if not conditions:
-        return partite
-    
-    # Esegui query batch
-    existing_partite = db.query(PartitaAnimale).filter(
-        or_(*conditions)
-    ).all()
-    
-    if not existing_partite:
-        return partite
-    
-    # Crea un dict per lookup veloce: (tipo, data, codice_stalla) -> PartitaAnimale
-    existing_map = {
-        (p.tipo, p.data, p.codice_stalla): p
-        for p in existing_partite
-    }
-    
-    # Raccogli tutti gli ID delle partite esistenti per query batch degli animali
-    existing_ids = [p.id for p in existing_partite]
-    
-    # Query batch per contare animali collegati per tutte le partite
-    animali_collegati_map = {}
-    if existing_ids:
-        risultati = db.query(
-            PartitaAnimaleAnimale.partita_animale_id,
-            func.count(PartitaAnimaleAnimale.id).label('count')
-        ).filter(
-            PartitaAnimaleAnimale.partita_animale_id.in_(existing_ids)
-        ).group_by(PartitaAnimaleAnimale.partita_animale_id).all()
-        
-        animali_collegati_map = {r.partita_animale_id: r.count for r in risultati}
-    
-    # OTTIMIZZAZIONE: Query batch per animali creati invece di query individuali
-    # Raggruppa le partite per tipo e codice_stalla_azienda per fare meno query
-    animali_creati_map = {}
-    
-    # Raccogli tutti i codici stalla e date per query batch
-    codici_stalla_ingresso = set()
-    codici_stalla_uscita = set()
-    date_ingresso = set()
-    date_uscita = set()
-    
-    for existing in existing_partite:
-        if existing.codice_stalla_azienda:
-            if existing.tipo.value == 'ingresso':
-                codici_stalla_ingresso.add(existing.codice_stalla_azienda)
-                date_ingresso.add(existing.data)
-            else:
-                codici_stalla_uscita.add(existing.codice_stalla_azienda)
-                date_uscita.add(existing.data)
-    
-    # Query batch per ingressi (una sola query per tutti)
-    if codici_stalla_ingresso and date_ingresso:
-        ingresso_counts = db.query(
-            Animale.codice_azienda_anagrafe,
-            Animale.data_arrivo,
-            func.count(Animale.id).label('count')
-        ).filter(
-            Animale.codice_azienda_anagrafe.in_(list(codici_stalla_ingresso)),
-            Animale.data_arrivo.in_(list(date_ingresso)),
-            Animale.deleted_at.is_(None)
-        ).group_by(
-            Animale.codice_azienda_anagrafe,
-            Animale.data_arrivo
-        ).all()
-        
-        # Mappa: (codice_stalla, data) -> count
-        ingresso_map = {(r.codice_azienda_anagrafe, r.data_arrivo): r.count for r in ingresso_counts}
-        
-        # Associa i conteggi alle partite
-        for existing in existing_partite:
-            if existing.codice_stalla_azienda and existing.tipo.value == 'ingresso':
-                key = (existing.codice_stalla_azienda, existing.data)
-                animali_creati_map[existing.id] = ingresso_map.get(key, 0)
-    
-    # Query batch per uscite (una sola query per tutti)
-    if codici_stalla_uscita and date_uscita:
-        uscita_counts = db.query(
-            Animale.codice_azienda_anagrafe,
-            Animale.data_uscita,
-            func.count(Animale.id).label('count')
-        ).filter(
-            Animale.codice_azienda_anagrafe.in_(list(codici_stalla_uscita)),
-            Animale.data_uscita.in_(list(date_uscita)),
-            Animale.deleted_at.is_(None)
-        ).group_by(
-            Animale.codice_azienda_anagrafe,
-            Animale.data_uscita
-        ).all()
-        
-        # Mappa: (codice_stalla, data) -> count
-        uscita_map = {(r.codice_azienda_anagrafe, r.data_uscita): r.count for r in uscita_counts}
-        
-        # Associa i conteggi alle partite
-        for existing in existing_partite:
-            if existing.codice_stalla_azienda and existing.tipo.value == 'uscita':
-                key = (existing.codice_stalla_azienda, existing.data)
-                animali_creati_map[existing.id] = uscita_map.get(key, 0)
-    
-    # Filtra le partite
-    partite_filtered = []
-    for partita in partite:
-        key = (partita['tipo'], partita['data'], partita['codice_stalla'])
-        existing = existing_map.get(key)
-        
-        if existing:
-            # Verifica se la partita è stata completamente processata
-            animali_collegati = animali_collegati_map.get(existing.id, 0)
-            animali_creati = animali_creati_map.get(existing.id, 0)
-            animali_processati_reali = max(animali_collegati, animali_creati)
-            numero_capi_esistente = existing.numero_capi
-            
-            # Se la partita esiste ma non è completamente processata, includila
-            if animali_processati_reali < numero_capi_esistente:
-                partite_filtered.append(partita)
+    return complete
+
+
+# ============ INDICE EVENTI CAPO (riconciliazione incrementale) ============
+EVENTO_INGRESSO = "ingresso"
+EVENTO_USCITA = "uscita"
+EVENTO_DECESSO = "decesso"
+
+# Evento: (codice_capo, tipo_evento, data_evento, codice_stalla)
+CapoEvent = Tuple[str, str, date, Optional[str]]
+
+_EVENT_HASH_LOOKUP_CHUNK = 5000
+
+
+def capo_event_hash(codice_capo: str, tipo_evento: str, data_evento: date, codice_stalla: Optional[str]) -> str:
+    """Impronta stabile di un evento anagrafe (valori normalizzati, data ISO)."""
+    key = "|".join((
+        str(codice_capo).strip().upper(),
+        tipo_evento,
+        data_evento.isoformat(),
+        (codice_stalla or "").strip().upper(),
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def row_capo_events(table: AnagrafeTable, row: tuple) -> List[CapoEvent]:
+    """
+    Eventi contenuti in una riga del file anagrafe, con le stesse regole di
+    group_ingressi / group_uscite / group_decessi.
+    """
+    get = table.get
+    codice_capo = get(row, "CODICE_CAPO")
+    if not codice_capo:
+        return []
+    events: List[CapoEvent] = []
+    data_ingresso = parse_date(get(row, "DATA_INGRESSO"))
+    codice_provenienza = get(row, "CODICE_PROVENIENZA")
+    if data_ingresso and codice_provenienza:
+        events.append((codice_capo, EVENTO_INGRESSO, data_ingresso, codice_provenienza))
+    data_uscita = parse_date(get(row, "DATA_USCITA_STALLA"))
+    if data_uscita:
+        codice_destinazione = get(row, "CODICE_AZIENDA_DESTINAZIONE")
+        if codice_destinazione:
+            events.append((codice_capo, EVENTO_USCITA, data_uscita, codice_destinazione))
+        motivo = get(row, "MOTIVO_USCITA")
+        if motivo and motivo.upper() in _CODICI_MOTIVO_DECESSO:
+            events.append((codice_capo, EVENTO_DECESSO, data_uscita, _codice_stalla_azienda_from_row(table, row)))
+    return events
+
+
+def load_known_capo_events(db: Session, azienda_id: int, hashes: Iterable[str]) -> set:
+    """Restituisce il sottoinsieme di hash già presenti nell'indice per l'azienda."""
+    from app.models.amministrazione.anagrafe_evento_capo import AnagrafeEventoCapo
+
+    hashes = list(hashes)
+    known = set()
+    for start in range(0, len(hashes), _EVENT_HASH_LOOKUP_CHUNK):
+        chunk = hashes[start:start + _EVENT_HASH_LOOKUP_CHUNK]
+        known.update(
+            h for (h,) in db.query(AnagrafeEventoCapo.event_hash).filter(
+                AnagrafeEventoCapo.azienda_id == azienda_id,
+                AnagrafeEventoCapo.event_hash.in_(chunk),
+            )
+        )
+    return known
+
+
+def record_capo_events(
+    db: Session,
+    azienda_id: int,
+    events: Iterable[CapoEvent],
+    partita_animale_id: Optional[int] = None,
+    gruppo_decessi_id: Optional[int] = None,
+) -> int:
+    """
+    Registra eventi riconciliati nell'indice, collegati alla partita o al gruppo decessi
+    che li contiene. Idempotente: gli eventi già presenti vengono ignorati. Non esegue
+    commit (resta nella transazione del chiamante). Restituisce il numero di eventi inseriti.
+    """
+    pending: Dict[str, Dict[str, Any]] = {}
+    _add_capo_event_rows(pending, azienda_id, events, partita_animale_id, gruppo_decessi_id)
+    return _insert_capo_event_rows(db, azienda_id, pending)
+
+
+def _add_capo_event_rows(
+    pending: Dict[str, Dict[str, Any]],
+    azienda_id: int,
+    events: Iterable[CapoEvent],
+    partita_animale_id: Optional[int] = None,
+    gruppo_decessi_id: Optional[int] = None,
+) -> None:
+    """Aggiunge a pending (hash -> riga) le righe dell'indice per gli eventi."""
+    for codice_capo, tipo_evento, data_evento, codice_stalla in events:
+        if not codice_capo or not data_evento:
+            continue
+        event_hash = capo_event_hash(codice_capo, tipo_evento, data_evento, codice_stalla)
+        codice_stalla = (codice_stalla or "").strip()[:50] or None
+        pending[event_hash] = {
+            "azienda_id": azienda_id,
+            "event_hash": event_hash,
+            "codice_capo": str(codice_capo).strip()[:50],
+            "tipo_evento": tipo_evento,
+            "data_evento": data_evento,
+            "codice_stalla": codice_stalla,
+            "partita_animale_id": partita_animale_id,
+            "gruppo_decessi_id": gruppo_decessi_id,
+        }
+
+
+def _insert_capo_event_rows(db: Session, azienda_id: int, pending: Dict[str, Dict[str, Any]]) -> int:
+    """Inserisce le righe non ancora indicizzate; restituisce quante ne ha inserite."""
+    from sqlalchemy.exc import IntegrityError
+    from app.models.amministrazione.anagrafe_evento_capo import AnagrafeEventoCapo
+
+    if not pending:
+        return 0
+    for event_hash in load_known_capo_events(db, azienda_id, pending.keys()):
+        pending.pop(event_hash, None)
+    if not pending:
+        return 0
+    # Savepoint: un inserimento concorrente dello stesso evento non deve annullare
+    # la transazione del chiamante (l'indice è solo un acceleratore)
+    try:
+        with db.begin_nested():
+            db.bulk_insert_mappings(AnagrafeEventoCapo, list(pending.values()))
+    except IntegrityError:
+        return 0
+    return len(pending)
+
+
+def partita_capo_events(partita: Dict[str, Any]) -> List[CapoEvent]:
+    """Eventi indicizzabili di una partita raggruppata (ingresso/uscita)."""
+    tipo = partita["tipo"]
+    tipo_evento = tipo.value if hasattr(tipo, "value") else str(tipo)
+    return [
+        (codice_capo, tipo_evento, partita["data"], partita.get("codice_stalla"))
+        for codice_capo in partita.get("codici_capi") or []
+    ]
+
+
+def gruppo_decessi_capo_events(gruppo: Dict[str, Any]) -> List[CapoEvent]:
+    """Eventi indicizzabili di un gruppo decessi raggruppato."""
+    return [
+        (codice_capo, EVENTO_DECESSO, gruppo["data_uscita"], gruppo.get("codice_stalla_decesso"))
+        for codice_capo in gruppo.get("codici_capi") or []
+    ]
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _eventi_capo_before_flush(session: Session, flush_context, instances) -> None:
+    """
+    Partite e gruppi decessi eliminati con soft delete: i loro eventi escono dall'indice,
+    così il prossimo upload anagrafe li ripropone. L'eliminazione definitiva è coperta
+    da ON DELETE CASCADE sulle FK dell'indice.
+    """
+    from app.models.allevamento.gruppo_decessi import GruppoDecessi
+    from app.models.amministrazione.anagrafe_evento_capo import AnagrafeEventoCapo
+
+    partite_ids, gruppi_ids = [], []
+    for obj in session.dirty:
+        if isinstance(obj, PartitaAnimale):
+            ids = partite_ids
+        elif isinstance(obj, GruppoDecessi):
+            ids = gruppi_ids
         else:
-            # Se non esiste, aggiungi alla lista filtrata
-            partite_filtered.append(partita)
-    
-    return partite_filtered
+            continue
+        if obj.id is not None and obj.deleted_at is not None and sa_inspect(obj).attrs.deleted_at.history.added:
+            ids.append(obj.id)
+
+    indice = AnagrafeEventoCapo.__table__
+    if partite_ids:
+        session.execute(indice.delete().where(indice.c.partita_animale_id.in_(partite_ids)))
+    if gruppi_ids:
+        session.execute(indice.delete().where(indice.c.gruppo_decessi_id.in_(gruppi_ids)))
 
 
-def extract_azienda_codice_from_file(columns: List[str], rows: List[Dict[str, Any]]) -> Optional[str]:
+def extract_azienda_codice_from_file(table: AnagrafeTable, first_row: Optional[tuple] = None) -> Optional[str]:
     """
     Estrae AZIENDA_CODICE dalla prima colonna della prima riga del file.
     Questa colonna identifica per quale codice stalla viene richiesto l'import.
-    Senza pandas: lavora su (columns, rows).
+    first_row permette di passare la prima riga quando la tabella contiene solo un sottoinsieme.
     """
-    if not rows:
-        return None
-    first_row = rows[0]
-    # Colonne già normalizzate dal chiamante / da process_gz_file
-    if "AZIENDA_CODICE" in columns:
-        val = first_row.get("AZIENDA_CODICE")
-        if val is not None and str(val).strip():
-            return str(val).strip().upper()
-    if columns:
-        val = first_row.get(columns[0])
-        if val is not None and str(val).strip():
-            return str(val).strip().upper()
-    return None
+    if first_row is None:
+        if not table.rows:
+            return None
+        first_row = table.rows[0]
+    # Colonne già normalizzate da load_anagrafe_table
+    val = _codice_stalla_azienda_from_row(table, first_row)
+    return val.upper() if val else None
 
 
 def verify_codice_stalla_exists(codice_stalla: str, db: Session) -> Tuple[bool, Optional[int], Optional[int]]:
@@ -723,100 +1054,53 @@ def verify_codice_stalla_exists(codice_stalla: str, db: Session) -> Tuple[bool,
     return False, None, None
 
 
-def process_anagrafe_file(
-    gz_content: Union[bytes, str],
+def load_movement_rows(
+    gz_content: Union[bytes, str, io.BytesIO],
+    max_rows: Optional[int] = None,
+) -> Tuple[AnagrafeTable, Optional[tuple]]:
+    """
+    Decodifica il file in una AnagrafeTable tenendo solo le righe con un movimento
+    (ingresso/uscita/decesso). Restituisce anche la prima riga del file, da cui si
+    ricava il codice stalla per cui è stato fatto l'export.
+    """
+    raw_columns, rows_iter = open_anagrafe_rows(gz_content, max_rows=max_rows)
+    table = AnagrafeTable(normalize_column_name(c) for c in raw_columns)
+    data_ingresso_of = table.getter("DATA_INGRESSO")
+    provenienza_of = table.getter("CODICE_PROVENIENZA")
+    data_uscita_of = table.getter("DATA_USCITA_STALLA")
+    first_row: Optional[tuple] = None
+    for r in rows_iter:
+        row = table.make_row(r.get(c) for c in raw_columns)
+        if first_row is None:
+            first_row = row
+        if (data_ingresso_of(row) and provenienza_of(row)) or data_uscita_of(row):
+            table.rows.append(row)
+    return table, first_row
+
+
+def _assign_codice_stalla_azienda(
+    partite: List[Dict],
+    codice_stalla_file: Optional[str],
     azienda_id: int,
-    azienda_codice: str,
-    db: Session
-) -> Tuple[List[Dict], List[Dict], List[Dict], Optional[str]]:
+    db: Session,
+) -> None:
     """
-    Processa file anagrafe .gz e restituisce liste di partite e decessi da creare
-    Esclude automaticamente le partite e decessi già presenti nel database.
-    
-    Ottimizzato per ridurre l'uso della memoria.
-    Accetta bytes o percorso file (str).
+    Aggiunge codice_stalla_azienda (codice stalla dell'allevamento dell'utente) alle partite.
+    Priorità: codice_stalla_azienda_from_file (prima colonna) > codice_stalla_file > logica dinamica.
     """
-    # Forza garbage collection all'inizio per assicurare massima memoria disponibile
-    import gc
-    gc.collect()
-    
-    # Estrai dati dal file (columns, rows) senza pandas
-    try:
-        columns, rows = process_gz_file(gz_content)
-    except Exception as e:
-        if isinstance(gz_content, bytes):
-            del gz_content
-        gc.collect()
-        raise e
-    
-    if isinstance(gz_content, bytes):
-        del gz_content
-    gc.collect()
-    
-    columns = [normalize_column_name(c) for c in columns]
-    
-    MAX_ROWS = 25000
-    if len(rows) > MAX_ROWS:
-        raise ValueError(f"File contiene troppe righe ({len(rows)}). Dimensione massima consentita: {MAX_ROWS} righe. Suddividere il file o contattare il supporto.")
-    
-    codice_stalla_file = extract_azienda_codice_from_file(columns, rows)
-    
-    # Verifica se il codice stalla esiste
-    if codice_stalla_file:
-        sede_exists, sede_id, sede_azienda_id = verify_codice_stalla_exists(codice_stalla_file, db)
-        if not sede_exists:
-            # Il codice stalla non esiste, verrà gestito dall'endpoint per richiedere la creazione
-            pass  # Continuiamo comunque il processamento per identificare le partite
-    
-    # Carica codici stalla gestiti una sola volta per ottimizzazione
-    from app.services.allevamento.codici_stalla_service import get_codici_stalla_gestiti
-    codici_stalla_gestiti = get_codici_stalla_gestiti(db, azienda_id)
-    
-    # Pre-carica animali esistenti per ottimizzare group_decessi
-    # OTTIMIZZAZIONE: Carica solo ID e Auricolare, non interi oggetti ORM
-    from app.models.allevamento.animale import Animale
-    
-    all_codici_capi = set()
-    if "CODICE_CAPO" in columns:
-        for r in rows:
-            v = r.get("CODICE_CAPO")
-            if v is not None and str(v).strip():
-                all_codici_capi.add(str(v).strip())
-    
-    animali_esistenti_map = {}
-    if all_codici_capi:
-        # Usa yield_per per processare in batch se sono troppi, ma qui basta selezionare solo le colonne
-        # Carica tuple (id, auricolare) invece di oggetti completi per risparmiare >80% memoria
-        animali_tuples = db.query(Animale.id, Animale.auricolare).filter(
-            Animale.auricolare.in_(list(all_codici_capi)),
-            Animale.azienda_id == azienda_id,
-            Animale.deleted_at.is_(None)
-        ).all()
-        
-        animali_esistenti_map = {aur: id_ for id_, aur in animali_tuples}
-    
-    partite_ingresso = group_ingressi(columns, rows, azienda_codice, azienda_id, db, codici_stalla_gestiti)
-    partite_uscita = group_uscite(columns, rows, azienda_codice, azienda_id, db, codici_stalla_gestiti)
-    
-    # Importa il service per i codici stalla
     from app.services.allevamento.codici_stalla_service import (
         determina_codice_stalla_azienda,
-        is_codice_stalla_gestito,
         get_codice_stalla_default_ingresso,
         get_codice_stalla_default_uscita
     )
-    
-    # Aggiungi codice_stalla_azienda a tutte le partite (codice stalla dell'allevamento dell'utente)
-    # Determina dinamicamente in base alla logica di business
-    # Priorità: codice_stalla_azienda_from_file (estratto dalla prima colonna) > codice_stalla_file > logica dinamica
-    
-    for partita in partite_ingresso + partite_uscita:
+
+    for partita in partite:
         tipo = partita['tipo'].value
         is_trasferimento_interno = partita.get('is_trasferimento_interno', False)
-        
+
         # Priorità 1: usa codice_stalla_azienda_from_file se disponibile (estratto dalla prima colonna del file)
         codice_stalla_azienda = partita.get('codice_stalla_azienda_from_file')
-        
+
         # Priorità 2: se non disponibile, usa codice_stalla_file
         if not codice_stalla_azienda:
             # Per ingressi da esterni: codice_stalla_file è la destinazione (sede per cui viene fatto l'import)
@@ -837,39 +1121,309 @@ def process_anagrafe_file(
                     db=db,
                     azienda_id=azienda_id
                 )
-                
+
                 # Fallback solo se determina_codice_stalla_azienda restituisce None
                 if not codice_stalla_azienda:
                     if tipo == 'ingresso':
                         codice_stalla_azienda = get_codice_stalla_default_ingresso(db, azienda_id)
                     elif tipo == 'uscita':
                         codice_stalla_azienda = get_codice_stalla_default_uscita(db, azienda_id)
-                    
+
                     # Ultimo fallback: codice_stalla_file
                     if not codice_stalla_azienda:
                         codice_stalla_azienda = codice_stalla_file
-        
+
         partita['codice_stalla_azienda'] = codice_stalla_azienda
-    
-    decessi = group_decessi(columns, rows, azienda_codice, azienda_id, db, animali_esistenti_map)
-    
-    del rows
-    gc.collect()
-    
+
+
+def _reconcile_groups(
+    partite_ingresso: List[Dict],
+    partite_uscita: List[Dict],
+    decessi: List[Dict],
+    azienda_id: int,
+    db: Session,
+) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Filtra partite e decessi già presenti nel database (eventi non ancora nell'indice,
+    es. importati prima della sua introduzione). Sola lettura: è il percorso
+    dell'anteprima, l'indice viene scritto solo dalle conferme (record_capo_events).
+    """
+    def _reconcile_partite(partite: List[Dict]) -> List[Dict]:
+        esistenti = _match_existing_partite(partite, azienda_id, db)
+        return [partita for idx, partita in enumerate(partite) if idx not in esistenti]
+
+    partite_ingresso = _reconcile_partite(partite_ingresso)
+    partite_uscita = _reconcile_partite(partite_uscita)
+
+    esistenti = _match_existing_decessi(decessi, azienda_id, db)
+    decessi = [gruppo for idx, gruppo in enumerate(decessi) if idx not in esistenti]
+
+    return partite_ingresso, partite_uscita, decessi
+
+
+def _load_animali_esistenti_map(db: Session, azienda_id: int, codici_capi: Iterable[str]) -> Dict[str, int]:
+    """Mappa auricolare -> id animale (solo colonne, non oggetti ORM)."""
+    from app.models.allevamento.animale import Animale
+
+    codici_capi = [c for c in set(codici_capi) if c]
+    if not codici_capi:
+        return {}
+    animali_tuples = db.query(Animale.id, Animale.auricolare).filter(
+        Animale.auricolare.in_(codici_capi),
+        Animale.azienda_id == azienda_id,
+        Animale.deleted_at.is_(None)
+    ).all()
+    return {aur: id_ for id_, aur in animali_tuples}
+
+
+def process_anagrafe_file(
+    gz_content: Union[bytes, str],
+    azienda_id: int,
+    azienda_codice: str,
+    db: Session
+) -> Tuple[List[Dict], List[Dict], List[Dict], Optional[str]]:
+    """
+    Processa file anagrafe .gz e restituisce liste di partite e decessi da creare
+    Esclude automaticamente le partite e decessi già presenti nel database.
+
+    Ottimizzato per ridurre l'uso della memoria.
+    Accetta bytes o percorso file (str).
+    """
+    # Un solo passaggio sul file: tabella compatta (tuple con stringhe condivise)
+    # con le sole righe di movimento
+    table, first_row = load_movement_rows(gz_content, max_rows=settings.ANAGRAFE_MAX_ROWS)
+    if isinstance(gz_content, bytes):
+        del gz_content
+
+    # Riconciliazione incrementale: scarta gli eventi già importati in precedenza
+    # (lookup per hash sull'indice anagrafe_eventi_capi, niente catene OR)
+    rows_events = [
+        (r, [(ev[1], capo_event_hash(*ev)) for ev in row_capo_events(table, r)])
+        for r in table.rows
+    ]
+    known_hashes = load_known_capo_events(
+        db, azienda_id, {h for _, events in rows_events for _, h in events}
+    )
+    rows_ingresso: List[tuple] = []
+    rows_uscita: List[tuple] = []
+    rows_decesso: List[tuple] = []
+    all_codici_capi = set()
+    codice_capo_of = table.getter("CODICE_CAPO")
+    for r, events in rows_events:
+        if not events:
+            # Righe senza codice capo: i group_* le scartano comunque
+            rows_ingresso.append(r)
+            rows_uscita.append(r)
+            rows_decesso.append(r)
+            continue
+        new_tipi = {tipo for tipo, h in events if h not in known_hashes}
+        if EVENTO_INGRESSO in new_tipi:
+            rows_ingresso.append(r)
+        if EVENTO_USCITA in new_tipi:
+            rows_uscita.append(r)
+        if EVENTO_DECESSO in new_tipi:
+            rows_decesso.append(r)
+            all_codici_capi.add(codice_capo_of(r))
+    del rows_events, known_hashes
+
+    # Il codice stalla del file viene verificato dall'endpoint, che chiede la
+    # creazione della sede se non esiste
+    codice_stalla_file = extract_azienda_codice_from_file(table, first_row) if first_row else None
+
+    # Carica codici stalla gestiti una sola volta per ottimizzazione
+    from app.services.allevamento.codici_stalla_service import get_codici_stalla_gestiti
+    codici_stalla_gestiti = get_codici_stalla_gestiti(db, azienda_id)
+
+    # Pre-carica animali esistenti per ottimizzare group_decessi
+    animali_esistenti_map = _load_animali_esistenti_map(db, azienda_id, all_codici_capi)
+
+    partite_ingresso = group_ingressi(table.subset(rows_ingresso), azienda_codice, azienda_id, db, codici_stalla_gestiti)
+    partite_uscita = group_uscite(table.subset(rows_uscita), azienda_codice, azienda_id, db, codici_stalla_gestiti)
+    decessi = group_decessi(table.subset(rows_decesso), azienda_codice, azienda_id, db, animali_esistenti_map)
+    del rows_ingresso, rows_uscita, rows_decesso, table
+
+    _assign_codice_stalla_azienda(partite_ingresso + partite_uscita, codice_stalla_file, azienda_id, db)
+
     # Aggiungi azienda_id a tutti i gruppi decessi
     for gruppo in decessi:
         gruppo['azienda_id'] = azienda_id
-    
-    # Filtra le partite già esistenti nel database
-    partite_ingresso = filter_existing_partite(partite_ingresso, azienda_id, db)
-    partite_uscita = filter_existing_partite(partite_uscita, azienda_id, db)
-    
-    # Filtra i decessi già esistenti nel database
-    decessi = filter_existing_decessi(decessi, azienda_id, db)
-    
+
+    partite_ingresso, partite_uscita, decessi = _reconcile_groups(
+        partite_ingresso, partite_uscita, decessi, azienda_id, db
+    )
+
     return partite_ingresso, partite_uscita, decessi, codice_stalla_file
 
 
+# ============ SINCRONIZZAZIONE MULTI-FILE (una sessione, più codici stalla) ============
+def decode_anagrafe_file(
+    path: str,
+    azienda_codice: str,
+    codici_stalla_gestiti: set,
+    max_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Decodifica e raggruppa un file anagrafe senza accedere al database.
+    Eseguito nei processi worker di decode_anagrafe_files: argomenti e risultato
+    devono essere serializzabili (pickle).
+
+    I gruppi decessi hanno animali_ids vuoti: vengono completati dopo il merge
+    con un'unica query sugli animali esistenti.
+    """
+    table, first_row = load_movement_rows(path, max_rows=max_rows)
+    codice_stalla_file = extract_azienda_codice_from_file(table, first_row) if first_row else None
+    return {
+        "codice_stalla_file": codice_stalla_file,
+        "ingressi": group_ingressi(table, azienda_codice, 0, None, codici_stalla_gestiti),
+        "uscite": group_uscite(table, azienda_codice, 0, None, codici_stalla_gestiti),
+        "decessi": group_decessi(table, azienda_codice, 0, None, animali_esistenti_map={}),
+    }
+
+
+async def decode_anagrafe_files(
+    paths: List[str],
+    azienda_codice: str,
+    codici_stalla_gestiti: set,
+) -> List[Dict[str, Any]]:
+    """
+    Decodifica più file anagrafe in parallelo in un process pool (al massimo
+    ANAGRAFE_DECODE_WORKERS processi), nello stesso ordine dei percorsi.
+    Il pool vive solo per la durata della sincronizzazione: a riposo non occupa memoria.
+    """
+    import asyncio
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if len(paths) == 1:
+        return [decode_anagrafe_file(paths[0], azienda_codice, codici_stalla_gestiti, settings.ANAGRAFE_MAX_ROWS)]
+    workers = max(1, min(settings.ANAGRAFE_DECODE_WORKERS, len(paths)))
+    loop = asyncio.get_running_loop()
+    # spawn: i worker non ereditano il pool di connessioni DB del processo API
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            loop.run_in_executor(
+                executor, decode_anagrafe_file, path, azienda_codice, codici_stalla_gestiti, settings.ANAGRAFE_MAX_ROWS
+            )
+            for path in paths
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+    for indice, result in enumerate(results):
+        if isinstance(result, Exception):
+            raise ValueError(f"File {indice + 1}: {result}") from result
+    return results
+
+
+def _without_known_partita_capi(partita: Dict[str, Any], known: set) -> Optional[Dict[str, Any]]:
+    """Toglie dalla partita i capi il cui evento è già nell'indice; None se non resta nulla."""
+    tipo_evento = partita["tipo"].value
+    nuovi = [
+        c for c in partita["codici_capi"]
+        if capo_event_hash(c, tipo_evento, partita["data"], partita["codice_stalla"]) not in known
+    ]
+    if len(nuovi) == len(partita["codici_capi"]):
+        return partita
+    if not nuovi:
+        return None
+    partita["codici_capi"] = nuovi
+    partita["numero_capi"] = len(nuovi)
+    partita["animali_dati"] = {c: partita["animali_dati"][c] for c in nuovi if c in partita["animali_dati"]}
+    return partita
+
+
+def _without_known_decessi_capi(gruppo: Dict[str, Any], known: set) -> Optional[Dict[str, Any]]:
+    """Come _without_known_partita_capi, per un gruppo decessi."""
+    nuovi = [
+        c for c in gruppo["codici_capi"]
+        if capo_event_hash(c, EVENTO_DECESSO, gruppo["data_uscita"], gruppo.get("codice_stalla_decesso")) not in known
+    ]
+    if not nuovi:
+        return None
+    gruppo["codici_capi"] = nuovi
+    gruppo["animali_dati"] = {c: gruppo["animali_dati"][c] for c in nuovi if c in gruppo["animali_dati"]}
+    return gruppo
+
+
+def match_trasferimenti_interni(partite_ingresso: List[Dict], partite_uscita: List[Dict]) -> int:
+    """
+    Abbina le uscite interne di una stalla gestita agli ingressi nell'altra stalla
+    (stessa data, origine e destinazione), quando entrambi i file sono nella sessione.
+    Le due partite ricevono lo stesso id_trasferimento_interno e, se i capi non
+    coincidono, l'elenco capi_non_corrispondenti. Restituisce il numero di abbinamenti.
+    """
+    ingressi_per_chiave: Dict[Tuple[date, str, str], Dict] = {}
+    for ingresso in partite_ingresso:
+        if not ingresso.get("is_trasferimento_interno"):
+            continue
+        destinazione = (ingresso.get("codice_stalla_azienda") or "").upper()
+        chiave = (ingresso["data"], ingresso["codice_stalla"].upper(), destinazione)
+        ingressi_per_chiave.setdefault(chiave, ingresso)
+    abbinati = 0
+    for uscita in partite_uscita:
+        if not uscita.get("is_trasferimento_interno"):
+            continue
+        origine = (uscita.get("codice_stalla_azienda") or "").upper()
+        chiave = (uscita["data"], origine, uscita["codice_stalla"].upper())
+        ingresso = ingressi_per_chiave.pop(chiave, None)
+        if ingresso is None:
+            continue
+        id_trasferimento = f"{chiave[0].isoformat()}|{chiave[1]}|{chiave[2]}"
+        non_corrispondenti = sorted(set(uscita["codici_capi"]) ^ set(ingresso["codici_capi"]))
+        for partita in (uscita, ingresso):
+            partita["id_trasferimento_interno"] = id_trasferimento
+            partita["capi_non_corrispondenti"] = non_corrispondenti
+        abbinati += 1
+    return abbinati
+
+
+def merge_anagrafe_results(
+    results: List[Dict[str, Any]],
+    azienda_id: int,
+    db: Session,
+) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Unisce i risultati di decode_anagrafe_file di più file e li riconcilia con il
+    database una sola volta: un lookup sull'indice eventi, una query animali per i
+    decessi, un filtro partite/decessi esistenti. Ogni gruppo riporta file_indice,
+    la posizione del file di provenienza.
+    """
+    partite_ingresso: List[Dict] = []
+    partite_uscita: List[Dict] = []
+    decessi: List[Dict] = []
+    for indice, result in enumerate(results):
+        ingressi_file, uscite_file = result["ingressi"], result["uscite"]
+        _assign_codice_stalla_azienda(ingressi_file + uscite_file, result["codice_stalla_file"], azienda_id, db)
+        for gruppo in ingressi_file + uscite_file + result["decessi"]:
+            gruppo["file_indice"] = indice
+        partite_ingresso.extend(ingressi_file)
+        partite_uscita.extend(uscite_file)
+        decessi.extend(result["decessi"])
+
+    # Lo stesso evento può comparire in due file (es. trasferimento interno visto da
+    # entrambe le stalle): il lookup sull'indice avviene una volta sola per tutti
+    hashes = {capo_event_hash(*ev) for p in partite_ingresso + partite_uscita for ev in partita_capo_events(p)}
+    hashes.update(capo_event_hash(*ev) for g in decessi for ev in gruppo_decessi_capo_events(g))
+    known = load_known_capo_events(db, azienda_id, hashes)
+    if known:
+        partite_ingresso = [p for p in (_without_known_partita_capi(p, known) for p in partite_ingresso) if p]
+        partite_uscita = [p for p in (_without_known_partita_capi(p, known) for p in partite_uscita) if p]
+        decessi = [g for g in (_without_known_decessi_capi(g, known) for g in decessi) if g]
+
+    animali_esistenti_map = _load_animali_esistenti_map(
+        db, azienda_id, (c for g in decessi for c in g["codici_capi"])
+    )
+    for gruppo in decessi:
+        gruppo["animali_ids"] = [animali_esistenti_map[c] for c in gruppo["codici_capi"] if c in animali_esistenti_map]
+        gruppo["animali_esistenti"] = len(gruppo["animali_ids"])
+        gruppo["animali_non_esistenti"] = len(gruppo["codici_capi"]) - gruppo["animali_esistenti"]
+        gruppo["azienda_id"] = azienda_id
+
+    partite_ingresso, partite_uscita, decessi = _reconcile_groups(
+        partite_ingresso, partite_uscita, decessi, azienda_id, db
+    )
+    match_trasferimenti_interni(partite_ingresso, partite_uscita)
+    return partite_ingresso, partite_uscita, decessi
+
+
 def create_partite_from_groups(
     partite_data: List[Dict],
     azienda_id: int,
@@ -879,26 +1433,30 @@ def create_partite_from_groups(
     """
     Crea record PartitaAnimale nel database a partire dai dati raggruppati
     """
+    from app.services.amministrazione.sequenze_service import (
+        allocate_sequence,
+        format_numero_partita,
+        sequenza_partita,
+    )
+    
+    # Riserva un blocco di numeri per ogni (anno, tipo) con un solo UPDATE ... RETURNING
+    senza_numero: Dict[Tuple[int, str], List[Dict]] = defaultdict(list)
+    for partita_data in partite_data:
+        if not partita_data.get('numero_partita'):
+            chiave = (partita_data['data'].year, sequenza_partita(partita_data['tipo']))
+            senza_numero[chiave].append(partita_data)
+    numeri_assegnati: Dict[int, str] = {}
+    for (anno, sequenza), gruppo in senza_numero.items():
+        primo = allocate_sequence(db, azienda_id, anno, sequenza, quantita=len(gruppo))
+        for offset, partita_data in enumerate(gruppo):
+            numeri_assegnati[id(partita_data)] = format_numero_partita(
+                partita_data['tipo'], partita_data['data'], partita_data['codice_stalla'], primo + offset
+            )
+    
     created_partite = []
     
     for partita_data in partite_data:
-        # Genera numero_partita univoco se non fornito
-        numero_partita = partita_data.get('numero_partita')
-        if not numero_partita:
-            tipo_prefix = "ING" if partita_data['tipo'] == TipoPartita.INGRESSO else "USC"
-            data_str = partita_data['data'].strftime('%Y%m%d')
-            codice_stalla = partita_data['codice_stalla']
-            
-            # Conta quante partite esistono già per questo giorno e tipo
-            count = db.query(func.count(PartitaAnimale.id)).filter(
-                PartitaAnimale.data == partita_data['data'],
-                PartitaAnimale.tipo == partita_data['tipo'],
-                PartitaAnimale.deleted_at.is_(None)
-            ).scalar() or 0
-            
-            # Genera numero progressivo a 3 cifre (001, 002, ecc.)
-            numero_progressivo = f"{(count + 1):03d}"
-            numero_partita = f"{tipo_prefix}-{data_str}-{codice_stalla}-{numero_progressivo}"
+        numero_partita = partita_data.get('numero_partita') or numeri_assegnati[id(partita_data)]
         
         # Crea partita
         partita = PartitaAnimale(
@@ -0,0 +1,272 @@
+"""
+Servizio di rendering PDF in processi separati.
+
+I generatori ReportLab in app.utils.pdf_generator sono sincroni e CPU-bound:
+chiamarli direttamente da un endpoint async blocca l'event loop dell'unico worker
+uvicorn e rallenta tutte le altre richieste. Qui ogni rendering gira in un
+processo dedicato (spawn) con:
+- al massimo PDF_RENDER_WORKERS processi contemporanei e coda limitata
+  (PDF_RENDER_WORKERS + PDF_RENDER_MAX_QUEUE richieste in corso), oltre la quale
+  la richiesta viene rifiutata subito;
+- timeout per singolo rendering, scaduto il quale viene terminato solo il
+  processo di quel rendering (gli altri in corso non vengono toccati);
+- richiesta annullata (client disconnesso): il processo viene terminato e il
+  posto resta occupato finché il thread che lo segue non è terminato, così i
+  processi attivi non superano mai PDF_RENDER_WORKERS.
+
+Il worker scrive il PDF su un file temporaneo e restituisce solo il percorso,
+così il processo API non tiene in memoria l'intero documento.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Generatori eseguibili nel pool (nomi delle funzioni in app.utils.pdf_generator)
+ALLOWED_GENERATORS = frozenset({
+    "generate_piano_uscita_pdf",
+    "generate_report_allevamento_pdf",
+    "generate_report_allevamento_per_partita_pdf",
+    "generate_prima_nota_dare_avere_pdf",
+})
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Intervallo con cui il thread controlla annullamento e timeout del rendering
+_POLL_INTERVAL = 0.25
+
+
+class PdfRenderBusy(RuntimeError):
+    """Raised when too many PDF renderings are already queued."""
+
+
+class PdfRenderTimeout(RuntimeError):
+    """Raised when a PDF rendering exceeds PDF_RENDER_TIMEOUT_SECONDS."""
+
+
+class PdfRenderError(RuntimeError):
+    """Raised when the rendering process fails or dies without a result."""
+
+
+# spawn: i processi non ereditano il pool di connessioni DB del processo API
+_mp_context = multiprocessing.get_context("spawn")
+_processes: Set[Any] = set()
+_processes_lock = threading.Lock()
+_slots: Optional[asyncio.Semaphore] = None
+_workers: Optional[asyncio.Semaphore] = None
+
+
+def _render_to_file(generator_name: str, args: tuple, kwargs: dict) -> str:
+    """Eseguito nel processo worker: genera il PDF e lo salva su file temporaneo."""
+    from app.utils import pdf_generator
+
+    generator = getattr(pdf_generator, generator_name)
+    buffer = generator(*args, **kwargs)
+    fd, path = tempfile.mkstemp(prefix="regifarm_pdf_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            buffer.seek(0)
+            shutil.copyfileobj(buffer, out)
+    except Exception:
+        os.unlink(path)
+        raise
+    finally:
+        buffer.close()
+    return path
+
+
+def _render_worker(conn, generator_name: str, args: tuple, kwargs: dict) -> None:
+    """Entry point del processo di rendering: invia al padre il percorso o l'errore."""
+    try:
+        conn.send((True, _render_to_file(generator_name, args, kwargs)))
+    except BaseException as exc:
+        conn.send((False, f"{type(exc).__name__}: {exc}"))
+    finally:
+        conn.close()
+
+
+def _terminate(process) -> None:
+    if process.is_alive():
+        process.terminate()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+    process.join()
+
+
+def _run_in_process(
+    generator_name: str,
+    args: tuple,
+    kwargs: dict,
+    timeout: float,
+    annullato: threading.Event,
+) -> str:
+    """
+    Esegue un rendering in un processo dedicato e ne attende il risultato (bloccante,
+    chiamata da un thread). Allo scadere del timeout o all'annullamento termina solo
+    questo processo.
+    """
+    parent_conn, child_conn = _mp_context.Pipe(duplex=False)
+    process = _mp_context.Process(
+        target=_render_worker,
+        args=(child_conn, generator_name, args, kwargs),
+        daemon=True,
+    )
+    process.start()
+    child_conn.close()
+    with _processes_lock:
+        _processes.add(process)
+    try:
+        scadenza = time.monotonic() + timeout
+        while not parent_conn.poll(_POLL_INTERVAL):
+            if annullato.is_set():
+                raise PdfRenderError(f"Rendering {generator_name} annullato")
+            if time.monotonic() >= scadenza:
+                logger.error("Rendering PDF %s oltre il timeout di %.0fs", generator_name, timeout)
+                raise PdfRenderTimeout(
+                    "La generazione del PDF ha superato il tempo massimo consentito."
+                )
+        try:
+            ok, result = parent_conn.recv()
+        except EOFError:
+            raise PdfRenderError(
+                f"Processo di rendering {generator_name} terminato senza risultato "
+                f"(exit code {process.exitcode})"
+            ) from None
+        if not ok:
+            raise PdfRenderError(f"Errore nel rendering {generator_name}: {result}")
+        return result
+    finally:
+        parent_conn.close()
+        _terminate(process)
+        with _processes_lock:
+            _processes.discard(process)
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.PDF_RENDER_WORKERS + settings.PDF_RENDER_MAX_QUEUE)
+    return _slots
+
+
+def _get_workers() -> asyncio.Semaphore:
+    global _workers
+    if _workers is None:
+        _workers = asyncio.Semaphore(max(settings.PDF_RENDER_WORKERS, 1))
+    return _workers
+
+
+async def render_pdf(
+    generator_name: str,
+    *args: Any,
+    timeout: Optional[float] = None,
+    wait: bool = False,
+    **kwargs: Any,
+) -> str:
+    """
+    Genera un PDF in un processo dedicato e restituisce il percorso del file temporaneo.
+
+    Args e kwargs vengono passati al generatore e devono essere serializzabili (pickle):
+    dizionari di dati del report e branding, non oggetti ORM.
+    Il file va consumato con iter_pdf_file, che lo elimina al termine.
+    Con wait=True, a coda piena si attende un posto libero invece di fallire.
+    """
+    if generator_name not in ALLOWED_GENERATORS:
+        raise ValueError(f"Generatore PDF non supportato: {generator_name}")
+
+    slots = _get_slots()
+    if slots.locked() and not wait:
+        raise PdfRenderBusy("Troppi report PDF in generazione. Riprova tra qualche secondo.")
+
+    timeout = timeout if timeout is not None else settings.PDF_RENDER_TIMEOUT_SECONDS
+    workers = _get_workers()
+    await slots.acquire()
+    try:
+        await workers.acquire()
+    except BaseException:
+        slots.release()
+        raise
+
+    annullato = threading.Event()
+    task = asyncio.ensure_future(
+        asyncio.to_thread(_run_in_process, generator_name, args, kwargs, timeout, annullato)
+    )
+
+    def _rilascia(done: asyncio.Future) -> None:
+        # I posti si liberano solo quando il thread ha chiuso il processo
+        workers.release()
+        slots.release()
+        if annullato.is_set() and not done.cancelled() and done.exception() is None:
+            discard_pdf_file(done.result())
+
+    task.add_done_callback(_rilascia)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Richiesta annullata: il thread termina il processo e poi libera i posti
+        annullato.set()
+        raise
+
+
+RenderJob = Tuple[str, tuple, dict]
+
+
+async def render_pdfs(jobs: Sequence[RenderJob]) -> List[Union[str, Exception]]:
+    """
+    Genera più PDF in parallelo (al massimo PDF_RENDER_WORKERS alla volta per batch).
+
+    Restituisce, nello stesso ordine dei job, il percorso del file oppure l'eccezione
+    sollevata da quel rendering, così un errore non blocca gli altri documenti.
+    """
+    concurrency = asyncio.Semaphore(max(settings.PDF_RENDER_WORKERS, 1))
+
+    async def _run(job: RenderJob) -> str:
+        generator_name, args, kwargs = job
+        async with concurrency:
+            return await render_pdf(generator_name, *args, wait=True, **kwargs)
+
+    return await asyncio.gather(*(_run(job) for job in jobs), return_exceptions=True)
+
+
+def discard_pdf_file(path: str) -> None:
+    """Elimina un PDF generato che non verrà inviato al client."""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def iter_pdf_file(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Legge il PDF generato a blocchi per StreamingResponse ed elimina il file alla fine."""
+    try:
+        with open(path, "rb") as pdf_file:
+            while True:
+                chunk = pdf_file.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        discard_pdf_file(path)
+
+
+def shutdown_pdf_rendering() -> None:
+    """Termina i rendering ancora in corso (chiamato allo shutdown dell'applicazione)."""
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        try:
+            _terminate(process)
+        except Exception:
+            pass
@@ -0,0 +1 @@
+# Servizi per le statistiche della dashboard
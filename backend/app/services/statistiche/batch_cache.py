@@ -0,0 +1,112 @@
+"""
+Cache in memoria delle risposte degli endpoint batch della dashboard
+
+Le risposte sono indicizzate per (endpoint, azienda_id) e scadono dopo
+settings.STATISTICHE_CACHE_TTL_SECONDS. Ogni endpoint dichiara i modelli da cui
+dipende (register_batch): le scritture ORM su quei modelli invalidano, al commit,
+le voci dell'azienda toccata e la voce senza azienda (totali di tutte le aziende).
+Gli UPDATE/DELETE in blocco via ORM invalidano l'endpoint per tutte le aziende.
+
+La cache è per processo: il TTL breve limita quanto restano visibili le scritture
+che gli hook non vedono (SQL testuale, altre istanze dell'applicazione).
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+
+# Chiave in session.info: {(endpoint, azienda_id | TUTTE_LE_AZIENDE)} da invalidare al commit
+_PENDING_KEY = "statistiche_batch_da_invalidare"
+
+TUTTE_LE_AZIENDE = "*"
+
+_lock = threading.Lock()
+_voci: Dict[Tuple[str, Optional[int]], Tuple[float, Any]] = {}
+# Incrementata a ogni invalidazione: un calcolo iniziato prima non viene salvato
+_generazioni: Dict[str, int] = {}
+_dipendenze: Dict[type, Set[str]] = {}
+
+
+def register_batch(nome: str, modelli: Iterable[type]) -> None:
+    """Dichiara i modelli le cui scritture invalidano l'endpoint `nome`."""
+    for modello in modelli:
+        _dipendenze.setdefault(modello, set()).add(nome)
+
+
+def cached_batch(nome: str, azienda_id: Optional[int], calcola: Callable[[], Any]) -> Any:
+    """Restituisce la risposta in cache per (nome, azienda_id) o la calcola e la salva."""
+    ttl = settings.STATISTICHE_CACHE_TTL_SECONDS
+    if ttl <= 0:
+        return calcola()
+    chiave = (nome, azienda_id)
+    with _lock:
+        voce = _voci.get(chiave)
+        generazione = _generazioni.get(nome, 0)
+    if voce is not None and voce[0] > time.monotonic():
+        return voce[1]
+
+    valore = calcola()
+    with _lock:
+        if _generazioni.get(nome, 0) == generazione:
+            _voci[chiave] = (time.monotonic() + ttl, valore)
+    return valore
+
+
+def invalidate_batch(nomi: Iterable[str], azienda_id: Any = TUTTE_LE_AZIENDE) -> None:
+    """Scarta le voci degli endpoint `nomi` per l'azienda (e i totali), o per tutte."""
+    with _lock:
+        for nome in set(nomi):
+            _generazioni[nome] = _generazioni.get(nome, 0) + 1
+            for chiave in list(_voci):
+                if chiave[0] != nome:
+                    continue
+                if azienda_id == TUTTE_LE_AZIENDE or chiave[1] in (azienda_id, None):
+                    del _voci[chiave]
+
+
+# ============ HOOK DI SESSIONE ============
+def _aziende_oggetto(obj: Any) -> Set[Any]:
+    state = sa_inspect(obj)
+    if "azienda_id" not in state.attrs:
+        # Modelli senza azienda (es. somministrazioni, scadenze attrezzature)
+        return {TUTTE_LE_AZIENDE}
+    history = state.attrs["azienda_id"].history
+    aziende = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    aziende.discard(None)
+    return aziende or {TUTTE_LE_AZIENDE}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _batch_cache_after_flush(session: Session, flush_context) -> None:
+    pending = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        nomi = _dipendenze.get(type(obj))
+        if not nomi:
+            continue
+        if pending is None:
+            pending = session.info.setdefault(_PENDING_KEY, set())
+        for azienda_id in _aziende_oggetto(obj):
+            pending.update((nome, azienda_id) for nome in nomi)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _batch_cache_bulk(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    for mapper in orm_execute_state.all_mappers:
+        nomi = _dipendenze.get(mapper.class_)
+        if nomi:
+            pending = orm_execute_state.session.info.setdefault(_PENDING_KEY, set())
+            pending.update((nome, TUTTE_LE_AZIENDE) for nome in nomi)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _batch_cache_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    for nome, azienda_id in pending or ():
+        invalidate_batch((nome,), azienda_id)
@@ -21,22 +21,37 @@ from reportlab.platypus import (
     Flowable,
 )
 
-from app.utils.pdf_layout import create_document, build_pdf, branding_from_azienda
+from app.utils.pdf_layout import (
+    TABLE_CHUNK_ROWS,
+    build_pdf,
+    branding_from_azienda,
+    chunked_table,
+    create_document,
+    create_spooled_buffer,
+)
+
 
+def _table_chunk_rows(chunked: bool, data) -> int:
+    """Righe per blocco: page-sized in modalità chunked, tabella unica altrimenti."""
+    return TABLE_CHUNK_ROWS if chunked else max(len(data), 1)
 
-def generate_piano_uscita_pdf(animali_data, branding=None):
+
+def generate_piano_uscita_pdf(animali_data, branding=None, chunked: bool = False):
     """
     Genera PDF per piano uscita
     
     Args:
         animali_data: Lista di dizionari con informazioni animali e loro box/sede/azienda
-                     Ogni elemento deve avere: auricolare, box_id, box_nome, box_codice,
-                     stabilimento_nome, sede_nome, azienda_nome
+                     Ogni elemento deve avere: auricolare, box_id, box_nome,
+                     stabilimento_nome, sede_nome, azienda_nome (box_codice facoltativo:
+                     colonna e intestazione del box lo mostrano solo se presente)
+        chunked: Se True le tabelle lunghe vengono divise in blocchi da una pagina e il PDF
+                 viene scritto su un file temporaneo spooled (memoria limitata per uscite grandi)
     
     Returns:
-        BytesIO object con il PDF
+        BytesIO (o SpooledTemporaryFile in modalità chunked) con il PDF
     """
-    buffer = BytesIO()
+    buffer = create_spooled_buffer() if chunked else BytesIO()
     doc, branding_config = create_document(
         buffer,
         branding=branding,
@@ -82,7 +97,7 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
     box_dict = {}
     for animale in animali_data:
         box_key = (animale.get('box_id'), animale.get('box_nome', 'N/A'), 
-                  animale.get('box_codice', ''), animale.get('stabilimento_nome', 'N/A'),
+                  animale.get('box_codice') or '', animale.get('stabilimento_nome', 'N/A'),
                   animale.get('sede_nome', 'N/A'), animale.get('azienda_nome', 'N/A'))
         if box_key not in box_dict:
             box_dict[box_key] = []
@@ -120,36 +135,44 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
     # Dettaglio per box
     story.append(Paragraph("DETTAGLIO PER BOX", heading_style))
     
-    # Tabella box
-    box_data = [['Sede', 'Stabilimento', 'Box', 'Codice Box', 'Num. Capi']]
+    # Tabella box (colonna codice solo se almeno un box ce l'ha)
+    con_codice = any(box_key[2] for box_key in box_dict)
+    if con_codice:
+        box_data = [['Sede', 'Stabilimento', 'Box', 'Codice Box', 'Num. Capi']]
+        box_col_widths = [50*mm, 50*mm, 35*mm, 30*mm, 25*mm]
+    else:
+        box_data = [['Sede', 'Stabilimento', 'Box', 'Num. Capi']]
+        box_col_widths = [55*mm, 55*mm, 50*mm, 30*mm]
     
     for box_key, auricolari in sorted(box_dict.items(), key=lambda x: (x[0][4], x[0][3], x[0][1])):
         box_id, box_nome, box_codice, stab_nome, sede_nome, azienda_nome = box_key
         num_capi_box = len(auricolari)
-        box_data.append([
-            sede_nome,
-            stab_nome,
-            box_nome,
-            box_codice,
-            str(num_capi_box)
-        ])
-    
-    box_table = Table(box_data, colWidths=[50*mm, 50*mm, 35*mm, 30*mm, 25*mm])
-    box_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a4a4a')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#666666')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')])
-    ]))
+        riga = [sede_nome, stab_nome, box_nome]
+        if con_codice:
+            riga.append(box_codice)
+        riga.append(str(num_capi_box))
+        box_data.append(riga)
+    
+    box_tables = chunked_table(
+        box_data,
+        [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a4a4a')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#666666')),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')])
+        ],
+        col_widths=box_col_widths,
+        rows_per_chunk=_table_chunk_rows(chunked, box_data),
+    )
     
-    story.append(box_table)
+    story.extend(box_tables)
     
     story.append(PageBreak())
     
@@ -237,7 +260,8 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
             auricolari_rows = [[''] * cols_auricolari]
         
         # Crea header con numero capi più evidente
-        header_content = f"<b>{box_nome}</b> ({box_codice}) - <b>{num_capi}</b> capi"
+        codice = f" ({box_codice})" if box_codice else ""
+        header_content = f"<b>{box_nome}</b>{codice} - <b>{num_capi}</b> capi"
         header_text = Paragraph(header_content, header_style)
         
         return {
@@ -317,9 +341,8 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
                 table_data.extend(box_data['auricolari_rows'])
                 
                 col_widths = [box_width / cols] * cols
-                row_table = Table(table_data, colWidths=col_widths)
-                
-                row_table.setStyle(TableStyle([
+                # Box con molti capi: blocchi con l'intestazione ripetuta, come le altre tabelle
+                row_tables = chunked_table(table_data, [
                     # Header
                     ('SPAN', (0, 0), (-1, 0)),
                     ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a4a4a')),
@@ -343,9 +366,9 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
                     ('INNERGRID', (0, 1), (-1, -1), 0.5, colors.HexColor('#cccccc')),
                     ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#333333')),
                     ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-                ]))
+                ], col_widths=col_widths, rows_per_chunk=_table_chunk_rows(chunked, table_data))
                 
-                story.append(row_table)
+                story.extend(row_tables)
             else:
                 # Due box affiancati - crea tabella combinata
                 box1_data = boxes_data[0]['data']
@@ -396,8 +419,7 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
                 
                 col_widths = [box1_col_width] * box1_cols + [spacing_width] + [box2_col_width] * box2_cols
                 
-                combined_table = Table(combined_data, colWidths=col_widths)
-                combined_table.setStyle(TableStyle([
+                combined_tables = chunked_table(combined_data, [
                     # Header box 1
                     ('SPAN', (0, 0), (box1_cols - 1, 0)),
                     ('BACKGROUND', (0, 0), (box1_cols - 1, 0), colors.HexColor('#4a4a4a')),
@@ -433,9 +455,9 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
                     # Background alternato
                     ('ROWBACKGROUNDS', (0, 1), (box1_cols - 1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
                     ('ROWBACKGROUNDS', (box1_cols + 1, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-                ]))
+                ], col_widths=col_widths, rows_per_chunk=_table_chunk_rows(chunked, combined_data))
                 
-                story.append(combined_table)
+                story.extend(combined_tables)
             
             story.append(Spacer(1, 4*mm))
         
@@ -449,18 +471,20 @@ def generate_piano_uscita_pdf(animali_data, branding=None):
     return buffer
 
 
-def generate_report_allevamento_pdf(report_data: dict, branding=None):
+def generate_report_allevamento_pdf(report_data: dict, branding=None, chunked: bool = False):
     """
     Genera PDF per report allevamento con conteggi vendita animali
     
     Args:
         report_data: Dizionario con i dati del report calcolati da calculate_report_allevamento_data
         branding: Configurazione branding (logo, dati aziendali, etc.)
+        chunked: Se True le tabelle per partita, auricolari e decessi vengono divise in blocchi
+                 da una pagina e il PDF viene scritto su un file temporaneo spooled
     
     Returns:
-        BytesIO object con il PDF
+        BytesIO (o SpooledTemporaryFile in modalità chunked) con il PDF
     """
-    buffer = BytesIO()
+    buffer = create_spooled_buffer() if chunked else BytesIO()
     doc, branding_config = create_document(
         buffer,
         branding=branding,
@@ -1046,34 +1070,38 @@ def generate_report_allevamento_pdf(report_data: dict, branding=None):
         # 6 colonne uguali: 190/6 = 31.67mm per colonna
         larghezza_totale_tabella = 190*mm  # Stessa larghezza delle tabelle nella prima pagina
         larghezza_colonna = larghezza_totale_tabella / 6
-        riepilogo_table = Table(riepilogo_data, colWidths=[larghezza_colonna] * 6)
-        riepilogo_table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2d5016')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-            ('TOPPADDING', (0, 0), (-1, 0), 6),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            # Body
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
-            ('TOPPADDING', (0, 1), (-1, -1), 5),
-            ('LEFTPADDING', (0, 1), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 1), (-1, -1), 6),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Codice stalla
-            ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # Data arrivo
-            ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Capi arrivati
-            ('ALIGN', (3, 1), (3, -1), 'CENTER'),  # Capi usciti
-            ('ALIGN', (4, 1), (4, -1), 'RIGHT'),  # Peso medio arrivo
-            ('ALIGN', (5, 1), (5, -1), 'RIGHT'),  # Peso medio uscita
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-        ]))
+        riepilogo_tables = chunked_table(
+            riepilogo_data,
+            [
+                # Header
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2d5016')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 8),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+                ('TOPPADDING', (0, 0), (-1, 0), 6),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                # Body
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
+                ('TOPPADDING', (0, 1), (-1, -1), 5),
+                ('LEFTPADDING', (0, 1), (-1, -1), 6),
+                ('RIGHTPADDING', (0, 1), (-1, -1), 6),
+                ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Codice stalla
+                ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # Data arrivo
+                ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Capi arrivati
+                ('ALIGN', (3, 1), (3, -1), 'CENTER'),  # Capi usciti
+                ('ALIGN', (4, 1), (4, -1), 'RIGHT'),  # Peso medio arrivo
+                ('ALIGN', (5, 1), (5, -1), 'RIGHT'),  # Peso medio uscita
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+            ],
+            col_widths=[larghezza_colonna] * 6,
+            rows_per_chunk=_table_chunk_rows(chunked, riepilogo_data),
+        )
         
-        story.append(riepilogo_table)
+        story.extend(riepilogo_tables)
         story.append(Spacer(1, 12*mm))
         
         # Dettaglio auricolari in griglia
@@ -1097,19 +1125,24 @@ def generate_report_allevamento_pdf(report_data: dict, branding=None):
         # Crea tabella griglia con font monospaziato e piccolo - usa la stessa larghezza delle altre tabelle
         larghezza_totale_tabella = 190*mm  # Stessa larghezza delle tabelle nella prima pagina
         larghezza_colonna_auricolari = larghezza_totale_tabella / num_colonne
-        auricolari_table = Table(auricolari_grid_data, colWidths=[larghezza_colonna_auricolari] * num_colonne)
-        auricolari_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Courier'),  # Font monospaziato
-            ('FONTSIZE', (0, 0), (-1, -1), 9),  # Font piccolo
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ('TOPPADDING', (0, 0), (-1, -1), 3),
-            ('LEFTPADDING', (0, 0), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('GRID', (0, 0), (-1, -1), 0.3, colors.HexColor('#e0e0e0')),
-        ]))
+        auricolari_tables = chunked_table(
+            auricolari_grid_data,
+            [
+                ('FONTNAME', (0, 0), (-1, -1), 'Courier'),  # Font monospaziato
+                ('FONTSIZE', (0, 0), (-1, -1), 9),  # Font piccolo
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                ('TOPPADDING', (0, 0), (-1, -1), 3),
+                ('LEFTPADDING', (0, 0), (-1, -1), 4),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('GRID', (0, 0), (-1, -1), 0.3, colors.HexColor('#e0e0e0')),
+            ],
+            col_widths=[larghezza_colonna_auricolari] * num_colonne,
+            header_rows=0,
+            rows_per_chunk=_table_chunk_rows(chunked, auricolari_grid_data),
+        )
         
-        story.append(auricolari_table)
+        story.extend(auricolari_tables)
     
     # ========== PAGINA FINALE: DECESSI ==========
     decessi = report_data.get('decessi', {})
@@ -1173,38 +1206,42 @@ def generate_report_allevamento_pdf(report_data: dict, branding=None):
                 ''
             ])
         
-        decessi_table = Table(decessi_table_data, colWidths=[25*mm, 20*mm, 23*mm, 22*mm, 25*mm, 15*mm, 20*mm, 15*mm], repeatRows=1)
-        decessi_table.setStyle(TableStyle([
-            # Header rosso scuro con testo bianco
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8B0000')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-            ('TOPPADDING', (0, 0), (-1, 0), 6),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            # Body
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-            ('TOPPADDING', (0, 1), (-1, -1), 4),
-            ('LEFTPADDING', (0, 1), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 1), (-1, -1), 4),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Auricolare
-            ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # Data arrivo
-            ('ALIGN', (2, 1), (2, -1), 'LEFT'),  # Provenienza
-            ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Peso arrivo
-            ('ALIGN', (4, 1), (4, -1), 'CENTER'),  # Data decesso
-            ('ALIGN', (5, 1), (5, -1), 'CENTER'),  # Giorni
-            ('ALIGN', (6, 1), (6, -1), 'RIGHT'),  # Valore
-            ('ALIGN', (7, 1), (7, -1), 'CENTER'),  # A carico
-            # Grid
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-            # Alternating row colors
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-        ]))
+        decessi_tables = chunked_table(
+            decessi_table_data,
+            [
+                # Header rosso scuro con testo bianco
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8B0000')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+                ('TOPPADDING', (0, 0), (-1, 0), 6),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                # Body
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 8),
+                ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+                ('TOPPADDING', (0, 1), (-1, -1), 4),
+                ('LEFTPADDING', (0, 1), (-1, -1), 4),
+                ('RIGHTPADDING', (0, 1), (-1, -1), 4),
+                ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Auricolare
+                ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # Data arrivo
+                ('ALIGN', (2, 1), (2, -1), 'LEFT'),  # Provenienza
+                ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Peso arrivo
+                ('ALIGN', (4, 1), (4, -1), 'CENTER'),  # Data decesso
+                ('ALIGN', (5, 1), (5, -1), 'CENTER'),  # Giorni
+                ('ALIGN', (6, 1), (6, -1), 'RIGHT'),  # Valore
+                ('ALIGN', (7, 1), (7, -1), 'CENTER'),  # A carico
+                # Grid
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
+                # Alternating row colors
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+            ],
+            col_widths=[25*mm, 20*mm, 23*mm, 22*mm, 25*mm, 15*mm, 20*mm, 15*mm],
+            rows_per_chunk=_table_chunk_rows(chunked, decessi_table_data),
+        )
         
-        story.append(decessi_table)
+        story.extend(decessi_tables)
     
     # Genera PDF
     build_pdf(doc, story, branding_config)
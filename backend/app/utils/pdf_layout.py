@@ -3,11 +3,12 @@ Shared PDF layout utilities for ReportLab reports.
 Provides a consistent RegiFarm-branded header, footer and branding helpers.
 """
 import logging
+import tempfile
 from copy import deepcopy
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, Tuple
 from urllib.request import urlopen
 
 from reportlab.lib import colors
@@ -95,6 +96,14 @@ DEFAULT_BRANDING: Dict[str, Any] = {
     "generated_at": None,
 }
 
+# Modalità chunked (report con migliaia di capi):
+# - il PDF viene scritto su un file temporaneo "spooled" che resta in RAM fino a
+#   PDF_SPOOL_MAX_SIZE e poi passa automaticamente su disco
+# - le tabelle lunghe vengono spezzate in blocchi di TABLE_CHUNK_ROWS righe, così
+#   ReportLab non deve ricalcolare/dividere una singola Table enorme ad ogni pagina
+PDF_SPOOL_MAX_SIZE = 4 * 1024 * 1024
+TABLE_CHUNK_ROWS = 40
+
 
 def _resolve_candidate_paths(path_value: str) -> Tuple[Path, ...]:
     if not path_value:
@@ -245,7 +254,7 @@ def prepare_branding(user_branding: Optional[Dict[str, Any]] = None) -> Dict[str
     return branding
 
 
-def create_document(buffer: BytesIO, branding: Optional[Dict[str, Any]] = None, doc_kwargs: Optional[Dict[str, Any]] = None):
+def create_document(buffer: BinaryIO, branding: Optional[Dict[str, Any]] = None, doc_kwargs: Optional[Dict[str, Any]] = None):
     branding_cfg = prepare_branding(branding)
     merged_kwargs = {**DEFAULT_DOC_KWARGS}
     if doc_kwargs:
@@ -583,6 +592,50 @@ def build_pdf(doc, story, branding: Dict[str, Any]):
     )
 
 
+def create_spooled_buffer(max_size: int = PDF_SPOOL_MAX_SIZE) -> BinaryIO:
+    """
+    Buffer di output per la modalità chunked: resta in memoria per i PDF piccoli,
+    passa su file temporaneo oltre max_size byte.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b")
+
+
+def chunked_table(
+    data: Sequence[Sequence[Any]],
+    style_commands: List[tuple],
+    col_widths: Optional[Sequence[float]] = None,
+    header_rows: int = 1,
+    rows_per_chunk: int = TABLE_CHUNK_ROWS,
+    **table_kwargs,
+) -> List[Table]:
+    """
+    Divide una tabella lunga in più Table di al massimo rows_per_chunk righe,
+    ripetendo l'intestazione in ogni blocco.
+
+    Gli style_commands vengono applicati a ogni blocco: gli indici negativi e quelli
+    relativi all'intestazione restano validi. Con rows_per_chunk pari l'alternanza
+    di ROWBACKGROUNDS resta coerente tra un blocco e l'altro.
+    """
+    header = list(data[:header_rows])
+    body = data[header_rows:]
+    if len(body) <= rows_per_chunk:
+        table = Table([*header, *body], colWidths=col_widths, repeatRows=header_rows, **table_kwargs)
+        table.setStyle(TableStyle(style_commands))
+        return [table]
+
+    tables = []
+    for start in range(0, len(body), rows_per_chunk):
+        table = Table(
+            [*header, *body[start:start + rows_per_chunk]],
+            colWidths=col_widths,
+            repeatRows=header_rows,
+            **table_kwargs,
+        )
+        table.setStyle(TableStyle(style_commands))
+        tables.append(table)
+    return tables
+
+
 def generate_pdf(story, branding: Optional[Dict[str, Any]] = None, doc_kwargs: Optional[Dict[str, Any]] = None):
     """
     Convenience helper: build a full PDF returning the BytesIO buffer.
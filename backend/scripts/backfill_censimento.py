@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Script per ricostruire il censimento giornaliero (tabella censimenti_giornalieri).
+Lo storico iniziale lo scrive la migrazione 20261019_censimenti_backfill; lo
+script serve a riallineare la tabella dopo interventi manuali sui dati.
+
+Le statistiche non scrivono mai il censimento: con --mancanti lo script calcola
+solo i giorni dopo l'ultimo calcolato (giorni senza scritture, es. uscite con
+data futura) e il backfill completo delle aziende che non hanno ancora righe.
+Il primo commit che tocca animali, partite o decessi dell'azienda fa lo stesso.
+
+Uso:
+    python scripts/backfill_censimento.py                 # tutte le aziende, dal primo arrivo
+    python scripts/backfill_censimento.py --azienda 3     # una sola azienda
+    python scripts/backfill_censimento.py --da 2025-01-01 # solo dal giorno indicato
+    python scripts/backfill_censimento.py --mancanti      # solo i giorni non ancora calcolati
+"""
+
+import argparse
+import sys
+import os
+from datetime import date
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.allevamento.censimento_service import (
+    aziende_censimento,
+    backfill_censimento,
+    completa_censimento,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill del censimento giornaliero")
+    parser.add_argument("--azienda", type=int, default=None, help="ID azienda (default: tutte)")
+    parser.add_argument("--da", type=date.fromisoformat, default=None, help="Data iniziale YYYY-MM-DD")
+    parser.add_argument("--mancanti", action="store_true", help="Calcola solo i giorni dopo l'ultimo calcolato")
+    args = parser.parse_args()
+    if args.mancanti and args.da:
+        parser.error("--mancanti e --da non sono compatibili")
+
+    db = SessionLocal()
+    try:
+        for azienda_id in aziende_censimento(db, args.azienda):
+            if args.mancanti:
+                righe = completa_censimento(db, azienda_id)
+            else:
+                righe = backfill_censimento(db, azienda_id, args.da)
+            db.commit()
+            print(f"Azienda {azienda_id}: {righe} righe di censimento scritte")
+    except Exception as e:
+        db.rollback()
+        print(f"Errore durante il backfill: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Script per ricostruire l'indice delle scadenze (tabella scadenze) usato dalle notifiche.
+Il popolamento iniziale lo esegue la migrazione 20261019_scadenze_backfill; lo
+script serve a riallineare l'indice dopo interventi manuali sui dati (SQL
+diretto, import esterni).
+
+Uso:
+    python scripts/backfill_scadenze.py               # tutte le aziende
+    python scripts/backfill_scadenze.py --azienda 3   # una sola azienda
+"""
+
+import argparse
+import sys
+import os
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.models.amministrazione.scadenza_indice import ScadenzaIndice
+from app.services.amministrazione.scadenze_service import rebuild_scadenze
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricostruzione dell'indice scadenze")
+    parser.add_argument("--azienda", type=int, default=None, help="ID azienda (default: tutte)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        rebuild_scadenze(db, args.azienda)
+        db.commit()
+        query = db.query(ScadenzaIndice)
+        if args.azienda:
+            query = query.filter(ScadenzaIndice.azienda_id == args.azienda)
+        print(f"Indice scadenze ricostruito: {query.count()} righe")
+    except Exception as e:
+        db.rollback()
+        print(f"Errore durante la ricostruzione: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
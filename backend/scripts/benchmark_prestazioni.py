@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmark dei percorsi principali dell'API su un database popolato (tipicamente
+un'azienda generata con scripts/genera_dati_sintetici.py su Postgres locale).
+
+Le richieste passano dall'applicazione FastAPI in-process (TestClient, stessi
+middleware e serializzazione dell'API reale). Per ogni caso misura il tempo
+(min, mediana, p95, max) su --ripetizioni esecuzioni e il numero di istruzioni
+SQL per richiesta; i risultati vanno in un file JSON. Con --baseline confronta le
+mediane con un'esecuzione precedente ed esce con codice 2 se un caso è più lento
+oltre --tolleranza. Un caso che risponde con HTTP >= 400 non ha tempi validi: viene
+segnato come fallito, escluso dal confronto, e lo script esce con codice 1.
+
+Casi:
+- sync_pull: POST /sync/pull (tutte le tabelle)
+- animali: GET /allevamento/animali
+- partite: GET /amministrazione/partite
+- home_batch: GET /statistiche/home-batch (cache svuotata prima di ogni richiesta)
+- report_allevamento: GET /amministrazione/report/allevamento (JSON, ultimo anno)
+- import_xml: POST /amministrazione/import/fatture-xml (ZIP sintetico; il
+  riscaldamento le inserisce, le esecuzioni misurate aggiornano fatture esistenti)
+- sync_anagrafe: POST /amministrazione/sincronizza-anagrafe (file .gz sintetico)
+
+Uso:
+    python scripts/benchmark_prestazioni.py --azienda 12 --output risultati.json
+    python scripts/benchmark_prestazioni.py --azienda 12 --casi animali,partite --ripetizioni 10
+    python scripts/benchmark_prestazioni.py --azienda 12 --output nuovo.json --baseline risultati.json --tolleranza 0.15
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+
+from app.core.database import SessionLocal, engine
+from app.main import app
+from app.models.allevamento.animale import Animale
+from app.models.amministrazione.fattura_amministrazione import FatturaAmministrazione
+from app.models.amministrazione.partita_animale import PartitaAnimale
+from app.models.amministrazione.pn import PNMovimento
+from app.services.statistiche.batch_cache import invalidate_batch
+from genera_dati_sintetici import genera_file_anagrafe, genera_zip_fatture_xml
+
+API = "/api/v1"
+
+_istruzioni_sql = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _conta_istruzioni(conn, cursor, statement, parameters, context, executemany):
+    global _istruzioni_sql
+    _istruzioni_sql += 1
+
+
+def _percentile(valori: List[float], quota: float) -> float:
+    ordinati = sorted(valori)
+    return ordinati[min(len(ordinati) - 1, int(round(quota * (len(ordinati) - 1))))]
+
+
+def casi_benchmark(azienda_id: int, file_xml: bytes, file_anagrafe: bytes) -> Dict[str, Callable]:
+    """Nome caso -> funzione che esegue una richiesta con il client."""
+    oggi = date.today()
+
+    def home_batch(client):
+        invalidate_batch(["home"])
+        return client.get(f"{API}/statistiche/home-batch", params={"azienda_id": azienda_id})
+
+    return {
+        "sync_pull": lambda client: client.post(f"{API}/sync/pull", params={"azienda_id": azienda_id}),
+        "animali": lambda client: client.get(f"{API}/allevamento/animali", params={"azienda_id": azienda_id}),
+        "partite": lambda client: client.get(
+            f"{API}/amministrazione/partite", params={"azienda_id": azienda_id, "limit": 1000}
+        ),
+        "home_batch": home_batch,
+        "report_allevamento": lambda client: client.get(
+            f"{API}/amministrazione/report/allevamento",
+            params={
+                "azienda_id": azienda_id,
+                "data_uscita_da": (oggi - timedelta(days=365)).isoformat(),
+                "data_uscita_a": oggi.isoformat(),
+                "formato": "json",
+            },
+        ),
+        "import_xml": lambda client: client.post(
+            f"{API}/amministrazione/import/fatture-xml",
+            files={"file": ("fatture.zip", file_xml, "application/zip")},
+        ),
+        "sync_anagrafe": lambda client: client.post(
+            f"{API}/amministrazione/sincronizza-anagrafe",
+            params={"azienda_id": azienda_id},
+            files={"file": ("anagrafe.gz", file_anagrafe, "application/gzip")},
+        ),
+    }
+
+
+def esegui_caso(client: TestClient, richiesta: Callable, ripetizioni: int) -> Dict:
+    """Tempi e istruzioni SQL del caso; alla prima risposta HTTP >= 400 il caso non è valido."""
+    global _istruzioni_sql
+    tempi: List[float] = []
+    istruzioni: List[int] = []
+    risposta = None
+    for _ in range(ripetizioni):
+        _istruzioni_sql = 0
+        inizio = time.perf_counter()
+        risposta = richiesta(client)
+        tempi.append((time.perf_counter() - inizio) * 1000)
+        istruzioni.append(_istruzioni_sql)
+        if risposta.status_code >= 400:
+            return {
+                "status": risposta.status_code,
+                "valido": False,
+                "errore": risposta.text[:500],
+            }
+    return {
+        "status": risposta.status_code,
+        "valido": True,
+        "byte": len(risposta.content),
+        "ripetizioni": ripetizioni,
+        "min_ms": round(min(tempi), 1),
+        "mediana_ms": round(statistics.median(tempi), 1),
+        "p95_ms": round(_percentile(tempi, 0.95), 1),
+        "max_ms": round(max(tempi), 1),
+        "istruzioni_sql": int(statistics.median(istruzioni)),
+    }
+
+
+def dimensioni_dataset(azienda_id: int) -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return {
+            tabella: db.execute(
+                select(func.count()).select_from(modello).where(modello.azienda_id == azienda_id)
+            ).scalar()
+            for tabella, modello in (
+                ("animali", Animale),
+                ("partite_animali", PartitaAnimale),
+                ("fatture_amministrazione", FatturaAmministrazione),
+                ("pn_movimenti", PNMovimento),
+            )
+        }
+    finally:
+        db.close()
+
+
+def _commit_corrente() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def confronta(risultati: Dict, baseline: Dict, tolleranza: float) -> List[str]:
+    """Casi con mediana oltre (1 + tolleranza) volte quella della baseline."""
+    regressioni = []
+    for nome, caso in risultati["casi"].items():
+        if not caso.get("valido", True):
+            continue
+        riferimento = baseline.get("casi", {}).get(nome)
+        if not riferimento or not riferimento.get("valido", True) or not riferimento.get("mediana_ms"):
+            print(f"{nome}: nessun riferimento valido nella baseline")
+            continue
+        rapporto = caso["mediana_ms"] / riferimento["mediana_ms"]
+        print(
+            f"{nome}: {caso['mediana_ms']} ms contro {riferimento['mediana_ms']} ms (x{rapporto:.2f}), "
+            f"SQL {caso['istruzioni_sql']} contro {riferimento.get('istruzioni_sql')}"
+        )
+        if rapporto > 1 + tolleranza:
+            regressioni.append(nome)
+    return regressioni
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei percorsi principali dell'API")
+    parser.add_argument("--azienda", type=int, required=True, help="ID azienda (es. generata da genera_dati_sintetici.py)")
+    parser.add_argument("--casi", default=None, help="Casi da eseguire separati da virgola (default: tutti)")
+    parser.add_argument("--ripetizioni", type=int, default=5, help="Esecuzioni misurate per caso")
+    parser.add_argument("--riscaldamento", type=int, default=1, help="Esecuzioni non misurate prima delle misure")
+    parser.add_argument("--fatture-xml", type=int, default=200, help="Fatture nello ZIP di import")
+    parser.add_argument("--output", default=None, help="File JSON dei risultati")
+    parser.add_argument("--baseline", default=None, help="File JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolleranza", type=float, default=0.2, help="Rallentamento ammesso rispetto alla baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        file_xml = genera_zip_fatture_xml(db, args.azienda, numero=args.fatture_xml)
+        file_anagrafe = genera_file_anagrafe(db, args.azienda)
+    finally:
+        db.close()
+
+    casi = casi_benchmark(args.azienda, file_xml, file_anagrafe)
+    if args.casi:
+        nomi = [nome.strip() for nome in args.casi.split(",") if nome.strip()]
+        sconosciuti = [nome for nome in nomi if nome not in casi]
+        if sconosciuti:
+            print(f"Casi sconosciuti: {', '.join(sconosciuti)}. Disponibili: {', '.join(casi)}")
+            sys.exit(1)
+        casi = {nome: casi[nome] for nome in nomi}
+
+    risultati = {
+        "eseguito_il": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_corrente(),
+        "azienda_id": args.azienda,
+        "dimensioni": dimensioni_dataset(args.azienda),
+        "casi": {},
+    }
+    with TestClient(app) as client:
+        for nome, richiesta in casi.items():
+            for _ in range(args.riscaldamento):
+                richiesta(client)
+            risultato = esegui_caso(client, richiesta, args.ripetizioni)
+            risultati["casi"][nome] = risultato
+            if not risultato["valido"]:
+                print(f"{nome}: FALLITO, HTTP {risultato['status']}: {risultato['errore']}")
+                continue
+            print(
+                f"{nome}: mediana {risultato['mediana_ms']} ms, p95 {risultato['p95_ms']} ms, "
+                f"{risultato['istruzioni_sql']} istruzioni SQL, HTTP {risultato['status']}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, indent=2, ensure_ascii=False)
+        print(f"Risultati scritti in {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressioni = confronta(risultati, baseline, args.tolleranza)
+        if regressioni:
+            print(f"Casi più lenti della baseline oltre il {args.tolleranza:.0%}: {', '.join(regressioni)}")
+            sys.exit(2)
+
+    falliti = [nome for nome, caso in risultati["casi"].items() if not caso["valido"]]
+    if falliti:
+        print(f"Casi falliti (HTTP >= 400, tempi non validi): {', '.join(falliti)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
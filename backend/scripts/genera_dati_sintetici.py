@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Script per generare un'azienda sintetica di dimensione configurabile su un
+database locale, per misurare le prestazioni (scripts/benchmark_prestazioni.py)
+e verificare i piani delle query (scripts/verifica_piani_query.py).
+
+Genera sedi, stabilimenti e box, animali con partite di ingresso e uscita,
+decessi, farmaci e somministrazioni, fornitori, fatture (con dati_xml) e
+movimenti di Prima Nota per il numero di anni indicato. Dati deterministici
+per lo stesso --seed. Le righe vengono scritte con INSERT in blocco; le tabelle
+derivate (censimento giornaliero, indice scadenze, saldi mensili, contropartite)
+vengono poi ricostruite con i servizi di backfill.
+
+Contiene anche i generatori dei file usati dal benchmark: ZIP di fatture XML
+FatturaPA e file .gz dell'anagrafe nazionale (formato TSV).
+
+NON eseguire su un database di produzione.
+
+Uso:
+    python scripts/genera_dati_sintetici.py                        # 5.000 animali, 3 anni
+    python scripts/genera_dati_sintetici.py --animali 50000 --anni 5
+    python scripts/genera_dati_sintetici.py --animali 1000 --seed 7 --sedi 1
+"""
+
+import argparse
+import gzip
+import io
+import random
+import sys
+import os
+import zipfile
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.allevamento.animale import Animale
+from app.models.allevamento.azienda import Azienda
+from app.models.allevamento.box import Box
+from app.models.allevamento.decesso import Decesso
+from app.models.allevamento.gruppo_decessi import GruppoDecessi
+from app.models.allevamento.sede import Sede
+from app.models.allevamento.stabilimento import Stabilimento
+from app.models.amministrazione.fattura_amministrazione import FatturaAmministrazione
+from app.models.amministrazione.fornitore import Fornitore
+from app.models.amministrazione.partita_animale import PartitaAnimale
+from app.models.amministrazione.partita_animale_animale import PartitaAnimaleAnimale
+from app.models.amministrazione.pn import PNConto, PNMovimento
+from app.models.sanitario.farmaco import Farmaco
+from app.models.sanitario.somministrazione import Somministrazione
+
+BLOCCO = 5000
+
+RAZZE = ["Limousine", "Charolaise", "Blonde d'Aquitaine", "Piemontese", "Incrocio"]
+CATEGORIE_FATTURE = ["mangimi", "farmaci", "energia", "acqua", "gas", "lavorazione_terreni", "veterinario", "trasporti"]
+FARMACI = [
+    "Ivomec", "Baytril", "Metacam", "Draxxin", "Nuflor", "Dectomax", "Excenel", "Zactran",
+    "Resflor", "Finadyne", "Clamoxyl", "Oxytetra", "Bovilis", "Rispoval", "Hiprabovis",
+]
+# Stato finale degli animali (pesi sul totale)
+STATI = [("presente", 55), ("venduto", 25), ("macellato", 10), ("deceduto", 6), ("trasferito", 4)]
+MOTIVO_USCITA = {"venduto": "V", "macellato": "M", "trasferito": "K", "deceduto": "D"}
+
+
+def _inserisci(db: Session, modello, righe: Sequence[Dict]) -> List[int]:
+    """INSERT in blocco; restituisce gli id nello stesso ordine delle righe."""
+    tabella = modello.__table__
+    ids: List[int] = []
+    for start in range(0, len(righe), BLOCCO):
+        blocco = righe[start:start + BLOCCO]
+        if not blocco:
+            continue
+        stmt = insert(tabella).returning(tabella.c.id, sort_by_parameter_order=True)
+        ids.extend(db.execute(stmt, list(blocco)).scalars().all())
+    return ids
+
+
+def _giorno_casuale(rng: random.Random, da: date, a: date) -> date:
+    return da + timedelta(days=rng.randint(0, max((a - da).days, 0)))
+
+
+def _importo(rng: random.Random, minimo: float, massimo: float) -> Decimal:
+    return Decimal(str(round(rng.uniform(minimo, massimo), 2)))
+
+
+def _partita_iva(seed: int, n: int) -> str:
+    return f"{(seed * 100000 + n) % 10 ** 11:011d}"
+
+
+# ============ GENERAZIONE ============
+def genera_azienda(
+    db: Session,
+    animali: int = 5000,
+    anni: int = 3,
+    sedi: int = 2,
+    box_per_stabilimento: int = 20,
+    fornitori: int = 40,
+    fatture_al_mese: int = 60,
+    seed: int = 1,
+) -> Dict[str, int]:
+    """Crea l'azienda sintetica e restituisce id e conteggi. Non esegue commit."""
+    rng = random.Random(seed)
+    oggi = date.today()
+    inizio = oggi.replace(day=1) - timedelta(days=365 * anni)
+    conteggi: Dict[str, int] = {}
+
+    piva = _partita_iva(seed, 0)
+    [azienda_id] = _inserisci(db, Azienda, [{
+        "nome": f"Azienda sintetica {seed}",
+        "partita_iva": piva,
+        "codice_fiscale": piva,
+        "indirizzo_comune": "Cuneo",
+        "indirizzo_provincia": "CN",
+    }])
+
+    # Sedi, stabilimenti, box
+    codici_stalla = [f"{seed % 1000:03d}CN{i:03d}" for i in range(sedi)]
+    sede_ids = _inserisci(db, Sede, [
+        {"azienda_id": azienda_id, "nome": f"Sede {i + 1}", "codice_stalla": codice}
+        for i, codice in enumerate(codici_stalla)
+    ])
+    stabilimento_ids = _inserisci(db, Stabilimento, [
+        {"sede_id": sede_id, "nome": f"Stalla {j + 1}", "capacita_totale": box_per_stabilimento * 30}
+        for sede_id in sede_ids for j in range(2)
+    ])
+    box_ids = _inserisci(db, Box, [
+        {"stabilimento_id": stab_id, "nome": f"Box {k + 1}", "capacita": 30, "stato": "occupato"}
+        for stab_id in stabilimento_ids for k in range(box_per_stabilimento)
+    ])
+    conteggi.update(sedi=len(sede_ids), stabilimenti=len(stabilimento_ids), box=len(box_ids))
+
+    # Fornitori e clienti
+    fornitore_righe = [
+        {
+            "azienda_id": azienda_id,
+            "nome": f"Fornitore {n:03d} S.r.l.",
+            "partita_iva": _partita_iva(seed, n),
+            "indirizzo_comune": "Torino",
+            "is_fornitore": n % 5 != 0,
+            "is_cliente": n % 5 == 0,
+        }
+        for n in range(1, fornitori + 1)
+    ]
+    fornitore_ids = _inserisci(db, Fornitore, fornitore_righe)
+    fornitori_dati = list(zip(fornitore_ids, fornitore_righe))
+    conteggi["fornitori"] = len(fornitore_ids)
+
+    # Animali: arrivano a gruppi (partite di ingresso) distribuiti nel periodo
+    provenienze = [f"0{n:02d}TO{n:03d}" for n in range(1, 31)]
+    destinazioni = [f"0{n:02d}MI{n:03d}" for n in range(1, 21)]
+    animale_righe: List[Dict] = []
+    gruppi_ingresso: Dict[tuple, List[int]] = {}
+    while len(animale_righe) < animali:
+        data_arrivo = _giorno_casuale(rng, inizio, oggi - timedelta(days=1))
+        provenienza = rng.choice(provenienze)
+        codice_stalla = rng.choice(codici_stalla)
+        for _ in range(min(rng.randint(15, 60), animali - len(animale_righe))):
+            stato = rng.choices([s for s, _ in STATI], weights=[p for _, p in STATI])[0]
+            data_uscita = None
+            if stato != "presente":
+                data_uscita = _giorno_casuale(rng, data_arrivo + timedelta(days=1), oggi)
+                if data_uscita <= data_arrivo:
+                    stato = "presente"
+                    data_uscita = None
+            indice = len(animale_righe)
+            gruppi_ingresso.setdefault((data_arrivo, provenienza, codice_stalla), []).append(indice)
+            animale_righe.append({
+                "auricolare": f"IT{seed % 1000:03d}{indice:09d}",
+                "azienda_id": azienda_id,
+                "specie": "bovino",
+                "razza": rng.choice(RAZZE),
+                "sesso": rng.choice("MF"),
+                "data_nascita": data_arrivo - timedelta(days=rng.randint(180, 400)),
+                "codice_azienda_anagrafe": codice_stalla,
+                "codice_provenienza": provenienza,
+                "motivo_ingresso": "A",
+                "data_arrivo": data_arrivo,
+                "peso_arrivo": _importo(rng, 250, 400),
+                "tipo_allevamento": "ingrasso",
+                "peso_attuale": _importo(rng, 300, 700),
+                "stato": stato,
+                "motivo_uscita": MOTIVO_USCITA.get(stato),
+                "data_uscita": data_uscita,
+                "codice_azienda_destinazione": rng.choice(destinazioni) if stato in ("venduto", "macellato", "trasferito") else None,
+                "box_id": rng.choice(box_ids) if stato == "presente" else None,
+                "valore": _importo(rng, 800, 1800),
+                "origine_dati": "anagrafe",
+            })
+    animale_ids = _inserisci(db, Animale, animale_righe)
+    conteggi["animali"] = len(animale_ids)
+
+    # Partite di ingresso e di uscita con il collegamento agli animali
+    partita_righe: List[Dict] = []
+    membri: List[List[int]] = []
+    for (data_arrivo, provenienza, codice_stalla), indici in gruppi_ingresso.items():
+        partita_righe.append({
+            "azienda_id": azienda_id,
+            "tipo": "ingresso",
+            "data": data_arrivo,
+            "codice_stalla": provenienza,
+            "codice_stalla_azienda": codice_stalla,
+            "numero_capi": len(indici),
+            "peso_totale": sum(animale_righe[i]["peso_arrivo"] for i in indici),
+            "modalita_gestione": "proprieta",
+            "valore_totale": sum(animale_righe[i]["valore"] for i in indici),
+            "motivo": "A",
+            "is_trasferimento_interno": False,
+        })
+        membri.append(indici)
+    gruppi_uscita: Dict[tuple, List[int]] = {}
+    for indice, riga in enumerate(animale_righe):
+        if riga["codice_azienda_destinazione"]:
+            chiave = (riga["data_uscita"], riga["codice_azienda_destinazione"], riga["codice_azienda_anagrafe"])
+            gruppi_uscita.setdefault(chiave, []).append(indice)
+    for (data_uscita, destinazione, codice_stalla), indici in gruppi_uscita.items():
+        partita_righe.append({
+            "azienda_id": azienda_id,
+            "tipo": "uscita",
+            "data": data_uscita,
+            "codice_stalla": destinazione,
+            "codice_stalla_azienda": codice_stalla,
+            "numero_capi": len(indici),
+            "modalita_gestione": "proprieta",
+            "valore_totale": sum(animale_righe[i]["valore"] for i in indici),
+            "motivo": animale_righe[indici[0]]["motivo_uscita"],
+            "is_trasferimento_interno": False,
+        })
+        membri.append(indici)
+    partita_ids = _inserisci(db, PartitaAnimale, partita_righe)
+    _inserisci(db, PartitaAnimaleAnimale, [
+        {"partita_animale_id": partita_id, "animale_id": animale_ids[i]}
+        for partita_id, indici in zip(partita_ids, membri) for i in indici
+    ])
+    conteggi["partite"] = len(partita_ids)
+
+    # Decessi raggruppati per giorno e stalla
+    gruppi_decesso: Dict[tuple, List[int]] = {}
+    for indice, riga in enumerate(animale_righe):
+        if riga["stato"] == "deceduto":
+            gruppi_decesso.setdefault((riga["data_uscita"], riga["codice_azienda_anagrafe"]), []).append(indice)
+    gruppo_ids = _inserisci(db, GruppoDecessi, [
+        {"azienda_id": azienda_id, "data_uscita": data_uscita, "codice_stalla_decesso": codice_stalla}
+        for data_uscita, codice_stalla in gruppi_decesso
+    ])
+    _inserisci(db, Decesso, [
+        {
+            "animale_id": animale_ids[i],
+            "gruppo_decessi_id": gruppo_id,
+            "data_ora": datetime.combine(animale_righe[i]["data_uscita"], time(8), tzinfo=timezone.utc),
+            "causa": "Sintetico",
+            "valore_capo": animale_righe[i]["valore"],
+        }
+        for gruppo_id, indici in zip(gruppo_ids, gruppi_decesso.values()) for i in indici
+    ])
+    conteggi["decessi"] = sum(len(indici) for indici in gruppi_decesso.values())
+
+    # Farmaci e somministrazioni (0-4 per animale durante la permanenza)
+    farmaco_ids = _inserisci(db, Farmaco, [
+        {"azienda_id": azienda_id, "nome_commerciale": nome} for nome in FARMACI
+    ])
+    somministrazione_righe = []
+    for animale_id, riga in zip(animale_ids, animale_righe):
+        fine = riga["data_uscita"] or oggi
+        for _ in range(rng.randint(0, 4)):
+            giorno = _giorno_casuale(rng, riga["data_arrivo"], fine)
+            somministrazione_righe.append({
+                "animale_id": animale_id,
+                "farmaco_id": rng.choice(farmaco_ids),
+                "data_ora": datetime.combine(giorno, time(rng.randint(6, 18)), tzinfo=timezone.utc),
+                "quantita": _importo(rng, 1, 20),
+                "operatore_nome": "Operatore sintetico",
+                "periodo_sospensione": rng.choice([0, 7, 14, 28]),
+            })
+    _inserisci(db, Somministrazione, somministrazione_righe)
+    conteggi["somministrazioni"] = len(somministrazione_righe)
+
+    # Fatture ricevute ed emesse, mese per mese
+    fattura_righe = []
+    mese = inizio
+    numero = 0
+    while mese <= oggi:
+        fine_mese = (mese.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        for _ in range(fatture_al_mese):
+            numero += 1
+            fornitore_id, fornitore = rng.choice(fornitori_dati)
+            tipo = "entrata" if fornitore["is_cliente"] else "uscita"
+            data_fattura = _giorno_casuale(rng, mese, min(fine_mese, oggi))
+            netto = _importo(rng, 50, 8000)
+            iva = (netto * Decimal("0.22")).quantize(Decimal("0.01"))
+            totale = netto + iva
+            data_scadenza = data_fattura + timedelta(days=rng.choice([0, 30, 60, 90]))
+            pagata = data_scadenza < oggi - timedelta(days=30) or rng.random() < 0.3
+            fattura_righe.append({
+                "azienda_id": azienda_id,
+                "tipo": tipo,
+                "numero": f"S{seed}-{numero:06d}",
+                "data_fattura": data_fattura,
+                "data_registrazione": data_fattura,
+                "divisa": "EUR",
+                "tipo_documento": "TD01",
+                "fornitore_id": fornitore_id if tipo == "uscita" else None,
+                "cliente_id": fornitore_id if tipo == "entrata" else None,
+                "cliente_nome": fornitore["nome"] if tipo == "entrata" else None,
+                "importo_totale": totale,
+                "importo_iva": iva,
+                "importo_netto": netto,
+                "importo_pagato": totale if pagata and tipo == "uscita" else Decimal("0"),
+                "importo_incassato": totale if pagata and tipo == "entrata" else Decimal("0"),
+                "stato_pagamento": ("pagata" if tipo == "uscita" else "incassata") if pagata else (
+                    "da_pagare" if tipo == "uscita" else "da_incassare"
+                ),
+                "data_scadenza": data_scadenza,
+                "data_pagamento": data_scadenza if pagata and tipo == "uscita" else None,
+                "data_incasso": data_scadenza if pagata and tipo == "entrata" else None,
+                "condizioni_pagamento": "TP02",
+                "categoria": rng.choice(CATEGORIE_FATTURE),
+                "dati_xml": {
+                    "cedente": {"denominazione": fornitore["nome"], "partita_iva": fornitore["partita_iva"]},
+                    "dati_pagamento": [{"modalita_pagamento": "MP05", "data_scadenza": data_scadenza.isoformat()}],
+                },
+                "righe": [{"descrizione": "Fornitura sintetica", "quantita": 1, "prezzo_totale": float(netto)}],
+            })
+        mese = fine_mese + timedelta(days=1)
+    fattura_ids = _inserisci(db, FatturaAmministrazione, fattura_righe)
+    conteggi["fatture"] = len(fattura_ids)
+
+    # Prima Nota: un movimento per fattura pagata più spese e incassi manuali
+    conto_ids = _inserisci(db, PNConto, [
+        {"azienda_id": azienda_id, "nome": "Cassa", "tipo": "cassa", "saldo_iniziale": Decimal("5000")},
+        {"azienda_id": azienda_id, "nome": "Banca", "tipo": "banca", "saldo_iniziale": Decimal("50000")},
+    ])
+    nomi_fornitori = {fornitore_id: fornitore["nome"] for fornitore_id, fornitore in fornitori_dati}
+    movimento_righe = []
+    for fattura_id, fattura in zip(fattura_ids, fattura_righe):
+        if fattura["stato_pagamento"] not in ("pagata", "incassata"):
+            continue
+        entrata = fattura["tipo"] == "entrata"
+        movimento_righe.append({
+            "azienda_id": azienda_id,
+            "conto_id": conto_ids[1],
+            "tipo_operazione": "entrata" if entrata else "uscita",
+            "stato": "definitivo",
+            "origine": "automatico",
+            "data": fattura["data_incasso"] or fattura["data_pagamento"],
+            "descrizione": f"{'Incasso' if entrata else 'Pagamento'} fattura {fattura['numero']}",
+            "importo": fattura["importo_totale"],
+            "contropartita_nome": fattura["cliente_nome"] or nomi_fornitori[fattura["fornitore_id"]],
+            "metodo_pagamento": "bonifico",
+            "fattura_amministrazione_id": fattura_id,
+        })
+    giorni = (oggi - inizio).days
+    for _ in range(giorni * 2):
+        entrata = rng.random() < 0.3
+        movimento_righe.append({
+            "azienda_id": azienda_id,
+            "conto_id": rng.choice(conto_ids),
+            "tipo_operazione": "entrata" if entrata else "uscita",
+            "stato": "definitivo" if rng.random() < 0.95 else "provvisorio",
+            "origine": "manuale",
+            "data": _giorno_casuale(rng, inizio, oggi),
+            "descrizione": rng.choice(["Gasolio", "Spesa varia", "Rimborso", "Commissioni bancarie", "Ricambi"]),
+            "importo": _importo(rng, 5, 900),
+            "contropartita_nome": rng.choice(fornitori_dati)[1]["nome"] if rng.random() < 0.5 else None,
+            "metodo_pagamento": "contanti" if rng.random() < 0.5 else "carta",
+        })
+    _inserisci(db, PNMovimento, movimento_righe)
+    conteggi["pn_movimenti"] = len(movimento_righe)
+
+    conteggi["azienda_id"] = azienda_id
+    return conteggi
+
+
+def ricostruisci_tabelle_derivate(db: Session, azienda_id: int) -> None:
+    """
+    Le INSERT in blocco non passano dagli hook di sessione: ricostruisce
+    censimento, indice scadenze, contropartite e saldi di Prima Nota.
+    """
+    from app.services.allevamento.censimento_service import backfill_censimento
+    from app.services.amministrazione.pn_contropartite_service import contropartita_id_per_nome
+    from app.services.amministrazione.pn_saldi_service import verifica_saldi
+    from app.services.amministrazione.scadenze_service import rebuild_scadenze
+
+    backfill_censimento(db, azienda_id)
+    rebuild_scadenze(db, azienda_id)
+
+    nomi = db.execute(
+        select(PNMovimento.contropartita_nome)
+        .where(PNMovimento.azienda_id == azienda_id, PNMovimento.contropartita_nome.isnot(None))
+        .distinct()
+    ).scalars().all()
+    for nome in nomi:
+        db.execute(
+            update(PNMovimento)
+            .where(PNMovimento.azienda_id == azienda_id, PNMovimento.contropartita_nome == nome)
+            .values(contropartita_id=contropartita_id_per_nome(db, azienda_id, nome))
+            .execution_options(synchronize_session=False)
+        )
+    verifica_saldi(db, azienda_id, correggi=True)
+
+
+# ============ FILE PER I BENCHMARK DI IMPORT ============
+def _fattura_xml(
+    piva_cedente: str,
+    nome_cedente: str,
+    piva_cessionario: str,
+    nome_cessionario: str,
+    numero: str,
+    giorno: date,
+    netto: Decimal,
+    righe: int,
+) -> str:
+    iva = (netto * Decimal("0.22")).quantize(Decimal("0.01"))
+    prezzo = (netto / righe).quantize(Decimal("0.01"))
+    linee = "".join(
+        f"<DettaglioLinee><NumeroLinea>{n}</NumeroLinea><Descrizione>Mangime lotto {n}</Descrizione>"
+        f"<Quantita>1.00</Quantita><PrezzoUnitario>{prezzo}</PrezzoUnitario>"
+        f"<PrezzoTotale>{prezzo}</PrezzoTotale><AliquotaIVA>22.00</AliquotaIVA></DettaglioLinee>"
+        for n in range(1, righe + 1)
+    )
+    scadenza = giorno + timedelta(days=30)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<p:FatturaElettronica versione="FPR12" xmlns:p="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2">'
+        "<FatturaElettronicaHeader>"
+        f"<DatiTrasmissione><IdTrasmittente><IdPaese>IT</IdPaese><IdCodice>{piva_cedente}</IdCodice></IdTrasmittente>"
+        f"<ProgressivoInvio>{numero[-5:]}</ProgressivoInvio><FormatoTrasmissione>FPR12</FormatoTrasmissione>"
+        "<CodiceDestinatario>0000000</CodiceDestinatario></DatiTrasmissione>"
+        f"<CedentePrestatore><DatiAnagrafici><IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{piva_cedente}</IdCodice></IdFiscaleIVA>"
+        f"<Anagrafica><Denominazione>{nome_cedente}</Denominazione></Anagrafica><RegimeFiscale>RF01</RegimeFiscale></DatiAnagrafici>"
+        "<Sede><Indirizzo>Via Roma 1</Indirizzo><CAP>10100</CAP><Comune>Torino</Comune><Provincia>TO</Provincia><Nazione>IT</Nazione></Sede>"
+        "</CedentePrestatore>"
+        f"<CessionarioCommittente><DatiAnagrafici><IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{piva_cessionario}</IdCodice></IdFiscaleIVA>"
+        f"<Anagrafica><Denominazione>{nome_cessionario}</Denominazione></Anagrafica></DatiAnagrafici>"
+        "<Sede><Indirizzo>Via Cuneo 1</Indirizzo><CAP>12100</CAP><Comune>Cuneo</Comune><Provincia>CN</Provincia><Nazione>IT</Nazione></Sede>"
+        "</CessionarioCommittente>"
+        "</FatturaElettronicaHeader>"
+        "<FatturaElettronicaBody>"
+        "<DatiGenerali><DatiGeneraliDocumento><TipoDocumento>TD01</TipoDocumento><Divisa>EUR</Divisa>"
+        f"<Data>{giorno.isoformat()}</Data><Numero>{numero}</Numero>"
+        f"<ImportoTotaleDocumento>{netto + iva}</ImportoTotaleDocumento></DatiGeneraliDocumento></DatiGenerali>"
+        f"<DatiBeniServizi>{linee}<DatiRiepilogo><AliquotaIVA>22.00</AliquotaIVA>"
+        f"<ImponibileImporto>{netto}</ImponibileImporto><Imposta>{iva}</Imposta>"
+        "<EsigibilitaIVA>I</EsigibilitaIVA></DatiRiepilogo></DatiBeniServizi>"
+        "<DatiPagamento><CondizioniPagamento>TP02</CondizioniPagamento><DettaglioPagamento>"
+        f"<ModalitaPagamento>MP05</ModalitaPagamento><DataScadenzaPagamento>{scadenza.isoformat()}</DataScadenzaPagamento>"
+        f"<ImportoPagamento>{netto + iva}</ImportoPagamento></DettaglioPagamento></DatiPagamento>"
+        "</FatturaElettronicaBody>"
+        "</p:FatturaElettronica>"
+    )
+
+
+def genera_zip_fatture_xml(db: Session, azienda_id: int, numero: int = 200, seed: int = 1) -> bytes:
+    """ZIP di fatture XML FatturaPA ricevute dall'azienda, da fornitori esistenti."""
+    rng = random.Random(seed)
+    azienda = db.get(Azienda, azienda_id)
+    fornitori = db.execute(
+        select(Fornitore.nome, Fornitore.partita_iva).where(Fornitore.azienda_id == azienda_id)
+    ).all() or [("Fornitore XML S.r.l.", _partita_iva(seed, 99999))]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archivio:
+        for n in range(1, numero + 1):
+            nome, piva = rng.choice(fornitori)
+            numero_fattura = f"XML{seed}-{n:05d}"
+            contenuto = _fattura_xml(
+                piva, nome, azienda.partita_iva, azienda.nome, numero_fattura,
+                _giorno_casuale(rng, date.today() - timedelta(days=365), date.today()),
+                _importo(rng, 100, 5000), rng.randint(1, 8),
+            )
+            archivio.writestr(f"IT{piva}_{n:05d}.xml", contenuto)
+    return buffer.getvalue()
+
+
+def genera_file_anagrafe(db: Session, azienda_id: int, nuovi_capi: int = 500, seed: int = 1) -> bytes:
+    """
+    File .gz dell'anagrafe (TSV) con tutti i capi dell'azienda più `nuovi_capi`
+    ingressi non ancora registrati, come l'estrazione completa di una stalla.
+    """
+    rng = random.Random(seed)
+    colonne = [
+        "AZIENDA_CODICE", "CODICE_CAPO", "SESSO", "RAZZA", "DATA_NASCITA",
+        "CODICE_PROVENIENZA", "DATA_INGRESSO", "MOTIVO_INGRESSO",
+        "DATA_USCITA_STALLA", "CODICE_AZIENDA_DESTINAZIONE", "MOTIVO_USCITA",
+    ]
+    formato = "%d/%m/%Y"
+
+    def _data(valore: Optional[date]) -> str:
+        return valore.strftime(formato) if valore else ""
+
+    righe = ["\t".join(colonne)]
+    animali = db.execute(
+        select(
+            Animale.codice_azienda_anagrafe, Animale.auricolare, Animale.sesso, Animale.razza,
+            Animale.data_nascita, Animale.codice_provenienza, Animale.data_arrivo,
+            Animale.data_uscita, Animale.codice_azienda_destinazione, Animale.motivo_uscita,
+        ).where(Animale.azienda_id == azienda_id, Animale.deleted_at.is_(None))
+    ).all()
+    for a in animali:
+        righe.append("\t".join([
+            a.codice_azienda_anagrafe or "", a.auricolare, a.sesso or "", a.razza or "",
+            _data(a.data_nascita), a.codice_provenienza or "", _data(a.data_arrivo), "A",
+            _data(a.data_uscita), a.codice_azienda_destinazione or "", a.motivo_uscita or "",
+        ]))
+    codice_stalla = animali[0].codice_azienda_anagrafe if animali else f"{seed % 1000:03d}CN000"
+    for n in range(nuovi_capi):
+        arrivo = date.today() - timedelta(days=rng.randint(1, 30))
+        righe.append("\t".join([
+            codice_stalla, f"IT{seed % 1000:03d}9{n:08d}", rng.choice("MF"), rng.choice(RAZZE),
+            _data(arrivo - timedelta(days=300)), f"0{n % 30 + 1:02d}TO{n % 30 + 1:03d}", _data(arrivo), "A",
+            "", "", "",
+        ]))
+    return gzip.compress(("\n".join(righe) + "\n").encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generazione di un'azienda sintetica per i benchmark")
+    parser.add_argument("--animali", type=int, default=5000, help="Numero di animali (1.000-50.000)")
+    parser.add_argument("--anni", type=int, default=3, help="Anni di fatture e movimenti")
+    parser.add_argument("--sedi", type=int, default=2, help="Numero di sedi (2 stabilimenti ciascuna)")
+    parser.add_argument("--box", type=int, default=20, help="Box per stabilimento")
+    parser.add_argument("--fornitori", type=int, default=40, help="Numero di fornitori/clienti")
+    parser.add_argument("--fatture-al-mese", type=int, default=60, help="Fatture per mese")
+    parser.add_argument("--seed", type=int, default=1, help="Seed del generatore casuale")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        conteggi = genera_azienda(
+            db,
+            animali=args.animali,
+            anni=args.anni,
+            sedi=args.sedi,
+            box_per_stabilimento=args.box,
+            fornitori=args.fornitori,
+            fatture_al_mese=args.fatture_al_mese,
+            seed=args.seed,
+        )
+        db.commit()
+        ricostruisci_tabelle_derivate(db, conteggi["azienda_id"])
+        db.commit()
+        for nome, valore in conteggi.items():
+            print(f"{nome}: {valore}")
+    except Exception as e:
+        db.rollback()
+        print(f"Errore durante la generazione: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
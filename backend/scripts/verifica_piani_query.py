@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Script per verificare i piani di esecuzione delle query più frequenti degli
+endpoint (animali per stato, partite per tipo/data, fatture, scadenze delle
+notifiche, movimenti di Prima Nota, somministrazioni per azienda).
+
+Le richieste passano dall'applicazione FastAPI in-process (TestClient, come
+scripts/benchmark_prestazioni.py): le SELECT che l'endpoint esegue davvero
+vengono intercettate sull'engine con i loro parametri, così la verifica segue il
+codice degli endpoint senza copie delle query da tenere allineate. Per ogni
+istruzione esegue EXPLAIN (FORMAT JSON) con gli stessi parametri e segnala le
+scansioni sequenziali sulle tabelle grandi (stima di righe in pg_class sopra
+--soglia-righe): su tabelle piccole la scansione sequenziale è legittima.
+Va eseguito su un database popolato (es. dati sintetici in locale) dopo ANALYZE.
+
+Uso:
+    python scripts/verifica_piani_query.py                      # azienda con più animali
+    python scripts/verifica_piani_query.py --azienda 3
+    python scripts/verifica_piani_query.py --soglia-righe 50000 --analyze
+    python scripts/verifica_piani_query.py --verbose            # stampa anche istruzioni e piani
+
+Esce con codice 2 se almeno una query scansiona in sequenza una tabella grande,
+con codice 1 se un endpoint risponde con HTTP >= 400.
+"""
+
+import argparse
+import sys
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select, text
+
+from app.core.database import SessionLocal, engine
+from app.main import app
+from app.models.allevamento.animale import Animale
+
+API = "/api/v1"
+TABELLE = ("animali", "partite_animali", "fatture_amministrazione", "pn_movimenti", "somministrazioni")
+
+
+class RegistroSelect:
+    """Listener before_cursor_execute: raccoglie le SELECT eseguite mentre è attivo."""
+
+    def __init__(self) -> None:
+        self.attivo = False
+        self.istruzioni: List[Tuple[str, object]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.attivo or executemany:
+            return
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            self.istruzioni.append((statement, parameters))
+
+
+def casi_verifica(azienda_id: int) -> Dict[str, Callable]:
+    """Nome caso -> funzione che esegue la richiesta dell'endpoint con il client."""
+    oggi = date.today()
+    return {
+        "animali presenti (GET /allevamento/animali?stato=presente)": lambda client: client.get(
+            f"{API}/allevamento/animali", params={"azienda_id": azienda_id, "stato": "presente"}
+        ),
+        "partite di ingresso ultimo anno (GET /amministrazione/partite?tipo=ingresso)": lambda client: client.get(
+            f"{API}/amministrazione/partite",
+            params={"azienda_id": azienda_id, "tipo": "ingresso", "data_da": (oggi - timedelta(days=365)).isoformat()},
+        ),
+        "fatture per data (GET /amministrazione/fatture)": lambda client: client.get(
+            f"{API}/amministrazione/fatture", params={"azienda_id": azienda_id}
+        ),
+        "scadenze (GET /statistiche/notifiche)": lambda client: client.get(
+            f"{API}/statistiche/notifiche", params={"azienda_id": azienda_id}
+        ),
+        "movimenti Prima Nota (GET /amministrazione/prima-nota/movimenti)": lambda client: client.get(
+            f"{API}/amministrazione/prima-nota/movimenti", params={"azienda_id": azienda_id}
+        ),
+        "movimenti Prima Nota definitivi del mese": lambda client: client.get(
+            f"{API}/amministrazione/prima-nota/movimenti",
+            params={"azienda_id": azienda_id, "stato": "definitivo", "data_da": oggi.replace(day=1).isoformat()},
+        ),
+        "somministrazioni per azienda (GET /sanitario/somministrazioni)": lambda client: client.get(
+            f"{API}/sanitario/somministrazioni", params={"azienda_id": azienda_id}
+        ),
+    }
+
+
+def scansioni_sequenziali(nodo):
+    """Tabelle lette con Seq Scan nel piano (ricorsivo sui sotto-piani)."""
+    tabelle = []
+    if nodo.get("Node Type") == "Seq Scan":
+        tabelle.append(nodo.get("Relation Name"))
+    for figlio in nodo.get("Plans", []):
+        tabelle.extend(scansioni_sequenziali(figlio))
+    return tabelle
+
+
+def piano_istruzione(conn, statement: str, parameters):
+    """Piano JSON dell'istruzione, con i parametri nel formato del driver."""
+    return conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters or None).scalar()[0]["Plan"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica dei piani delle query più frequenti")
+    parser.add_argument("--azienda", type=int, default=None, help="ID azienda (default: quella con più animali)")
+    parser.add_argument("--soglia-righe", type=int, default=10000, help="Righe stimate oltre cui una tabella è grande")
+    parser.add_argument("--analyze", action="store_true", help="Esegue ANALYZE sulle tabelle prima della verifica")
+    parser.add_argument("--verbose", action="store_true", help="Stampa istruzioni e piani completi")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.analyze:
+            for tabella in TABELLE:
+                db.execute(text(f"ANALYZE {tabella}"))
+            db.commit()
+
+        azienda_id = args.azienda
+        if azienda_id is None:
+            azienda_id = db.execute(
+                select(Animale.azienda_id)
+                .group_by(Animale.azienda_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            ).scalar()
+            if azienda_id is None:
+                print("Nessun animale nel database: popolare prima i dati")
+                sys.exit(1)
+
+        righe_stimate = dict(
+            db.execute(
+                text(
+                    "SELECT relname, reltuples::bigint FROM pg_class "
+                    "WHERE relkind = 'r' AND relnamespace = current_schema()::regnamespace"
+                )
+            ).all()
+        )
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(f"Errore durante la verifica: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+    print(f"Azienda {azienda_id}, soglia {args.soglia_righe} righe")
+    for tabella in TABELLE:
+        print(f"  {tabella}: ~{righe_stimate.get(tabella, 0)} righe")
+
+    registro = RegistroSelect()
+    event.listen(engine, "before_cursor_execute", registro)
+    problemi = 0
+    falliti = []
+    try:
+        with TestClient(app) as client:
+            for nome, richiesta in casi_verifica(azienda_id).items():
+                registro.istruzioni = []
+                registro.attivo = True
+                try:
+                    risposta = richiesta(client)
+                finally:
+                    registro.attivo = False
+                if risposta.status_code >= 400:
+                    print(f"{nome}: FALLITO, HTTP {risposta.status_code}: {risposta.text[:500]}")
+                    falliti.append(nome)
+                    continue
+
+                # Stessa istruzione ripetuta (es. caricamenti per riga): un solo piano
+                istruzioni = list({statement: parameters for statement, parameters in registro.istruzioni}.items())
+                print(f"{nome}: {len(istruzioni)} SELECT distinte")
+                with engine.connect() as conn:
+                    for statement, parameters in istruzioni:
+                        piano = piano_istruzione(conn, statement, parameters)
+                        grandi = sorted({
+                            tabella
+                            for tabella in scansioni_sequenziali(piano)
+                            if righe_stimate.get(tabella, 0) >= args.soglia_righe
+                        })
+                        esito = "SEQ SCAN su " + ", ".join(grandi) if grandi else "ok"
+                        print(f"  {esito} (costo {piano['Total Cost']}): {' '.join(statement.split())[:160]}")
+                        if args.verbose:
+                            print(f"    {statement}")
+                            print(f"    {parameters}")
+                            print(f"    {piano}")
+                        problemi += bool(grandi)
+                    conn.rollback()
+    except Exception as e:
+        print(f"Errore durante la verifica: {e}")
+        sys.exit(1)
+    finally:
+        event.remove(engine, "before_cursor_execute", registro)
+
+    print(f"Query con scansioni sequenziali su tabelle grandi: {problemi}")
+    if falliti:
+        print(f"Endpoint falliti (HTTP >= 400): {', '.join(falliti)}")
+        sys.exit(1)
+    if problemi:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script per verificare i saldi mensili di Prima Nota (tabella pn_saldi_mensili) e
+saldo_attuale dei conti rispetto ai movimenti definitivi. Segnala le differenze;
+con --correggi riscrive i saldi mensili e allinea saldo_attuale.
+
+Nota: un saldo_attuale impostato a mano dall'utente risulta come differenza.
+
+Uso:
+    python scripts/verifica_saldi_prima_nota.py                         # tutte le aziende
+    python scripts/verifica_saldi_prima_nota.py --azienda 3             # una sola azienda
+    python scripts/verifica_saldi_prima_nota.py --azienda 3 --correggi  # corregge le differenze
+"""
+
+import argparse
+import sys
+import os
+
+# Aggiungi il path del backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.amministrazione.pn_saldi_service import verifica_saldi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica dei saldi mensili di Prima Nota")
+    parser.add_argument("--azienda", type=int, default=None, help="ID azienda (default: tutte)")
+    parser.add_argument("--correggi", action="store_true", help="Riscrive i saldi dei conti con differenze")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        differenze = verifica_saldi(db, args.azienda, correggi=args.correggi)
+        for diff in differenze:
+            mese = diff["mese"].isoformat() if diff["mese"] else "-"
+            print(
+                f"Conto {diff['conto_id']} mese {mese} {diff['campo']}: "
+                f"atteso {diff['atteso']}, registrato {diff['registrato']}"
+            )
+        if args.correggi:
+            db.commit()
+            print(f"Differenze corrette: {len(differenze)}")
+        else:
+            db.rollback()
+            print(f"Differenze trovate: {len(differenze)}")
+            if differenze:
+                sys.exit(2)
+    except Exception as e:
+        db.rollback()
+        print(f"Errore durante la verifica: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -196,6 +196,15 @@ export const amministrazioneService = {
     });
   },
 
+  // Sincronizzazione Anagrafe multi-file (un export per codice stalla)
+  sincronizzaAnagrafeMulti: (files, aziendaId) => {
+    const formData = new FormData();
+    Array.from(files).forEach((file) => formData.append('files', file));
+    return api.post(`/amministrazione/sincronizza-anagrafe/multi?azienda_id=${aziendaId}`, formData, {
+      timeout: 300000
+    });
+  },
+
   // Conferma partita anagrafe
   confirmPartita: (partitaData) => {
     return api.post('/amministrazione/partite/confirm', partitaData);
@@ -206,6 +215,16 @@ export const amministrazioneService = {
     return api.post('/amministrazione/gruppi-decessi/confirm', gruppoData);
   },
 
+  // Conferma in blocco partite e gruppi decessi di un upload anagrafe (esito per elemento)
+  confirmAnagrafeBatch: (partite = [], gruppiDecessi = []) => {
+    return api.post('/amministrazione/sincronizza-anagrafe/confirm', {
+      partite,
+      gruppi_decessi: gruppiDecessi,
+    }, {
+      timeout: 300000
+    });
+  },
+
   // Report
   getReportSintesiVendite: (filters = {}) => 
     api.get('/amministrazione/report/sintesi-vendite', filters),